@@ -62,7 +62,7 @@ class Command(BaseCommand):
             APIKey.objects.create(
                 user=admin_user,
                 name="Default MCP Key (Auto-generated)",
-                key=default_api_key_value,
+                raw_key=default_api_key_value,
                 is_active=True
             )
             
@@ -5,27 +5,27 @@ from .models import APIKey
 class APIKeyAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'key_preview', 'created_at', 'expires_at', 'is_active')
     list_filter = ('is_active', 'created_at', 'expires_at')
-    search_fields = ('name', 'key', 'user__username')
+    search_fields = ('name', 'prefix', 'user__username')
     raw_id_fields = ('user',) # Use a raw ID field for user selection for better performance with many users
-    readonly_fields = ('key', 'created_at') # Make key and created_at read-only after creation
+    readonly_fields = ('prefix', 'created_at') # Only the key prefix is stored in clear text
 
     fieldsets = (
         (None, {
             'fields': ('name', 'user', 'is_active')
         }),
         ('Key Details', {
-            'fields': ('key', 'created_at', 'expires_at'),
+            'fields': ('prefix', 'created_at', 'expires_at'),
             'classes': ('collapse',) # Collapse this section by default
         }),
     )
 
     def key_preview(self, obj):
-        """Displays a truncated version of the key for readability."""
-        return f"{obj.key[:5]}...{obj.key[-5:]}"
+        """Displays the clear-text prefix of the key for readability."""
+        return obj.key_preview
     key_preview.short_description = "API Key (Preview)"
 
-    # Override save_model to ensure key is generated if not present
+    # The raw key is generated on save and can only be shown once
     def save_model(self, request, obj, form, change):
-        if not obj.pk: # Only generate key for new objects
-            obj.key = obj.generate_key()
         super().save_model(request, obj, form, change)
+        if not change and obj.raw_key:
+            self.message_user(request, f"API Key created: {obj.raw_key} (it will not be shown again)")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiKeysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_keys'
+
+    def ready(self):
+        """Registers cache invalidation for validated API keys."""
+        import api_keys.signals  # noqa
@@ -1,6 +1,7 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from django.utils import timezone
+from .cache import validated_keys
+from .hashing import hash_api_key
 from .models import APIKey
 
 class APIKeyAuthentication(BaseAuthentication):
@@ -28,12 +29,24 @@ class APIKeyAuthentication(BaseAuthentication):
         if not api_key_value:
             return None # No API Key or Authorization header found, let other authentication classes handle it
 
-        try:
-            api_key_obj = APIKey.objects.select_related('user').get(key=api_key_value)
-        except APIKey.DoesNotExist:
-            raise AuthenticationFailed('Invalid API Key.')
+        # Validated keys are served from the in-process cache (revocations from
+        # other processes are seen via the shared stamps); expiry is still checked
+        # on every request since it only needs the cached row.
+        key_hash = hash_api_key(api_key_value)
+        api_key_obj = validated_keys.get(key_hash)
+        if api_key_obj is None:
+            key_stamp = validated_keys.key_stamp(key_hash)
+            try:
+                api_key_obj = APIKey.objects.select_related('user').get(key_hash=key_hash)
+            except APIKey.DoesNotExist:
+                raise AuthenticationFailed('Invalid API Key.')
+            if api_key_obj.is_valid():
+                validated_keys.set(key_hash, api_key_obj, key_stamp)
+                # Hand out a copy so per-request state never reaches the cached instance
+                api_key_obj = validated_keys.get(key_hash) or api_key_obj
 
         if not api_key_obj.is_valid():
+            validated_keys.invalidate(key_hash)
             raise AuthenticationFailed('API Key is inactive or expired.')
 
         # If the key is valid, return the user and the APIKey object (as token)
@@ -0,0 +1,137 @@
+import copy
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class ValidatedKeyCache:
+    """
+    In-process LRU + TTL cache of validated API keys, keyed by key digest.
+
+    MCP tools and skills authenticate every call with the same key, so caching the
+    APIKey row (with its user) saves a database round trip per request. Entries are
+    dropped when the key or its user changes (see signals.py). Other worker processes
+    see the change through revocation stamps kept in the Django cache: every entry
+    records the key and user stamps it was validated under, and a hit whose stamps
+    no longer match is discarded. With REDIS_URL configured the default cache is
+    shared, so a revoke takes effect in every process immediately; if the shared
+    cache cannot be read the key is looked up in the database.
+
+    Settings:
+    - API_KEY_CACHE_TTL: seconds a validated key is trusted (default 60, 0 disables)
+    - API_KEY_CACHE_SIZE: maximum number of cached keys (default 1024)
+    """
+
+    VERSION_PREFIX = 'api_key_revocation'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return int(getattr(settings, 'API_KEY_CACHE_TTL', 60))
+
+    @property
+    def max_size(self):
+        return int(getattr(settings, 'API_KEY_CACHE_SIZE', 1024))
+
+    def _stamp_keys(self, key_hash, user_id):
+        return [f'{self.VERSION_PREFIX}:key:{key_hash}', f'{self.VERSION_PREFIX}:user:{user_id}']
+
+    def key_stamp(self, key_hash):
+        """
+        Current revocation stamp of the key, read before loading the row from the
+        database so a revoke racing the lookup is not cached. _MISSING when the
+        shared cache is unavailable (the key is then not cached).
+        """
+        try:
+            return cache.get(self._stamp_keys(key_hash, None)[0])
+        except Exception as e:
+            logger.warning(f"Reading API key revocation stamp failed: {e}")
+            return _MISSING
+
+    def _current_stamps(self, key_hash, user_id):
+        keys = self._stamp_keys(key_hash, user_id)
+        try:
+            values = cache.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Reading API key revocation stamps failed: {e}")
+            return _MISSING
+        return tuple(values.get(k) for k in keys)
+
+    def _bump(self, stamp_key):
+        # Stamps must outlive cached entries: once a stamp expires it reads as None
+        # again and would match entries cached before it was set.
+        try:
+            cache.set(stamp_key, uuid.uuid4().hex, max(self.ttl, 1) * 2)
+        except Exception as e:
+            logger.warning(f"Publishing API key revocation failed, other processes keep it for up to {self.ttl}s: {e}")
+
+    def get(self, key_hash):
+        """
+        Returns a copy of the cached APIKey (with a copy of its user), or None.
+        Copies keep per-request attributes set on the user (permission caches,
+        project roles) from leaking into later requests.
+        """
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            api_key, expires_at, stamps = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+
+        if self._current_stamps(key_hash, api_key.user_id) != stamps:
+            # Revoked in another process (or the shared cache is unavailable)
+            with self._lock:
+                if self._entries.get(key_hash) is entry:
+                    del self._entries[key_hash]
+            return None
+
+        api_key = copy.copy(api_key)
+        api_key.user = copy.copy(api_key.user)
+        return api_key
+
+    def set(self, key_hash, api_key, key_stamp=None):
+        """key_stamp: the value of key_stamp() read before the row was loaded"""
+        ttl = self.ttl
+        if ttl <= 0 or key_stamp is _MISSING:
+            return
+        stamps = self._current_stamps(key_hash, api_key.user_id)
+        if stamps is _MISSING or stamps[0] != key_stamp:
+            return
+        with self._lock:
+            self._entries[key_hash] = (api_key, time.monotonic() + ttl, stamps)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+        self._bump(self._stamp_keys(key_hash, None)[0])
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key_hash in [h for h, (api_key, _, _) in self._entries.items() if api_key.user_id == user_id]:
+                del self._entries[key_hash]
+        self._bump(self._stamp_keys(None, user_id)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+validated_keys = ValidatedKeyCache()
@@ -0,0 +1,26 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+
+# Number of leading characters of the raw key kept in clear text so users and
+# admins can tell keys apart without the full secret being stored.
+PREFIX_LENGTH = 8
+
+
+def _secret():
+    """
+    HMAC secret for API key digests.
+    API_KEY_HASH_SECRET can be set to decouple key digests from SECRET_KEY rotation.
+    """
+    return getattr(settings, 'API_KEY_HASH_SECRET', None) or settings.SECRET_KEY
+
+
+def hash_api_key(raw_key):
+    """Returns the hex HMAC-SHA256 digest stored for a raw API key."""
+    return hmac.new(_secret().encode(), raw_key.encode(), hashlib.sha256).hexdigest()
+
+
+def key_prefix(raw_key):
+    """Returns the clear-text identifying prefix of a raw API key."""
+    return raw_key[:PREFIX_LENGTH]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+from api_keys.hashing import PREFIX_LENGTH, hash_api_key, key_prefix
+
+
+def hash_existing_keys(apps, schema_editor):
+    APIKey = apps.get_model('api_keys', 'APIKey')
+    for api_key in APIKey.objects.all().only('id', 'key'):
+        api_key.prefix = key_prefix(api_key.key)
+        api_key.key_hash = hash_api_key(api_key.key)
+        api_key.save(update_fields=['prefix', 'key_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_keys', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='prefix',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=PREFIX_LENGTH, verbose_name='Key Prefix'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='key_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, verbose_name='Key Digest'),
+        ),
+        # Raw keys cannot be recovered from their digests, so this migration is irreversible
+        migrations.RunPython(hash_existing_keys),
+        migrations.RemoveField(
+            model_name='apikey',
+            name='key',
+        ),
+        migrations.AlterField(
+            model_name='apikey',
+            name='key_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True, verbose_name='Key Digest'),
+        ),
+    ]
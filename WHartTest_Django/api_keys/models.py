@@ -3,15 +3,17 @@ from django.conf import settings
 import secrets
 from django.utils import timezone
 
+from .hashing import PREFIX_LENGTH, hash_api_key, key_prefix
+
 class APIKey(models.Model):
     """
     Represents an API Key that can be used to authenticate requests to the platform.
     Each API Key is associated with a Django User, inheriting their permissions.
     """
-    # The actual API key string. Stored as plain text for direct use by external MCP tools.
-    # In a highly sensitive production environment, consider storing a hash of the key
-    # and only exposing the raw key once upon creation.
-    key = models.CharField(max_length=64, unique=True, db_index=True, verbose_name="API Key")
+    # Only a keyed digest of the API key is stored; the raw key is shown once on creation.
+    # The clear-text prefix lets users and admins tell keys apart.
+    prefix = models.CharField(max_length=PREFIX_LENGTH, db_index=True, editable=False, verbose_name="Key Prefix")
+    key_hash = models.CharField(max_length=64, unique=True, editable=False, verbose_name="Key Digest")
     
     # A human-readable name for the API Key, e.g., "LangGraph Agent Key"
     name = models.CharField(max_length=100, unique=True, verbose_name="Key Name")
@@ -45,9 +47,24 @@ class APIKey(models.Model):
     def __str__(self):
         return f"API Key: {self.name} (User: {self.user.username})"
 
+    @property
+    def raw_key(self):
+        """The raw key; only available on the instance that created or set it."""
+        return getattr(self, '_raw_key', None)
+
+    @raw_key.setter
+    def raw_key(self, value):
+        self._raw_key = value
+        self.prefix = key_prefix(value)
+        self.key_hash = hash_api_key(value)
+
+    @property
+    def key_preview(self):
+        return f"{self.prefix}..."
+
     def save(self, *args, **kwargs):
-        if not self.key: # Generate key only if it's new
-            self.key = self.generate_key()
+        if not self.key_hash: # Generate key only if it's new
+            self.raw_key = self.generate_key()
         super().save(*args, **kwargs)
 
     def generate_key(self):
@@ -3,8 +3,13 @@ from .models import APIKey
 
 class APIKeySerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username') # Display username instead of user ID
+    # The raw key is only returned in the create response; afterwards only its prefix is known
+    key = serializers.SerializerMethodField()
 
     class Meta:
         model = APIKey
-        fields = ['id', 'name', 'key', 'user', 'created_at', 'expires_at', 'is_active']
-        read_only_fields = ['key', 'created_at'] # Key is generated on save, created_at is auto_now_add
\ No newline at end of file
+        fields = ['id', 'name', 'key', 'prefix', 'user', 'created_at', 'expires_at', 'is_active']
+        read_only_fields = ['prefix', 'created_at'] # Key is generated on save, created_at is auto_now_add
+
+    def get_key(self, obj):
+        return obj.raw_key or obj.key_preview
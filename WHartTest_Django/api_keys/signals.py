@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import validated_keys
+from .models import APIKey
+
+
+@receiver([post_save, post_delete], sender=APIKey)
+def invalidate_api_key(sender, instance, **kwargs):
+    """Drops a revoked, expired or deleted key from the validated key cache."""
+    validated_keys.invalidate(instance.key_hash)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_api_keys(sender, instance, **kwargs):
+    """Cached keys carry their user, so refresh them when the user changes."""
+    validated_keys.invalidate_user(instance.pk)
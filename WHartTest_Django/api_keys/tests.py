@@ -1,3 +1,105 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .authentication import APIKeyAuthentication
+from .cache import ValidatedKeyCache, validated_keys
+from .hashing import hash_api_key
+from .models import APIKey
+
+
+class APIKeyAuthenticationTests(TestCase):
+    def setUp(self):
+        validated_keys.clear()
+        self.user = User.objects.create_user(username='agent', password='password')
+        self.api_key = APIKey.objects.create(user=self.user, name='MCP Key')
+        self.raw_key = self.api_key.raw_key
+        self.factory = APIRequestFactory()
+
+    def _authenticate(self, raw_key=None):
+        request = self.factory.get('/', HTTP_X_API_KEY=raw_key or self.raw_key)
+        return APIKeyAuthentication().authenticate(request)
+
+    def test_only_digest_stored(self):
+        stored = APIKey.objects.get(pk=self.api_key.pk)
+        self.assertIsNone(stored.raw_key)
+        self.assertEqual(stored.key_hash, hash_api_key(self.raw_key))
+        self.assertEqual(stored.prefix, self.raw_key[:8])
+        self.assertNotIn(self.raw_key, [str(v) for v in APIKey.objects.values_list(flat=False).get()])
+
+    def test_validated_key_served_from_cache(self):
+        with self.assertNumQueries(1):
+            user, api_key = self._authenticate()
+        self.assertEqual((user, api_key), (self.user, self.api_key))
+
+        with self.assertNumQueries(0):
+            user, _ = self._authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+
+        # Per-request state on the returned user must not leak into the cache
+        user._perm_cache = {'leaked'}
+        cached_user, _ = self._authenticate()
+        self.assertFalse(hasattr(cached_user, '_perm_cache'))
+
+    def test_revocation_invalidates_cache(self):
+        self._authenticate()
+        self.api_key.is_active = False
+        self.api_key.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+    def test_revocation_in_another_process_rejects_cached_key(self):
+        """Another process only shares the Django cache: its revoke must still reach our cached entry."""
+        self._authenticate()
+        other_process = ValidatedKeyCache()
+
+        # The other process revokes the key; no signal fires in this process
+        APIKey.objects.filter(pk=self.api_key.pk).update(is_active=False)
+        other_process.invalidate(self.api_key.key_hash)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+        # Deactivating the user elsewhere also drops keys cached here
+        other_key = APIKey.objects.create(user=self.user, name='Skill Key')
+        self._authenticate(other_key.raw_key)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        other_process.invalidate_user(self.user.pk)
+        with self.assertNumQueries(1):
+            user, _ = self._authenticate(other_key.raw_key)
+        self.assertFalse(user.is_active)
+
+    def test_expired_cached_key_rejected(self):
+        self._authenticate()
+        cached = validated_keys._entries[self.api_key.key_hash][0]
+        cached.expires_at = timezone.now() - timedelta(seconds=1)
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+        self.assertNotIn(self.api_key.key_hash, validated_keys._entries)
+
+    def test_invalid_key_rejected(self):
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate('not-a-key')
+
+    @override_settings(API_KEY_CACHE_SIZE=1)
+    def test_cache_evicts_least_recently_used(self):
+        other = APIKey.objects.create(user=self.user, name='Skill Key')
+        self._authenticate()
+        self._authenticate(other.raw_key)
+        self.assertEqual(list(validated_keys._entries), [other.key_hash])
+
+    def test_raw_key_returned_only_on_create(self):
+        self.user.is_superuser = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        created = client.post('/api/api-keys/', {'name': 'New Key'}, format='json').json()['data']
+        raw_key = created['key']
+        self.assertEqual(APIKey.objects.get(pk=created['id']).key_hash, hash_api_key(raw_key))
+
+        listed = client.get(f"/api/api-keys/{created['id']}/").json()['data']
+        self.assertEqual(listed['key'], f'{raw_key[:8]}...')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 10:17
+
+from django.db import migrations, models
+
+from wharttest_django.search import create_search_index, drop_search_index, rebuild_search_index
+
+
+def build_search_index(apps, schema_editor):
+    model = apps.get_model('knowledge', 'Document')
+    create_search_index(schema_editor, model)
+    rebuild_search_index(model, ('title', 'content'), using=schema_editor.connection.alias)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor, apps.get_model('knowledge', 'Document'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0013_alter_knowledgeglobalconfig_api_base_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_tokens',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='检索词元'),
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+    ]
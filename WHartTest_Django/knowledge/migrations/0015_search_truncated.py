@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+from wharttest_django.search import rebuild_search_index
+
+
+SEARCH_FIELDS = {
+    'document': ('title', 'content'),
+}
+
+
+def mark_truncated(apps, schema_editor):
+    # 只有词元数达到上限的记录可能被截断，重新生成它们的词元以写入 search_truncated
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('knowledge', model_name)
+        rebuild_search_index(model, fields, using=schema_editor.connection.alias, only_full=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0014_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='检索词元已截断'),
+        ),
+        migrations.RunPython(mark_truncated, migrations.RunPython.noop),
+    ]
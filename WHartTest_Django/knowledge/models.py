@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from projects.models import Project
+from wharttest_django.search import FullTextSearchMixin
 import uuid
 import os
 
@@ -160,10 +161,12 @@ def document_upload_path(instance, filename):
     return f'knowledge_bases/{instance.knowledge_base.id}/documents/{filename}'
 
 
-class Document(models.Model):
+class Document(FullTextSearchMixin):
     """
     文档模型，支持多种文档类型
     """
+    SEARCH_FIELDS = ('title', 'content')
+
     DOCUMENT_TYPES = [
         ('pdf', 'PDF'),
         ('docx', 'Word文档'),
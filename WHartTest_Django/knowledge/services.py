@@ -5,6 +5,8 @@
 import os
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
 from typing import List, Dict, Any
 import nltk
 from django.conf import settings
@@ -1039,9 +1041,14 @@ class VectorStoreManager:
         """获取 Qdrant 服务地址"""
         return os.environ.get('QDRANT_URL', 'http://localhost:8918')
 
+    @staticmethod
+    def collection_name_for(knowledge_base_id) -> str:
+        """知识库对应的 Qdrant 集合名称"""
+        return f"kb_{knowledge_base_id}"
+
     def _get_collection_name(self) -> str:
         """获取集合名称"""
-        return f"kb_{self.knowledge_base.id}"
+        return self.collection_name_for(self.knowledge_base.id)
 
     @property
     def qdrant_client(self) -> QdrantClient:
@@ -1091,7 +1098,7 @@ class VectorStoreManager:
             try:
                 qdrant_url = os.environ.get('QDRANT_URL', 'http://localhost:8918')
                 client = QdrantClient(url=qdrant_url)
-                collection_name = f"kb_{knowledge_base_id}"
+                collection_name = cls.collection_name_for(knowledge_base_id)
                 if client.collection_exists(collection_name):
                     client.delete_collection(collection_name)
                     logger.info(f"已删除 Qdrant 集合: {collection_name}")
@@ -1312,51 +1319,58 @@ class VectorStoreManager:
             logger.error(f"稠密向量搜索失败: {e}")
             raise
 
-    def _hybrid_similarity_search(self, query: str, k: int, score_threshold: float) -> List[Dict[str, Any]]:
-        """混合检索（RRF 融合稠密+稀疏 + Reranker 精排）"""
-        try:
-            collection_name = self._get_collection_name()
-            # Reranker 需要更多候选，增加召回量
-            reranker_enabled = self._get_reranker_url() is not None
-            per_source_limit = max(k * 5, 20) if reranker_enabled else max(k * 3, 10)
-
-            # 计算稠密向量
-            dense_vector = self.embeddings.embed_query(query)
-
-            # 计算稀疏向量
-            sparse_query = self.sparse_encoder.encode_query(query)
-
-            # 稠密向量检索
-            dense_results = self.qdrant_client.search(
-                collection_name=collection_name,
-                query_vector=NamedVector(
-                    name=self.DENSE_VECTOR_NAME,
-                    vector=dense_vector,
-                ),
-                limit=per_source_limit,
+    def candidate_limits(self, k: int) -> tuple:
+        """每路检索的召回量与 RRF 融合后保留的候选数（Reranker 需要更多候选）"""
+        if self._get_reranker_url() is not None:
+            return max(k * 5, 20), k * 3
+        return max(k * 3, 10), k
+
+    def encode_query(self, query: str) -> tuple:
+        """计算查询的稠密向量和稀疏向量（无稀疏编码器时稀疏向量为 None）"""
+        dense_vector = self.embeddings.embed_query(query)
+        sparse_query = self.sparse_encoder.encode_query(query) if self.sparse_encoder else None
+        return dense_vector, sparse_query
+
+    def search_candidates(self, collection_name: str, dense_vector, sparse_query, limit: int) -> tuple:
+        """在一次批量请求中取回稠密和稀疏候选，返回 (dense_results, sparse_results)"""
+        requests = [
+            models.SearchRequest(
+                vector=NamedVector(name=self.DENSE_VECTOR_NAME, vector=dense_vector),
+                limit=limit,
                 with_payload=True,
             )
-
-            # 稀疏向量检索
-            sparse_results = []
-            if sparse_query:
-                sparse_results = self.qdrant_client.search(
-                    collection_name=collection_name,
-                    query_vector=NamedSparseVector(
+        ]
+        if sparse_query:
+            requests.append(
+                models.SearchRequest(
+                    vector=NamedSparseVector(
                         name=self.SPARSE_VECTOR_NAME,
                         vector=SparseVector(
                             indices=sparse_query.indices.tolist(),
                             values=sparse_query.values.tolist(),
                         ),
                     ),
-                    limit=per_source_limit,
+                    limit=limit,
                     with_payload=True,
                 )
+            )
+        results = self.qdrant_client.search_batch(collection_name=collection_name, requests=requests)
+        return results[0], (results[1] if len(results) > 1 else [])
+
+    def _hybrid_similarity_search(self, query: str, k: int, score_threshold: float) -> List[Dict[str, Any]]:
+        """混合检索（RRF 融合稠密+稀疏 + Reranker 精排）"""
+        try:
+            reranker_enabled = self._get_reranker_url() is not None
+            per_source_limit, fusion_limit = self.candidate_limits(k)
+
+            dense_vector, sparse_query = self.encode_query(query)
+            dense_results, sparse_results = self.search_candidates(
+                self._get_collection_name(), dense_vector, sparse_query, per_source_limit
+            )
 
             logger.info(f"🔍 稠密候选: {len(dense_results)}, 稀疏候选: {len(sparse_results)}")
 
             # RRF 融合（取更多候选用于 Reranker）
-            fusion_limit = k * 3 if reranker_enabled else k
             fused_results = self._rrf_fusion(dense_results, sparse_results, fusion_limit)
 
             # Reranker 精排（仅 Xinference 支持）
@@ -1526,6 +1540,95 @@ class VectorStoreManager:
             raise
 
 
+class MultiKnowledgeBaseSearch:
+    """
+    多知识库联合检索
+
+    所有知识库共用全局嵌入配置，因此查询只编码一次（稠密+稀疏）；各知识库集合的候选并发检索
+    （每个集合一次批量请求），耗时取决于最慢的一个集合，而不是随知识库数量线性增长。
+
+    全局合并：各集合的 RRF 分数按集合内名次计算（每个集合的第一名都约为 1.0），不能跨集合比较。
+    这里把所有集合的稠密候选按余弦相似度、稀疏候选按稀疏分数分别合并成两个全局排名，
+    再对这两个排名做一次 RRF，最后统一做一次 Reranker 精排。
+
+    配置项：
+    - KNOWLEDGE_SEARCH_MAX_WORKERS: 并发检索的最大线程数（默认 8）
+    """
+
+    def __init__(self, knowledge_bases):
+        self.knowledge_bases = list(knowledge_bases)
+        # 嵌入模型、稀疏编码器、Reranker 配置和 Qdrant 客户端对所有知识库相同，复用一个管理器
+        self.manager = VectorStoreManager(self.knowledge_bases[0]) if self.knowledge_bases else None
+
+    def search(self, query: str, k: int = 5, score_threshold: float = 0.1) -> List[Dict[str, Any]]:
+        """
+        在所有知识库中检索，返回格式与 VectorStoreManager.similarity_search 相同，
+        metadata 中附带 knowledge_base_id / knowledge_base_name
+
+        所有知识库都检索失败时抛出最后一个异常
+        """
+        if not self.manager:
+            return []
+        manager = self.manager
+        per_source_limit, fusion_limit = manager.candidate_limits(k)
+        dense_vector, sparse_query = manager.encode_query(query)
+
+        def search_one(kb):
+            dense_results, sparse_results = manager.search_candidates(
+                manager.collection_name_for(kb.id), dense_vector, sparse_query, per_source_limit
+            )
+            logger.info(f"    └─ {kb.name}: 稠密候选 {len(dense_results)}, 稀疏候选 {len(sparse_results)}")
+            return [self._tag(kb, point) for point in dense_results], [self._tag(kb, point) for point in sparse_results]
+
+        max_workers = max(1, min(len(self.knowledge_bases), getattr(settings, 'KNOWLEDGE_SEARCH_MAX_WORKERS', 8)))
+        dense_candidates, sparse_candidates, last_error, failures = [], [], None, 0
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='kb-search') as executor:
+            futures = {executor.submit(search_one, kb): kb for kb in self.knowledge_bases}
+            for future in as_completed(futures):
+                try:
+                    dense_results, sparse_results = future.result()
+                except Exception as e:
+                    failures += 1
+                    last_error = e
+                    logger.error(f"    └─ {futures[future].name}: 搜索失败 {e}")
+                    continue
+                dense_candidates.extend(dense_results)
+                sparse_candidates.extend(sparse_results)
+        if failures == len(self.knowledge_bases) and last_error is not None:
+            raise last_error
+
+        # 同一嵌入模型的余弦相似度、同一稀疏编码器的分数跨集合可比，先按原始分数排出全局名次再融合
+        dense_candidates.sort(key=lambda point: point.score, reverse=True)
+        sparse_candidates.sort(key=lambda point: point.score, reverse=True)
+        if manager.sparse_encoder:
+            candidates = manager._rrf_fusion(dense_candidates, sparse_candidates, fusion_limit)
+        else:
+            candidates = [
+                {
+                    "id": point.id,
+                    "payload": point.payload,
+                    "score": point.score,
+                    "labels": {"dense": point.score},
+                    "original_scores": {"dense": point.score},
+                }
+                for point in dense_candidates[:fusion_limit]
+            ]
+        if manager._get_reranker_url() is not None and candidates:
+            candidates = manager._rerank(query, candidates, k)
+        else:
+            candidates = candidates[:k]
+        return manager._format_fused_results(candidates, score_threshold)
+
+    @staticmethod
+    def _tag(kb, point):
+        """候选附带所属知识库；不同集合的点 ID 可能重复，加上知识库 ID 前缀"""
+        return SimpleNamespace(
+            id=f"{kb.id}:{point.id}",
+            score=point.score,
+            payload={**(point.payload or {}), "knowledge_base_id": kb.id, "knowledge_base_name": kb.name},
+        )
+
+
 class KnowledgeBaseService:
     """知识库服务"""
 
@@ -12,6 +12,7 @@ from django.db import transaction
 from django.db import models
 from django.utils import timezone
 from wharttest_django.viewsets import BaseModelViewSet
+from wharttest_django.search import FullTextSearchFilter, RankedOrderingFilter, full_text_search
 from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig
 from .serializers import (
     KnowledgeBaseSerializer, DocumentUploadSerializer, DocumentSerializer,
@@ -168,17 +169,13 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
         # 构建查询
         documents = knowledge_base.documents.filter(status=status)
 
-        if search:
-            documents = documents.filter(
-                models.Q(title__icontains=search) |
-                models.Q(content__icontains=search)
-            )
-
         if document_type:
             documents = documents.filter(document_type=document_type)
 
-        # 排序
+        # 排序：有检索词时按相关度
         documents = documents.order_by('-uploaded_at')
+        if search:
+            documents = full_text_search(documents, search)
 
         # 分页
         total_count = documents.count()
@@ -368,7 +365,7 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
 class DocumentViewSet(BaseModelViewSet):
     """文档视图集"""
     queryset = Document.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_fields = ['knowledge_base', 'document_type', 'status']
     search_fields = ['title', 'content']
     ordering_fields = ['uploaded_at', 'processed_at', 'title']
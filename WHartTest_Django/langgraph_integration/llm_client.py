@@ -0,0 +1,236 @@
+"""
+LLM HTTP 客户端与限流
+
+所有 ChatOpenAI 实例共享进程级 HTTP 连接池，请求发出前经过按端点划分的令牌桶限流：
+- 连接池：同步调用共用一个 httpx.Client；异步调用按事件循环各用一个 httpx.AsyncClient
+  （连接绑定在创建它的事件循环上，Celery 中 async_to_sync 每次都会新建事件循环），
+  事件循环关闭时（asyncio.run / async_to_sync 结束前的 shutdown_asyncgens）随之关闭对应的客户端
+- 限流：同一端点（scheme://host:port）的所有会话共用一个令牌桶，收到 429 时按 Retry-After 暂停该端点，
+  避免各会话各自重试撞上服务商的速率限制
+- 重试：retry_delay() 计算带抖动的指数退避，服务端返回 Retry-After 时以其为准
+
+配置项：
+- LLM_HTTP_MAX_CONNECTIONS: 连接池最大连接数（默认 100）
+- LLM_HTTP_MAX_KEEPALIVE: 保持的空闲连接数（默认 20）
+- LLM_RATE_LIMIT_RPM: 每个端点每分钟请求数上限（默认 0，不限流）
+- LLM_ENDPOINT_RATE_LIMITS: 按主机名覆盖每分钟请求数，如 {'api.openai.com': 500}
+- LLM_RETRY_BASE_DELAY / LLM_RETRY_MAX_DELAY: 退避基数与上限（秒，默认 1 / 30）
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+import openai
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶（线程安全，可同时用于同步和异步调用方）"""
+
+    def __init__(self, rate_per_minute: float, burst: float = None):
+        self.rate = max(float(rate_per_minute or 0), 0.0) / 60.0  # 每秒补充的令牌数
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, 0.0)
+            if self.rate > 0:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """暂停发放令牌（服务端返回 429 时使用）"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def endpoint_limiter(url) -> TokenBucket:
+    """获取端点共享的令牌桶"""
+    url = httpx.URL(str(url))
+    key = f'{url.scheme}://{url.host}:{url.port or ""}'
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                overrides = getattr(settings, 'LLM_ENDPOINT_RATE_LIMITS', {}) or {}
+                rpm = overrides.get(url.host, getattr(settings, 'LLM_RATE_LIMIT_RPM', 0))
+                bucket = _buckets[key] = TokenBucket(rpm)
+    return bucket
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """解析 Retry-After / retry-after-ms 响应头"""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _note_rate_limited(request: httpx.Request, response: httpx.Response):
+    if response.status_code == 429:
+        seconds = retry_after_seconds(response.headers)
+        if seconds:
+            logger.warning(f"LLM 端点 {request.url.host} 限流，暂停 {seconds:.1f} 秒")
+            endpoint_limiter(request.url).pause(seconds)
+
+
+# 可重试的错误：连接错误、429 和 5xx
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.RemoteProtocolError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def retry_delay(attempt: int, error: Exception = None) -> float:
+    """
+    第 attempt 次（从 0 开始）失败后的等待秒数
+
+    服务端给出 Retry-After 时以其为准，否则为带抖动的指数退避
+    """
+    response = getattr(error, 'response', None)
+    seconds = retry_after_seconds(getattr(response, 'headers', None))
+    if seconds is not None:
+        return seconds
+    base = float(getattr(settings, 'LLM_RETRY_BASE_DELAY', 1))
+    cap = min(float(getattr(settings, 'LLM_RETRY_MAX_DELAY', 30)), base * (2 ** attempt))
+    return cap / 2 + random.uniform(0, cap / 2)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=int(getattr(settings, 'LLM_HTTP_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(getattr(settings, 'LLM_HTTP_MAX_KEEPALIVE', 20)),
+    )
+
+
+class _SharedClient(httpx.Client):
+    """进程共享的同步客户端，发送前经过端点限流"""
+
+    def send(self, request, **kwargs):
+        endpoint_limiter(request.url).acquire()
+        response = super().send(request, **kwargs)
+        _note_rate_limited(request, response)
+        return response
+
+
+class _SharedAsyncClient(httpx.AsyncClient):
+    """进程共享的异步客户端：按事件循环复用连接池，发送前经过端点限流"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # 事件循环 -> (客户端, 关闭钩子)
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._loop_clients_lock = threading.Lock()
+
+    async def _close_on_loop_shutdown(self, client):
+        """
+        在事件循环内首次迭代后挂起的异步生成器：循环关闭前 shutdown_asyncgens 会在该循环上
+        执行 finally，关闭客户端的连接并移除记录（未调用 shutdown_asyncgens 就关闭的循环不会触发）
+        """
+        try:
+            yield
+        finally:
+            loop = asyncio.get_running_loop()
+            with self._loop_clients_lock:
+                self._loop_clients.pop(loop, None)
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug(f"关闭事件循环的 LLM 客户端失败: {e}")
+
+    async def _client_for_loop(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            # 同一事件循环内检查与登记之间没有 await，不会重复创建
+            client = httpx.AsyncClient(limits=_limits())
+            closer = self._close_on_loop_shutdown(client)
+            with self._loop_clients_lock:
+                self._loop_clients[loop] = entry = (client, closer)
+            await closer.__anext__()
+        return entry[0]
+
+    async def send(self, request, **kwargs):
+        await endpoint_limiter(request.url).acquire_async()
+        response = await (await self._client_for_loop()).send(request, **kwargs)
+        _note_rate_limited(request, response)
+        return response
+
+
+_clients = None
+_clients_lock = threading.Lock()
+
+
+def shared_http_clients() -> dict:
+    """返回可直接传给 ChatOpenAI 的 http_client / http_async_client"""
+    global _clients
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                _clients = {
+                    'http_client': _SharedClient(limits=_limits()),
+                    'http_async_client': _SharedAsyncClient(),
+                }
+    return dict(_clients)
+
+
+def reset_llm_clients():
+    """丢弃共享客户端和令牌桶（配置变更或测试时使用）"""
+    global _clients
+    with _clients_lock:
+        _clients = None
+    with _buckets_lock:
+        _buckets.clear()
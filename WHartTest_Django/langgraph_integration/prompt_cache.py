@@ -0,0 +1,150 @@
+"""
+系统提示词编译缓存
+
+每轮对话/Agent Loop 都需要拼装同一份系统提示词：查询 UserPrompt、LLMConfig，
+再注入项目凭据（ProjectCredential）和 Skills 元数据。这里把拼装结果连同 Token 数
+一起缓存在进程内，键为 (user_id, prompt_id, project_id)。
+
+- 失效：UserPrompt / LLMConfig / ProjectCredential / Skill 的保存和删除信号（见 signals.py）
+- 跨进程：失效时同时更新 Django 缓存中的版本戳（用户 / 项目 / 全局），条目记录编译时的版本戳，
+  读取时版本不一致即视为失效。配置了 REDIS_URL 时默认缓存为 Redis，其他 Web/Celery 进程立即生效；
+  未配置时版本戳只在本进程可见，其他进程最多在 TTL 内仍使用旧提示词
+- 兜底：条目带 TTL，覆盖 queryset.update() 等不触发信号的批量写入
+- 字节稳定：凭据和 Skills 按固定字段排序拼装，同样的配置总是得到同样的提示词，
+  便于上游模型服务的 Prompt Caching 命中
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """编译后的系统提示词"""
+    content: Optional[str]  # 已注入项目上下文的提示词内容
+    source: str  # 'user_specified' / 'user_default' / 'global' / 'none'
+    token_count: int  # content 的 Token 数（按编译时的激活模型计算）
+    model_name: str  # 计算 Token 时使用的模型名称
+
+
+class SystemPromptCache:
+    """进程内的系统提示词编译缓存（LRU + TTL），通过共享缓存中的版本戳跨进程失效"""
+
+    TTL_SECONDS = 300  # 5分钟兜底过期
+    MAX_ENTRIES = 1024
+    VERSION_PREFIX = 'system_prompt_version'
+
+    _entries: "OrderedDict[Tuple, Tuple[float, Optional[Tuple], CompiledPrompt]]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def make_key(user_id, prompt_id=None, project_id=None) -> Tuple:
+        """构建缓存键，统一转为字符串以兼容 int/str 形式的 ID"""
+        return (
+            str(user_id),
+            str(prompt_id) if prompt_id else '',
+            str(project_id) if project_id else '',
+        )
+
+    @classmethod
+    def _version_keys(cls, key: Tuple) -> list:
+        user_id, _, project_id = key
+        keys = [f'{cls.VERSION_PREFIX}:global', f'{cls.VERSION_PREFIX}:user:{user_id}']
+        if project_id:
+            keys.append(f'{cls.VERSION_PREFIX}:project:{project_id}')
+        return keys
+
+    @classmethod
+    def versions(cls, key: Tuple) -> Optional[Tuple]:
+        """条目相关的版本戳（一次缓存读取），缓存不可用时返回 None（不使用也不写入本地缓存）"""
+        keys = cls._version_keys(key)
+        try:
+            values = cache.get_many(keys)
+        except Exception as e:
+            logger.warning(f"读取系统提示词缓存版本失败: {e}")
+            return None
+        return tuple(values.get(k) for k in keys)
+
+    @classmethod
+    async def aversions(cls, key: Tuple) -> Optional[Tuple]:
+        """versions 的异步版本，供事件循环中的调用方使用（不阻塞事件循环）"""
+        keys = cls._version_keys(key)
+        try:
+            values = await cache.aget_many(keys)
+        except Exception as e:
+            logger.warning(f"读取系统提示词缓存版本失败: {e}")
+            return None
+        return tuple(values.get(k) for k in keys)
+
+    @classmethod
+    def _bump(cls, version_key: str) -> None:
+        # 版本戳的有效期需长于条目 TTL：过期后回到 None，TTL 内缓存的旧条目会重新匹配
+        try:
+            cache.set(f'{cls.VERSION_PREFIX}:{version_key}', uuid.uuid4().hex, cls.TTL_SECONDS * 2)
+        except Exception as e:
+            logger.warning(f"更新系统提示词缓存版本失败，其他进程最多在 {cls.TTL_SECONDS} 秒内使用旧提示词: {e}")
+
+    @classmethod
+    def get(cls, key: Tuple, versions: Optional[Tuple] = None) -> Optional[CompiledPrompt]:
+        """versions 为编译前读取的版本戳，未传入时在此读取"""
+        if versions is None:
+            versions = cls.versions(key)
+            if versions is None:
+                return None
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            cached_at, cached_versions, compiled = entry
+            if time.monotonic() - cached_at > cls.TTL_SECONDS or cached_versions != versions:
+                cls._entries.pop(key, None)
+                return None
+            cls._entries.move_to_end(key)
+            return compiled
+
+    @classmethod
+    def set(cls, key: Tuple, compiled: CompiledPrompt, versions: Optional[Tuple] = None) -> None:
+        """
+        versions 应为编译前读取的版本戳：编译期间发生的变更会更新版本，
+        这次编译的结果在下次读取时即被视为过期
+        """
+        if versions is None:
+            return
+        with cls._lock:
+            cls._entries[key] = (time.monotonic(), versions, compiled)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > cls.MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def invalidate_user(cls, user_id) -> None:
+        """清除某个用户的所有缓存条目（用户提示词变更）"""
+        user_key = str(user_id)
+        with cls._lock:
+            for key in [k for k in cls._entries if k[0] == user_key]:
+                cls._entries.pop(key, None)
+        cls._bump(f'user:{user_key}')
+
+    @classmethod
+    def invalidate_project(cls, project_id) -> None:
+        """清除某个项目的所有缓存条目（项目凭据变更）"""
+        project_key = str(project_id)
+        with cls._lock:
+            for key in [k for k in cls._entries if k[2] == project_key]:
+                cls._entries.pop(key, None)
+        cls._bump(f'project:{project_key}')
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空全部缓存（全局 LLM 配置或 Skills 变更）"""
+        with cls._lock:
+            cls._entries.clear()
+        cls._bump('global')
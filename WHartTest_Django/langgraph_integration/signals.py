@@ -0,0 +1,35 @@
+"""
+系统提示词缓存失效信号
+提示词、LLM 配置、项目凭据、Skills 变更时清理编译缓存
+"""
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .prompt_cache import SystemPromptCache
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender='prompts.UserPrompt')
+@receiver(post_delete, sender='prompts.UserPrompt')
+def invalidate_user_prompt_cache(sender, instance, **kwargs):
+    """用户提示词变更：只影响该用户"""
+    SystemPromptCache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender='projects.ProjectCredential')
+@receiver(post_delete, sender='projects.ProjectCredential')
+def invalidate_project_prompt_cache(sender, instance, **kwargs):
+    """项目凭据变更：只影响该项目"""
+    SystemPromptCache.invalidate_project(instance.project_id)
+
+
+@receiver(post_save, sender='langgraph_integration.LLMConfig')
+@receiver(post_delete, sender='langgraph_integration.LLMConfig')
+@receiver(post_save, sender='skills.Skill')
+@receiver(post_delete, sender='skills.Skill')
+def invalidate_all_prompt_cache(sender, instance, **kwargs):
+    """全局 LLM 配置或 Skills 变更：影响所有用户"""
+    SystemPromptCache.clear()
+    logger.debug(f"System prompt cache cleared by {sender.__name__} change")
@@ -1,3 +1,143 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from projects.models import Project, ProjectCredential
+from prompts.models import UserPrompt
+from .models import LLMConfig
+from .prompt_cache import SystemPromptCache
+from .views import get_compiled_system_prompt_async
+
+
+class CompiledSystemPromptCacheTests(TestCase):
+    """系统提示词编译缓存测试"""
+
+    def setUp(self):
+        SystemPromptCache.clear()
+        self.user = User.objects.create_user(username='promptcache', password='testpass123')
+        UserPrompt.objects.filter(user=self.user).delete()
+        self.project = Project.objects.create(name='PromptCacheProject', creator=self.user)
+        LLMConfig.objects.create(
+            config_name='cache-test', name='gpt-4o', api_url='http://localhost:1/v1',
+            system_prompt='全局提示词 {credentials_info}', is_active=True,
+        )
+        ProjectCredential.objects.create(project=self.project, username='admin', user_role='管理员')
+
+    def compile(self, prompt_id=None):
+        return async_to_sync(get_compiled_system_prompt_async)(self.user, prompt_id, self.project)
+
+    def test_cached_prompt_issues_no_queries(self):
+        first = self.compile()
+        self.assertEqual(first.source, 'global')
+        self.assertIn('admin', first.content)
+        self.assertGreater(first.token_count, 0)
+        with self.assertNumQueries(0):
+            second = self.compile()
+        self.assertEqual(first, second)
+
+    def test_user_prompt_save_invalidates(self):
+        self.compile()
+        UserPrompt.objects.create(user=self.user, name='默认', content='用户默认提示词', is_default=True)
+        compiled = self.compile()
+        self.assertEqual(compiled.source, 'user_default')
+        self.assertEqual(compiled.content, '用户默认提示词')
+
+    def test_credential_save_invalidates(self):
+        self.compile()
+        ProjectCredential.objects.create(project=self.project, username='tester', user_role='测试')
+        self.assertIn('tester', self.compile().content)
+
+    def test_invalidation_from_another_process(self):
+        """其他进程的失效只更新共享缓存中的版本戳，本进程的条目在下次读取时被视为过期"""
+        self.compile()
+        local_entries = SystemPromptCache._entries.copy()
+        UserPrompt.objects.create(user=self.user, name='默认', content='用户默认提示词', is_default=True)
+        # 模拟本进程未收到保存信号：条目仍在
+        SystemPromptCache._entries.update(local_entries)
+        self.assertEqual(self.compile().source, 'user_default')
+
+    def test_async_path_reads_versions_without_sync_cache_calls(self):
+        from unittest.mock import patch
+        from django.core.cache import cache
+
+        self.compile()
+        with patch.object(cache, 'get_many', side_effect=AssertionError('sync cache call in async path')):
+            self.assertEqual(self.compile().source, 'global')
+
+    def test_compiled_prompt_is_byte_stable(self):
+        ProjectCredential.objects.create(project=self.project, username='auditor', user_role='审核员')
+        first = self.compile().content
+        SystemPromptCache.clear()
+        self.assertEqual(first.encode('utf-8'), self.compile().content.encode('utf-8'))
+
+
+class LLMClientTests(TestCase):
+    """测试 LLM 共享客户端的限流与退避"""
+
+    def setUp(self):
+        from .llm_client import reset_llm_clients
+
+        reset_llm_clients()
+        self.addCleanup(reset_llm_clients)
+
+    def test_token_bucket_spaces_requests_after_burst(self):
+        from .llm_client import TokenBucket
+
+        bucket = TokenBucket(rate_per_minute=600)  # 每秒 10 个
+        waits = [bucket._reserve() for _ in range(12)]
+        self.assertEqual(waits[:10], [0.0] * 10)
+        self.assertAlmostEqual(waits[10], 0.1, delta=0.02)
+        self.assertAlmostEqual(waits[11], 0.2, delta=0.02)
+        self.assertEqual(TokenBucket(0)._reserve(), 0.0)
+
+    def test_retry_delay_honours_retry_after(self):
+        import httpx
+        import openai
+        from .llm_client import retry_after_seconds, retry_delay
+
+        request = httpx.Request('POST', 'https://llm.example.com/v1/chat/completions')
+        response = httpx.Response(429, headers={'retry-after': '7'}, request=request)
+        error = openai.RateLimitError('rate limited', response=response, body=None)
+        self.assertEqual(retry_delay(0, error), 7.0)
+        self.assertEqual(retry_after_seconds({'retry-after-ms': '1500'}), 1.5)
+        self.assertIsNone(retry_after_seconds({}))
+
+        with self.settings(LLM_RETRY_BASE_DELAY=1, LLM_RETRY_MAX_DELAY=30):
+            delays = [retry_delay(2) for _ in range(20)]
+        self.assertTrue(all(2 <= d <= 4 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_rate_limited_response_pauses_endpoint(self):
+        import httpx
+        from .llm_client import _SharedClient, endpoint_limiter
+
+        with self.settings(LLM_ENDPOINT_RATE_LIMITS={'llm.example.com': 6000}):
+            client = _SharedClient(transport=httpx.MockTransport(
+                lambda request: httpx.Response(429, headers={'retry-after': '5'})
+            ))
+            response = client.get('https://llm.example.com/v1/models')
+        self.assertEqual(response.status_code, 429)
+
+        bucket = endpoint_limiter('https://llm.example.com/v1/chat/completions')
+        self.assertEqual(bucket.rate, 100)
+        self.assertGreater(bucket._reserve(), 4)
+        self.assertEqual(endpoint_limiter('https://other.example.com/')._reserve(), 0.0)
+
+    def test_per_loop_async_client_closed_with_its_loop(self):
+        import asyncio
+        from .llm_client import _SharedAsyncClient
+
+        shared = _SharedAsyncClient()
+        clients = []
+
+        async def use():
+            clients.append(await shared._client_for_loop())
+            clients.append(await shared._client_for_loop())
+
+        asyncio.run(use())
+        asyncio.run(use())
+
+        self.assertIs(clients[0], clients[1])
+        self.assertIsNot(clients[1], clients[2])
+        self.assertTrue(all(client.is_closed for client in clients))
+        self.assertEqual(len(shared._loop_clients), 0)
@@ -24,7 +24,14 @@ from wharttest_django.permissions import HasModelPermission
 from prompts.models import UserPrompt
 
 # 导入上下文压缩模块
-from orchestrator_integration.context_compression import ConversationCompressor, CompressionSettings
+from orchestrator_integration.context_compression import (
+    ConversationCompressor, CompressionSettings, checkpoint_write_config, schedule_precompute,
+)
+from requirements.context_limits import context_checker
+
+# 系统提示词编译缓存
+from .prompt_cache import CompiledPrompt, SystemPromptCache
+from .llm_client import shared_http_clients
 
 # --- New Imports ---
 from typing import TypedDict, Annotated, List, Optional
@@ -73,7 +80,9 @@ def create_llm_instance(active_config, temperature=0.7):
         "model": model_identifier,
         "temperature": temperature,
         "api_key": active_config.api_key,
-        "base_url": active_config.api_url
+        "base_url": active_config.api_url,
+        # 共享连接池与端点限流
+        **shared_http_clients(),
     }
     llm = ChatOpenAI(**llm_kwargs)
     logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
@@ -395,9 +404,9 @@ async def _format_project_credentials(project):
     try:
         from projects.models import ProjectCredential
         
-        # 获取项目的所有凭据
+        # 获取项目的所有凭据（固定排序，保证生成的提示词字节稳定）
         credentials = await sync_to_async(list)(
-            ProjectCredential.objects.filter(project=project).all()
+            ProjectCredential.objects.filter(project=project).order_by('user_role', 'id')
         )
         
         if not credentials:
@@ -436,9 +445,9 @@ async def _format_project_skills(project):
     try:
         from skills.models import Skill
 
-        # Skills 全局共享，不限制项目
+        # Skills 全局共享，不限制项目（固定排序，保证生成的提示词字节稳定）
         skills = await sync_to_async(list)(
-            Skill.objects.filter(is_active=True).all()
+            Skill.objects.filter(is_active=True).only('name', 'description').order_by('name', 'id')
         )
 
         if not skills:
@@ -488,6 +497,104 @@ async def _inject_project_context(prompt_content: str, project) -> str:
     return prompt_content
 
 
+async def _compile_system_prompt(user, prompt_id=None, project=None):
+    """
+    编译系统提示词（不走缓存）
+
+    用户指定提示词和默认提示词合并为一次查询；全局配置只在需要时查询一次，
+    同时用于回退提示词和 Token 计数的模型名称。
+
+    Returns:
+        tuple: (prompt_content, prompt_source, model_name)
+    """
+    # 1/2. 用户指定的提示词 > 用户默认提示词（一次查询取回两者）
+    prompt_filter = Q(is_default=True)
+    if prompt_id:
+        prompt_filter |= Q(id=prompt_id)
+    candidates = await sync_to_async(list)(
+        UserPrompt.objects.filter(prompt_filter, user=user, is_active=True).order_by('id')
+    )
+
+    selected, source = None, 'none'
+    if prompt_id:
+        selected = next((p for p in candidates if str(p.id) == str(prompt_id)), None)
+        if selected:
+            source = 'user_specified'
+        else:
+            logger.warning(f"Specified prompt {prompt_id} not found for user {user.id}")
+    if not selected:
+        selected = next((p for p in candidates if p.is_default), None)
+        if selected:
+            source = 'user_default'
+
+    active_config = await sync_to_async(
+        lambda: LLMConfig.objects.filter(is_active=True).only('name', 'system_prompt').first()
+    )()
+    model_name = (active_config.name if active_config else None) or "gpt-4o"
+
+    if selected:
+        return await _inject_project_context(selected.content, project), source, model_name
+
+    # 3. 使用全局LLM配置的system_prompt
+    if active_config is None:
+        logger.warning("No active LLM configuration found")
+    elif active_config.system_prompt and active_config.system_prompt.strip():
+        prompt_content = await _inject_project_context(active_config.system_prompt.strip(), project)
+        return prompt_content, 'global', model_name
+
+    # 4. 没有任何提示词
+    return None, 'none', model_name
+
+
+async def get_compiled_system_prompt_async(user, prompt_id=None, project=None):
+    """
+    获取编译后的系统提示词（带缓存）
+    优先级：用户指定的提示词 > 用户默认提示词 > 全局LLM配置的system_prompt
+
+    结果按 (user, prompt_id, project) 缓存，并随 UserPrompt / LLMConfig /
+    ProjectCredential / Skill 的变更信号失效（其他进程通过共享缓存中的版本戳感知），Token 数与提示词一起缓存。
+
+    Returns:
+        CompiledPrompt: 提示词内容、来源、Token 数
+    """
+    cache_key = SystemPromptCache.make_key(
+        user.id, prompt_id, project.id if project else None
+    )
+    versions = await SystemPromptCache.aversions(cache_key)
+    compiled = SystemPromptCache.get(cache_key, versions)
+    if compiled is not None:
+        return compiled
+
+    try:
+        prompt_content, prompt_source, model_name = await _compile_system_prompt(user, prompt_id, project)
+    except Exception as e:
+        logger.error(f"Error getting effective system prompt: {e}")
+        # 降级到全局配置（不缓存，下次重新编译）
+        try:
+            active_config = await sync_to_async(LLMConfig.objects.get)(is_active=True)
+            if active_config.system_prompt and active_config.system_prompt.strip():
+                return CompiledPrompt(
+                    content=active_config.system_prompt.strip(),
+                    source='global',
+                    token_count=context_checker.count_tokens(
+                        active_config.system_prompt.strip(), active_config.name or "gpt-4o"
+                    ),
+                    model_name=active_config.name or "gpt-4o",
+                )
+        except:
+            pass
+        return CompiledPrompt(content=None, source='none', token_count=0, model_name="gpt-4o")
+
+    compiled = CompiledPrompt(
+        content=prompt_content,
+        source=prompt_source,
+        token_count=context_checker.count_tokens(prompt_content, model_name) if prompt_content else 0,
+        model_name=model_name,
+    )
+    SystemPromptCache.set(cache_key, compiled, versions)
+    return compiled
+
+
 async def get_effective_system_prompt_async(user, prompt_id=None, project=None):
     """
     获取有效的系统提示词（异步版本）
@@ -506,55 +613,8 @@ async def get_effective_system_prompt_async(user, prompt_id=None, project=None):
         prompt_content: 提示词内容（已注入项目上下文）
         prompt_source: 提示词来源 ('user_specified', 'user_default', 'global', 'none')
     """
-    try:
-        # 1. 如果指定了提示词ID，优先使用
-        if prompt_id:
-            try:
-                user_prompt = await sync_to_async(UserPrompt.objects.get)(
-                    id=prompt_id,
-                    user=user,
-                    is_active=True
-                )
-                prompt_content = await _inject_project_context(user_prompt.content, project)
-                return prompt_content, 'user_specified'
-            except UserPrompt.DoesNotExist:
-                logger.warning(f"Specified prompt {prompt_id} not found for user {user.id}")
-
-        # 2. 尝试获取用户的默认提示词
-        try:
-            default_prompt = await sync_to_async(UserPrompt.objects.get)(
-                user=user,
-                is_default=True,
-                is_active=True
-            )
-            if default_prompt:
-                prompt_content = await _inject_project_context(default_prompt.content, project)
-                return prompt_content, 'user_default'
-        except UserPrompt.DoesNotExist:
-            pass
-
-        # 3. 使用全局LLM配置的system_prompt
-        try:
-            active_config = await sync_to_async(LLMConfig.objects.get)(is_active=True)
-            if active_config.system_prompt and active_config.system_prompt.strip():
-                prompt_content = await _inject_project_context(active_config.system_prompt.strip(), project)
-                return prompt_content, 'global'
-        except LLMConfig.DoesNotExist:
-            logger.warning("No active LLM configuration found")
-
-        # 4. 没有任何提示词
-        return None, 'none'
-
-    except Exception as e:
-        logger.error(f"Error getting effective system prompt: {e}")
-        # 降级到全局配置
-        try:
-            active_config = await sync_to_async(LLMConfig.objects.get)(is_active=True)
-            if active_config.system_prompt and active_config.system_prompt.strip():
-                return active_config.system_prompt.strip(), 'global'
-        except:
-            pass
-        return None, 'none'
+    compiled = await get_compiled_system_prompt_async(user, prompt_id, project)
+    return compiled.content, compiled.source
 
 
 class ChatAPIView(APIView):
@@ -1967,7 +2027,8 @@ class ChatStreamAPIView(View):
                 messages_list = []
 
                 # 获取有效的系统提示词（用户提示词优先，并注入项目凭据信息）
-                effective_prompt, prompt_source = await get_effective_system_prompt_async(request.user, prompt_id, project)
+                compiled_prompt = await get_compiled_system_prompt_async(request.user, prompt_id, project)
+                effective_prompt, prompt_source = compiled_prompt.content, compiled_prompt.source
                 logger.info(f"ChatStreamAPIView: Using {prompt_source} prompt: {repr(effective_prompt[:100] if effective_prompt else None)}")
 
                 # 检查当前会话是否已经有系统提示词
@@ -2068,6 +2129,7 @@ class ChatStreamAPIView(View):
 
                 # 上下文检查与压缩
                 context_limit = active_config.context_limit or 128000
+                conversation_compressor = None
                 try:
                     from requirements.context_limits import context_checker
                     
@@ -2088,6 +2150,7 @@ class ChatStreamAPIView(View):
                     existing_metadata = {}
                     summary_text = None
                     summarized_count = 0
+                    pending_summary = None
                     
                     if latest_checkpoint_tuple:
                         latest_checkpoint = latest_checkpoint_tuple.checkpoint or {}
@@ -2096,12 +2159,14 @@ class ChatStreamAPIView(View):
                         compression_state = dict(existing_metadata.get("context_compression") or {})
                         summary_text = compression_state.get("context_summary")
                         summarized_count = compression_state.get("summarized_message_count", 0)
+                        pending_summary = compression_state.get("pending_summary")
                     
-                    # 执行压缩检查
+                    # 执行压缩检查（达到阈值时优先使用上一轮结束后在后台提前生成的摘要）
                     compression_result = await conversation_compressor.prepare(
                         messages=history_messages,
                         summary_text=summary_text,
                         summarized_count=summarized_count,
+                        pending=pending_summary,
                     )
                     history_token_count = compression_result.token_count
                     
@@ -2123,25 +2188,14 @@ class ChatStreamAPIView(View):
                             compression_meta["context_summary"] = compression_result.state_updates["context_summary"]
                         if "summarized_message_count" in compression_result.state_updates:
                             compression_meta["summarized_message_count"] = compression_result.state_updates["summarized_message_count"]
+                        if "pending_summary" in compression_result.state_updates:
+                            compression_meta.pop("pending_summary", None)
                         compression_meta["context_token_count"] = compression_result.state_updates.get("context_token_count", history_token_count)
                         updated_metadata["context_compression"] = compression_meta
                         
                         # 写入更新后的 checkpoint
-                        checkpoint_config = latest_checkpoint_tuple.config.get("configurable", {})
-                        update_config = {
-                            "configurable": {
-                                "thread_id": checkpoint_config.get("thread_id"),
-                                "checkpoint_ns": checkpoint_config.get("checkpoint_ns", ""),
-                            }
-                        }
-                        parent_config = latest_checkpoint_tuple.parent_config
-                        if parent_config:
-                            parent_checkpoint_id = parent_config.get("configurable", {}).get("checkpoint_id")
-                            if parent_checkpoint_id:
-                                update_config["configurable"]["checkpoint_id"] = parent_checkpoint_id
-                        
                         await actual_memory_checkpointer.aput(
-                            update_config,
+                            checkpoint_write_config(latest_checkpoint_tuple),
                             updated_checkpoint,
                             updated_metadata,
                             updated_checkpoint.get("channel_versions", {}),
@@ -2151,7 +2205,10 @@ class ChatStreamAPIView(View):
                     # 计算总 token 数（历史 + 当前消息）
                     total_tokens = history_token_count
                     for msg in messages_list:
-                        if hasattr(msg, 'content') and msg.content:
+                        if isinstance(msg, SystemMessage) and msg.content == effective_prompt:
+                            # 系统提示词的 Token 数已随编译结果缓存
+                            total_tokens += compiled_prompt.token_count
+                        elif hasattr(msg, 'content') and msg.content:
                             content = msg.content if isinstance(msg.content, str) else str(msg.content)
                             total_tokens += context_checker.count_tokens(content, active_config.name or "gpt-4o")
                     
@@ -2252,6 +2309,10 @@ class ChatStreamAPIView(View):
                         'context_token_count': total_tokens,
                         'context_limit': context_limit
                     })
+
+                    # 使用率超过提前压缩阈值时在后台摘要下一块消息，下一轮达到触发阈值时直接使用
+                    if conversation_compressor is not None and conversation_compressor.needs_precompute(total_tokens):
+                        schedule_precompute(conversation_compressor, thread_id)
                 except Exception as e:
                     logger.warning(f"ChatStreamAPIView: Failed to calculate token count: {e}")
 
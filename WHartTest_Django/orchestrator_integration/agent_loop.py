@@ -9,15 +9,21 @@ Agent Loop 编排器
 - AI 自主决策下一步操作
 """
 import asyncio
+import contextlib
 import json
 import logging
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from django.conf import settings
 from django.utils import timezone
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
+from langgraph_integration.llm_client import RETRYABLE_ERRORS, retry_delay
+from . import tool_output_store
+from .agent_persistence import AgentStateWriter
 from .models import AgentTask, AgentStep, AgentBlackboard
+from .tool_progress import current_tool_progress
 from langgraph_integration.models import ChatSession
 
 logger = logging.getLogger(__name__)
@@ -51,11 +57,22 @@ class AgentOrchestrator:
 3. 如果遇到问题无法继续，说明原因
 
 注意：
-- 每次只执行一个操作，执行后会收到结果再决定下一步。
+- 互不依赖的查询（如多次知识库检索、同时读取多个用例或脚本）可以在同一步中一起调用，它们会并行执行；有依赖关系的操作请分步执行，执行后会收到结果再决定下一步。
 - 如果用户目标里已经明确给出了 `项目ID` / `测试用例模块ID`（例如：测试用例模块ID "1"），优先直接使用它，不要为了“确认”而反复调用 `get_modules`。
 - 严禁在没有任何新信息的情况下重复调用同一工具（同名同参数）。如果上一步工具返回已经包含所需信息，请直接进入下一步（如生成用例标题并调用保存工具），或给出无法继续的原因。
 """
 
+    # 工具并发类别：同一步骤内的多个工具调用并发执行
+    # - 只读工具（按名称前缀识别）与其他调用并行
+    # - 有状态工具按通道串行，同一通道内保持模型给出的顺序
+    # - 其余（写入类）工具共用 default 通道，彼此串行但不阻塞只读工具
+    READ_ONLY_TOOL_PREFIXES = ('get_', 'list_', 'search_', 'read_', 'query_', 'fetch_', 'find_')
+    BROWSER_TOOL_PREFIXES = ('browser_',)
+    STATEFUL_TOOL_LANES = {
+        'edit_diagram': 'diagram',
+        'display_diagram': 'diagram',
+    }
+
     def __init__(self, llm, tools=None, max_steps: int = None):
         """
         初始化编排器
@@ -68,6 +85,8 @@ class AgentOrchestrator:
         self.llm = llm
         self.tools = tools or []
         self.max_steps = max_steps or self.DEFAULT_MAX_STEPS
+        # 任务状态批量写回器（task.id -> AgentStateWriter）
+        self._writers: Dict[int, AgentStateWriter] = {}
         
         # 如果有工具，绑定到 LLM
         if self.tools:
@@ -98,6 +117,13 @@ class AgentOrchestrator:
         
         logger.info(f"AgentOrchestrator: 开始执行任务 {task.id}, 目标: {goal[:100]}")
         
+        try:
+            return await self._run_loop(task, blackboard, goal)
+        finally:
+            await self._close_persistence(task)
+    
+    async def _run_loop(self, task: AgentTask, blackboard: AgentBlackboard, goal: str) -> Dict[str, Any]:
+        """执行 Agent Loop 主循环"""
         # 连续工具失败计数器（防止无效重试浪费步数）
         consecutive_tool_failures = 0
         max_consecutive_tool_failures = 3
@@ -228,18 +254,48 @@ class AgentOrchestrator:
                 context_variables={}
             )
         
-        return await create()
+        blackboard = await create()
+        
+        # 后续的任务、Blackboard 和步骤变更通过写回器批量落库
+        writer = AgentStateWriter(task, blackboard)
+        writer.start()
+        self._writers[task.id] = writer
+        return blackboard
     
     async def _save_task(self, task: AgentTask):
-        """保存任务状态"""
+        """保存任务状态（有写回器时登记变更，终态立即刷写）"""
         from asgiref.sync import sync_to_async
         
+        writer = self._writers.get(task.id)
+        if writer is not None:
+            await writer.save_task()
+            return
+        
         @sync_to_async
         def save():
             task.save()
         
         await save()
     
+    async def _save_blackboard(self, blackboard: AgentBlackboard, *fields: str):
+        """保存 Blackboard 指定字段（有写回器时随下次刷写写入）"""
+        from asgiref.sync import sync_to_async
+        
+        writer = self._writers.get(blackboard.task_id)
+        if writer is not None:
+            writer.save_blackboard(*fields)
+            return
+        
+        await sync_to_async(blackboard.save)(update_fields=[*fields, 'updated_at'])
+    
+    async def _close_persistence(self, task: AgentTask) -> Optional[Dict[str, Any]]:
+        """写入剩余变更并释放写回器，返回刷写指标"""
+        writer = self._writers.pop(task.id, None)
+        if writer is None:
+            return None
+        await writer.close()
+        return writer.metrics
+    
     def _build_step_context(self, blackboard: AgentBlackboard, goal: str) -> Dict:
         """
         构建单步执行的上下文（精简版）
@@ -271,7 +327,8 @@ class AgentOrchestrator:
         self,
         task: AgentTask,
         context: Dict,
-        stream_callback: callable = None
+        stream_callback: callable = None,
+        progress_callback: callable = None
     ) -> Dict[str, Any]:
         """
         执行单步
@@ -283,6 +340,8 @@ class AgentOrchestrator:
             context: 步骤上下文
             stream_callback: 流式输出回调，签名: async def callback(text: str)
                             如果提供，则使用流式 LLM 调用
+            progress_callback: 工具进度回调，签名: async def callback(payload: dict)
+                            长时间运行的工具（如 Skill 脚本）通过它上报增量输出
         """
         start_time = time.time()
 
@@ -336,11 +395,23 @@ class AgentOrchestrator:
             
             # 如果有工具调用，执行工具
             if result.get('tool_calls'):
-                tool_results = await self._execute_tools(result['tool_calls'])
+                progress_token = current_tool_progress.set(progress_callback)
+                try:
+                    tool_results = await self._execute_tools(result['tool_calls'])
+                finally:
+                    current_tool_progress.reset(progress_token)
                 result['tool_results'] = tool_results
                 
-                # 生成工具结果摘要
-                result['tool_summary'] = self._summarize_tool_results(tool_results)
+                # 生成工具结果摘要：过长的输出转存，上下文只保留开头和引用
+                result['tool_summary'] = await asyncio.to_thread(self._summarize_tool_results, tool_results)
+                full_summary = self._summarize_tool_results(tool_results, bounded=False)
+                if full_summary != result['tool_summary']:
+                    # 完整结果仍推送给前端（图表等需要完整 JSON），并整体存档到步骤记录
+                    result['tool_output_full'] = full_summary
+                    try:
+                        result['tool_output_ref'] = await asyncio.to_thread(tool_output_store.put, full_summary)
+                    except Exception as e:
+                        logger.error(f"保存步骤完整工具输出失败: {e}", exc_info=True)
                 
                 # 检测是否全部工具调用都失败
                 failures = [r.get('error') for r in tool_results if r.get('error')]
@@ -373,15 +444,12 @@ class AgentOrchestrator:
             messages: 消息列表
             max_retries: 最大重试次数，默认3次
         """
-        import httpx
-        import openai
-
         logger.debug(f"LLM 非流式调用开始: messages_count={len(messages)}, model={getattr(self.llm, 'model_name', getattr(self.llm, 'model', 'unknown'))}")
 
         last_error = None
         for attempt in range(max_retries):
             try:
-                response = await asyncio.to_thread(self.llm_with_tools.invoke, messages)
+                response = await self.llm_with_tools.ainvoke(messages)
 
                 # 检查响应是否包含错误信息
                 if hasattr(response, 'content') and response.content:
@@ -400,14 +468,15 @@ class AgentOrchestrator:
                             logger.error(f"LLM 响应包含错误元数据: {metadata}")
 
                 return response
-            except (httpx.ConnectError, httpx.RemoteProtocolError, openai.APIConnectionError) as e:
+            except RETRYABLE_ERRORS as e:
                 last_error = e
                 if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2  # 递增等待：2秒、4秒、6秒
-                    logger.warning(f"LLM 连接失败，{wait_time}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                    # 带抖动的指数退避，服务端返回 Retry-After 时以其为准
+                    wait_time = retry_delay(attempt, e)
+                    logger.warning(f"LLM 调用失败，{wait_time:.1f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
                     await asyncio.sleep(wait_time)
                 else:
-                    logger.error(f"LLM 连接失败，已达最大重试次数 ({max_retries}): {e}")
+                    logger.error(f"LLM 调用失败，已达最大重试次数 ({max_retries}): {e}")
             except ValueError as e:
                 # 捕获 "No generation chunks were returned" 等 ValueError
                 error_msg = str(e)
@@ -443,9 +512,7 @@ class AgentOrchestrator:
             - 重试会从头开始，不会发送重置信号给客户端
             - 如果部分内容已发送后失败，客户端可能收到不完整内容
         """
-        import httpx
         import openai
-        from langchain_core.messages import AIMessage
 
         # 记录请求信息用于调试
         logger.debug(f"LLM 流式调用开始: messages_count={len(messages)}, model={getattr(self.llm, 'model_name', getattr(self.llm, 'model', 'unknown'))}")
@@ -645,14 +712,14 @@ class AgentOrchestrator:
                 
                 return response
                 
-            except (httpx.ConnectError, httpx.RemoteProtocolError, openai.APIConnectionError) as e:
+            except RETRYABLE_ERRORS as e:
                 last_error = e
                 if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    logger.warning(f"LLM 流式连接失败，{wait_time}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+                    wait_time = retry_delay(attempt, e)
+                    logger.warning(f"LLM 流式调用失败，{wait_time:.1f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
                     await asyncio.sleep(wait_time)
                 else:
-                    logger.error(f"LLM 流式连接失败，已达最大重试次数 ({max_retries}): {e}")
+                    logger.error(f"LLM 流式调用失败，已达最大重试次数 ({max_retries}): {e}")
             except openai.APIError as e:
                 # API 错误（如 Bad request），打印详细信息便于排查
                 status_code = getattr(e, "status_code", None)
@@ -670,7 +737,7 @@ class AgentOrchestrator:
                         getattr(e, "body", None) or str(e),
                     )
                     try:
-                        fallback_response = await asyncio.to_thread(self.llm_with_tools.invoke, messages)
+                        fallback_response = await self.llm_with_tools.ainvoke(messages)
                         # 如果有文本内容，作为单个 chunk 输出（保证前端能看到回复）
                         if on_chunk and hasattr(fallback_response, "content") and fallback_response.content:
                             content = fallback_response.content
@@ -756,46 +823,78 @@ class AgentOrchestrator:
         return result
     
     async def _execute_tools(self, tool_calls: List) -> List[Dict]:
-        """执行工具调用"""
-        results = []
-        
-        for tool_call in tool_calls:
+        """
+        执行工具调用
+
+        同一步骤内的调用并发执行（按 _tool_lane 分类串行化有状态工具），
+        每个调用有独立超时，结果按原顺序返回并附带耗时 duration_ms
+        """
+        timeout = getattr(settings, 'AGENT_TOOL_CALL_TIMEOUT', 240)
+        semaphore = asyncio.Semaphore(getattr(settings, 'AGENT_TOOL_MAX_CONCURRENCY', 4))
+        lanes: Dict[str, asyncio.Lock] = {}
+
+        async def execute(tool_call) -> Dict:
             tool_name, tool_args = self._extract_tool_call_payload(tool_call)
-            
+
             if not tool_name:
-                results.append({
+                return {
                     'tool_name': '',
                     'input': tool_args,
                     'error': '工具名称缺失'
-                })
-                continue
-            
+                }
+
             # 查找工具
             tool = self._find_tool(tool_name)
             if not tool:
-                results.append({
+                return {
                     'tool_name': tool_name,
                     'error': f'工具 {tool_name} 不存在'
-                })
-                continue
-            
-            try:
-                # 执行工具（支持同步/异步）
-                output = await self._invoke_tool(tool, tool_args)
-                results.append({
-                    'tool_name': tool_name,
-                    'input': tool_args,
-                    'output': output
-                })
-            except Exception as e:
-                logger.error(f"工具 {tool_name} 调用失败: {e}", exc_info=True)
-                results.append({
-                    'tool_name': tool_name,
-                    'input': tool_args,
-                    'error': str(e)
-                })
-        
-        return results
+                }
+
+            lane = self._tool_lane(tool_name, tool_args)
+            lane_lock = lanes.setdefault(lane, asyncio.Lock()) if lane else contextlib.nullcontext()
+            async with lane_lock, semaphore:
+                start_time = time.monotonic()
+                try:
+                    # 执行工具（支持同步/异步）
+                    output = await asyncio.wait_for(self._invoke_tool(tool, tool_args), timeout=timeout)
+                    result = {
+                        'tool_name': tool_name,
+                        'input': tool_args,
+                        'output': output
+                    }
+                except asyncio.TimeoutError:
+                    logger.error(f"工具 {tool_name} 调用超时（{timeout}秒）")
+                    result = {
+                        'tool_name': tool_name,
+                        'input': tool_args,
+                        'error': f'工具执行超时（{timeout}秒）'
+                    }
+                except Exception as e:
+                    logger.error(f"工具 {tool_name} 调用失败: {e}", exc_info=True)
+                    result = {
+                        'tool_name': tool_name,
+                        'input': tool_args,
+                        'error': str(e)
+                    }
+                result['duration_ms'] = int((time.monotonic() - start_time) * 1000)
+                return result
+
+        return list(await asyncio.gather(*(execute(tool_call) for tool_call in tool_calls)))
+
+    def _tool_lane(self, tool_name: str, tool_args: Dict[str, Any]) -> Optional[str]:
+        """返回工具所属的串行通道，None 表示可与其他调用并行"""
+        if tool_name.startswith(self.BROWSER_TOOL_PREFIXES):
+            return 'browser'
+        if tool_name == 'execute_skill_script':
+            # 带 session_id 的调用共用同一个浏览器会话
+            session_id = tool_args.get('session_id')
+            return f'skill:{session_id}' if session_id else None
+        if tool_name in self.STATEFUL_TOOL_LANES:
+            return self.STATEFUL_TOOL_LANES[tool_name]
+        if tool_name.startswith(self.READ_ONLY_TOOL_PREFIXES):
+            return None
+        return 'default'
     
     def _find_tool(self, tool_name: str):
         """查找工具"""
@@ -859,11 +958,13 @@ class AgentOrchestrator:
         
         return await asyncio.to_thread(invoke_callable, tool_args)
     
-    def _summarize_tool_results(self, tool_results: List[Dict]) -> str:
+    def _summarize_tool_results(self, tool_results: List[Dict], bounded: bool = True) -> str:
         """
         生成工具结果摘要
         
-        这是关键：不把完整结果放入上下文，只保留摘要
+        这是关键：不把完整结果放入上下文，只保留摘要。
+        bounded=True 时超过内联上限的输出转存到 tool_output_store，摘要中只保留开头和引用，
+        引用同时写回 result['output_ref']
         """
         summaries = []
         
@@ -879,7 +980,6 @@ class AgentOrchestrator:
             else:
                 output = result.get('output', '')
                 
-                # 完整保留所有工具结果，不做截断
                 if isinstance(output, str):
                     summary = output
                 elif isinstance(output, (dict, list)):
@@ -887,14 +987,17 @@ class AgentOrchestrator:
                 else:
                     summary = str(output)
                 
+                if bounded:
+                    summary, ref = tool_output_store.bounded(summary, tool_name)
+                    if ref:
+                        result['output_ref'] = ref
+                
                 summaries.append(f"{tool_name}:\n{summary}")
         
         return '\n\n'.join(summaries)
     
     async def _update_blackboard(self, blackboard: AgentBlackboard, step_result: Dict):
         """更新 Blackboard"""
-        from asgiref.sync import sync_to_async
-        
         # 生成本步骤的摘要
         summary_parts = []
         
@@ -913,11 +1016,9 @@ class AgentOrchestrator:
         if summary_parts:
             step_summary = ' | '.join(summary_parts)
             
-            @sync_to_async
-            def update():
-                blackboard.add_history(step_summary)
-            
-            await update()
+            refs = [r['output_ref'] for r in step_result.get('tool_results') or [] if r.get('output_ref')]
+            fields = blackboard.add_history(step_summary, refs=refs, save=False)
+            await self._save_blackboard(blackboard, *fields)
     
     async def _record_step(
         self,
@@ -929,31 +1030,43 @@ class AgentOrchestrator:
         """记录步骤"""
         from asgiref.sync import sync_to_async
         
-        @sync_to_async
-        def create_step():
-            # 安全提取工具信息
-            tool_name = ''
-            tool_input = None
-            tool_calls = result.get('tool_calls') or []
-            if tool_calls:
-                tool_name, tool_input = self._extract_tool_call_payload(tool_calls[0])
-            
-            return AgentStep.objects.create(
-                task=task,
-                step_number=task.current_step,
-                input_context={
-                    'goal': context.get('goal', ''),
-                    'history_length': len(context.get('history', '').split('\n'))
-                },
-                ai_response=result.get('response', ''),
-                tool_name=tool_name,
-                tool_input=tool_input,
-                tool_output_summary=result.get('tool_summary', ''),
-                is_final=result.get('is_final', False),
-                duration_ms=duration_ms
-            )
+        # 安全提取工具信息
+        tool_name = ''
+        tool_input = None
+        tool_calls = result.get('tool_calls') or []
+        if tool_calls:
+            tool_name, tool_input = self._extract_tool_call_payload(tool_calls[0])
         
-        await create_step()
+        step = AgentStep(
+            task=task,
+            step_number=task.current_step,
+            input_context={
+                'goal': context.get('goal', ''),
+                'history_length': len(context.get('history', '').split('\n'))
+            },
+            ai_response=result.get('response', ''),
+            tool_name=tool_name,
+            tool_input=tool_input,
+            tool_output_summary=result.get('tool_summary', ''),
+            tool_output_full_ref=result.get('tool_output_ref', ''),
+            tool_metrics=[
+                {
+                    'tool_name': r.get('tool_name', ''),
+                    'duration_ms': r.get('duration_ms', 0),
+                    'status': 'error' if r.get('error') else 'success',
+                    **({'output_ref': r['output_ref']} if r.get('output_ref') else {}),
+                }
+                for r in result.get('tool_results') or []
+            ],
+            is_final=result.get('is_final', False),
+            duration_ms=duration_ms
+        )
+        
+        writer = self._writers.get(task.id)
+        if writer is not None:
+            await writer.add_step(step)
+        else:
+            await sync_to_async(step.save)()
 
 
 class AgentLoopIntegration:
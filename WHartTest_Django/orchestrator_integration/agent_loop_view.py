@@ -8,6 +8,7 @@ import json
 import logging
 import os
 import uuid
+from contextlib import AsyncExitStack
 from typing import Any, Dict, List, Optional
 
 from django.conf import settings
@@ -29,6 +30,7 @@ from wharttest_django.checkpointer import get_async_checkpointer
 
 from .agent_loop import AgentOrchestrator
 from .models import AgentTask, AgentBlackboard, AgentStep
+from .stop_signal import clear_stop_signal, watch_stop_signal
 from langgraph_integration.models import ChatSession, LLMConfig
 from langgraph_integration.views import (
     create_llm_instance,
@@ -465,6 +467,7 @@ class AgentLoopStreamAPIView(View):
             })
             return
 
+        stop_watch = AsyncExitStack()
         try:
             # 3. 初始化 LLM（避免阻塞事件循环）
             llm = await sync_to_async(create_llm_instance)(active_config, temperature=0.7)
@@ -825,6 +828,8 @@ page.get_by_placeholder("用户名").fill("admin")
             # 13. 执行 Agent Loop（流式输出每个步骤）
             task = await orchestrator._create_task(goal, chat_session)
             blackboard = await orchestrator._create_blackboard(task, initial_context)
+            # 连接结束（含客户端断开）时写入剩余的任务状态
+            stop_watch.push_async_callback(orchestrator._close_persistence, task)
             
             logger.info(f"AgentLoopStreamAPI: Starting task {task.id}, goal: {goal[:100]}")
 
@@ -897,7 +902,7 @@ page.get_by_placeholder("用户名").fill("admin")
 
                 blackboard.current_state = dict(blackboard.current_state or {})
                 blackboard.current_state['conversation_history'] = combined_text
-                await sync_to_async(blackboard.save)(update_fields=['current_state', 'updated_at'])
+                await orchestrator._save_blackboard(blackboard, 'current_state')
                 last_conversation_snapshot = combined_text
                 return True
 
@@ -907,15 +912,17 @@ page.get_by_placeholder("用户名").fill("admin")
             consecutive_tool_failures = 0
             max_consecutive_tool_failures = 3
             
+            # ⭐ 订阅停止信号（停止请求可能落在其他 worker 进程上）
+            stop_event = await stop_watch.enter_async_context(watch_stop_signal(session_id))
+
             step_count = 0
             while step_count < orchestrator.max_steps:
                 step_count += 1
 
                 # ⭐ 检查停止信号
-                from .stop_signal import should_stop, clear_stop_signal
-                if should_stop(session_id):
+                if stop_event.is_set():
                     logger.info(f"AgentLoopStreamAPI: Stop signal received for session {session_id} at step {step_count}")
-                    clear_stop_signal(session_id)
+                    await sync_to_async(clear_stop_signal)(session_id)
 
                     # 更新任务状态
                     task.status = 'cancelled'
@@ -987,10 +994,19 @@ page.get_by_placeholder("用户名").fill("admin")
                     """流式回调：将 chunk 放入队列并收集"""
                     streaming_content.append(chunk)
                     await stream_queue.put(('chunk', chunk))
+
+                async def progress_callback(payload: Dict[str, Any]):
+                    """工具进度回调：将 Skill 脚本等的增量输出放入队列"""
+                    await stream_queue.put(('tool_progress', payload))
                 
                 # 启动后台任务执行 LLM 调用
                 step_task = asyncio.create_task(
-                    orchestrator._execute_step(task, step_context, stream_callback=stream_callback)
+                    orchestrator._execute_step(
+                        task,
+                        step_context,
+                        stream_callback=stream_callback,
+                        progress_callback=progress_callback
+                    )
                 )
                 
                 # ⭐ 设置步骤整体超时（5分钟）
@@ -1015,7 +1031,7 @@ page.get_by_placeholder("用户名").fill("admin")
                             break
 
                         # ⭐ 检查用户停止信号
-                        if should_stop(session_id):
+                        if stop_event.is_set():
                             user_stopped = True
                             step_task.cancel()
                             logger.info(f"AgentLoopStreamAPI: Stop signal in streaming for session {session_id}")
@@ -1031,6 +1047,12 @@ page.get_by_placeholder("用户名").fill("admin")
                                 'type': 'stream',
                                 'data': content
                             })
+                        elif msg_type == 'tool_progress':
+                            yield create_sse_data({
+                                'type': 'tool_progress',
+                                'step': step_count,
+                                **content
+                            })
                     except asyncio.TimeoutError:
                         # 超时后继续检查任务是否完成
                         continue
@@ -1100,7 +1122,7 @@ page.get_by_placeholder("用户名").fill("admin")
                         pass
 
                     # 清除停止信号
-                    clear_stop_signal(session_id)
+                    await sync_to_async(clear_stop_signal)(session_id)
 
                     # 更新任务状态
                     task.status = 'cancelled'
@@ -1154,6 +1176,12 @@ page.get_by_placeholder("用户名").fill("admin")
                             'type': 'stream',
                             'data': content
                         })
+                    elif msg_type == 'tool_progress':
+                        yield create_sse_data({
+                            'type': 'tool_progress',
+                            'step': step_count,
+                            **content
+                        })
                 
                 # 获取执行结果
                 try:
@@ -1210,7 +1238,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     await refresh_conversation_history_snapshot()
                     yield create_sse_data({
                         'type': 'tool_result',
-                        'summary': tool_summary
+                        'summary': step_result.get('tool_output_full') or tool_summary
                     })
 
                 # 更新 Blackboard
@@ -1453,6 +1481,8 @@ page.get_by_placeholder("用户名").fill("admin")
                 'type': 'error',
                 'message': f'执行错误: {str(e)}'
             })
+        finally:
+            await stop_watch.aclose()
 
     async def post(self, request, *args, **kwargs):
         """处理流式聊天请求"""
@@ -1592,8 +1622,8 @@ class AgentLoopStopAPIView(View):
         if not session_id:
             return JsonResponse({'error': 'session_id is required', 'code': 400}, status=400)
 
-        # 3. 设置停止信号
-        success = set_stop_signal(session_id)
+        # 3. 设置停止信号（经共享信号后端通知执行该会话的进程）
+        success = await sync_to_async(set_stop_signal)(session_id)
 
         logger.info(f"AgentLoopStopAPI: Stop signal set for session {session_id} by user {user.id}")
 
@@ -0,0 +1,222 @@
+"""
+Agent Loop 状态批量写回（write-behind）
+
+Agent Loop 每一步都会修改 AgentTask（状态、步数）、AgentBlackboard（历史摘要、当前状态）并新增 AgentStep，
+逐条同步写库会产生大量经由 sync_to_async 的数据库往返。这里改为先在内存中登记变更，再批量刷写：
+- 定时刷写（AGENT_PERSIST_FLUSH_INTERVAL 秒）
+- 缓冲的步骤记录达到 AGENT_PERSIST_MAX_PENDING_STEPS 条时立即刷写
+- 任务进入终态（completed / failed / cancelled）或关闭时立即刷写
+
+每次刷写在一个事务中完成，进程崩溃时数据库保持在最近一次刷写后的一致状态。
+刷写失败时变更保留在缓冲中，下次刷写重试。刷写被取消（如关闭时取消定时器）不会中断写库线程，
+写完后再按结果处理，失败时同样放回缓冲。
+
+writer_stats() 汇总当前进程所有写回器的刷写指标，供管理员接口查看。
+
+配置项：
+- AGENT_PERSIST_FLUSH_INTERVAL: 定时刷写间隔（秒，默认 2，为 0 时关闭定时刷写）
+- AGENT_PERSIST_MAX_PENDING_STEPS: 触发立即刷写的缓冲步骤数（默认 20）
+"""
+import asyncio
+import contextlib
+import copy
+import logging
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AgentBlackboard, AgentStep, AgentTask
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# 写回的 AgentTask 字段（updated_at 在刷写时统一设置）
+TASK_FIELDS = ('status', 'current_step', 'final_response', 'error_message', 'completed_at')
+
+# 当前进程的写回器与累计刷写指标
+_writers = weakref.WeakSet()
+_totals = {
+    'flush_count': 0,
+    'failed_flushes': 0,
+    'rows_written': 0,
+    'max_flush_ms': 0.0,
+    'total_flush_ms': 0.0,
+}
+_totals_lock = threading.Lock()
+
+
+def _record_flush(metrics, rows, elapsed_ms):
+    for target in (metrics, _totals):
+        target['flush_count'] += 1
+        target['rows_written'] += rows
+        target['max_flush_ms'] = round(max(target['max_flush_ms'], elapsed_ms), 2)
+        target['total_flush_ms'] = round(target['total_flush_ms'] + elapsed_ms, 2)
+    metrics['last_flush_ms'] = round(elapsed_ms, 2)
+
+
+def writer_stats() -> dict:
+    """当前进程 Agent 状态写回的指标：活跃写回器、缓冲中的步骤数和累计刷写耗时"""
+    with _totals_lock:
+        totals = dict(_totals)
+    writers = list(_writers)
+    flush_count = totals['flush_count']
+    return {
+        'active_writers': len(writers),
+        'pending_steps': sum(len(writer._pending_steps) for writer in writers),
+        **totals,
+        'avg_flush_ms': round(totals['total_flush_ms'] / flush_count, 2) if flush_count else 0.0,
+    }
+
+
+class AgentStateWriter:
+    """单个 Agent 任务的状态缓冲与批量刷写"""
+
+    def __init__(self, task: AgentTask, blackboard: AgentBlackboard,
+                 flush_interval: float = None, max_pending_steps: int = None):
+        self.task = task
+        self.blackboard = blackboard
+        self.flush_interval = float(
+            flush_interval if flush_interval is not None
+            else getattr(settings, 'AGENT_PERSIST_FLUSH_INTERVAL', 2)
+        )
+        self.max_pending_steps = int(
+            max_pending_steps if max_pending_steps is not None
+            else getattr(settings, 'AGENT_PERSIST_MAX_PENDING_STEPS', 20)
+        )
+
+        self._pending_steps = []
+        self._task_dirty = False
+        self._blackboard_fields = set()
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._inflight = None
+
+        # 刷写指标（毫秒）
+        self.metrics = {
+            'flush_count': 0,
+            'failed_flushes': 0,
+            'rows_written': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+        _writers.add(self)
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending_steps or self._task_dirty or self._blackboard_fields)
+
+    def start(self):
+        """启动定时刷写"""
+        if self._timer is None and self.flush_interval > 0:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def save_task(self):
+        """登记任务变更；进入终态时立即刷写"""
+        self._task_dirty = True
+        if self.task.status in TERMINAL_STATUSES:
+            await self.flush()
+
+    def save_blackboard(self, *fields):
+        """登记 Blackboard 字段变更，随下次刷写写入"""
+        self._blackboard_fields.update(fields)
+
+    async def add_step(self, step: AgentStep):
+        """登记新的步骤记录；缓冲过多时立即刷写"""
+        self._pending_steps.append(step)
+        if len(self._pending_steps) >= self.max_pending_steps:
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """把缓冲的变更写入数据库，返回是否成功（无变更时视为成功）"""
+        async with self._lock:
+            if self._inflight is not None:
+                # 上次刷写被取消时写库线程仍在运行，等它结束（失败时变更已放回缓冲）
+                await asyncio.wait([self._inflight])
+                self._inflight = None
+            if not self.has_pending:
+                return True
+
+            steps, self._pending_steps = self._pending_steps, []
+            task_dirty, self._task_dirty = self._task_dirty, False
+            fields, self._blackboard_fields = self._blackboard_fields, set()
+
+            # 在事件循环线程中取快照，避免写库线程读取到正在被修改的对象
+            task_values = {name: getattr(self.task, name) for name in TASK_FIELDS} if task_dirty else None
+            blackboard_values = {
+                name: copy.deepcopy(getattr(self.blackboard, name)) for name in fields
+            }
+            rows = len(steps) + bool(task_values) + bool(blackboard_values)
+
+            started = time.monotonic()
+            write = asyncio.ensure_future(sync_to_async(self._write)(steps, task_values, blackboard_values))
+
+            def finish(done):
+                if done.cancelled() or done.exception() is not None:
+                    error = 'cancelled' if done.cancelled() else done.exception()
+                    self._pending_steps[:0] = steps
+                    self._task_dirty = self._task_dirty or task_dirty
+                    self._blackboard_fields |= fields
+                    self.metrics['failed_flushes'] += 1
+                    with _totals_lock:
+                        _totals['failed_flushes'] += 1
+                    logger.error(
+                        f"Agent 任务 {self.task.id} 状态刷写失败，将在下次刷写重试: {error}",
+                        exc_info=None if done.cancelled() else error,
+                    )
+                    return False
+                elapsed_ms = (time.monotonic() - started) * 1000
+                with _totals_lock:
+                    _record_flush(self.metrics, rows, elapsed_ms)
+                logger.debug(
+                    f"Agent 任务 {self.task.id} 刷写 {len(steps)} 个步骤，耗时 {elapsed_ms:.1f}ms"
+                )
+                return True
+
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # 取消不会中断写库线程：写完后再处理结果，既不丢失已取出的变更也不重复写入
+                self._inflight = write
+                write.add_done_callback(finish)
+                raise
+            except Exception:
+                pass
+            return finish(write)
+
+    def _write(self, steps, task_values, blackboard_values):
+        now = timezone.now()
+        with transaction.atomic():
+            if task_values:
+                AgentTask.objects.filter(pk=self.task.pk).update(updated_at=now, **task_values)
+            if blackboard_values:
+                AgentBlackboard.objects.filter(pk=self.blackboard.pk).update(updated_at=now, **blackboard_values)
+            if steps:
+                AgentStep.objects.bulk_create(steps)
+
+    async def close(self):
+        """停止定时刷写并写入剩余变更"""
+        if self._timer is not None:
+            self._timer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._timer
+            self._timer = None
+        await self.flush()
+        _writers.discard(self)
+        metrics = self.metrics
+        logger.info(
+            f"Agent 任务 {self.task.id} 状态写回结束: 刷写 {metrics['flush_count']} 次，"
+            f"写入 {metrics['rows_written']} 行，最大耗时 {metrics['max_flush_ms']}ms，"
+            f"失败 {metrics['failed_flushes']} 次"
+        )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OrchestratorIntegrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orchestrator_integration'
+
+    def ready(self):
+        """注册信号处理器"""
+        import orchestrator_integration.signals  # noqa
@@ -5,11 +5,13 @@
 - Playwright 脚本管理工具（查询、查看、编辑、执行）
 - Skill 脚本执行工具（执行用户上传的 Python 脚本）
 - Drawio 图表工具（创建、编辑图表）
+- 工具输出读取工具（按引用读取被截断的完整输出）
 """
 
 from .playwright_tools import get_playwright_tools
 from .skill_tools import get_skill_tools
 from .diagram_tools import get_diagram_tools
+from .tool_output_tools import get_tool_output_tools
 
 import logging
 
@@ -46,4 +48,8 @@ def get_builtin_tools(
     tools.extend(diagram_tools)
     logger.info(f"[BuiltinTools] 加载 {len(diagram_tools)} 个 Diagram 工具")
 
+    tool_output_tools = get_tool_output_tools()
+    tools.extend(tool_output_tools)
+    logger.info(f"[BuiltinTools] 加载 {len(tool_output_tools)} 个工具输出读取工具")
+
     return tools
@@ -3,6 +3,11 @@ Playwright 持久化会话管理
 
 提供跨多次 execute_skill_script 调用的浏览器会话保持能力。
 通过 stdin/stdout JSON-RPC 与长驻 Node.js 进程通信。
+
+两种模式：
+- PlaywrightSessionManager: 每个会话独占一个 Node 进程（一个完整浏览器）
+- PlaywrightBrowserPool: 少量长驻 Node 进程组成浏览器池，每个会话在其中独占一个
+  BrowserContext（cookie/storage 隔离），进程数按 CPU/内存预算封顶
 """
 from __future__ import annotations
 
@@ -16,7 +21,7 @@ import threading
 import time
 import uuid
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -273,13 +278,22 @@ class _PlaywrightNodeProcess:
             except Exception:
                 continue
 
+    def is_alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
     def _ensure_alive(self) -> None:
         if self._proc is None:
             raise PlaywrightPersistentSessionError("Playwright persistent process not started")
         if self._proc.poll() is not None:
             raise PlaywrightPersistentSessionError("Playwright persistent process is not running")
 
-    def request(self, method: str, params: Dict[str, Any], timeout_seconds: int) -> Dict[str, Any]:
+    def request(
+        self,
+        method: str,
+        params: Dict[str, Any],
+        timeout_seconds: int,
+        terminate_on_timeout: bool = True,
+    ) -> Dict[str, Any]:
         self._ensure_alive()
         assert self._proc is not None
         assert self._proc.stdin is not None
@@ -305,7 +319,9 @@ class _PlaywrightNodeProcess:
         try:
             resp = q.get(timeout=timeout_seconds)
         except queue.Empty:
-            self.terminate(graceful=False)
+            # 池化模式下进程被其他会话共享，由调用方只关闭超时的会话
+            if terminate_on_timeout:
+                self.terminate(graceful=False)
             raise TimeoutError(f"Playwright persistent request timed out after {timeout_seconds}s")
         finally:
             with self._pending_lock:
@@ -316,7 +332,10 @@ class _PlaywrightNodeProcess:
     def exec_run_js(self, run_js_args: List[str], env: Dict[str, str], timeout_seconds: int) -> str:
         params: Dict[str, Any] = {"args": run_js_args or [], "env": env or {}}
         resp = self.request("exec", params=params, timeout_seconds=timeout_seconds)
+        return self.format_exec_output(resp)
 
+    @staticmethod
+    def format_exec_output(resp: Dict[str, Any]) -> str:
         stdout_lines = resp.get("stdout") or []
         stderr_lines = resp.get("stderr") or []
         if isinstance(stdout_lines, str):
@@ -512,3 +531,344 @@ class PlaywrightSessionManager:
             keys = list(self._entries.keys())
         for k in keys:
             self.close_session(k)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            alive = sum(1 for e in self._entries.values() if e.proc.is_alive())
+            return {
+                "mode": "per_session",
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "processes": alive,
+            }
+
+
+def _total_memory_mb() -> Optional[int]:
+    """物理内存总量（MB），无法获取时返回 None"""
+    try:
+        return int(os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024))
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def compute_browser_pool_size(
+    *,
+    memory_per_browser_mb: int = 512,
+    memory_fraction: float = 0.5,
+    cpu_count: Optional[int] = None,
+    total_memory_mb: Optional[int] = None,
+) -> int:
+    """
+    按 CPU/内存预算计算浏览器进程上限：
+    min(CPU 核数, 可用于浏览器的内存 / 单个浏览器内存预算)，至少为 1
+    """
+    cpus = cpu_count if cpu_count is not None else (os.cpu_count() or 1)
+    memory_mb = total_memory_mb if total_memory_mb is not None else _total_memory_mb()
+    limit = max(1, int(cpus))
+    if memory_mb:
+        by_memory = int(memory_mb * memory_fraction) // max(1, int(memory_per_browser_mb))
+        limit = min(limit, max(1, by_memory))
+    return limit
+
+
+@dataclass
+class _PoolWorker:
+    skill_dir: str
+    proc: "_PlaywrightNodeProcess"
+    sessions: set = field(default_factory=set)
+    contexts_created: int = 0
+    last_used_monotonic: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _PooledSession:
+    session_key: str
+    worker: _PoolWorker
+    last_used_monotonic: float
+
+
+class PlaywrightBrowserPool:
+    """
+    浏览器池会话管理器（与 PlaywrightSessionManager 接口一致）：
+    - 每个 Node 进程只启动一个浏览器，会话以独立 BrowserContext 挂在进程上
+    - 会话按最少负载分配到进程，此后固定（sticky），直到关闭或过期
+    - 进程数上限由 CPU/内存预算决定；超出软上限的会话复用负载最低的进程
+    - 进程累计创建的 context 数达到 recycle_after_contexts 且空闲时回收重启，
+      防止浏览器长期运行的内存膨胀；进程崩溃时同样计入回收
+    """
+
+    def __init__(
+        self,
+        *,
+        max_processes: int,
+        contexts_per_process: int = 8,
+        recycle_after_contexts: int = 200,
+        idle_timeout_seconds: int = 900,
+        max_sessions: int = 100,
+    ):
+        self.max_processes = max(1, int(max_processes))
+        self.contexts_per_process = max(1, int(contexts_per_process))
+        self.recycle_after_contexts = max(1, int(recycle_after_contexts))
+        self.idle_timeout_seconds = max(30, int(idle_timeout_seconds))
+        self.max_sessions = max(1, int(max_sessions))
+        self._lock = threading.RLock()
+        self._workers: List[_PoolWorker] = []
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._recycle_count = 0
+        self._context_count = 0
+        self._context_total_ms = 0
+        self._context_last_ms: Optional[int] = None
+        self._context_max_ms = 0
+        self._cleanup_started = False
+        self._shutdown = False
+        atexit.register(self.close_all)
+
+    def _ensure_cleanup_thread(self) -> None:
+        with self._lock:
+            if self._cleanup_started:
+                return
+            self._cleanup_started = True
+
+        def _loop() -> None:
+            while not self._shutdown:
+                try:
+                    self.cleanup_expired()
+                except Exception:
+                    pass
+                time.sleep(30)
+
+        t = threading.Thread(target=_loop, name="pw-pool-cleanup", daemon=True)
+        t.start()
+
+    def _retire_worker(self, worker: _PoolWorker, reason: str) -> None:
+        """移除进程并丢弃其上的会话（调用方负责终止进程）"""
+        with self._lock:
+            if worker not in self._workers:
+                return
+            self._workers.remove(worker)
+            for key in list(worker.sessions):
+                self._sessions.pop(key, None)
+            worker.sessions.clear()
+            self._recycle_count += 1
+        logger.info(f"[persistent_playwright] 浏览器池回收进程: {reason}")
+
+    def _assign_worker(self, session_key: str, skill_dir: str) -> _PooledSession:
+        with self._lock:
+            entry = self._sessions.get(session_key)
+            if entry is not None and entry.worker.skill_dir == skill_dir:
+                entry.last_used_monotonic = time.monotonic()
+                return entry
+
+            if entry is not None:
+                # skill 目录变化：原会话作废
+                self._sessions.pop(session_key, None)
+                entry.worker.sessions.discard(session_key)
+
+            candidates = [w for w in self._workers if w.skill_dir == skill_dir]
+            worker = min(candidates, key=lambda w: len(w.sessions), default=None)
+            if worker is None or len(worker.sessions) >= self.contexts_per_process:
+                if len(self._workers) >= self.max_processes:
+                    # 进程预算已满：优先腾出一个没有会话的进程（可能属于其他 skill 目录）
+                    victim = next((w for w in self._workers if not w.sessions and w is not worker), None)
+                    if victim is not None:
+                        self._workers.remove(victim)
+                        threading.Thread(target=victim.proc.terminate, daemon=True).start()
+                if len(self._workers) < self.max_processes:
+                    worker = _PoolWorker(skill_dir=skill_dir, proc=_PlaywrightNodeProcess(skill_dir))
+                    self._workers.append(worker)
+                elif worker is None:
+                    raise PlaywrightPersistentSessionError(
+                        f"Playwright 浏览器池已满（{self.max_processes} 个进程），请稍后重试"
+                    )
+                # 否则超出软上限，继续复用负载最低的进程
+
+            worker.sessions.add(session_key)
+            worker.last_used_monotonic = time.monotonic()
+            entry = _PooledSession(
+                session_key=session_key,
+                worker=worker,
+                last_used_monotonic=time.monotonic(),
+            )
+            self._sessions[session_key] = entry
+            return entry
+
+    def _prune_lru_if_needed(self) -> None:
+        with self._lock:
+            if len(self._sessions) <= self.max_sessions:
+                return
+            victims = sorted(self._sessions.values(), key=lambda e: e.last_used_monotonic)
+            to_close = victims[:max(0, len(self._sessions) - self.max_sessions)]
+
+        for entry in to_close:
+            self.close_session(entry.session_key)
+
+    def _record_context_created(self, worker: _PoolWorker, elapsed_ms: Optional[int]) -> None:
+        if elapsed_ms is None:
+            return
+        with self._lock:
+            worker.contexts_created += 1
+            self._context_count += 1
+            self._context_total_ms += int(elapsed_ms)
+            self._context_last_ms = int(elapsed_ms)
+            self._context_max_ms = max(self._context_max_ms, int(elapsed_ms))
+
+    def execute_run_js(
+        self,
+        *,
+        session_key: str,
+        skill_dir: str,
+        run_js_args: List[str],
+        env: Dict[str, str],
+        timeout_seconds: int = 120,
+    ) -> str:
+        self._ensure_cleanup_thread()
+        self.cleanup_expired()
+
+        skill_dir_abs = os.path.abspath(skill_dir)
+        entry = self._assign_worker(session_key, skill_dir_abs)
+        worker = entry.worker
+
+        if worker.proc._proc is not None and not worker.proc.is_alive():
+            # 进程已崩溃：其上所有会话丢失，重新分配
+            self._retire_worker(worker, "进程已退出")
+            entry = self._assign_worker(session_key, skill_dir_abs)
+            worker = entry.worker
+
+        self._prune_lru_if_needed()
+
+        try:
+            worker.proc._start(env=env)
+        except Exception:
+            self._retire_worker(worker, "进程启动失败")
+            worker.proc.terminate(graceful=False)
+            raise
+
+        params: Dict[str, Any] = {"args": run_js_args or [], "env": env or {}, "session": session_key}
+        try:
+            resp = worker.proc.request(
+                "exec",
+                params=params,
+                timeout_seconds=int(timeout_seconds),
+                terminate_on_timeout=False,
+            )
+        except TimeoutError:
+            # 只关闭超时的会话，同进程上的其他会话不受影响
+            self.close_session(session_key)
+            raise
+
+        state = resp.get("state") or {}
+        self._record_context_created(worker, state.get("contextCreatedMs"))
+
+        now = time.monotonic()
+        with self._lock:
+            updated = self._sessions.get(session_key)
+            if updated is not None:
+                updated.last_used_monotonic = now
+            worker.last_used_monotonic = now
+
+        return _PlaywrightNodeProcess.format_exec_output(resp)
+
+    def _maybe_recycle(self, worker: _PoolWorker) -> None:
+        """空闲且累计 context 数达到阈值的进程直接终止，下次需要时重新启动"""
+        with self._lock:
+            if worker.sessions or worker.contexts_created < self.recycle_after_contexts:
+                return
+            if worker not in self._workers:
+                return
+            self._workers.remove(worker)
+            self._recycle_count += 1
+        logger.info(
+            f"[persistent_playwright] 浏览器池回收进程: 已创建 {worker.contexts_created} 个 context"
+        )
+        worker.proc.terminate(graceful=True)
+
+    def cleanup_expired(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key for key, entry in self._sessions.items()
+                if (now - entry.last_used_monotonic) > self.idle_timeout_seconds
+            ]
+        for key in expired:
+            self.close_session(key)
+
+        # 无会话且长时间空闲的进程释放内存
+        with self._lock:
+            idle_workers = [
+                w for w in self._workers
+                if not w.sessions and (now - w.last_used_monotonic) > self.idle_timeout_seconds
+            ]
+            for worker in idle_workers:
+                self._workers.remove(worker)
+        for worker in idle_workers:
+            worker.proc.terminate(graceful=True)
+
+    def close_session(self, session_key: str) -> None:
+        with self._lock:
+            entry = self._sessions.pop(session_key, None)
+            if entry is None:
+                return
+            worker = entry.worker
+            worker.sessions.discard(session_key)
+            worker.last_used_monotonic = time.monotonic()
+
+        if worker.proc.is_alive():
+            try:
+                worker.proc.request(
+                    "close_session",
+                    params={"session": session_key},
+                    timeout_seconds=10,
+                    terminate_on_timeout=False,
+                )
+            except Exception as e:
+                logger.warning(f"[persistent_playwright] 关闭会话失败，回收进程: {e}")
+                self._retire_worker(worker, "关闭会话失败")
+                worker.proc.terminate(graceful=False)
+                return
+
+        self._maybe_recycle(worker)
+
+    def close_all(self) -> None:
+        self._shutdown = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+            self._sessions.clear()
+        for worker in workers:
+            try:
+                worker.proc.terminate(graceful=True)
+            except Exception:
+                try:
+                    worker.proc.terminate(graceful=False)
+                except Exception:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """浏览器池指标：进程占用、context 创建耗时、回收次数"""
+        with self._lock:
+            workers = [
+                {
+                    "skill_dir": os.path.basename(w.skill_dir),
+                    "alive": w.proc.is_alive(),
+                    "sessions": len(w.sessions),
+                    "contexts_created": w.contexts_created,
+                }
+                for w in self._workers
+            ]
+            return {
+                "mode": "pooled",
+                "max_processes": self.max_processes,
+                "contexts_per_process": self.contexts_per_process,
+                "processes": len(workers),
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "occupancy": round(len(self._sessions) / (self.max_processes * self.contexts_per_process), 3),
+                "workers": workers,
+                "contexts_created": self._context_count,
+                "context_create_ms": {
+                    "last": self._context_last_ms,
+                    "avg": round(self._context_total_ms / self._context_count, 1) if self._context_count else None,
+                    "max": self._context_max_ms,
+                },
+                "recycles": self._recycle_count,
+            }
@@ -7,11 +7,22 @@
  * 协议：stdin/stdout 行分隔 JSON
  * 请求：
  *   { id, method: "ping", params: {} }
- *   { id, method: "exec", params: { args: string[], env?: object } }
+ *   { id, method: "exec", params: { args: string[], env?: object, session?: string } }
+ *   { id, method: "close_session", params: { session: string } }
+ *   { id, method: "stats", params: {} }
  *   { id, method: "close", params: {} }
  *
  * 响应：
  *   { id, ok: boolean, stdout?: string[], stderr?: string[], error?: string, state?: object }
+ *
+ * 会话模型：
+ *   - 不带 session 的 exec 使用默认会话，行为与单会话模式一致（env 写入 process.env）
+ *   - 带 session 的 exec 为池化模式：同一进程内共享一个浏览器，每个会话独占一个
+ *     BrowserContext（cookie/storage 相互隔离）；env 只对该会话的 process.env 生效
+ *   - 池化会话中用户代码拿到的 chromium/firefox/webkit 与 helpers.launchBrowser 是包装过的：
+ *     launch() 返回共享浏览器的代理（browser.close() 只关闭本会话创建的 context），
+ *     只有请求与共享浏览器不同的浏览器类型时才真正启动新浏览器
+ *   - 同一会话内的请求串行执行，不同会话之间并发执行
  */
 
 const fs = require('fs');
@@ -131,10 +142,22 @@ async function main() {
   let devices = null;
   let helpers = null;
 
-  const state = {
+  const DEFAULT_SESSION = '__default__';
+  const BLOCKED_ENV_KEYS = ['NODE_OPTIONS', 'PATH', 'HOME', 'USERPROFILE', 'TEMP', 'TMP'];
+
+  // 池化模式下所有会话共享的浏览器
+  const shared = {
     browser: null,
-    context: null,
-    page: null,
+    type: null,
+    launches: 0,
+  };
+
+  // session -> { state: {browser, context, page}, env, chain, pooled, browserProxy, contexts, ownBrowser, lastUsed }
+  const sessions = new Map();
+  const counters = {
+    contextsCreated: 0,
+    contextsClosed: 0,
+    privateBrowserLaunches: 0,
   };
 
   async function loadDeps() {
@@ -157,9 +180,30 @@ async function main() {
     }
   }
 
-  function getContextOptionsWithHeaders(options = {}) {
+  function sessionEnv(session) {
+    return session && session.pooled ? Object.assign({}, process.env, session.env) : process.env;
+  }
+
+  function sessionBrowserType(session) {
+    return (sessionEnv(session).PW_BROWSER_TYPE || 'chromium').toLowerCase();
+  }
+
+  function withSessionEnv(session, fn) {
+    // lib/helpers 直接读取 process.env：调用期间临时换成会话的 env。
+    // launchBrowser / getExtraHeadersFromEnv 都在第一个 await 之前读取 env，单线程下不会与其他会话交错
+    if (!session || !session.pooled) return fn();
+    const original = process.env;
+    process.env = sessionEnv(session);
+    try {
+      return fn();
+    } finally {
+      process.env = original;
+    }
+  }
+
+  function getContextOptionsWithHeaders(options = {}, session = null) {
     if (!helpers?.getExtraHeadersFromEnv) return options;
-    const extra = helpers.getExtraHeadersFromEnv();
+    const extra = withSessionEnv(session, () => helpers.getExtraHeadersFromEnv());
     if (!extra) return options;
     return {
       ...options,
@@ -170,10 +214,173 @@ async function main() {
     };
   }
 
-  async function ensureBrowserContextPage() {
-    await loadDeps();
+  function isBrowserAlive(browser) {
+    return !!browser && !(typeof browser.isConnected === 'function' && !browser.isConnected());
+  }
+
+  function getSession(name) {
+    const key = name || DEFAULT_SESSION;
+    let session = sessions.get(key);
+    if (!session) {
+      session = {
+        name: key,
+        pooled: key !== DEFAULT_SESSION,
+        state: { browser: null, context: null, page: null },
+        env: {},
+        chain: Promise.resolve(),
+        browserProxy: null,
+        browserTarget: null,
+        contexts: new Set(),
+        ownBrowser: null,
+        lastUsed: Date.now(),
+      };
+      sessions.set(key, session);
+    }
+    return session;
+  }
+
+  function applyEnv(session, env) {
+    if (!env || typeof env !== 'object') return;
+    // 单会话模式沿用进程级 env；池化模式只记录在会话上，避免并发会话互相覆盖（如 SCREENSHOT_DIR）
+    const target = session.pooled ? session.env : process.env;
+    for (const [k, v] of Object.entries(env)) {
+      if (BLOCKED_ENV_KEYS.includes(k.toUpperCase())) {
+        continue; // 跳过敏感变量
+      }
+      if (v === null || v === undefined) {
+        delete target[k];
+      } else {
+        target[k] = String(v);
+      }
+    }
+  }
+
+  async function closeSessionContexts(session) {
+    for (const context of session.contexts) {
+      await safeClose(context);
+    }
+    session.contexts.clear();
+    await safeClose(session.state.context);
+    session.state.context = null;
+    session.state.page = null;
+  }
+
+  async function ensureSharedBrowser(session) {
+    if (!isBrowserAlive(shared.browser)) {
+      // 共享浏览器按首个触发启动的会话的 env 启动
+      const browserType = sessionBrowserType(session);
+      shared.browser = await withSessionEnv(session, () => helpers.launchBrowser(browserType));
+      shared.type = browserType;
+      shared.launches += 1;
+      // 浏览器重启后旧的 context/page 全部失效
+      for (const session of sessions.values()) {
+        if (session.pooled && !session.ownBrowser) {
+          session.contexts.clear();
+          session.state.context = null;
+          session.state.page = null;
+        }
+      }
+    }
+    return shared.browser;
+  }
+
+  function createBrowserProxy(session) {
+    // 用户代码看到的 browser：记录经它创建的 context，close() 只关闭这些 context，不影响共享浏览器上的其他会话
+    return new Proxy(shared.browser, {
+      get(target, prop) {
+        if (prop === 'close') {
+          return () => closeSessionContexts(session);
+        }
+        if (prop === 'newContext') {
+          return async (...args) => {
+            const context = await target.newContext(...args);
+            session.contexts.add(context);
+            return context;
+          };
+        }
+        if (prop === 'newPage') {
+          return async (...args) => {
+            const page = await target.newPage(...args);
+            session.contexts.add(page.context());
+            return page;
+          };
+        }
+        const value = Reflect.get(target, prop, target);
+        return typeof value === 'function' ? value.bind(target) : value;
+      },
+    });
+  }
+
+  async function attachSharedBrowser(session) {
+    const browser = await ensureSharedBrowser(session);
+    if (!session.browserProxy || session.browserTarget !== browser) {
+      session.browserProxy = createBrowserProxy(session);
+      session.browserTarget = browser;
+    }
+    session.state.browser = session.browserProxy;
+    return session.browserProxy;
+  }
+
+  function wantsSharedBrowser(session, type) {
+    return (type || 'chromium').toLowerCase() === (shared.type || sessionBrowserType(session));
+  }
+
+  async function adoptPrivateBrowser(session, browser) {
+    // 与共享浏览器类型不同的浏览器归该会话所有，关闭会话时一并关闭
+    counters.privateBrowserLaunches += 1;
+    if (session.ownBrowser && session.ownBrowser !== browser) {
+      await safeClose(session.ownBrowser);
+    }
+    session.ownBrowser = browser;
+    return browser;
+  }
+
+  function createBrowserTypeShim(session, browserType, type) {
+    // 池化会话中 chromium.launch() 返回共享浏览器代理，而不是为每个会话启动一个浏览器
+    if (!browserType) return browserType;
+    return new Proxy(browserType, {
+      get(target, prop) {
+        if (prop === 'launch') {
+          return async (...args) => {
+            if (wantsSharedBrowser(session, type)) return attachSharedBrowser(session);
+            return adoptPrivateBrowser(session, await target.launch(...args));
+          };
+        }
+        const value = Reflect.get(target, prop, target);
+        return typeof value === 'function' ? value.bind(target) : value;
+      },
+    });
+  }
+
+  function createSessionHelpers(session) {
+    return Object.assign({}, helpers, {
+      launchBrowser: async (type, ...rest) => {
+        if (wantsSharedBrowser(session, type)) return attachSharedBrowser(session);
+        return adoptPrivateBrowser(session, await withSessionEnv(session, () => helpers.launchBrowser(type, ...rest)));
+      },
+      getExtraHeadersFromEnv: (...args) =>
+        withSessionEnv(session, () => helpers.getExtraHeadersFromEnv(...args)),
+    });
+  }
 
-    if (!state.browser || (typeof state.browser.isConnected === 'function' && !state.browser.isConnected())) {
+  async function ensureBrowserContextPage(session) {
+    await loadDeps();
+    const state = session.state;
+    let contextCreatedMs = null;
+
+    if (session.pooled) {
+      if (session.ownBrowser && !isBrowserAlive(session.ownBrowser)) {
+        // 会话自带的浏览器已断开，回退到共享浏览器
+        session.ownBrowser = null;
+        state.context = null;
+        state.page = null;
+      }
+      if (session.ownBrowser) {
+        state.browser = session.ownBrowser;
+      } else {
+        await attachSharedBrowser(session);
+      }
+    } else if (!isBrowserAlive(state.browser)) {
       const browserType = (process.env.PW_BROWSER_TYPE || 'chromium').toLowerCase();
       state.browser = await helpers.launchBrowser(browserType);
       state.context = null;
@@ -181,12 +388,35 @@ async function main() {
     }
 
     if (!state.context) {
-      state.context = await state.browser.newContext(getContextOptionsWithHeaders({}));
+      const startedAt = Date.now();
+      state.context = await state.browser.newContext(getContextOptionsWithHeaders({}, session));
+      contextCreatedMs = Date.now() - startedAt;
+      counters.contextsCreated += 1;
     }
 
     if (!state.page || (typeof state.page.isClosed === 'function' && state.page.isClosed())) {
       state.page = await state.context.newPage();
     }
+
+    return contextCreatedMs;
+  }
+
+  async function closeSession(name) {
+    const session = sessions.get(name);
+    if (!session) return false;
+    sessions.delete(name);
+    await safeClose(session.state.page);
+    if (session.state.context) {
+      counters.contextsClosed += 1;
+    }
+    await closeSessionContexts(session);
+    if (session.pooled) {
+      await safeClose(session.ownBrowser);
+    } else {
+      await safeClose(session.state.browser);
+    }
+    session.state = { browser: null, context: null, page: null };
+    return true;
   }
 
   function resolveCodeFromArgs(args) {
@@ -202,18 +432,20 @@ async function main() {
     return '';
   }
 
-  async function runUserCode(code) {
+  async function runUserCode(session, code) {
     const captured = createCapturedConsole();
     const AsyncFunction = Object.getPrototypeOf(async function () {}).constructor;
+    const state = session.state;
 
     const safeProcess = Object.assign({}, process, {
+      env: sessionEnv(session),
       exit: (code) => {
         throw new Error(`process.exit(${code}) blocked in persistent session`);
       },
     });
 
     // 调试：记录实际执行的代码
-    serverLog('[runUserCode] Code length:', code.length);
+    serverLog('[runUserCode] Session:', session.name, 'Code length:', code.length);
     serverLog('[runUserCode] Code preview:', code.slice(0, 200));
 
     const fn = new AsyncFunction(
@@ -227,9 +459,12 @@ async function main() {
       'require',
       'process',
       'getContextOptionsWithHeaders',
+      // 用户代码放在独立块作用域中：SKILL.md 写法 const browser = await chromium.launch() 会遮蔽外层变量而不是重复声明
       `
 let { browser, context, page } = state;
+{
 ${code}
+}
 state.browser = browser;
 state.context = context;
 state.page = page;
@@ -237,17 +472,18 @@ state.page = page;
     );
 
     try {
+      const pooled = session.pooled;
       await fn(
         captured.console,
         state,
-        helpers,
-        chromium,
-        firefox,
-        webkit,
+        pooled ? createSessionHelpers(session) : helpers,
+        pooled ? createBrowserTypeShim(session, chromium, 'chromium') : chromium,
+        pooled ? createBrowserTypeShim(session, firefox, 'firefox') : firefox,
+        pooled ? createBrowserTypeShim(session, webkit, 'webkit') : webkit,
         devices,
         requireFromSkill,
         safeProcess,
-        getContextOptionsWithHeaders
+        (options = {}) => getContextOptionsWithHeaders(options, session)
       );
       return { ok: true, stdout: captured.stdout, stderr: captured.stderr };
     } catch (e) {
@@ -257,99 +493,123 @@ state.page = page;
     }
   }
 
-  let chain = Promise.resolve();
-  const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+  function collectStats() {
+    return {
+      sessions: sessions.size,
+      sharedBrowserAlive: isBrowserAlive(shared.browser),
+      browserLaunches: shared.launches,
+      privateBrowserLaunches: counters.privateBrowserLaunches,
+      contextsCreated: counters.contextsCreated,
+      contextsClosed: counters.contextsClosed,
+    };
+  }
 
-  rl.on('line', (line) => {
-    const raw = (line || '').trim();
-    if (!raw) return;
+  async function handleExec(id, params) {
+    const session = getSession(params.session);
+    session.lastUsed = Date.now();
+    applyEnv(session, params.env);
+
+    const contextCreatedMs = await ensureBrowserContextPage(session);
+    const code = resolveCodeFromArgs(params.args);
+    if (!code) {
+      send({
+        id,
+        ok: false,
+        error: 'No code to execute (args empty)',
+        stdout: [],
+        stderr: [],
+      });
+      return;
+    }
 
-    chain = chain.then(async () => {
-      let req;
-      try {
-        req = JSON.parse(raw);
-      } catch (_) {
-        // 无效 JSON，忽略
+    const result = await runUserCode(session, code);
+    const page = session.state.page;
+    const pageUrl = page && typeof page.url === 'function' ? page.url() : null;
+    send({
+      id,
+      ok: !!result.ok,
+      stdout: result.stdout || [],
+      stderr: result.stderr || [],
+      error: result.error,
+      state: { pageUrl, contextCreatedMs },
+    });
+  }
+
+  async function handleRequest(req) {
+    const id = req.id;
+    const method = req.method;
+    const params = req.params || {};
+
+    try {
+      if (method === 'ping') {
+        send({ id, ok: true, state: { alive: true } });
         return;
       }
 
-      // 验证请求格式：必须是对象且包含 id
-      if (!req || typeof req !== 'object' || Array.isArray(req) || !req.id) {
-        // 畸形请求，忽略（无法响应因为没有有效 id）
-        serverLog('[playwright_persistent_server] Malformed request ignored:', raw.slice(0, 100));
+      if (method === 'stats') {
+        send({ id, ok: true, state: collectStats() });
         return;
       }
 
-      const id = req.id;
-      const method = req.method;
-      const params = req.params || {};
-
-      // 仅处理允许的 env 变量，过滤敏感变量
-      const BLOCKED_ENV_KEYS = ['NODE_OPTIONS', 'PATH', 'HOME', 'USERPROFILE', 'TEMP', 'TMP'];
-      if (params.env && typeof params.env === 'object') {
-        for (const [k, v] of Object.entries(params.env)) {
-          if (BLOCKED_ENV_KEYS.includes(k.toUpperCase())) {
-            continue; // 跳过敏感变量
-          }
-          if (v === null || v === undefined) {
-            delete process.env[k];
-          } else {
-            process.env[k] = String(v);
-          }
-        }
+      if (method === 'close_session') {
+        const closed = await closeSession(params.session || DEFAULT_SESSION);
+        send({ id, ok: true, state: { closed } });
+        return;
       }
 
-      try {
-        if (method === 'ping') {
-          send({ id, ok: true, state: { alive: true } });
-          return;
+      if (method === 'close') {
+        for (const name of Array.from(sessions.keys())) {
+          await closeSession(name);
         }
+        await safeClose(shared.browser);
+        shared.browser = null;
+        send({ id, ok: true });
+        setTimeout(() => process.exit(0), 10);
+        return;
+      }
 
-        if (method === 'close') {
-          await safeClose(state.page);
-          state.page = null;
-          await safeClose(state.context);
-          state.context = null;
-          await safeClose(state.browser);
-          state.browser = null;
-          send({ id, ok: true });
-          setTimeout(() => process.exit(0), 10);
-          return;
-        }
+      if (method === 'exec') {
+        await handleExec(id, params);
+        return;
+      }
 
-        if (method === 'exec') {
-          await ensureBrowserContextPage();
-          const code = resolveCodeFromArgs(params.args);
-          if (!code) {
-            send({
-              id,
-              ok: false,
-              error: 'No code to execute (args empty)',
-              stdout: [],
-              stderr: [],
-            });
-            return;
-          }
-
-          const result = await runUserCode(code);
-          const pageUrl = state.page && typeof state.page.url === 'function' ? state.page.url() : null;
-          send({
-            id,
-            ok: !!result.ok,
-            stdout: result.stdout || [],
-            stderr: result.stderr || [],
-            error: result.error,
-            state: { pageUrl },
-          });
-          return;
-        }
+      send({ id, ok: false, error: `Unknown method: ${method}`, stdout: [], stderr: [] });
+    } catch (e) {
+      const msg = e?.stack || e?.message || String(e);
+      send({ id, ok: false, error: msg, stdout: [], stderr: [msg] });
+    }
+  }
 
-        send({ id, ok: false, error: `Unknown method: ${method}`, stdout: [], stderr: [] });
-      } catch (e) {
-        const msg = e?.stack || e?.message || String(e);
-        send({ id, ok: false, error: msg, stdout: [], stderr: [msg] });
-      }
-    });
+  const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+
+  rl.on('line', (line) => {
+    const raw = (line || '').trim();
+    if (!raw) return;
+
+    let req;
+    try {
+      req = JSON.parse(raw);
+    } catch (_) {
+      // 无效 JSON，忽略
+      return;
+    }
+
+    // 验证请求格式：必须是对象且包含 id
+    if (!req || typeof req !== 'object' || Array.isArray(req) || !req.id) {
+      // 畸形请求，忽略（无法响应因为没有有效 id）
+      serverLog('[playwright_persistent_server] Malformed request ignored:', raw.slice(0, 100));
+      return;
+    }
+
+    if (req.method === 'exec') {
+      // 同一会话内串行，不同会话并发
+      const session = getSession((req.params || {}).session);
+      session.chain = session.chain.then(() => handleRequest(req));
+      return;
+    }
+
+    // ping/stats/close_session/close 不排队：close_session 需要能中断卡住的会话
+    handleRequest(req);
   });
 
   serverLog('[playwright_persistent_server] Ready. Waiting for commands...');
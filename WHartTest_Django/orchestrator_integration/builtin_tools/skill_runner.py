@@ -0,0 +1,255 @@
+"""
+Skill 命令异步执行器
+
+- SkillDirectoryCache: Skill 名称 -> 目录的进程内缓存，Skill 保存/删除时失效（通过共享缓存中的版本戳通知其他进程），
+  另有 SKILL_DIRECTORY_CACHE_TTL（秒，默认 300）兜底
+- SkillConcurrencyLimiter: 全局 + 每用户的并发上限，跨事件循环/线程共享；用户名额在没有执行和等待时回收
+- run_shell_command: 基于 asyncio 子进程执行命令，增量读取 stdout/stderr 并回调
+"""
+import asyncio
+import codecs
+import logging
+import os
+import platform
+import signal
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('orchestrator_integration')
+
+
+class SkillDirectoryCache:
+    """
+    Skill 名称 -> 绝对目录路径（仅包含启用的 Skill）
+
+    每次读取时比对共享缓存（Django 默认缓存，配置 REDIS_URL 时为 Redis）中的版本戳，
+    其他进程保存/删除 Skill 后本进程随即重新加载；共享缓存不可用时依靠 TTL 过期
+    """
+
+    VERSION_KEY = 'skill_directory_version'
+
+    _directories: Optional[Dict[str, Optional[str]]] = None
+    _loaded_at = 0.0
+    _version = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _ttl() -> float:
+        return float(getattr(settings, 'SKILL_DIRECTORY_CACHE_TTL', 300))
+
+    @classmethod
+    def _shared_version(cls):
+        try:
+            return cache.get(cls.VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"读取 Skill 目录缓存版本失败，按 TTL 过期: {e}")
+            return cls._version
+
+    @classmethod
+    def _load(cls) -> Dict[str, Optional[str]]:
+        from skills.models import Skill
+
+        directories: Dict[str, Optional[str]] = {}
+        # 与原先 filter(...).first() 一致：同名 Skill 取模型默认排序（-created_at）的第一个
+        for name, skill_path in Skill.objects.filter(is_active=True).values_list('name', 'skill_path'):
+            if name in directories:
+                continue
+            directories[name] = (
+                os.path.abspath(os.path.join(settings.MEDIA_ROOT, skill_path)) if skill_path else None
+            )
+        return directories
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Optional[str]]:
+        """返回当前缓存（未命中、过期或版本变化时一次查询加载全部启用的 Skill）"""
+        version = cls._shared_version()
+        with cls._lock:
+            stale = (
+                cls._directories is None
+                or version != cls._version
+                or time.monotonic() - cls._loaded_at > cls._ttl()
+            )
+            if stale:
+                # 先记录版本再加载：加载期间发生的变更会再次更新版本，下次读取时重新加载
+                cls._directories = cls._load()
+                cls._loaded_at = time.monotonic()
+                cls._version = version
+            return cls._directories
+
+    @classmethod
+    def get(cls, skill_name: str) -> Optional[str]:
+        return cls.snapshot().get(skill_name)
+
+    @classmethod
+    def exists(cls, skill_name: str) -> bool:
+        return skill_name in cls.snapshot()
+
+    @classmethod
+    def available_names(cls):
+        return list(cls.snapshot().keys())
+
+    @classmethod
+    def invalidate(cls) -> None:
+        with cls._lock:
+            cls._directories = None
+        try:
+            cache.set(cls.VERSION_KEY, uuid.uuid4().hex, None)
+        except Exception as e:
+            logger.warning(f"更新 Skill 目录缓存版本失败，其他进程最多在 {cls._ttl()} 秒内使用旧目录: {e}")
+
+
+class SkillConcurrencyLimiter:
+    """
+    Skill 子进程并发池
+
+    使用 threading 信号量而不是 asyncio.Semaphore：Agent Loop、同步视图
+    （async_to_sync 新建的事件循环）和脚本直接调用可能处于不同的事件循环。
+    """
+
+    _global_semaphore: Optional[threading.BoundedSemaphore] = None
+    # user_id -> [信号量, 正在执行或等待的调用数]，调用数归零时移除，避免随用户数无限增长
+    _user_semaphores: Dict[int, list] = {}
+    _lock = threading.Lock()
+    POLL_INTERVAL = 0.05
+
+    @classmethod
+    def _semaphores(cls, user_id):
+        with cls._lock:
+            if cls._global_semaphore is None:
+                cls._global_semaphore = threading.BoundedSemaphore(
+                    int(getattr(settings, 'SKILL_EXECUTION_MAX_CONCURRENCY', 8))
+                )
+            entry = cls._user_semaphores.get(user_id)
+            if entry is None:
+                entry = [threading.BoundedSemaphore(int(getattr(settings, 'SKILL_EXECUTION_MAX_PER_USER', 2))), 0]
+                cls._user_semaphores[user_id] = entry
+            entry[1] += 1
+            return cls._global_semaphore, entry[0]
+
+    @classmethod
+    def _leave(cls, user_id):
+        with cls._lock:
+            entry = cls._user_semaphores.get(user_id)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del cls._user_semaphores[user_id]
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, user_id, wait_timeout: float):
+        """
+        获取一个执行名额：先占用户名额，再占全局名额，避免单个用户占满全局池
+
+        Raises:
+            TimeoutError: 等待超过 wait_timeout 秒仍未获得名额
+        """
+        global_semaphore, user_semaphore = cls._semaphores(user_id)
+        deadline = time.monotonic() + wait_timeout
+        acquired = []
+        try:
+            for semaphore in (user_semaphore, global_semaphore):
+                while not semaphore.acquire(blocking=False):
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError('Skill 执行并发已满，等待超时')
+                    await asyncio.sleep(cls.POLL_INTERVAL)
+                acquired.append(semaphore)
+            yield
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            cls._leave(user_id)
+
+
+@dataclass
+class ShellCommandResult:
+    returncode: Optional[int]
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+
+
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+
+def _kill_process_tree(process: asyncio.subprocess.Process) -> None:
+    """终止 shell 及其子进程（POSIX 下子进程在独立进程组中）"""
+    if process.returncode is not None:
+        return
+    try:
+        if platform.system() != 'Windows':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def run_shell_command(
+    command: str,
+    cwd: str,
+    env: Dict[str, str],
+    timeout: float,
+    on_output: Optional[OutputCallback] = None,
+    chunk_size: int = 4096,
+) -> ShellCommandResult:
+    """
+    异步执行 shell 命令，边读边回调 on_output(stream_name, text)
+
+    输出按原始字节收集，由调用方按平台编码解码；回调中的文本使用 UTF-8 增量解码。
+    """
+    kwargs = {}
+    if platform.system() != 'Windows':
+        kwargs['start_new_session'] = True
+
+    process = await asyncio.create_subprocess_shell(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **kwargs,
+    )
+
+    buffers = {'stdout': bytearray(), 'stderr': bytearray()}
+
+    async def pump(stream: asyncio.StreamReader, name: str):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            data = await stream.read(chunk_size)
+            if not data:
+                break
+            buffers[name].extend(data)
+            if on_output:
+                text = decoder.decode(data)
+                if text:
+                    await on_output(name, text)
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pump(process.stdout, 'stdout'), pump(process.stderr, 'stderr'), process.wait()),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill_process_tree(process)
+        await process.wait()
+    except asyncio.CancelledError:
+        _kill_process_tree(process)
+        raise
+
+    return ShellCommandResult(
+        returncode=process.returncode,
+        stdout=bytes(buffers['stdout']),
+        stderr=bytes(buffers['stderr']),
+        timed_out=timed_out,
+    )
@@ -3,42 +3,83 @@ Skill 工具
 
 提供渐进式加载的 Skill 系统：
 - read_skill_content: 读取 Skill 的 SKILL.md 内容（按需加载）
-- execute_skill_script: 执行 Skill 的 shell 命令（支持持久化浏览器会话）
+- execute_skill_script: 执行 Skill 的 shell 命令（异步子进程，增量输出上报为 tool_progress，支持持久化浏览器会话）
 """
 
+import asyncio
+import inspect
 import logging
-import subprocess
 import os
+import platform
+import re
 import threading
-from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
-from langchain_core.tools import tool as langchain_tool
+from asgiref.sync import sync_to_async
+from langchain_core.tools import StructuredTool, tool as langchain_tool
 from django.conf import settings
 
-from .persistent_playwright import PlaywrightSessionManager, extract_runjs_args
+from ..tool_progress import report_tool_progress
+from .persistent_playwright import (
+    PlaywrightBrowserPool,
+    PlaywrightSessionManager,
+    compute_browser_pool_size,
+    extract_runjs_args,
+)
+from .skill_runner import SkillConcurrencyLimiter, SkillDirectoryCache, run_shell_command
 
 logger = logging.getLogger('orchestrator_integration')
 
-_playwright_session_manager: Optional[PlaywrightSessionManager] = None
+_playwright_session_manager: Optional[Union[PlaywrightSessionManager, PlaywrightBrowserPool]] = None
 _playwright_session_manager_lock = threading.Lock()
 
+SKILL_COMMAND_TIMEOUT_SECONDS = 120
 
-def _get_playwright_session_manager() -> PlaywrightSessionManager:
-    """延迟初始化，避免在 import 时启动后台清理线程（线程安全）"""
+
+def _get_playwright_session_manager() -> Union[PlaywrightSessionManager, PlaywrightBrowserPool]:
+    """
+    延迟初始化，避免在 import 时启动后台清理线程（线程安全）
+
+    PLAYWRIGHT_BROWSER_POOL_ENABLED=True（默认）时使用浏览器池：进程数按 CPU/内存预算封顶，
+    会话以独立 BrowserContext 共享浏览器；关闭后回退为每会话一个浏览器进程。
+    """
     global _playwright_session_manager
     if _playwright_session_manager is None:
         with _playwright_session_manager_lock:
             if _playwright_session_manager is None:
                 idle_timeout = getattr(settings, "PLAYWRIGHT_BROWSER_SESSION_IDLE_TIMEOUT_SECONDS", 15 * 60)
-                max_sessions = getattr(settings, "PLAYWRIGHT_BROWSER_MAX_SESSIONS", 20)
-                _playwright_session_manager = PlaywrightSessionManager(
-                    idle_timeout_seconds=int(idle_timeout),
-                    max_sessions=int(max_sessions),
-                )
+                if getattr(settings, "PLAYWRIGHT_BROWSER_POOL_ENABLED", True):
+                    # 0 表示按 CPU/内存预算自动计算
+                    max_processes = getattr(settings, "PLAYWRIGHT_BROWSER_POOL_MAX_PROCESSES", 0)
+                    if not max_processes:
+                        max_processes = compute_browser_pool_size(
+                            memory_per_browser_mb=int(getattr(settings, "PLAYWRIGHT_BROWSER_POOL_MEMORY_PER_BROWSER_MB", 512)),
+                            memory_fraction=float(getattr(settings, "PLAYWRIGHT_BROWSER_POOL_MEMORY_FRACTION", 0.5)),
+                        )
+                    _playwright_session_manager = PlaywrightBrowserPool(
+                        max_processes=int(max_processes),
+                        contexts_per_process=int(getattr(settings, "PLAYWRIGHT_BROWSER_POOL_CONTEXTS_PER_PROCESS", 8)),
+                        recycle_after_contexts=int(getattr(settings, "PLAYWRIGHT_BROWSER_POOL_RECYCLE_AFTER_CONTEXTS", 200)),
+                        idle_timeout_seconds=int(idle_timeout),
+                        max_sessions=int(getattr(settings, "PLAYWRIGHT_BROWSER_POOL_MAX_SESSIONS", 100)),
+                    )
+                else:
+                    max_sessions = getattr(settings, "PLAYWRIGHT_BROWSER_MAX_SESSIONS", 20)
+                    _playwright_session_manager = PlaywrightSessionManager(
+                        idle_timeout_seconds=int(idle_timeout),
+                        max_sessions=int(max_sessions),
+                    )
     return _playwright_session_manager
 
 
+def get_playwright_session_stats() -> dict:
+    """当前持久化 Playwright 会话的运行指标（未初始化时不创建管理器）"""
+    manager = _playwright_session_manager
+    if manager is None:
+        return {"mode": "uninitialized", "sessions": 0, "processes": 0}
+    return manager.stats()
+
+
 def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = None, chat_session_id: str = None) -> list:
     """获取 Skill 工具列表（Skills 全局共享，不限制项目）"""
     current_user_id = user_id
@@ -86,8 +127,102 @@ def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = No
             logger.error(f"[read_skill_content] 读取失败: {e}", exc_info=True)
             return f"错误: {str(e)}"
 
-    @langchain_tool
-    def execute_skill_script(skill_name: str, command: str, session_id: str = None) -> str:
+    def _prepare_skill_execution(skill_name: str, command: str, session_id: str = None):
+        """
+        解析 Skill 目录、准备环境变量和截图目录（同步文件操作，开销很小）
+
+        Returns:
+            (error_message, skill_dir, env, screenshots_dir, exec_command)
+        """
+        skill_dir = SkillDirectoryCache.get(skill_name)
+        if not SkillDirectoryCache.exists(skill_name):
+            available_list = SkillDirectoryCache.available_names()
+            return f"错误: 未找到名为 '{skill_name}' 的 Skill。可用的 Skills: {available_list}", None, None, None, None
+
+        if not skill_dir or not os.path.isdir(skill_dir):
+            return f"错误: Skill '{skill_name}' 目录不存在", None, None, None, None
+
+        logger.info(f"[execute_skill_script] 在目录 {skill_dir} 执行: {command}")
+
+        env = os.environ.copy()
+        env['WHARTTEST_BACKEND_URL'] = getattr(settings, 'WHARTTEST_BACKEND_URL', 'http://localhost:8000')
+        env['WHARTTEST_API_KEY'] = getattr(settings, 'WHARTTEST_API_KEY', '')
+
+        # 截图目录：使用 playwright-skill 目录下的 media/screenshots（跨 skill 共享）
+        # 优先使用 test_case_id（最稳定），其次 session_id，最后 _default
+        playwright_skill_dir = SkillDirectoryCache.get('playwright-skill') or skill_dir
+
+        # 确定截图子目录 key
+        case_dir_key = None
+        if current_test_case_id:
+            case_dir_key = str(current_test_case_id)
+        elif session_id:
+            case_dir_key = session_id
+
+        if case_dir_key:
+            screenshots_dir = os.path.abspath(os.path.join(playwright_skill_dir, 'media', 'screenshots', case_dir_key))
+            # 使用标记文件记录当前 chat_session_id，不同对话时清空目录
+            session_marker = os.path.join(screenshots_dir, '.chat_session')
+            current_chat_id = current_chat_session_id or 'default'
+            should_clear = False
+            if os.path.exists(screenshots_dir):
+                if os.path.exists(session_marker):
+                    with open(session_marker, 'r') as f:
+                        stored_chat_id = f.read().strip()
+                    if stored_chat_id != current_chat_id:
+                        should_clear = True
+                else:
+                    should_clear = True
+            if should_clear:
+                import shutil
+                shutil.rmtree(screenshots_dir, ignore_errors=True)
+                logger.info(f"[execute_skill_script] 清空旧截图目录: {screenshots_dir}")
+            os.makedirs(screenshots_dir, exist_ok=True)
+            with open(session_marker, 'w') as f:
+                f.write(current_chat_id)
+        else:
+            screenshots_dir = os.path.abspath(os.path.join(playwright_skill_dir, 'media', 'screenshots', '_default'))
+            os.makedirs(screenshots_dir, exist_ok=True)
+        env['SCREENSHOT_DIR'] = screenshots_dir
+
+        # Windows 兼容：将单引号包裹的参数转换为双引号（用于 cmd.exe）
+        # 同时处理多行字符串，将换行符转换为单行
+        exec_command = command
+        if platform.system() == 'Windows':
+            # 处理多行字符串：将双引号内的换行符替换为空格或分号
+            def collapse_multiline(m):
+                content = m.group(1)
+                # 将换行替换为空格，保持代码可执行
+                collapsed = ' '.join(line.strip() for line in content.split('\n') if line.strip())
+                return f'"{collapsed}"'
+            # 匹配 "..." 形式的多行字符串
+            exec_command = re.sub(r'"([^"]*\n[^"]*)"', collapse_multiline, command)
+
+            # 单引号转双引号
+            def convert_quotes(m):
+                param = m.group(1)
+                value = m.group(2)
+                escaped = value.replace('"', '\\"')
+                return f'{param}"{escaped}"'
+            exec_command = re.sub(r"(--\w+\s+)'([^']*)'", convert_quotes, exec_command)
+
+            if exec_command != command:
+                logger.info(f"[execute_skill_script] Windows 命令转换完成")
+
+        return None, skill_dir, env, screenshots_dir, exec_command
+
+    def _decode_output(data: bytes) -> str:
+        """Windows cmd 默认 GBK：先尝试 UTF-8（现代工具通常输出 UTF-8），失败再用 GBK"""
+        if not data:
+            return ''
+        if platform.system() == 'Windows':
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError:
+                return data.decode('gbk', errors='replace')
+        return data.decode('utf-8', errors='replace')
+
+    async def _aexecute_skill_script(skill_name: str, command: str, session_id: str = None) -> str:
         """
         执行指定 Skill 的命令。
 
@@ -104,100 +239,14 @@ def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = No
         Returns:
             命令执行的输出结果
         """
-        from skills.models import Skill
-
         logger.info(f"[execute_skill_script] skill_name={skill_name}, command={command}")
 
         try:
-            skill = Skill.objects.filter(
-                name=skill_name,
-                is_active=True
-            ).first()
-
-            if not skill:
-                available = Skill.objects.filter(
-                    is_active=True
-                ).values_list('name', flat=True)
-                available_list = list(available)
-                return f"错误: 未找到名为 '{skill_name}' 的 Skill。可用的 Skills: {available_list}"
-
-            skill_dir = skill.get_full_path()
-            if not skill_dir or not os.path.isdir(skill_dir):
-                return f"错误: Skill '{skill_name}' 目录不存在"
-
-            logger.info(f"[execute_skill_script] 在目录 {skill_dir} 执行: {command}")
-
-            env = os.environ.copy()
-            env['WHARTTEST_BACKEND_URL'] = getattr(settings, 'WHARTTEST_BACKEND_URL', 'http://localhost:8000')
-            env['WHARTTEST_API_KEY'] = getattr(settings, 'WHARTTEST_API_KEY', '')
-
-            # 截图目录：使用 playwright-skill 目录下的 media/screenshots（跨 skill 共享）
-            # 优先使用 test_case_id（最稳定），其次 session_id，最后 _default
-            playwright_skill = Skill.objects.filter(name='playwright-skill', is_active=True).first()
-            if playwright_skill and playwright_skill.skill_path:
-                playwright_skill_dir = os.path.join(settings.MEDIA_ROOT, playwright_skill.skill_path)
-            else:
-                playwright_skill_dir = skill_dir
-
-            # 确定截图子目录 key
-            case_dir_key = None
-            if current_test_case_id:
-                case_dir_key = str(current_test_case_id)
-            elif session_id:
-                case_dir_key = session_id
-
-            if case_dir_key:
-                screenshots_dir = os.path.abspath(os.path.join(playwright_skill_dir, 'media', 'screenshots', case_dir_key))
-                # 使用标记文件记录当前 chat_session_id，不同对话时清空目录
-                session_marker = os.path.join(screenshots_dir, '.chat_session')
-                current_chat_id = current_chat_session_id or 'default'
-                should_clear = False
-                if os.path.exists(screenshots_dir):
-                    if os.path.exists(session_marker):
-                        with open(session_marker, 'r') as f:
-                            stored_chat_id = f.read().strip()
-                        if stored_chat_id != current_chat_id:
-                            should_clear = True
-                    else:
-                        should_clear = True
-                if should_clear:
-                    import shutil
-                    shutil.rmtree(screenshots_dir, ignore_errors=True)
-                    logger.info(f"[execute_skill_script] 清空旧截图目录: {screenshots_dir}")
-                os.makedirs(screenshots_dir, exist_ok=True)
-                with open(session_marker, 'w') as f:
-                    f.write(current_chat_id)
-            else:
-                screenshots_dir = os.path.abspath(os.path.join(playwright_skill_dir, 'media', 'screenshots', '_default'))
-                os.makedirs(screenshots_dir, exist_ok=True)
-            env['SCREENSHOT_DIR'] = screenshots_dir
-
-            # Windows 兼容：将单引号包裹的参数转换为双引号（用于 cmd.exe）
-            # 同时处理多行字符串，将换行符转换为单行
-            import platform
-            import re
-
-            exec_command = command
-            if platform.system() == 'Windows':
-                # 处理多行字符串：将双引号内的换行符替换为空格或分号
-                def collapse_multiline(m):
-                    content = m.group(1)
-                    # 将换行替换为空格，保持代码可执行
-                    collapsed = ' '.join(line.strip() for line in content.split('\n') if line.strip())
-                    return f'"{collapsed}"'
-                # 匹配 "..." 形式的多行字符串
-                exec_command = re.sub(r'"([^"]*\n[^"]*)"', collapse_multiline, command)
-
-                # 单引号转双引号
-                def convert_quotes(m):
-                    param = m.group(1)
-                    value = m.group(2)
-                    escaped = value.replace('"', '\\"')
-                    return f'{param}"{escaped}"'
-                exec_command = re.sub(r"(--\w+\s+)'([^']*)'", convert_quotes, exec_command)
-
-                if exec_command != command:
-                    logger.info(f"[execute_skill_script] Windows 命令转换完成")
+            error, skill_dir, env, screenshots_dir, exec_command = await sync_to_async(
+                _prepare_skill_execution
+            )(skill_name, command, session_id)
+            if error:
+                return error
 
             # 持久化 Playwright 会话路径
             # 仅当 session_id 存在 + skill_name == 'playwright-skill' + 命令是 run.js 调用时启用
@@ -211,60 +260,46 @@ def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = No
                     session_key = f"{current_user_id}_{current_project_id}_{chat_id_part}_{session_id}"
                     try:
                         manager = _get_playwright_session_manager()
-                        output = manager.execute_run_js(
+                        output = await asyncio.to_thread(
+                            manager.execute_run_js,
                             session_key=session_key,
                             skill_dir=skill_dir,
                             run_js_args=run_js_args,
                             env=env,
-                            timeout_seconds=120,
+                            timeout_seconds=SKILL_COMMAND_TIMEOUT_SECONDS,
                         )
                         logger.info(f"[execute_skill_script] 持久化会话执行完成, session_key={session_key}")
                         result_output = output.strip() if output.strip() else "(无输出)"
                         return f"[PERSISTENT_SESSION] session_id={session_id}\n[SCREENSHOT_DIR] {screenshots_dir}\n{result_output}\n[提示] 后续步骤请继续使用 session_id=\"{session_id}\"；截图已保存在 {screenshots_dir}"
                     except TimeoutError:
                         logger.error("[execute_skill_script] 持久化 Playwright 执行超时")
-                        return "错误: 命令执行超时（120秒）"
+                        return f"错误: 命令执行超时（{SKILL_COMMAND_TIMEOUT_SECONDS}秒）"
                     except Exception as e:
                         logger.error(f"[execute_skill_script] 持久化 Playwright 执行失败: {e}", exc_info=True)
                         return f"错误: {str(e)}"
 
-            # Windows 编码处理：cmd.exe 默认使用 GBK (cp936)，需要使用系统默认编码
-            import locale
-            if platform.system() == 'Windows':
-                # Windows cmd 默认使用 GBK 编码，使用 None 让 subprocess 自动检测
-                result = subprocess.run(
-                    exec_command,
-                    shell=True,
-                    cwd=skill_dir,
-                    capture_output=True,
-                    timeout=120,
-                    env=env,
-                )
-                # 智能解码：先尝试 UTF-8（现代工具通常输出 UTF-8），失败再用 GBK（Windows cmd 默认）
-                def smart_decode(data: bytes) -> str:
-                    if not data:
-                        return ''
-                    try:
-                        return data.decode('utf-8')
-                    except UnicodeDecodeError:
-                        return data.decode('gbk', errors='replace')
-                
-                stdout = smart_decode(result.stdout)
-                stderr = smart_decode(result.stderr)
-            else:
-                result = subprocess.run(
-                    exec_command,
-                    shell=True,
-                    cwd=skill_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=120,
-                    env=env,
-                    encoding='utf-8',
-                    errors='replace'
-                )
-                stdout = result.stdout or ''
-                stderr = result.stderr or ''
+            async def on_output(stream_name: str, text: str):
+                await report_tool_progress('execute_skill_script', stream=stream_name, data=text)
+
+            try:
+                async with SkillConcurrencyLimiter.slot(current_user_id, wait_timeout=SKILL_COMMAND_TIMEOUT_SECONDS):
+                    result = await run_shell_command(
+                        exec_command,
+                        cwd=skill_dir,
+                        env=env,
+                        timeout=SKILL_COMMAND_TIMEOUT_SECONDS,
+                        on_output=on_output,
+                    )
+            except TimeoutError as e:
+                logger.warning(f"[execute_skill_script] {e}")
+                return f"错误: {str(e)}"
+
+            if result.timed_out:
+                logger.error("[execute_skill_script] 执行超时")
+                return f"错误: 命令执行超时（{SKILL_COMMAND_TIMEOUT_SECONDS}秒）"
+
+            stdout = _decode_output(result.stdout)
+            stderr = _decode_output(result.stderr)
 
             output = ''
             if stdout:
@@ -290,11 +325,19 @@ def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = No
 
             return result_output
 
-        except subprocess.TimeoutExpired:
-            logger.error("[execute_skill_script] 执行超时")
-            return "错误: 命令执行超时（120秒）"
         except Exception as e:
             logger.error(f"[execute_skill_script] 执行失败: {e}", exc_info=True)
             return f"错误: {str(e)}"
 
+    def _execute_skill_script(skill_name: str, command: str, session_id: str = None) -> str:
+        """同步调用入口（脚本/测试中直接 invoke 时使用）"""
+        return asyncio.run(_aexecute_skill_script(skill_name, command, session_id))
+
+    execute_skill_script = StructuredTool.from_function(
+        func=_execute_skill_script,
+        coroutine=_aexecute_skill_script,
+        name='execute_skill_script',
+        description=inspect.cleandoc(_aexecute_skill_script.__doc__),
+    )
+
     return [read_skill_content, execute_skill_script]
@@ -0,0 +1,52 @@
+"""
+工具输出读取工具
+
+提供按需读取被截断的工具输出：
+- read_tool_output: 按引用（sha256:...）分段读取完整的工具输出
+"""
+
+import logging
+from langchain_core.tools import tool as langchain_tool
+
+from .. import tool_output_store
+
+logger = logging.getLogger('orchestrator_integration')
+
+MAX_READ_CHARS = 20000
+
+
+def get_tool_output_tools() -> list:
+    """获取工具输出读取工具列表"""
+
+    @langchain_tool
+    def read_tool_output(ref: str, offset: int = 0, limit: int = 8000) -> str:
+        """
+        读取被截断的完整工具输出。
+
+        工具结果过长时，上下文中只保留开头部分并附带 "完整内容引用: sha256:..."。
+        确实需要后续内容（如完整页面快照、接口返回）时使用此工具分段读取，不要重复调用原工具。
+
+        Args:
+            ref: 完整内容引用，格式为 sha256:<64位十六进制>
+            offset: 起始字符位置，默认 0
+            limit: 本次读取的最大字符数，默认 8000，最大 20000
+
+        Returns:
+            指定范围的输出内容，开头注明总长度和读取范围
+        """
+        content = tool_output_store.get(ref)
+        if content is None:
+            return f"未找到工具输出: {ref}"
+
+        offset = max(int(offset or 0), 0)
+        limit = min(max(int(limit or 0), 1), MAX_READ_CHARS)
+        chunk = content[offset:offset + limit]
+        end = offset + len(chunk)
+        logger.info(f"[read_tool_output] ref={ref}, range={offset}-{end}/{len(content)}")
+
+        header = f"[共 {len(content)} 字符，当前 {offset}-{end}"
+        if end < len(content):
+            header += f"，继续读取请使用 offset={end}"
+        return f"{header}]\n{chunk}"
+
+    return [read_tool_output]
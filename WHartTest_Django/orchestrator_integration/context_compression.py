@@ -5,13 +5,20 @@
 - 在对话历史Token超过阈值时自动压缩
 - 保留最近N条消息完整，对更早的消息生成摘要
 - 摘要作为SystemMessage前缀传入LLM
+- 提前压缩：一轮对话结束后使用率超过 precompute_ratio 时在后台摘要下一块消息（precompute），
+  结果存入 checkpoint 元数据；达到 trigger_ratio 时 prepare 直接使用预先生成的摘要，不在请求路径上调用 LLM
+- 相同消息块的摘要按内容哈希缓存（CONTEXT_SUMMARY_CACHE_TTL 秒，默认 7 天）
 """
 import asyncio
+import copy
+import hashlib
 import json
 import logging
 from dataclasses import dataclass
 from typing import Dict, List, Optional, Sequence
 
+from django.conf import settings as django_settings
+from django.core.cache import cache
 from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 
@@ -25,6 +32,7 @@ class CompressionSettings:
     """压缩配置参数"""
     max_context_tokens: int = 128000
     trigger_ratio: float = 0.75  # 达到75%时触发压缩
+    precompute_ratio: float = 0.6  # 达到60%时在后台预先摘要下一块消息
     preserve_recent_messages: int = 4  # 保留最近4条消息（约2轮对话）
     min_messages_to_compress: int = 2  # 至少有2条消息才能压缩
     summary_prefix: str = "对话历史摘要"
@@ -49,11 +57,62 @@ class ConversationCompressor:
         self.model_name = model_name or getattr(llm, "model_name", "gpt-4o")
         self.settings = settings or CompressionSettings()
 
+    def _available_tokens(self) -> int:
+        return max(self.settings.max_context_tokens - self.settings.reserved_tokens, 1000)
+
+    def needs_precompute(self, token_count: int) -> bool:
+        """当前使用量是否已超过提前压缩的阈值"""
+        return token_count > int(self._available_tokens() * self.settings.precompute_ratio)
+
+    async def precompute(
+        self,
+        messages: Sequence[BaseMessage],
+        summary_text: Optional[str] = None,
+        summarized_count: int = 0,
+        pending: Optional[dict] = None,
+    ) -> Optional[dict]:
+        """
+        提前摘要下一块消息（在后台调用，不影响请求耗时）
+        
+        Returns:
+            待应用的摘要 {'base_count', 'cutoff', 'block_hash', 'summary'}；
+            无需摘要或已有的待应用摘要仍然有效时返回 None
+        """
+        normalized_messages = list(messages or [])
+        cutoff = max(len(normalized_messages) - self.settings.preserve_recent_messages, 0)
+        if cutoff <= summarized_count:
+            return None
+        if self._pending_is_valid(pending, normalized_messages, summarized_count) and pending['cutoff'] >= cutoff:
+            return None
+
+        block = normalized_messages[summarized_count:cutoff]
+        block_summary = await self._summarize_block(block, fallback=False)
+        if not block_summary:
+            return None
+        summary_value = await self._bounded_summary(self._merge_summary(summary_text, block_summary))
+        logger.info("已提前生成对话摘要：消息#%s-#%s", summarized_count, cutoff)
+        return {
+            'base_count': summarized_count,
+            'cutoff': cutoff,
+            'block_hash': self._block_hash(block),
+            'summary': summary_value,
+        }
+
+    def _pending_is_valid(self, pending, messages, summarized_count) -> bool:
+        """待应用的摘要是否仍对应当前的消息历史"""
+        if not pending:
+            return False
+        base_count, cutoff = pending.get('base_count'), pending.get('cutoff')
+        if base_count != summarized_count or not isinstance(cutoff, int) or cutoff > len(messages):
+            return False
+        return pending.get('block_hash') == self._block_hash(messages[base_count:cutoff])
+
     async def prepare(
         self,
         messages: Sequence[BaseMessage],
         summary_text: Optional[str] = None,
         summarized_count: int = 0,
+        pending: Optional[dict] = None,
     ) -> CompressionResult:
         """
         准备上下文：检查是否需要压缩，如需则执行压缩
@@ -62,6 +121,7 @@ class ConversationCompressor:
             messages: 当前完整消息历史
             summary_text: 已有的摘要文本
             summarized_count: 已被摘要覆盖的消息数量
+            pending: precompute 提前生成的摘要（如有）
         
         Returns:
             CompressionResult: 压缩结果
@@ -71,9 +131,7 @@ class ConversationCompressor:
         incoming_count = summarized_count or 0
 
         # 计算可用Token空间
-        available_tokens = max(
-            self.settings.max_context_tokens - self.settings.reserved_tokens, 1000
-        )
+        available_tokens = self._available_tokens()
         
         # 计算现有摘要的Token数
         summary_tokens = (
@@ -104,6 +162,21 @@ class ConversationCompressor:
             
             cutoff = max(len(normalized_messages) - preserve_count, 0)
             
+            # 优先使用后台提前生成的摘要，应用后已低于触发阈值时不再同步调用 LLM
+            if self._pending_is_valid(pending, normalized_messages, incoming_count):
+                summary_value = pending['summary']
+                new_summarized_count = pending['cutoff']
+                summary_updated = True
+                remaining_tokens = (
+                    self._estimate_token_count(normalized_messages[new_summarized_count:])
+                    + context_checker.count_tokens(summary_value, self.model_name)
+                )
+                logger.info(
+                    "对话上下文已压缩（使用提前生成的摘要）：覆盖消息#0-#%s", new_summarized_count
+                )
+                if remaining_tokens <= trigger_tokens:
+                    cutoff = new_summarized_count
+            
             # 检查是否有新的消息需要摘要
             if cutoff > new_summarized_count:
                 block = normalized_messages[new_summarized_count:cutoff]
@@ -118,14 +191,8 @@ class ConversationCompressor:
                         cutoff, preserve_count
                     )
                     
-                    # 检查摘要是否过长（超过可用空间的30%），如果是则重新压缩摘要
-                    summary_tokens = context_checker.count_tokens(summary_value, self.model_name)
-                    max_summary_tokens = int(available_tokens * 0.3)
-                    if summary_tokens > max_summary_tokens:
-                        logger.info(f"摘要过长({summary_tokens} tokens)，重新压缩...")
-                        summary_value = await self._recompress_summary(summary_value)
-                        logger.info(f"摘要重压缩完成")
-            else:
+                    summary_value = await self._bounded_summary(summary_value)
+            elif not summary_updated:
                 logger.debug("触发压缩但无新消息块可处理（cutoff=%s, summarized_count=%s）", cutoff, new_summarized_count)
 
         # 构建最终消息列表
@@ -149,6 +216,9 @@ class ConversationCompressor:
             state_updates["context_summary"] = summary_value
         if new_summarized_count != incoming_count:
             state_updates["summarized_message_count"] = new_summarized_count
+        if pending and new_summarized_count != incoming_count:
+            # 已应用或已被新的压缩覆盖
+            state_updates["pending_summary"] = None
 
         return CompressionResult(
             messages=context_messages,
@@ -158,6 +228,40 @@ class ConversationCompressor:
             token_count=final_token_count,
         )
 
+    async def _bounded_summary(self, summary_value: str) -> str:
+        """摘要过长（超过可用空间的30%）时重新压缩"""
+        summary_tokens = context_checker.count_tokens(summary_value, self.model_name)
+        max_summary_tokens = int(self._available_tokens() * 0.3)
+        if summary_tokens > max_summary_tokens:
+            logger.info(f"摘要过长({summary_tokens} tokens)，重新压缩...")
+            summary_value = await self._recompress_summary(summary_value)
+            logger.info(f"摘要重压缩完成")
+        return summary_value
+
+    def _block_hash(self, block: Sequence[BaseMessage]) -> str:
+        """消息块的内容哈希（摘要缓存与待应用摘要校验使用）"""
+        text = "\n\n".join(self._message_to_text(msg) for msg in block)
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    async def _cached(self, kind: str, digest: str, producer):
+        """按内容哈希缓存摘要；只缓存 LLM 生成成功的结果"""
+        key = f"context_summary:{kind}:{digest}"
+        try:
+            cached = await cache.aget(key)
+        except Exception as e:
+            logger.debug("读取摘要缓存失败: %s", e)
+            cached = None
+        if cached:
+            logger.debug("摘要缓存命中: %s", key)
+            return cached
+        value, cacheable = await producer()
+        if value and cacheable:
+            try:
+                await cache.aset(key, value, getattr(django_settings, "CONTEXT_SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+            except Exception as e:
+                logger.debug("写入摘要缓存失败: %s", e)
+        return value
+
     def _message_to_text(self, message: BaseMessage) -> str:
         """将消息转换为文本"""
         role = getattr(message, "type", message.__class__.__name__)
@@ -199,6 +303,11 @@ class ConversationCompressor:
 
     async def _recompress_summary(self, long_summary: str) -> str:
         """当摘要本身过长时，重新生成更简洁的摘要"""
+        digest = hashlib.sha256(f"{self.model_name}\n{long_summary}".encode("utf-8")).hexdigest()
+        return await self._cached("recompress", digest, lambda: self._generate_recompressed(long_summary))
+
+    async def _generate_recompressed(self, long_summary: str):
+        """调用 LLM 重新压缩摘要，返回 (摘要, 是否可缓存)"""
         try:
             prompt = f"""以下是一段对话历史的摘要，请将其压缩为更简洁的版本，只保留最关键的信息：
 
@@ -211,7 +320,7 @@ class ConversationCompressor:
                 HumanMessage(content=prompt)
             ])
             
-            return response.content.strip() if hasattr(response, 'content') else str(response).strip()
+            return (response.content.strip() if hasattr(response, 'content') else str(response).strip()), True
         except Exception as e:
             # 某些 OpenAI 兼容服务会返回非标准响应，导致 langchain_openai 在解析 choices 时抛 TypeError
             if isinstance(e, TypeError) and "NoneType" in str(e) and "iterable" in str(e):
@@ -219,10 +328,21 @@ class ConversationCompressor:
             else:
                 logger.error("摘要重压缩失败: %s", e)
             # 回退：截取前半部分
-            return long_summary[:len(long_summary)//2] + "\n[历史摘要已截断]"
+            return long_summary[:len(long_summary)//2] + "\n[历史摘要已截断]", False
 
-    async def _summarize_block(self, block: Sequence[BaseMessage]) -> str:
-        """对消息块生成结构化摘要"""
+    async def _summarize_block(self, block: Sequence[BaseMessage], fallback: bool = True) -> str:
+        """
+        对消息块生成结构化摘要（相同消息块复用缓存的摘要）
+        
+        fallback: LLM 失败时是否返回截断的原文概要（后台提前摘要时不需要，失败后留给请求时处理）
+        """
+        summary = await self._cached(
+            "block", self._block_hash(block), lambda: self._generate_block_summary(block, fallback)
+        )
+        return summary or ""
+
+    async def _generate_block_summary(self, block: Sequence[BaseMessage], fallback: bool):
+        """调用 LLM 生成消息块摘要，返回 (摘要, 是否可缓存)"""
         docs = []
         for msg in block:
             text = self._message_to_text(msg)
@@ -230,7 +350,7 @@ class ConversationCompressor:
                 docs.append(Document(page_content=text))
         
         if not docs:
-            return ""
+            return "", False
 
         try:
             # 合并文档内容
@@ -255,7 +375,7 @@ class ConversationCompressor:
                 HumanMessage(content=summary_prompt)
             ])
             
-            return response.content.strip() if hasattr(response, 'content') else str(response).strip()
+            return (response.content.strip() if hasattr(response, 'content') else str(response).strip()), True
             
         except Exception as e:
             # 某些 OpenAI 兼容服务会返回非标准响应，导致 langchain_openai 在解析 choices 时抛 TypeError
@@ -272,6 +392,81 @@ class ConversationCompressor:
                 logger.warning("摘要生成失败（服务端响应异常，已降级处理）: %s", e)
             else:
                 logger.error("摘要生成失败: %s", e, exc_info=True)
+            if not fallback:
+                return "", False
             # 回退：简单截断
             combined = "\n".join([self._message_to_text(msg) for msg in block[:3]])
-            return f"[摘要生成失败，保留前3条消息概要]\n{combined[:500]}..."
+            return f"[摘要生成失败，保留前3条消息概要]\n{combined[:500]}...", False
+
+
+def checkpoint_write_config(checkpoint_tuple) -> dict:
+    """原地更新 checkpoint（只改写元数据/消息，不新增版本）时传给 aput 的配置"""
+    checkpoint_config = checkpoint_tuple.config.get("configurable", {})
+    update_config = {
+        "configurable": {
+            "thread_id": checkpoint_config.get("thread_id"),
+            "checkpoint_ns": checkpoint_config.get("checkpoint_ns", ""),
+        }
+    }
+    parent_config = checkpoint_tuple.parent_config
+    if parent_config:
+        parent_checkpoint_id = parent_config.get("configurable", {}).get("checkpoint_id")
+        if parent_checkpoint_id:
+            update_config["configurable"]["checkpoint_id"] = parent_checkpoint_id
+    return update_config
+
+
+async def precompute_thread_summary(compressor: ConversationCompressor, thread_id: str) -> Optional[dict]:
+    """
+    为会话的最新 checkpoint 提前生成摘要，写入元数据 context_compression.pending_summary
+    
+    使用独立的 checkpointer 连接，可在响应结束后的后台任务中执行
+    """
+    from wharttest_django.checkpointer import get_async_checkpointer
+
+    async with get_async_checkpointer() as checkpointer:
+        checkpoint_tuple = await checkpointer.aget_tuple({"configurable": {"thread_id": thread_id}})
+        if not checkpoint_tuple:
+            return None
+        checkpoint = checkpoint_tuple.checkpoint or {}
+        messages = checkpoint.get("channel_values", {}).get("messages", []) or []
+        metadata = copy.deepcopy(checkpoint_tuple.metadata or {})
+        compression_meta = dict(metadata.get("context_compression") or {})
+
+        pending = await compressor.precompute(
+            messages,
+            summary_text=compression_meta.get("context_summary"),
+            summarized_count=compression_meta.get("summarized_message_count", 0),
+            pending=compression_meta.get("pending_summary"),
+        )
+        if not pending:
+            return None
+
+        compression_meta["pending_summary"] = pending
+        metadata["context_compression"] = compression_meta
+        await checkpointer.aput(
+            checkpoint_write_config(checkpoint_tuple),
+            checkpoint,
+            metadata,
+            checkpoint.get("channel_versions", {}),
+        )
+        return pending
+
+
+# 后台任务需要保留引用，否则可能在完成前被垃圾回收
+_background_tasks = set()
+
+
+def schedule_precompute(compressor: ConversationCompressor, thread_id: str) -> asyncio.Task:
+    """在当前事件循环中后台执行 precompute_thread_summary，失败只记录日志"""
+
+    async def run():
+        try:
+            await precompute_thread_summary(compressor, thread_id)
+        except Exception as e:
+            logger.warning("会话 %s 提前生成摘要失败: %s", thread_id, e)
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -36,20 +36,25 @@ class OrchestratorState(TypedDict):
     context_token_count: int
 
 
-def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
+KNOWLEDGE_TOOL_TOP_K = 5  # 知识库工具返回所有知识库合计最相关的文档数（不按知识库平均分配）
+
+
+def create_knowledge_tool(project_id: int) -> Tool:
     """
-    创建知识库搜索工具，自动重试最多3次
+    创建知识库搜索工具
+    
+    查询只编码一次，项目下所有激活的知识库并发检索后全局融合排序（knowledge.services.MultiKnowledgeBaseSearch），
+    返回全局最相关的 KNOWLEDGE_TOOL_TOP_K 个文档，某个知识库没有足够相关的内容时可能不出现在结果中
     
     Args:
         project_id: 项目ID
-        max_retries: 最大重试次数
     
     Returns:
         LangChain Tool对象
     """
     def search_knowledge_base(query: str) -> str:
         """
-        在项目的所有知识库中搜索相关文档，自动重试最多3次
+        在项目的所有知识库中搜索相关文档
         
         Args:
             query: 搜索查询字符串
@@ -57,63 +62,50 @@ def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
         Returns:
             搜索结果摘要，如果没找到返回失败信息
         """
-        logger.info(f"🔍 知识库工具被调用: query='{query}', max_retries={max_retries}")
-        
-        for attempt in range(max_retries):
-            try:
-                # 获取项目下所有激活的知识库
-                project_kbs = KnowledgeBase.objects.filter(
-                    project_id=project_id,
-                    is_active=True
-                )
-                
-                if not project_kbs.exists():
-                    msg = f"项目 {project_id} 下没有可用的知识库"
-                    logger.warning(msg)
-                    return msg
-                
-                logger.info(f"  📚 第{attempt+1}次尝试: 在 {project_kbs.count()} 个知识库中搜索...")
-                
-                all_docs = []
-                for kb in project_kbs:
-                    try:
-                        # 使用VectorStoreManager进行搜索
-                        from knowledge.services import KnowledgeBaseService
-                        kb_service = KnowledgeBaseService(kb)
-                        results = kb_service.vector_manager.similarity_search(query, k=3, score_threshold=0.1)
-                        if results:
-                            all_docs.extend(results)
-                            logger.info(f"    └─ {kb.name}: 找到 {len(results)} 个文档")
-                    except Exception as e:
-                        logger.error(f"    └─ {kb.name}: 搜索失败 {e}")
-                
-                if all_docs:
-                    # 找到文档，返回摘要
-                    docs_summary = "\n\n".join([
-                        f"【文档{i+1}】来源: {doc.get('metadata', {}).get('source', '未知')}\n内容: {doc.get('content', '')[:300]}..."
-                        for i, doc in enumerate(all_docs[:5])
-                    ])
-                    logger.info(f"  ✅ 第{attempt+1}次尝试成功: 找到 {len(all_docs)} 个文档")
-                    return f"找到 {len(all_docs)} 个相关文档:\n\n{docs_summary}"
-                else:
-                    logger.info(f"  ⚠️ 第{attempt+1}次尝试: 未找到文档")
-                    if attempt < max_retries - 1:
-                        continue  # 继续重试
-                    else:
-                        return f"在 {project_kbs.count()} 个知识库中搜索了 {max_retries} 次，未找到与'{query}'相关的文档"
+        logger.info(f"🔍 知识库工具被调用: query='{query}'")
+        
+        try:
+            # 获取项目下所有激活的知识库
+            project_kbs = list(KnowledgeBase.objects.filter(
+                project_id=project_id,
+                is_active=True
+            ))
+            
+            if not project_kbs:
+                msg = f"项目 {project_id} 下没有可用的知识库"
+                logger.warning(msg)
+                return msg
+            
+            logger.info(f"  📚 在 {len(project_kbs)} 个知识库中搜索...")
+            
+            from knowledge.services import MultiKnowledgeBaseSearch
+            all_docs = MultiKnowledgeBaseSearch(project_kbs).search(
+                query, k=KNOWLEDGE_TOOL_TOP_K, score_threshold=0.1
+            )
             
-            except Exception as e:
-                logger.error(f"  ❌ 第{attempt+1}次尝试失败: {e}", exc_info=True)
-                if attempt < max_retries - 1:
-                    continue
-                else:
-                    return f"知识库搜索失败（重试{max_retries}次）: {str(e)}"
-        
-        return f"知识库搜索失败: 达到最大重试次数{max_retries}"
+            if not all_docs:
+                # 相同输入重试不会得到不同结果，直接返回
+                logger.info(f"  ⚠️ 未找到文档")
+                return f"在 {len(project_kbs)} 个知识库中未找到与'{query}'相关的文档"
+            
+            docs_summary = "\n\n".join([
+                f"【文档{i+1}】来源: {doc.get('metadata', {}).get('knowledge_base_name', '未知')}/"
+                f"{doc.get('metadata', {}).get('source', '未知')}\n内容: {doc.get('content', '')[:300]}..."
+                for i, doc in enumerate(all_docs)
+            ])
+            logger.info(f"  ✅ 找到 {len(all_docs)} 个文档")
+            return f"找到 {len(all_docs)} 个相关文档:\n\n{docs_summary}"
+        
+        except Exception as e:
+            logger.error(f"  ❌ 知识库搜索失败: {e}", exc_info=True)
+            return f"知识库搜索失败: {str(e)}"
     
     return Tool(
         name="search_knowledge_base",
-        description=f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回相关文档内容。自动重试最多{max_retries}次。适用于查找项目文档、需求、设计等信息。",
+        description=(
+            f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回所有知识库中最相关的"
+            f"{KNOWLEDGE_TOOL_TOP_K}个文档内容（按相关度排序，注明所属知识库）。适用于查找项目文档、需求、设计等信息。"
+        ),
         func=search_knowledge_base
     )
 
@@ -149,7 +141,7 @@ class AgentNodes:
         self.brain_tools = []
         
         if project_id:
-            knowledge_tool = create_knowledge_tool(project_id, max_retries=3)
+            knowledge_tool = create_knowledge_tool(project_id)
             self.all_tools.append(knowledge_tool)
             self.brain_tools.append(knowledge_tool)  # Brain只有knowledge工具用于验证
             logger.info(f"✅ AgentNodes初始化: MCP工具={mcp_tool_count}个, 知识库工具=1个, 总计={len(self.all_tools)}个")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from orchestrator_integration.tool_output_store import purge_expired, retention_days
+
+
+class Command(BaseCommand):
+    help = 'Delete stored agent tool outputs older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Retention period in days (default: AGENT_TOOL_OUTPUT_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **kwargs):
+        days = kwargs.get('days')
+        days = retention_days() if days is None else days
+        self.stdout.write(f'Purging tool outputs older than {days} day(s)...')
+
+        removed = purge_expired(days)
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {removed} file(s) removed.'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator_integration', '0007_change_max_steps_default_500'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentstep',
+            name='tool_metrics',
+            field=models.JSONField(blank=True, default=list, verbose_name='工具调用耗时'),
+        ),
+    ]
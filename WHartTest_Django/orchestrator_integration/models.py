@@ -132,6 +132,7 @@ class AgentStep(models.Model):
     tool_input = models.JSONField(null=True, blank=True, verbose_name='工具输入')
     tool_output_summary = models.TextField(blank=True, verbose_name='工具输出摘要')
     tool_output_full_ref = models.CharField(max_length=200, blank=True, verbose_name='完整输出引用')
+    tool_metrics = models.JSONField(default=list, blank=True, verbose_name='工具调用耗时')
     
     # AI 响应
     ai_response = models.TextField(blank=True, verbose_name='AI响应')
@@ -189,15 +190,25 @@ class AgentBlackboard(models.Model):
     def __str__(self):
         return f"Blackboard for Task {self.task_id}"
     
-    def add_history(self, summary: str):
-        """添加历史摘要"""
+    def add_history(self, summary: str, refs: list = None, save: bool = True):
+        """
+        添加历史摘要，refs 为本步骤转存的工具输出引用
+
+        save=False 时只修改内存中的字段，返回需要写回的字段列表（供批量写回使用）
+        """
         history = list(self.history_summary or [])
         history.append(str(summary))
         # 限制历史长度
         if len(history) > self.MAX_HISTORY_LENGTH:
             history = history[-self.MAX_HISTORY_LENGTH:]
         self.history_summary = history
-        self.save(update_fields=['history_summary', 'updated_at'])
+        changed_fields = ['history_summary']
+        if refs:
+            self.tool_results_refs = (list(self.tool_results_refs or []) + list(refs))[-self.MAX_HISTORY_LENGTH:]
+            changed_fields.append('tool_results_refs')
+        if save:
+            self.save(update_fields=[*changed_fields, 'updated_at'])
+        return changed_fields
     
     def update_state(self, key: str, value):
         """更新当前状态"""
@@ -0,0 +1,14 @@
+"""
+orchestrator_integration 信号处理器
+Skill 变更时清理 Skill 目录缓存
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender='skills.Skill')
+@receiver(post_delete, sender='skills.Skill')
+def invalidate_skill_directory_cache(sender, instance, **kwargs):
+    """Skill 新增、启停、路径变化或删除后，下次执行重新加载目录映射"""
+    from .builtin_tools.skill_runner import SkillDirectoryCache
+    SkillDirectoryCache.invalidate()
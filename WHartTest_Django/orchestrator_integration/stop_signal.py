@@ -1,23 +1,29 @@
 """
 Agent Loop 停止信号管理
 
-提供线程安全的停止信号存储，用于中断正在执行的 Agent Loop。
+停止请求与 Agent Loop 可能运行在不同的 worker 进程上，信号存放在
+wharttest_django.signalling 的共享后端（配置 Redis 时跨进程生效）。
 
 使用场景：
 - 用户点击"停止"按钮时，调用 set_stop_signal(session_id)
-- Agent Loop 在每步检查 should_stop(session_id)
+- Agent Loop 通过 watch_stop_signal(session_id) 订阅停止信号，无需轮询
 - 任务结束后调用 clear_stop_signal(session_id) 清理
 """
 import threading
-import time
-from typing import Dict, Optional
+from typing import Optional
 import logging
 
+from wharttest_django.signalling import signal_backend, watch_signal
+
 logger = logging.getLogger(__name__)
 
 
+def _signal_name(session_id: str) -> str:
+    return f'agent-loop-stop:{session_id}'
+
+
 class StopSignalManager:
-    """停止信号管理器（线程安全的内存存储）"""
+    """停止信号管理器（委托给共享信号后端）"""
 
     def __init__(self, signal_ttl: int = 300):
         """
@@ -26,8 +32,6 @@ class StopSignalManager:
         Args:
             signal_ttl: 信号过期时间（秒），防止信号永不清理
         """
-        self._signals: Dict[str, float] = {}  # session_id -> timestamp
-        self._lock = threading.Lock()
         self._signal_ttl = signal_ttl
 
     def set_stop_signal(self, session_id: str) -> bool:
@@ -40,10 +44,9 @@ class StopSignalManager:
         Returns:
             是否设置成功
         """
-        with self._lock:
-            self._signals[session_id] = time.time()
-            logger.info(f"[StopSignal] Set stop signal for session: {session_id}")
-            return True
+        success = signal_backend().set(_signal_name(session_id), ttl=self._signal_ttl)
+        logger.info(f"[StopSignal] Set stop signal for session: {session_id}")
+        return success
 
     def should_stop(self, session_id: str) -> bool:
         """
@@ -55,19 +58,7 @@ class StopSignalManager:
         Returns:
             是否应该停止
         """
-        with self._lock:
-            if session_id not in self._signals:
-                return False
-
-            # 检查信号是否过期
-            signal_time = self._signals[session_id]
-            if time.time() - signal_time > self._signal_ttl:
-                # 信号已过期，清理
-                del self._signals[session_id]
-                logger.debug(f"[StopSignal] Signal expired for session: {session_id}")
-                return False
-
-            return True
+        return signal_backend().is_set(_signal_name(session_id))
 
     def clear_stop_signal(self, session_id: str) -> bool:
         """
@@ -79,37 +70,14 @@ class StopSignalManager:
         Returns:
             是否清除成功（信号是否存在）
         """
-        with self._lock:
-            if session_id in self._signals:
-                del self._signals[session_id]
-                logger.info(f"[StopSignal] Cleared stop signal for session: {session_id}")
-                return True
-            return False
-
-    def cleanup_expired(self) -> int:
-        """
-        清理所有过期的信号
+        cleared = signal_backend().clear(_signal_name(session_id))
+        if cleared:
+            logger.info(f"[StopSignal] Cleared stop signal for session: {session_id}")
+        return cleared
 
-        Returns:
-            清理的信号数量
-        """
-        with self._lock:
-            current_time = time.time()
-            expired = [
-                sid for sid, t in self._signals.items()
-                if current_time - t > self._signal_ttl
-            ]
-            for sid in expired:
-                del self._signals[sid]
-
-            if expired:
-                logger.info(f"[StopSignal] Cleaned up {len(expired)} expired signals")
-            return len(expired)
-
-    def get_active_signals(self) -> Dict[str, float]:
-        """获取所有活跃的停止信号（调试用）"""
-        with self._lock:
-            return dict(self._signals)
+    def watch(self, session_id: str):
+        """订阅停止信号，返回异步上下文管理器，产出的 asyncio.Event 在收到信号后被设置"""
+        return watch_signal(_signal_name(session_id))
 
 
 # 全局单例
@@ -141,3 +109,8 @@ def should_stop(session_id: str) -> bool:
 def clear_stop_signal(session_id: str) -> bool:
     """清除停止信号"""
     return get_stop_signal_manager().clear_stop_signal(session_id)
+
+
+def watch_stop_signal(session_id: str):
+    """订阅停止信号"""
+    return get_stop_signal_manager().watch(session_id)
@@ -131,3 +131,847 @@ class OrchestratorGraphTest(TestCase):
         self.assertIsNotNone(graph)
         # 验证图可以被编译（不会抛出异常）
         self.assertTrue(hasattr(graph, 'invoke'))
+
+
+class SkillRunnerTest(TestCase):
+    """测试 Skill 命令异步执行与目录缓存"""
+
+    def setUp(self):
+        from .builtin_tools.skill_runner import SkillDirectoryCache
+        SkillDirectoryCache.invalidate()
+        self.user = User.objects.create_user(username='skilluser', password='testpass123')
+        self.project = Project.objects.create(name='SkillProject', creator=self.user)
+
+    def test_run_shell_command_streams_output(self):
+        """stdout/stderr 在进程结束前增量回调"""
+        import os
+        import sys
+        from asgiref.sync import async_to_sync
+        from .builtin_tools.skill_runner import run_shell_command
+
+        received = []
+
+        async def on_output(stream_name, text):
+            received.append((stream_name, text))
+
+        command = f'"{sys.executable}" -c "import sys; print(\'out\'); print(\'err\', file=sys.stderr)"'
+        result = async_to_sync(run_shell_command)(
+            command, cwd=os.getcwd(), env=dict(os.environ), timeout=30, on_output=on_output
+        )
+
+        self.assertEqual(result.returncode, 0)
+        self.assertFalse(result.timed_out)
+        self.assertIn(b'out', result.stdout)
+        self.assertIn(('stderr', 'err\n'), received)
+
+    def test_run_shell_command_timeout(self):
+        import os
+        import sys
+        from asgiref.sync import async_to_sync
+        from .builtin_tools.skill_runner import run_shell_command
+
+        command = f'"{sys.executable}" -c "import time; time.sleep(10)"'
+        result = async_to_sync(run_shell_command)(command, cwd=os.getcwd(), env=dict(os.environ), timeout=0.5)
+        self.assertTrue(result.timed_out)
+
+    def test_directory_cache_invalidated_on_skill_save(self):
+        from skills.models import Skill
+        from .builtin_tools.skill_runner import SkillDirectoryCache
+
+        skill = Skill.objects.create(project=self.project, creator=self.user, name='demo', description='demo')
+        self.assertTrue(SkillDirectoryCache.exists('demo'))
+        with self.assertNumQueries(0):
+            SkillDirectoryCache.get('demo')
+
+        skill.is_active = False
+        skill.save()
+        self.assertFalse(SkillDirectoryCache.exists('demo'))
+
+    def test_directory_cache_reloads_after_invalidation_in_another_process(self):
+        import uuid
+        from django.core.cache import cache
+        from skills.models import Skill
+        from .builtin_tools.skill_runner import SkillDirectoryCache
+
+        skill = Skill.objects.create(project=self.project, creator=self.user, name='demo', description='demo')
+        self.assertTrue(SkillDirectoryCache.exists('demo'))
+
+        # 模拟其他进程修改：绕过信号更新数据库，只更新共享版本戳
+        Skill.objects.filter(pk=skill.pk).update(is_active=False)
+        self.assertTrue(SkillDirectoryCache.exists('demo'))
+        cache.set(SkillDirectoryCache.VERSION_KEY, uuid.uuid4().hex, None)
+        self.assertFalse(SkillDirectoryCache.exists('demo'))
+
+    def test_directory_cache_expires_after_ttl(self):
+        from skills.models import Skill
+        from .builtin_tools.skill_runner import SkillDirectoryCache
+
+        skill = Skill.objects.create(project=self.project, creator=self.user, name='demo', description='demo')
+        self.assertTrue(SkillDirectoryCache.exists('demo'))
+        Skill.objects.filter(pk=skill.pk).update(is_active=False)
+        with self.settings(SKILL_DIRECTORY_CACHE_TTL=0):
+            self.assertFalse(SkillDirectoryCache.exists('demo'))
+
+    def test_concurrency_limiter_drops_idle_user_semaphores(self):
+        from asgiref.sync import async_to_sync
+        from .builtin_tools.skill_runner import SkillConcurrencyLimiter
+
+        async def run():
+            async with SkillConcurrencyLimiter.slot(424242, wait_timeout=1):
+                self.assertIn(424242, SkillConcurrencyLimiter._user_semaphores)
+
+        async_to_sync(run)()
+        self.assertNotIn(424242, SkillConcurrencyLimiter._user_semaphores)
+
+
+class PlaywrightBrowserPoolTest(TestCase):
+    """测试浏览器池的进程预算与会话分配（不启动 Node 进程）"""
+
+    def test_pool_size_capped_by_cpu_and_memory(self):
+        from .builtin_tools.persistent_playwright import compute_browser_pool_size
+
+        self.assertEqual(compute_browser_pool_size(cpu_count=8, total_memory_mb=4096), 4)
+        self.assertEqual(compute_browser_pool_size(cpu_count=2, total_memory_mb=65536), 2)
+        self.assertEqual(compute_browser_pool_size(cpu_count=8, total_memory_mb=256), 1)
+
+    def test_sessions_fill_processes_then_share(self):
+        from .builtin_tools.persistent_playwright import PlaywrightBrowserPool
+
+        pool = PlaywrightBrowserPool(max_processes=2, contexts_per_process=2)
+        self.addCleanup(pool.close_all)
+        workers = [pool._assign_worker(f's{i}', '/tmp/skill').worker for i in range(5)]
+
+        self.assertIs(workers[0], workers[1])
+        self.assertIsNot(workers[1], workers[2])
+        self.assertEqual(len(pool._workers), 2)
+        # 同一会话保持在原进程上
+        self.assertIs(pool._assign_worker('s0', '/tmp/skill').worker, workers[0])
+
+        stats = pool.stats()
+        self.assertEqual(stats['processes'], 2)
+        self.assertEqual(stats['sessions'], 5)
+        self.assertEqual(stats['recycles'], 0)
+
+
+FAKE_PLAYWRIGHT_MODULE = """
+let launches = 0;
+class Page {
+  constructor(context) { this._context = context; this._url = 'about:blank'; this._closed = false; }
+  context() { return this._context; }
+  async goto(url) { this._url = url; }
+  url() { return this._url; }
+  isClosed() { return this._closed; }
+  async close() { this._closed = true; }
+}
+class Context {
+  constructor(options) { this.options = options || {}; this.closed = false; }
+  async newPage() { return new Page(this); }
+  async close() { this.closed = true; }
+}
+class Browser {
+  isConnected() { return true; }
+  async newContext(options) { return new Context(options); }
+  async newPage(options) { return (await this.newContext(options)).newPage(); }
+  async close() {}
+}
+const browserType = () => ({ launch: async () => { launches += 1; return new Browser(); } });
+module.exports = {
+  chromium: browserType(), firefox: browserType(), webkit: browserType(), devices: {},
+  launchCount: () => launches,
+};
+"""
+
+FAKE_HELPERS_MODULE = """
+const playwright = require('playwright');
+module.exports = {
+  launchBrowser: async (type) => playwright[type || 'chromium'].launch(),
+  getExtraHeadersFromEnv: () =>
+    process.env.PW_HEADER_NAME ? { [process.env.PW_HEADER_NAME]: process.env.PW_HEADER_VALUE } : null,
+};
+"""
+
+
+class PlaywrightSharedBrowserTest(TestCase):
+    """测试池化会话共享浏览器（使用假的 playwright 模块启动真实的 Node 进程）"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from pathlib import Path
+
+        if not shutil.which('node'):
+            self.skipTest('node 不可用')
+        skill_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, skill_dir, True)
+        (skill_dir / 'package.json').write_text('{"name": "fake-skill"}')
+        (skill_dir / 'node_modules' / 'playwright').mkdir(parents=True)
+        (skill_dir / 'node_modules' / 'playwright' / 'index.js').write_text(FAKE_PLAYWRIGHT_MODULE)
+        (skill_dir / 'lib').mkdir()
+        (skill_dir / 'lib' / 'helpers.js').write_text(FAKE_HELPERS_MODULE)
+
+        from .builtin_tools.persistent_playwright import _PlaywrightNodeProcess
+
+        self.proc = _PlaywrightNodeProcess(str(skill_dir))
+        self.proc._start({'PLAYWRIGHT_AUTO_INSTALL': 'false'})
+        self.addCleanup(self.proc.terminate, False)
+
+    def _exec(self, session, code, env=None):
+        resp = self.proc.request(
+            'exec', params={'args': [code], 'env': env or {}, 'session': session}, timeout_seconds=30
+        )
+        self.assertTrue(resp.get('ok'), resp)
+        return resp['stdout']
+
+    def test_skill_pattern_reuses_shared_browser_across_sessions(self):
+        # SKILL.md 中的写法：自行 launch、newPage、close
+        code = (
+            "const browser = await chromium.launch({ headless: false }); "
+            "const page = await browser.newPage(); await page.goto('http://example.com'); "
+            "console.log(page.url()); await browser.close();"
+        )
+        self.assertEqual(self._exec('s1', code), ['http://example.com'])
+        self.assertEqual(self._exec('s2', code), ['http://example.com'])
+
+        stats = self.proc.request('stats', params={}, timeout_seconds=10)['state']
+        self.assertEqual(stats['browserLaunches'], 1)
+        self.assertEqual(stats['privateBrowserLaunches'], 0)
+        self.assertEqual(self._exec('s1', "console.log(require('playwright').launchCount())"), ['1'])
+
+    def test_session_env_reaches_helpers(self):
+        code = "console.log(JSON.stringify(context.options.extraHTTPHeaders || null))"
+        env = {'PW_HEADER_NAME': 'X-Session', 'PW_HEADER_VALUE': 's1'}
+        self.assertEqual(self._exec('s1', code, env), ['{"X-Session":"s1"}'])
+        self.assertEqual(self._exec('s2', code), ['null'])
+
+
+class StopSignalTest(TestCase):
+    """测试停止信号（进程内存后端）"""
+
+    def setUp(self):
+        from wharttest_django.signalling import reset_signal_backend
+        reset_signal_backend()
+        self.addCleanup(reset_signal_backend)
+
+    def test_set_and_clear(self):
+        from .stop_signal import clear_stop_signal, set_stop_signal, should_stop
+
+        self.assertFalse(should_stop('s1'))
+        self.assertTrue(set_stop_signal('s1'))
+        self.assertTrue(should_stop('s1'))
+        self.assertFalse(should_stop('s2'))
+        self.assertTrue(clear_stop_signal('s1'))
+        self.assertFalse(should_stop('s1'))
+
+    def test_signal_expires(self):
+        from wharttest_django.signalling import InMemorySignalBackend
+
+        backend = InMemorySignalBackend()
+        backend.set('s1', ttl=-1)
+        self.assertFalse(backend.is_set('s1'))
+
+    def test_watcher_woken_from_other_thread(self):
+        """停止请求在其他线程设置时，订阅方无需轮询即可收到"""
+        import asyncio
+        import threading
+        from asgiref.sync import async_to_sync
+        from .stop_signal import set_stop_signal, watch_stop_signal
+
+        async def run():
+            async with watch_stop_signal('s1') as stopped:
+                self.assertFalse(stopped.is_set())
+                threading.Timer(0.05, set_stop_signal, args=('s1',)).start()
+                await asyncio.wait_for(stopped.wait(), timeout=5)
+
+        async_to_sync(run)()
+
+    def test_watch_returns_immediately_when_already_set(self):
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from .stop_signal import set_stop_signal, watch_stop_signal
+
+        set_stop_signal('s1')
+
+        async def run():
+            async with watch_stop_signal('s1') as stopped:
+                await asyncio.wait_for(stopped.wait(), timeout=5)
+
+        async_to_sync(run)()
+
+
+class AgentToolExecutionTest(TestCase):
+    """测试同一步骤内工具调用的并发执行"""
+
+    def setUp(self):
+        import asyncio
+        from langchain_core.tools import StructuredTool
+        from .agent_loop import AgentOrchestrator
+
+        self.events = []
+
+        def make_tool(name, delay=0.2):
+            async def run(query: str = '') -> str:
+                self.events.append(('start', name, query))
+                await asyncio.sleep(delay)
+                self.events.append(('end', name, query))
+                return f'{name}:{query}'
+            return StructuredTool.from_function(coroutine=run, name=name, description=name)
+
+        tools = [
+            make_tool('search_knowledge_base'),
+            make_tool('browser_click'),
+            make_tool('save_testcase'),
+            make_tool('slow_tool', delay=5),
+        ]
+        self.orchestrator = AgentOrchestrator(llm=Mock(), tools=tools)
+
+    def _execute(self, calls):
+        import time
+        from asgiref.sync import async_to_sync
+
+        started = time.monotonic()
+        results = async_to_sync(self.orchestrator._execute_tools)(
+            [{'name': name, 'args': {'query': query}} for name, query in calls]
+        )
+        return results, time.monotonic() - started
+
+    def test_read_only_tools_run_in_parallel(self):
+        results, elapsed = self._execute([('search_knowledge_base', str(i)) for i in range(3)])
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual([r['output'] for r in results], [f'search_knowledge_base:{i}' for i in range(3)])
+        self.assertTrue(all(r['duration_ms'] >= 200 for r in results))
+
+    def test_browser_tools_serialized_in_order(self):
+        results, elapsed = self._execute([
+            ('browser_click', 'a'), ('search_knowledge_base', 'q'), ('browser_click', 'b'),
+        ])
+        self.assertGreaterEqual(elapsed, 0.4)
+        self.assertLess(elapsed, 0.6)
+        browser_events = [e for e in self.events if e[1] == 'browser_click']
+        self.assertEqual(browser_events, [
+            ('start', 'browser_click', 'a'), ('end', 'browser_click', 'a'),
+            ('start', 'browser_click', 'b'), ('end', 'browser_click', 'b'),
+        ])
+        self.assertEqual([r['input']['query'] for r in results], ['a', 'q', 'b'])
+
+    def test_per_call_timeout(self):
+        from django.test import override_settings
+
+        with override_settings(AGENT_TOOL_CALL_TIMEOUT=0.3):
+            results, elapsed = self._execute([('slow_tool', 'x'), ('search_knowledge_base', 'y')])
+        self.assertLess(elapsed, 1)
+        self.assertIn('超时', results[0]['error'])
+        self.assertEqual(results[1]['output'], 'search_knowledge_base:y')
+
+    def test_tool_latency_recorded_on_step(self):
+        from asgiref.sync import async_to_sync
+        from langgraph_integration.models import ChatSession
+        from .models import AgentStep, AgentTask
+
+        user = User.objects.create_user(username='tooluser', password='testpass123')
+        session = ChatSession.objects.create(user=user, session_id='tool-session')
+        task = AgentTask.objects.create(session=session, goal='goal', current_step=1)
+        results, _ = self._execute([('search_knowledge_base', 'q'), ('missing_tool', 'x')])
+        async_to_sync(self.orchestrator._record_step)(task, {'goal': 'goal'}, {'tool_results': results}, 10)
+
+        metrics = AgentStep.objects.get(task=task).tool_metrics
+        self.assertEqual([(m['tool_name'], m['status']) for m in metrics], [
+            ('search_knowledge_base', 'success'), ('missing_tool', 'error'),
+        ])
+        self.assertGreaterEqual(metrics[0]['duration_ms'], 200)
+
+
+class ToolOutputStoreTest(TestCase):
+    """测试大体积工具输出转存与按引用读取"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from langchain_core.tools import StructuredTool
+        from . import tool_output_store
+        from .agent_loop import AgentOrchestrator
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        # 保留期设为 0：写入时的后台清理不删除文件，清理用例显式传入保留天数
+        settings_override = override_settings(
+            AGENT_TOOL_OUTPUT_ROOT=root, AGENT_TOOL_OUTPUT_INLINE_CHARS=100, AGENT_TOOL_OUTPUT_RETENTION_DAYS=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tool_output_store.reset_storage()
+        self.addCleanup(tool_output_store.reset_storage)
+        self.store = tool_output_store
+
+        def snapshot(url: str = '') -> str:
+            return 'x' * 500
+
+        def diagram(xml: str = '') -> dict:
+            return {'success': True, 'xml': 'y' * 500}
+
+        self.orchestrator = AgentOrchestrator(llm=Mock(), tools=[
+            StructuredTool.from_function(func=snapshot, name='browser_snapshot', description='snapshot'),
+            StructuredTool.from_function(func=diagram, name='display_diagram', description='diagram'),
+        ])
+
+    def test_put_deduplicates_and_get_roundtrips(self):
+        ref = self.store.put('内容' * 100)
+        self.assertEqual(ref, self.store.put('内容' * 100))
+        self.assertRegex(ref, r'^sha256:[0-9a-f]{64}$')
+        self.assertEqual(self.store.get(ref), '内容' * 100)
+        self.assertIsNone(self.store.get('sha256:' + '0' * 64))
+        self.assertIsNone(self.store.get('../../etc/passwd'))
+
+    def _age(self, ref, days):
+        import os
+        import time
+
+        path = self.store.get_storage().path(self.store._name(ref[len(self.store.REF_PREFIX):]))
+        old = time.time() - days * 86400
+        os.utime(path, (old, old))
+
+    def test_purge_removes_outputs_past_retention(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        expired = self.store.put('expired' * 100)
+        kept = self.store.put('kept' * 100)
+        self._age(expired, 10)
+
+        self.assertEqual(self.store.purge_expired(0), 0)
+        output = StringIO()
+        call_command('purge_tool_outputs', days=7, stdout=output)
+        self.assertIn('1 file(s) removed', output.getvalue())
+        self.assertIsNone(self.store.get(expired))
+        self.assertEqual(self.store.get(kept), 'kept' * 100)
+
+    def test_reused_output_is_not_purged(self):
+        ref = self.store.put('reused' * 100)
+        self._age(ref, 10)
+        self.assertEqual(self.store.put('reused' * 100), ref)
+
+        self.assertEqual(self.store.purge_expired(7), 0)
+        self.assertEqual(self.store.get(ref), 'reused' * 100)
+
+    def test_large_outputs_bounded_in_step_and_blackboard(self):
+        from asgiref.sync import async_to_sync
+        from langgraph_integration.models import ChatSession
+        from .builtin_tools.tool_output_tools import get_tool_output_tools
+        from .models import AgentBlackboard, AgentStep, AgentTask
+
+        user = User.objects.create_user(username='outputuser', password='testpass123')
+        session = ChatSession.objects.create(user=user, session_id='output-session')
+        task = AgentTask.objects.create(session=session, goal='goal', current_step=1)
+        blackboard = AgentBlackboard.objects.create(task=task)
+
+        results = async_to_sync(self.orchestrator._execute_tools)([
+            {'name': 'browser_snapshot', 'args': {'url': 'a'}},
+            {'name': 'display_diagram', 'args': {'xml': 'b'}},
+        ])
+        summary = self.orchestrator._summarize_tool_results(results)
+        full = self.orchestrator._summarize_tool_results(results, bounded=False)
+        self.assertLess(len(summary), len(full))
+        self.assertIn('x' * 500, full)
+        self.assertNotIn('x' * 500, summary)
+
+        snapshot_ref = results[0]['output_ref']
+        self.assertIn(f'完整内容引用: {snapshot_ref}', summary)
+        self.assertEqual(self.store.get(snapshot_ref), 'x' * 500)
+
+        step_result = {'tool_results': results, 'tool_summary': summary, 'tool_output_ref': self.store.put(full)}
+        async_to_sync(self.orchestrator._record_step)(task, {'goal': 'goal'}, step_result, 10)
+        async_to_sync(self.orchestrator._update_blackboard)(blackboard, step_result)
+
+        step = AgentStep.objects.get(task=task)
+        self.assertEqual(self.store.get(step.tool_output_full_ref), full)
+        self.assertEqual(step.tool_metrics[0]['output_ref'], snapshot_ref)
+        blackboard.refresh_from_db()
+        self.assertEqual(blackboard.tool_results_refs, [r['output_ref'] for r in results])
+        self.assertNotIn('x' * 500, blackboard.history_summary[-1])
+
+        read_tool_output = get_tool_output_tools()[0]
+        chunk = read_tool_output.invoke({'ref': snapshot_ref, 'offset': 450, 'limit': 100})
+        self.assertEqual(chunk, '[共 500 字符，当前 450-500]\n' + 'x' * 50)
+        self.assertIn('未找到', read_tool_output.invoke({'ref': 'sha256:' + '1' * 64}))
+
+
+class AgentStatePersistenceTest(TestCase):
+    """测试 Agent 任务状态的批量写回"""
+
+    def setUp(self):
+        from django.test import override_settings
+        from langgraph_integration.models import ChatSession
+        from .agent_loop import AgentOrchestrator
+
+        settings_override = override_settings(AGENT_PERSIST_FLUSH_INTERVAL=0, AGENT_PERSIST_MAX_PENDING_STEPS=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create_user(username='persistuser', password='testpass123')
+        self.session = ChatSession.objects.create(user=user, session_id='persist-session')
+        self.orchestrator = AgentOrchestrator(llm=Mock())
+
+    def _run(self, scenario):
+        from asgiref.sync import async_to_sync
+
+        async def run():
+            task = await self.orchestrator._create_task('goal', self.session)
+            blackboard = await self.orchestrator._create_blackboard(task)
+            try:
+                return await scenario(task, blackboard)
+            finally:
+                await self.orchestrator._close_persistence(task)
+
+        return async_to_sync(run)()
+
+    def test_changes_buffered_until_flush(self):
+        from asgiref.sync import sync_to_async
+        from .models import AgentBlackboard, AgentStep, AgentTask
+
+        async def scenario(task, blackboard):
+            writer = self.orchestrator._writers[task.id]
+            for step_number in (1, 2):
+                task.current_step = step_number
+                task.status = 'running'
+                await self.orchestrator._save_task(task)
+                await self.orchestrator._record_step(task, {'goal': 'goal'}, {'response': f'r{step_number}'}, 5)
+                await self.orchestrator._update_blackboard(blackboard, {'tool_summary': f'step {step_number}'})
+
+            stored = await sync_to_async(AgentTask.objects.get)(pk=task.pk)
+            self.assertEqual((stored.status, stored.current_step), ('pending', 0))
+            self.assertEqual(await AgentStep.objects.filter(task=task).acount(), 0)
+
+            self.assertTrue(await writer.flush())
+            stored = await sync_to_async(AgentTask.objects.get)(pk=task.pk)
+            self.assertEqual((stored.status, stored.current_step), ('running', 2))
+            self.assertEqual(await AgentStep.objects.filter(task=task).acount(), 2)
+            stored_blackboard = await sync_to_async(AgentBlackboard.objects.get)(pk=blackboard.pk)
+            self.assertEqual(stored_blackboard.history_summary, ['step 1', 'step 2'])
+
+            # 终态立即刷写
+            task.status = 'completed'
+            await self.orchestrator._save_task(task)
+            stored = await sync_to_async(AgentTask.objects.get)(pk=task.pk)
+            self.assertEqual(stored.status, 'completed')
+            return dict(writer.metrics)
+
+        metrics = self._run(scenario)
+        self.assertEqual(metrics['flush_count'], 2)
+        self.assertEqual(metrics['rows_written'], 5)
+        self.assertGreater(metrics['max_flush_ms'], 0)
+
+    def test_steps_flushed_when_buffer_full_and_retried_after_failure(self):
+        from .models import AgentStep
+
+        async def scenario(task, blackboard):
+            writer = self.orchestrator._writers[task.id]
+            with patch.object(AgentStep.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+                for step_number in (1, 2, 3):
+                    task.current_step = step_number
+                    await self.orchestrator._record_step(task, {}, {}, 1)
+            self.assertEqual(writer.metrics['failed_flushes'], 1)
+            self.assertEqual(len(writer._pending_steps), 3)
+
+            task.current_step = 4
+            await self.orchestrator._record_step(task, {}, {}, 1)
+            return await AgentStep.objects.filter(task=task).acount()
+
+        self.assertEqual(self._run(scenario), 4)
+        self.assertNotIn(1, self.orchestrator._writers)
+
+
+    def test_cancelled_flush_keeps_popped_steps(self):
+        """刷写被取消时写库线程写完再处理结果：失败的步骤放回缓冲，成功的不会重复写入"""
+        import asyncio
+        import time as time_module
+        from .models import AgentStep
+
+        original_bulk_create = AgentStep.objects.bulk_create
+        outcomes = [RuntimeError('db down'), None]
+
+        def slow_bulk_create(steps):
+            time_module.sleep(0.2)
+            outcome = outcomes.pop(0)
+            if outcome:
+                raise outcome
+            return original_bulk_create(steps)
+
+        async def cancel_mid_flush(writer):
+            flushing = asyncio.ensure_future(writer.flush())
+            await asyncio.sleep(0.05)
+            flushing.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await flushing
+
+        async def scenario(task, blackboard):
+            writer = self.orchestrator._writers[task.id]
+            with patch.object(AgentStep.objects, 'bulk_create', side_effect=slow_bulk_create):
+                for step_number in (1, 2):
+                    task.current_step = step_number
+                    await self.orchestrator._record_step(task, {}, {}, 1)
+
+                await cancel_mid_flush(writer)
+                # 下次刷写先等待被取消的写入结束，失败的两个步骤已放回缓冲并重新写入
+                await cancel_mid_flush(writer)
+                self.assertTrue(await writer.flush())
+            self.assertEqual(writer.metrics['failed_flushes'], 1)
+            return await AgentStep.objects.filter(task=task).acount()
+
+        self.assertEqual(self._run(scenario), 2)
+
+    def test_writer_stats_endpoint_is_admin_only(self):
+        from rest_framework.test import APIClient
+        from .agent_persistence import writer_stats
+
+        before = writer_stats()
+
+        async def scenario(task, blackboard):
+            await self.orchestrator._record_step(task, {}, {}, 1)
+            self.assertEqual(writer_stats()['active_writers'], before['active_writers'] + 1)
+            self.assertEqual(writer_stats()['pending_steps'], before['pending_steps'] + 1)
+
+        self._run(scenario)
+
+        client = APIClient()
+        client.force_authenticate(self.session.user)
+        self.assertEqual(client.get('/api/orchestrator/agent-loop/persistence-stats/').status_code, 403)
+        admin = User.objects.create_superuser(username='persist-admin', password='testpass123')
+        client.force_authenticate(admin)
+        response = client.get('/api/orchestrator/agent-loop/persistence-stats/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        data = data.get('data', data)
+        self.assertEqual(data['flush_count'], before['flush_count'] + 1)
+        self.assertEqual(data['rows_written'], before['rows_written'] + 1)
+
+class AgentLLMInvokeTest(TestCase):
+    """测试 Agent Loop 的异步 LLM 调用与重试"""
+
+    def test_invoke_retries_rate_limit_with_retry_after(self):
+        import httpx
+        import openai
+        from unittest.mock import AsyncMock
+        from asgiref.sync import async_to_sync
+        from .agent_loop import AgentOrchestrator
+
+        request = httpx.Request('POST', 'https://llm.example.com/v1/chat/completions')
+        rate_limited = openai.RateLimitError(
+            'rate limited',
+            response=httpx.Response(429, headers={'retry-after': '0.05'}, request=request),
+            body=None,
+        )
+        llm = Mock()
+        llm.ainvoke = AsyncMock(side_effect=[rate_limited, AIMessage(content='ok')])
+        orchestrator = AgentOrchestrator(llm=llm)
+
+        response = async_to_sync(orchestrator._invoke_llm)([])
+        self.assertEqual(response.content, 'ok')
+        self.assertEqual(llm.ainvoke.await_count, 2)
+        llm.invoke.assert_not_called()
+
+
+class ContextCompressionTest(TestCase):
+    """测试对话摘要缓存与后台提前压缩"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # 按单词数计 Token，避免依赖 tiktoken 编码文件
+        counter = patch(
+            'orchestrator_integration.context_compression.context_checker.count_tokens',
+            side_effect=lambda text, model=None: len(str(text).split()),
+        )
+        counter.start()
+        self.addCleanup(counter.stop)
+
+    def _compressor(self, llm):
+        from .context_compression import CompressionSettings, ConversationCompressor
+
+        settings = CompressionSettings(max_context_tokens=1000, reserved_tokens=0)
+        return ConversationCompressor(llm=llm, model_name='test-model', settings=settings)
+
+    def _llm(self, *responses):
+        from unittest.mock import AsyncMock
+
+        llm = Mock()
+        llm.ainvoke = AsyncMock(side_effect=list(responses))
+        return llm
+
+    def _messages(self, count):
+        from langchain_core.messages import HumanMessage
+
+        return [
+            HumanMessage(content=' '.join(f'm{index}w{word}' for word in range(100)))
+            for index in range(count)
+        ]
+
+    def test_block_summary_cached_by_content(self):
+        from asgiref.sync import async_to_sync
+
+        block = self._messages(3)
+        failing = self._llm(RuntimeError('llm down'))
+        self.assertIn('摘要生成失败', async_to_sync(self._compressor(failing)._summarize_block)(block))
+
+        # 失败的回退结果不缓存；成功的摘要被其他会话的相同消息块复用
+        first = self._llm(AIMessage(content='block summary'))
+        self.assertEqual(async_to_sync(self._compressor(first)._summarize_block)(block), 'block summary')
+        second = self._llm()
+        self.assertEqual(async_to_sync(self._compressor(second)._summarize_block)(list(block)), 'block summary')
+        second.ainvoke.assert_not_awaited()
+
+    def test_precomputed_summary_applied_at_trigger_without_llm_call(self):
+        from asgiref.sync import async_to_sync
+
+        messages = self._messages(8)
+        background = self._compressor(self._llm(AIMessage(content='early summary')))
+        self.assertTrue(background.needs_precompute(background._estimate_token_count(messages[:7])))
+        pending = async_to_sync(background.precompute)(messages[:7])
+        self.assertEqual((pending['base_count'], pending['cutoff'], pending['summary']), (0, 3, 'early summary'))
+
+        llm = self._llm()
+        result = async_to_sync(self._compressor(llm).prepare)(messages, pending=pending)
+        llm.ainvoke.assert_not_awaited()
+        self.assertTrue(result.triggered)
+        self.assertEqual(result.state_updates['summarized_message_count'], 3)
+        self.assertIsNone(result.state_updates['pending_summary'])
+        self.assertIn('early summary', result.messages[0].content)
+        self.assertEqual(result.messages[1:], messages[3:])
+
+    def test_stale_precomputed_summary_ignored(self):
+        from asgiref.sync import async_to_sync
+
+        messages = self._messages(8)
+        pending = {'base_count': 0, 'cutoff': 3, 'block_hash': 'stale', 'summary': 'old summary'}
+        llm = self._llm(AIMessage(content='fresh summary'))
+        result = async_to_sync(self._compressor(llm).prepare)(messages, pending=pending)
+        self.assertEqual(llm.ainvoke.await_count, 1)
+        self.assertEqual(result.state_updates['summarized_message_count'], 4)
+        self.assertIn('fresh summary', result.messages[0].content)
+
+    def test_background_precompute_stored_in_checkpoint_metadata(self):
+        from contextlib import asynccontextmanager
+        from asgiref.sync import async_to_sync
+        from langgraph.checkpoint.base import empty_checkpoint
+        from langgraph.checkpoint.memory import InMemorySaver
+        from .context_compression import precompute_thread_summary
+
+        saver = InMemorySaver()
+        checkpoint = empty_checkpoint()
+        checkpoint['channel_values'] = {'messages': self._messages(7)}
+        checkpoint['channel_versions'] = {'messages': 1}
+        config = {'configurable': {'thread_id': 'thread-1', 'checkpoint_ns': ''}}
+        saver.put(config, checkpoint, {'context_compression': {'context_token_count': 707}}, {'messages': 1})
+
+        @asynccontextmanager
+        async def checkpointer():
+            yield saver
+
+        compressor = self._compressor(self._llm(AIMessage(content='early summary')))
+        with patch('wharttest_django.checkpointer.get_async_checkpointer', checkpointer):
+            async_to_sync(precompute_thread_summary)(compressor, 'thread-1')
+
+        stored = saver.get_tuple({'configurable': {'thread_id': 'thread-1'}})
+        self.assertEqual(stored.checkpoint['id'], checkpoint['id'])
+        compression_meta = stored.metadata['context_compression']
+        self.assertEqual(compression_meta['context_token_count'], 707)
+        self.assertEqual(compression_meta['pending_summary']['summary'], 'early summary')
+
+
+class ProjectKnowledgeSearchTest(TestCase):
+    """测试项目级多知识库联合检索"""
+
+    def setUp(self):
+        from types import SimpleNamespace
+        from qdrant_client.models import ScoredPoint
+        from knowledge.models import KnowledgeBase
+        from knowledge.services import VectorStoreManager
+
+        user = User.objects.create_user(username='kbuser', password='testpass123')
+        self.project = Project.objects.create(name='KB Project', creator=user)
+        self.kbs = [
+            KnowledgeBase.objects.create(name=f'kb{index}', project=self.project, creator=user)
+            for index in range(3)
+        ]
+
+        def point(kb_index, rank, score):
+            return ScoredPoint(
+                id=kb_index * 100 + rank, version=0, score=score,
+                payload={'page_content': f'kb{kb_index} doc{rank}', 'source': f'doc{rank}.md'},
+            )
+
+        collections = {VectorStoreManager.collection_name_for(kb.id): index for index, kb in enumerate(self.kbs)}
+
+        def search_batch(collection_name, requests):
+            index = collections[collection_name]
+            if index == 2:
+                raise RuntimeError('collection missing')
+            ranked = [point(index, rank, 0.9 - index * 0.1 - rank * 0.1) for rank in range(2)]
+            return [ranked, ranked[:1]][:len(requests)]
+
+        def fake_init(manager, knowledge_base):
+            manager.knowledge_base = knowledge_base
+            manager.global_config = SimpleNamespace(reranker_service='none', embedding_service='openai')
+            manager.embeddings = Mock()
+            manager.embeddings.embed_query.return_value = [0.1, 0.2]
+            manager.sparse_encoder = Mock()
+            manager.sparse_encoder.encode_query.return_value = SimpleNamespace(
+                indices=Mock(tolist=lambda: [1]), values=Mock(tolist=lambda: [1.0]),
+            )
+            manager._qdrant_client = Mock()
+            manager._qdrant_client.search_batch.side_effect = search_batch
+            self.manager = manager
+
+        patcher = patch.object(VectorStoreManager, '__init__', fake_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_query_encoded_once_and_results_fused_across_knowledge_bases(self):
+        from knowledge.services import MultiKnowledgeBaseSearch
+
+        results = MultiKnowledgeBaseSearch(self.kbs).search('login flow', k=3)
+
+        self.manager.embeddings.embed_query.assert_called_once_with('login flow')
+        self.manager.sparse_encoder.encode_query.assert_called_once_with('login flow')
+        # 每个集合一次批量请求（稠密+稀疏），失败的知识库被跳过
+        self.assertEqual(self.manager._qdrant_client.search_batch.call_count, 3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual({doc['metadata']['knowledge_base_name'] for doc in results[:2]}, {'kb0', 'kb1'})
+        self.assertEqual(results[2]['fusion_detail']['sources'], ['dense'])
+
+    def test_merge_compares_scores_across_knowledge_bases(self):
+        """全局排名按可比较的原始分数合并，而不是按各集合内的名次轮流取"""
+        from qdrant_client.models import ScoredPoint
+        from knowledge.services import MultiKnowledgeBaseSearch, VectorStoreManager
+
+        scores = {
+            VectorStoreManager.collection_name_for(self.kbs[0].id): [0.5, 0.45],
+            VectorStoreManager.collection_name_for(self.kbs[1].id): [0.95, 0.9],
+        }
+
+        def search_batch(collection_name, requests):
+            # 不同集合的点 ID 相同
+            ranked = [
+                ScoredPoint(id=rank, version=0, score=score, payload={'page_content': f'{collection_name} {rank}'})
+                for rank, score in enumerate(scores[collection_name])
+            ]
+            return [ranked, ranked][:len(requests)]
+
+        search = MultiKnowledgeBaseSearch(self.kbs[:2])
+        self.manager._qdrant_client.search_batch.side_effect = search_batch
+        results = search.search('login flow', k=3)
+        self.assertEqual([doc['metadata']['knowledge_base_name'] for doc in results], ['kb1', 'kb1', 'kb0'])
+
+        self.manager.sparse_encoder = None
+        results = search.search('login flow', k=2)
+        self.assertEqual([doc['similarity_score'] for doc in results], [0.95, 0.9])
+
+    def test_tool_does_not_retry_identical_searches(self):
+        from .graph import create_knowledge_tool
+
+        tool = create_knowledge_tool(self.project.id)
+        with patch('knowledge.services.MultiKnowledgeBaseSearch.search', return_value=[]) as search:
+            response = tool.func('unknown topic')
+        search.assert_called_once()
+        self.assertIn('3 个知识库中未找到', response)
@@ -0,0 +1,205 @@
+"""
+工具输出存储
+
+大体积的工具输出（DOM 快照、接口返回等）不再原样写入 Blackboard 历史、AgentStep 和 LLM 上下文，
+而是按内容哈希存入独立存储，上下文中只保留开头部分和引用，Agent 需要时通过 read_tool_output 工具按需读取。
+
+- 引用格式: sha256:<64位十六进制>，相同内容只存一份
+- 存储: 优先使用 STORAGES 中名为 agent_tool_outputs 的存储（可配置为对象存储），
+  否则为 AGENT_TOOL_OUTPUT_ROOT 目录（默认 data/agent_tool_outputs）；内容以 gzip 压缩保存
+
+- 清理: 超过保留期（按最后一次写入或再次引用的时间）的输出被删除；写入时每隔一段时间在后台线程顺带清理，
+  也可用 purge_tool_outputs 命令定时清理
+
+配置项：
+- AGENT_TOOL_OUTPUT_INLINE_CHARS: 单个工具输出超过该字符数时转存并截断（默认 4000）
+- AGENT_TOOL_OUTPUT_RETENTION_DAYS: 保留天数（默认 30，0 表示不清理）
+- AGENT_TOOL_OUTPUT_PURGE_INTERVAL: 写入时顺带清理的最小间隔（秒，默认 3600）
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, InvalidStorageError, storages
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ALIAS = 'agent_tool_outputs'
+REF_PREFIX = 'sha256:'
+_REF_RE = re.compile(r'^sha256:([0-9a-f]{64})$')
+
+_storage = None
+_storage_lock = threading.Lock()
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def inline_limit():
+    return int(getattr(settings, 'AGENT_TOOL_OUTPUT_INLINE_CHARS', 4000))
+
+
+def retention_days():
+    return int(getattr(settings, 'AGENT_TOOL_OUTPUT_RETENTION_DAYS', 30))
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                try:
+                    _storage = storages[STORAGE_ALIAS]
+                except InvalidStorageError:
+                    location = getattr(
+                        settings, 'AGENT_TOOL_OUTPUT_ROOT', settings.BASE_DIR / 'data' / 'agent_tool_outputs'
+                    )
+                    _storage = FileSystemStorage(location=str(location))
+    return _storage
+
+
+def reset_storage():
+    """丢弃缓存的存储实例（配置变更或测试时使用）"""
+    global _storage
+    with _storage_lock:
+        _storage = None
+
+
+def _name(digest):
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.txt.gz'
+
+
+def put(content: str) -> str:
+    """保存工具输出，返回引用；内容已存在时直接返回"""
+    data = content.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    storage = get_storage()
+    name = _name(digest)
+    if not storage.exists(name):
+        storage.save(name, ContentFile(gzip.compress(data, compresslevel=6)))
+    else:
+        _refresh(storage, name, data)
+    _maybe_purge()
+    return f'{REF_PREFIX}{digest}'
+
+
+def _refresh(storage, name, data):
+    """内容被再次引用时刷新修改时间，避免仍在使用的输出按保留期被清理"""
+    try:
+        os.utime(storage.path(name))
+        return
+    except NotImplementedError:
+        pass
+    except OSError as e:
+        logger.warning(f"刷新工具输出 {name} 的修改时间失败: {e}")
+        return
+    # 不支持本地路径的存储（对象存储）：超过半个保留期才重新写入，避免每次引用都上传
+    days = retention_days()
+    if days > 0 and storage.get_modified_time(name) < timezone.now() - timedelta(days=days / 2):
+        storage.delete(name)
+        storage.save(name, ContentFile(gzip.compress(data, compresslevel=6)))
+
+
+def _walk(storage, path=''):
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for directory in directories:
+        yield from _walk(storage, f'{path}{directory}/')
+    for file in files:
+        yield f'{path}{file}'
+
+
+def purge_expired(days=None) -> int:
+    """
+    删除超过保留期的工具输出
+
+    Args:
+        days: 保留天数，默认 AGENT_TOOL_OUTPUT_RETENTION_DAYS；0 表示不清理
+
+    Returns:
+        int: 删除的文件数
+    """
+    days = retention_days() if days is None else days
+    if days <= 0:
+        return 0
+    cutoff = timezone.now() - timedelta(days=days)
+    storage = get_storage()
+    removed = 0
+    for name in list(_walk(storage)):
+        try:
+            if storage.get_modified_time(name) < cutoff:
+                storage.delete(name)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"已清理 {removed} 个超过 {days} 天的工具输出")
+    return removed
+
+
+def _purge_in_background():
+    try:
+        purge_expired()
+    except Exception as e:
+        logger.warning(f"清理过期工具输出失败: {e}")
+
+
+def _maybe_purge():
+    """距上次清理超过 AGENT_TOOL_OUTPUT_PURGE_INTERVAL 时在后台线程清理，不阻塞写入"""
+    global _last_purge
+    interval = float(getattr(settings, 'AGENT_TOOL_OUTPUT_PURGE_INTERVAL', 3600))
+    with _purge_lock:
+        now = time.monotonic()
+        if now - _last_purge < interval:
+            return
+        _last_purge = now
+    threading.Thread(target=_purge_in_background, name='tool-output-purge', daemon=True).start()
+
+
+def get(ref: str):
+    """按引用读取完整输出，引用无效或不存在时返回 None"""
+    match = _REF_RE.match((ref or '').strip())
+    if not match:
+        return None
+    storage = get_storage()
+    name = _name(match.group(1))
+    try:
+        with storage.open(name, 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取工具输出 {ref} 失败: {e}")
+        return None
+
+
+def bounded(text: str, tool_name: str = ''):
+    """
+    超过内联上限的输出转存并截断
+
+    Returns:
+        (摘要文本, 引用或 None)
+    """
+    limit = inline_limit()
+    if len(text) <= limit:
+        return text, None
+    try:
+        ref = put(text)
+    except Exception as e:
+        # 存储不可用时保持原样，不丢失信息
+        logger.error(f"保存工具 {tool_name} 的输出失败: {e}", exc_info=True)
+        return text, None
+    summary = (
+        f"{text[:limit]}\n"
+        f"...[输出共 {len(text)} 字符，已截断。完整内容引用: {ref}，需要时调用 read_tool_output 读取]"
+    )
+    return summary, ref
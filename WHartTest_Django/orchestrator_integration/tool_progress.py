@@ -0,0 +1,29 @@
+"""
+工具执行进度上报
+
+Agent Loop 在执行工具前通过 ContextVar 注入进度回调，长时间运行的工具
+（如 execute_skill_script）可以借此把增量输出推送到 SSE 流（tool_progress 事件）。
+未注入回调时（普通对话、脚本直接调用）上报为空操作。
+"""
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+current_tool_progress: ContextVar[Optional[ProgressCallback]] = ContextVar(
+    'current_tool_progress', default=None
+)
+
+
+async def report_tool_progress(tool_name: str, **payload) -> None:
+    """上报一条工具进度，回调异常不影响工具本身的执行"""
+    callback = current_tool_progress.get()
+    if callback is None:
+        return
+    try:
+        await callback({'tool_name': tool_name, **payload})
+    except Exception as e:
+        logger.debug(f"工具进度上报失败: {e}")
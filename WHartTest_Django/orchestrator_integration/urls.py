@@ -1,7 +1,7 @@
 """URL路由配置"""
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrchestratorTaskViewSet, OrchestratorStreamAPIView
+from .views import OrchestratorTaskViewSet, OrchestratorStreamAPIView, PlaywrightPoolStatsView, AgentPersistenceStatsView
 from .agent_loop_view import AgentLoopStreamAPIView, AgentLoopStopAPIView
 
 router = DefaultRouter()
@@ -15,4 +15,8 @@ urlpatterns = [
     path('agent-loop/', AgentLoopStreamAPIView.as_view(), name='agent-loop-stream'),
     # Agent Loop 停止接口 - 中断正在执行的任务
     path('agent-loop/stop/', AgentLoopStopAPIView.as_view(), name='agent-loop-stop'),
+    # 持久化 Playwright 浏览器池指标
+    path('playwright-pool/stats/', PlaywrightPoolStatsView.as_view(), name='playwright-pool-stats'),
+    # Agent 状态批量写回指标
+    path('agent-loop/persistence-stats/', AgentPersistenceStatsView.as_view(), name='agent-persistence-stats'),
 ]
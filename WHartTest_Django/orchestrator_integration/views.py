@@ -13,7 +13,9 @@ from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from asgiref.sync import sync_to_async
 
 from langgraph_integration.models import LLMConfig, ChatSession
@@ -40,6 +42,24 @@ class OrchestratorTaskViewSet(viewsets.ReadOnlyModelViewSet):
         return OrchestratorTask.objects.filter(user=self.request.user)
 
 
+class PlaywrightPoolStatsView(APIView):
+    """持久化 Playwright 浏览器池指标（仅管理员）：进程占用、context 创建耗时、回收次数"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from .builtin_tools.skill_tools import get_playwright_session_stats
+        return Response(get_playwright_session_stats())
+
+
+class AgentPersistenceStatsView(APIView):
+    """Agent 状态批量写回指标（仅管理员，当前进程）：刷写次数、写入行数、刷写耗时、缓冲中的步骤"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from .agent_persistence import writer_stats
+        return Response(writer_stats())
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class OrchestratorStreamAPIView(View):
     """
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProjectsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "projects"
+
+    def ready(self):
+        """注册成员角色/权限缓存失效信号和项目统计增量维护信号"""
+        import projects.signals  # noqa
+        from projects.statistics import connect_signals
+        connect_signals()
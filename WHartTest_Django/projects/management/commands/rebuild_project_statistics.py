@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from projects.models import Project
+from projects.statistics import GLOBAL_CACHE_KEY, rebuild_project_statistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the project statistics rollup tables from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=int,
+            help='Only rebuild statistics of the given project ID (default: all projects)',
+        )
+
+    def handle(self, *args, **kwargs):
+        project_id = kwargs.get('project')
+        project_ids = [project_id] if project_id else list(Project.objects.values_list('id', flat=True))
+        scope = f'project {project_id}' if project_id else f'{len(project_ids)} project(s)'
+        self.stdout.write(f'Rebuilding statistics for {scope}...')
+
+        for pk in project_ids:
+            rebuild_project_statistics(pk)
+        cache.delete(GLOBAL_CACHE_KEY)
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,112 @@
+"""
+项目成员角色与模型权限解析
+
+权限类在一次请求内会多次判断同一用户的项目成员身份和模型权限（has_permission、
+每个对象的 has_object_permission、嵌套路由的多个权限类）。这里统一加载：
+- 一次查询取出用户在所有项目中的角色，缓存在本次请求的 user 实例上
+- 同时写入共享缓存（短 TTL），ProjectMember 变更时按用户失效
+- 模型权限同样一次查询加载，预填 ModelBackend 的 _perm_cache，后续 has_perm 不再查询
+
+共享缓存为 Django 默认缓存：配置了 REDIS_URL 时为 Redis，所有进程立即看到失效；
+未配置时为进程内存（LocMem），成员被移除或降级后，其他 Web/Celery 进程最多在 TTL 内仍沿用旧角色，
+多进程部署未配置 Redis 时可将 TTL 设为 0。
+
+配置项：
+- PROJECT_MEMBERSHIP_CACHE_TTL: 共享缓存秒数（默认 60，0 表示只做请求内缓存）
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import ProjectMember
+
+logger = logging.getLogger(__name__)
+
+MEMBER_ROLES = ('owner', 'admin', 'member')
+ADMIN_ROLES = ('owner', 'admin')
+
+_ROLES_ATTR = '_project_roles'
+
+
+def _ttl() -> int:
+    return int(getattr(settings, 'PROJECT_MEMBERSHIP_CACHE_TTL', 60))
+
+
+def _roles_key(user_id) -> str:
+    return f'project_roles:{user_id}'
+
+
+def _perms_key(user_id) -> str:
+    return f'user_perms:{user_id}'
+
+
+def get_project_roles(user) -> Dict[int, str]:
+    """获取用户在各项目中的角色 {project_id: role}"""
+    if not user or not user.is_authenticated:
+        return {}
+
+    roles = getattr(user, _ROLES_ATTR, None)
+    if roles is not None:
+        return roles
+
+    ttl = _ttl()
+    roles = cache.get(_roles_key(user.pk)) if ttl > 0 else None
+    if roles is None:
+        roles = dict(ProjectMember.objects.filter(user_id=user.pk).values_list('project_id', 'role'))
+        if ttl > 0:
+            cache.set(_roles_key(user.pk), roles, ttl)
+    setattr(user, _ROLES_ATTR, roles)
+    return roles
+
+
+def get_project_role(user, project_id) -> Optional[str]:
+    """获取用户在指定项目中的角色，非成员返回 None"""
+    try:
+        project_id = int(project_id)
+    except (TypeError, ValueError):
+        return None
+    return get_project_roles(user).get(project_id)
+
+
+def has_project_role(user, project_id, roles: Iterable[str] = MEMBER_ROLES) -> bool:
+    """用户在项目中的角色是否属于 roles"""
+    role = get_project_role(user, project_id)
+    return role is not None and role in roles
+
+
+def get_member_project_ids(user):
+    """用户所属的项目ID列表"""
+    return list(get_project_roles(user))
+
+
+def load_user_permissions(user) -> None:
+    """
+    预加载用户的模型权限
+
+    ModelBackend.has_perm 会读取 user._perm_cache，这里用一次查询（或共享缓存）填充，
+    替代 ModelBackend 分别查询用户权限和用户组权限的两次查询
+    """
+    if not user or not user.is_authenticated or user.is_superuser or hasattr(user, '_perm_cache'):
+        return
+
+    ttl = _ttl()
+    perms = cache.get(_perms_key(user.pk)) if ttl > 0 else None
+    if perms is None:
+        perms = {
+            f'{app_label}.{codename}'
+            for app_label, codename in Permission.objects.filter(
+                Q(user=user) | Q(group__user=user)
+            ).values_list('content_type__app_label', 'codename').distinct()
+        }
+        if ttl > 0:
+            cache.set(_perms_key(user.pk), perms, ttl)
+    user._perm_cache = perms
+
+
+def invalidate_user(user_id) -> None:
+    """清除用户的共享缓存（成员关系或权限变更时调用）"""
+    cache.delete_many([_roles_key(user_id), _perms_key(user_id)])
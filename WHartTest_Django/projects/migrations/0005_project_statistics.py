@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-19 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_remove_project_password_remove_project_system_url_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStatistics',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics_rollup', serialize=False, to='projects.project', verbose_name='项目')),
+                ('testcase_total', models.IntegerField(default=0, verbose_name='用例总数')),
+                ('testcase_pending_review', models.IntegerField(default=0, verbose_name='待审核')),
+                ('testcase_approved', models.IntegerField(default=0, verbose_name='审核通过')),
+                ('testcase_needs_optimization', models.IntegerField(default=0, verbose_name='需优化')),
+                ('testcase_optimization_pending_review', models.IntegerField(default=0, verbose_name='优化待审核')),
+                ('testcase_unavailable', models.IntegerField(default=0, verbose_name='不可用')),
+                ('script_total', models.IntegerField(default=0, verbose_name='脚本总数')),
+                ('script_draft', models.IntegerField(default=0, verbose_name='草稿')),
+                ('script_active', models.IntegerField(default=0, verbose_name='启用')),
+                ('script_deprecated', models.IntegerField(default=0, verbose_name='废弃')),
+                ('execution_total', models.IntegerField(default=0, verbose_name='执行总数')),
+                ('execution_completed', models.IntegerField(default=0, verbose_name='已完成')),
+                ('execution_failed', models.IntegerField(default=0, verbose_name='失败')),
+                ('execution_cancelled', models.IntegerField(default=0, verbose_name='已取消')),
+                ('case_total', models.IntegerField(default=0, verbose_name='执行用例总数')),
+                ('case_passed', models.IntegerField(default=0, verbose_name='通过用例数')),
+                ('case_failed', models.IntegerField(default=0, verbose_name='失败用例数')),
+                ('case_skipped', models.IntegerField(default=0, verbose_name='跳过用例数')),
+                ('case_error', models.IntegerField(default=0, verbose_name='错误用例数')),
+                ('requirement_total', models.IntegerField(default=0, verbose_name='需求文档数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '项目统计',
+                'verbose_name_plural': '项目统计',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectDailyStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('execution_count', models.IntegerField(default=0, verbose_name='执行次数')),
+                ('passed', models.IntegerField(default=0, verbose_name='通过用例数')),
+                ('failed', models.IntegerField(default=0, verbose_name='失败用例数')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_statistics', to='projects.project', verbose_name='项目')),
+            ],
+            options={
+                'verbose_name': '项目每日统计',
+                'verbose_name_plural': '项目每日统计',
+                'ordering': ['project_id', 'date'],
+                'unique_together': {('project', 'date')},
+            },
+        ),
+    ]
@@ -92,3 +92,80 @@ class ProjectMember(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.project.name} ({self.get_role_display()})"
+
+
+class ProjectStatistics(models.Model):
+    """
+    项目统计汇总，供仪表盘直接读取
+
+    由 projects.statistics 通过信号增量维护；记录缺失时在读取时重建，
+    也可用 rebuild_project_statistics 命令全量重建。
+    """
+    project = models.OneToOneField(
+        Project,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='statistics_rollup',
+        verbose_name=_('项目')
+    )
+
+    # 功能用例（按审核状态）
+    testcase_total = models.IntegerField(_('用例总数'), default=0)
+    testcase_pending_review = models.IntegerField(_('待审核'), default=0)
+    testcase_approved = models.IntegerField(_('审核通过'), default=0)
+    testcase_needs_optimization = models.IntegerField(_('需优化'), default=0)
+    testcase_optimization_pending_review = models.IntegerField(_('优化待审核'), default=0)
+    testcase_unavailable = models.IntegerField(_('不可用'), default=0)
+
+    # UI用例（自动化脚本）
+    script_total = models.IntegerField(_('脚本总数'), default=0)
+    script_draft = models.IntegerField(_('草稿'), default=0)
+    script_active = models.IntegerField(_('启用'), default=0)
+    script_deprecated = models.IntegerField(_('废弃'), default=0)
+
+    # 测试执行
+    execution_total = models.IntegerField(_('执行总数'), default=0)
+    execution_completed = models.IntegerField(_('已完成'), default=0)
+    execution_failed = models.IntegerField(_('失败'), default=0)
+    execution_cancelled = models.IntegerField(_('已取消'), default=0)
+    case_total = models.IntegerField(_('执行用例总数'), default=0)
+    case_passed = models.IntegerField(_('通过用例数'), default=0)
+    case_failed = models.IntegerField(_('失败用例数'), default=0)
+    case_skipped = models.IntegerField(_('跳过用例数'), default=0)
+    case_error = models.IntegerField(_('错误用例数'), default=0)
+
+    requirement_total = models.IntegerField(_('需求文档数'), default=0)
+
+    updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('项目统计')
+        verbose_name_plural = _('项目统计')
+
+    def __str__(self):
+        return f"{self.project_id} 统计"
+
+
+class ProjectDailyStatistics(models.Model):
+    """
+    项目每日执行统计（按 UTC 日期），用于执行趋势
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='daily_statistics',
+        verbose_name=_('项目')
+    )
+    date = models.DateField(_('日期'))
+    execution_count = models.IntegerField(_('执行次数'), default=0)
+    passed = models.IntegerField(_('通过用例数'), default=0)
+    failed = models.IntegerField(_('失败用例数'), default=0)
+
+    class Meta:
+        verbose_name = _('项目每日统计')
+        verbose_name_plural = _('项目每日统计')
+        unique_together = ('project', 'date')
+        ordering = ['project_id', 'date']
+
+    def __str__(self):
+        return f"{self.project_id} {self.date}"
@@ -1,5 +1,6 @@
 from rest_framework import permissions
 from .models import ProjectMember
+from .membership import ADMIN_ROLES, get_project_role, has_project_role
 from wharttest_django.permissions import HasModelPermission
 
 
@@ -18,10 +19,7 @@ class IsProjectMember(permissions.BasePermission):
             return False
         
         # 检查用户是否是项目成员
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user
-        ).exists()
+        return get_project_role(request.user, project_id) is not None
     
     def has_object_permission(self, request, view, obj):
         """
@@ -30,10 +28,7 @@ class IsProjectMember(permissions.BasePermission):
         if request.user.is_superuser:
             return True
             
-        return ProjectMember.objects.filter(
-            project=obj,
-            user=request.user
-        ).exists()
+        return get_project_role(request.user, obj.pk) is not None
 
 
 class IsProjectAdmin(permissions.BasePermission):
@@ -51,11 +46,7 @@ class IsProjectAdmin(permissions.BasePermission):
             return False
         
         # 检查用户是否是项目管理员或拥有者
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user,
-            role__in=['admin', 'owner']
-        ).exists()
+        return has_project_role(request.user, project_id, ADMIN_ROLES)
     
     def has_object_permission(self, request, view, obj):
         """
@@ -64,11 +55,7 @@ class IsProjectAdmin(permissions.BasePermission):
         if request.user.is_superuser:
             return True
             
-        return ProjectMember.objects.filter(
-            project=obj,
-            user=request.user,
-            role__in=['admin', 'owner']
-        ).exists()
+        return has_project_role(request.user, obj.pk, ADMIN_ROLES)
 
 
 class IsProjectOwner(permissions.BasePermission):
@@ -86,11 +73,7 @@ class IsProjectOwner(permissions.BasePermission):
             return False
             
         # 检查用户是否是项目拥有者
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user,
-            role='owner'
-        ).exists()
+        return has_project_role(request.user, project_id, ('owner',))
     
     def has_object_permission(self, request, view, obj):
         """
@@ -99,11 +82,7 @@ class IsProjectOwner(permissions.BasePermission):
         if request.user.is_superuser:
             return True
             
-        return ProjectMember.objects.filter(
-            project=obj,
-            user=request.user,
-            role='owner'
-        ).exists()
+        return has_project_role(request.user, obj.pk, ('owner',))
 
 
 class HasProjectMemberPermission(HasModelPermission):
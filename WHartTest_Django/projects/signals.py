@@ -0,0 +1,36 @@
+"""
+项目成员/权限变更时失效共享缓存的角色与权限
+"""
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .membership import invalidate_user
+
+
+@receiver(post_save, sender='projects.ProjectMember')
+@receiver(post_delete, sender='projects.ProjectMember')
+def _invalidate_member_roles(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def _invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user(instance.pk)
+        return
+    # 从用户组/权限一侧增删用户（clear 时无法得知用户，由缓存 TTL 兜底）
+    for user_id in pk_set or []:
+        invalidate_user(user_id)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def _invalidate_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    groups = [instance] if not reverse else Group.objects.filter(pk__in=pk_set or [])
+    for user_id in User.objects.filter(groups__in=groups).values_list('id', flat=True).distinct():
+        invalidate_user(user_id)
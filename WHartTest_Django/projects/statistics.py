@@ -0,0 +1,365 @@
+"""
+项目统计汇总
+
+仪表盘轮询 statistics 接口，原先每次都要执行十几次聚合查询。这里把统计结果保存在
+ProjectStatistics / ProjectDailyStatistics 中：
+- 用例、脚本、测试执行、需求文档保存/删除时，按变更前后的差值用 F() 增量更新
+  （变更前的值在 post_init 时记录，Celery 任务更新执行计数同样走 save，因此一并覆盖）
+- 汇总记录不存在时（新项目、首次部署）在读取时按需全量重建
+- 全局的 MCP / Skill / 知识库文档数量缓存在共享缓存中，相关模型变更时失效
+
+配置项：
+- PROJECT_STATISTICS_GLOBAL_CACHE_TTL: 全局统计缓存秒数（默认 300）
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .models import ProjectDailyStatistics, ProjectStatistics
+
+logger = logging.getLogger(__name__)
+
+TESTCASE_REVIEW_STATUSES = (
+    'pending_review', 'approved', 'needs_optimization', 'optimization_pending_review', 'unavailable',
+)
+SCRIPT_STATUSES = ('draft', 'active', 'deprecated')
+EXECUTION_STATUSES = ('completed', 'failed', 'cancelled')
+# TestExecution 计数字段 -> 汇总字段
+CASE_RESULT_FIELDS = {
+    'total_count': 'case_total',
+    'passed_count': 'case_passed',
+    'failed_count': 'case_failed',
+    'skipped_count': 'case_skipped',
+    'error_count': 'case_error',
+}
+
+TREND_DAYS = 7
+GLOBAL_CACHE_KEY = 'project_statistics:global'
+
+
+def _global_cache_ttl():
+    return int(getattr(settings, 'PROJECT_STATISTICS_GLOBAL_CACHE_TTL', 300))
+
+
+def _utc_date(value):
+    return value.astimezone(dt_timezone.utc).date() if timezone.is_aware(value) else value.date()
+
+
+# ---------------------------------------------------------------------------
+# 全量重建
+# ---------------------------------------------------------------------------
+
+def rebuild_project_statistics(project_id):
+    """从业务表全量重建项目统计（汇总 + 每日执行），返回 ProjectStatistics"""
+    from requirements.models import RequirementDocument
+    from testcases.models import AutomationScript, TestCase, TestExecution
+
+    values = {}
+
+    testcase_agg = TestCase.objects.filter(project_id=project_id).order_by().aggregate(
+        testcase_total=Count('id'),
+        **{f'testcase_{s}': Count('id', filter=Q(review_status=s)) for s in TESTCASE_REVIEW_STATUSES},
+    )
+    values.update(testcase_agg)
+
+    script_agg = AutomationScript.objects.filter(test_case__project_id=project_id).order_by().aggregate(
+        script_total=Count('id'),
+        **{f'script_{s}': Count('id', filter=Q(status=s)) for s in SCRIPT_STATUSES},
+    )
+    values.update(script_agg)
+
+    executions = TestExecution.objects.filter(suite__project_id=project_id).order_by()
+    execution_agg = executions.aggregate(
+        execution_total=Count('id'),
+        **{f'execution_{s}': Count('id', filter=Q(status=s)) for s in EXECUTION_STATUSES},
+        **{column: Sum(field) for field, column in CASE_RESULT_FIELDS.items()},
+    )
+    values.update({k: v or 0 for k, v in execution_agg.items()})
+
+    values['requirement_total'] = RequirementDocument.objects.filter(project_id=project_id).count()
+
+    daily = executions.annotate(day=TruncDate('created_at', tzinfo=dt_timezone.utc)).values('day').annotate(
+        execution_count=Count('id'), passed=Sum('passed_count'), failed=Sum('failed_count'),
+    )
+
+    with transaction.atomic():
+        stats, _ = ProjectStatistics.objects.update_or_create(project_id=project_id, defaults=values)
+        ProjectDailyStatistics.objects.filter(project_id=project_id).delete()
+        ProjectDailyStatistics.objects.bulk_create([
+            ProjectDailyStatistics(
+                project_id=project_id, date=row['day'],
+                execution_count=row['execution_count'], passed=row['passed'] or 0, failed=row['failed'] or 0,
+            )
+            for row in daily
+        ])
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# 读取
+# ---------------------------------------------------------------------------
+
+def get_global_statistics():
+    """全局共享的 MCP / Skill / 知识库文档统计"""
+    stats = cache.get(GLOBAL_CACHE_KEY)
+    if stats is not None:
+        return stats
+
+    from knowledge.models import Document
+    from mcp_tools.models import RemoteMCPConfig
+    from skills.models import Skill
+
+    mcp = RemoteMCPConfig.objects.aggregate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+    skills = Skill.objects.aggregate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+    stats = {
+        'mcp': mcp,
+        'skills': skills,
+        'knowledge': {'total': Document.objects.count()},
+    }
+    cache.set(GLOBAL_CACHE_KEY, stats, _global_cache_ttl())
+    return stats
+
+
+def get_project_statistics(project):
+    """组装 statistics 接口的数据；汇总记录不存在时先重建"""
+    stats = ProjectStatistics.objects.filter(project_id=project.id).first()
+    if stats is None:
+        stats = rebuild_project_statistics(project.id)
+
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    first_day = today - timedelta(days=TREND_DAYS - 1)
+    buckets = {
+        row.date: row
+        for row in ProjectDailyStatistics.objects.filter(project_id=project.id, date__gte=first_day, date__lte=today)
+    }
+    daily = []
+    for i in range(TREND_DAYS):
+        day = first_day + timedelta(days=i)
+        row = buckets.get(day)
+        daily.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'execution_count': row.execution_count if row else 0,
+            'passed': row.passed if row else 0,
+            'failed': row.failed if row else 0,
+        })
+
+    data = {
+        'project': {
+            'id': project.id,
+            'name': project.name,
+        },
+        'testcases': {
+            'total': stats.testcase_total,
+            'by_review_status': {s: getattr(stats, f'testcase_{s}') for s in TESTCASE_REVIEW_STATUSES},
+        },
+        'automation_scripts': {
+            'total': stats.script_total,
+            'by_status': {s: getattr(stats, f'script_{s}') for s in SCRIPT_STATUSES},
+        },
+        'executions': {
+            'total_executions': stats.execution_total,
+            'by_status': {s: getattr(stats, f'execution_{s}') for s in EXECUTION_STATUSES},
+            'case_results': {
+                'total': stats.case_total,
+                'passed': stats.case_passed,
+                'failed': stats.case_failed,
+                'skipped': stats.case_skipped,
+                'error': stats.case_error,
+            },
+        },
+        'execution_trend': {
+            'daily_7d': daily,
+            'summary_7d': {
+                key: sum(day[key] for day in daily) for key in ('execution_count', 'passed', 'failed')
+            },
+        },
+        'requirements': {'total': stats.requirement_total},
+    }
+    data.update(get_global_statistics())
+    return data
+
+
+# ---------------------------------------------------------------------------
+# 增量维护
+# ---------------------------------------------------------------------------
+
+def _suite_project_id(suite_id):
+    from testcases.models import TestSuite
+    return TestSuite.objects.filter(pk=suite_id).values_list('project_id', flat=True).first()
+
+
+def _test_case_project_id(test_case_id):
+    from testcases.models import TestCase
+    return TestCase.objects.filter(pk=test_case_id).values_list('project_id', flat=True).first()
+
+
+def _testcase_contribution(values):
+    return {'testcase_total': 1, f"testcase_{values['review_status']}": 1}, None
+
+
+def _script_contribution(values):
+    return {'script_total': 1, f"script_{values['status']}": 1}, None
+
+
+def _execution_contribution(values):
+    counts = {'execution_total': 1, f"execution_{values['status']}": 1}
+    for field, column in CASE_RESULT_FIELDS.items():
+        counts[column] = values[field]
+    day = {'execution_count': 1, 'passed': values['passed_count'], 'failed': values['failed_count']}
+    return counts, (_utc_date(values['created_at']), day)
+
+
+def _requirement_contribution(values):
+    return {'requirement_total': 1}, None
+
+
+# 模型 -> (影响统计的字段, (确定项目的字段, 由该字段查项目ID的函数), 单条记录对统计的贡献)
+TRACKED_MODELS = {
+    'testcases.TestCase': (('project_id', 'review_status'), ('project_id', None), _testcase_contribution),
+    'testcases.AutomationScript': (
+        ('test_case_id', 'status'), ('test_case_id', _test_case_project_id), _script_contribution,
+    ),
+    'testcases.TestExecution': (
+        ('suite_id', 'status', 'created_at', *CASE_RESULT_FIELDS), ('suite_id', _suite_project_id),
+        _execution_contribution,
+    ),
+    'requirements.RequirementDocument': (('project_id',), ('project_id', None), _requirement_contribution),
+}
+
+_STATS_COLUMNS = {f.attname for f in ProjectStatistics._meta.concrete_fields} - {'project_id', 'updated_at'}
+
+
+def _values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def _snapshot(instance, fields):
+    """post_init 时的字段值；有字段被延迟加载时返回 None"""
+    if not all(field in instance.__dict__ for field in fields):
+        return None
+    return {field: instance.__dict__[field] for field in fields}
+
+
+def apply_changes(label, changes):
+    """
+    按变更前后的差值增量更新统计
+
+    changes: [(变更前的字段值或 None, 变更后的字段值或 None)]
+    汇总记录不存在时跳过，由下次读取时重建
+    """
+    _, (project_field, resolve_project), contribution = TRACKED_MODELS[label]
+    project_ids = {}
+    totals = defaultdict(Counter)
+    daily = defaultdict(Counter)
+    for old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            key = values[project_field]
+            if key not in project_ids:
+                project_ids[key] = resolve_project(key) if resolve_project else key
+            project_id = project_ids[key]
+            if project_id is None:
+                continue
+            counts, day = contribution(values)
+            for column, n in counts.items():
+                if column in _STATS_COLUMNS:
+                    totals[project_id][column] += sign * n
+            if day:
+                date, day_counts = day
+                for column, n in day_counts.items():
+                    daily[(project_id, date)][column] += sign * n
+
+    for project_id, counter in totals.items():
+        counts = {column: n for column, n in counter.items() if n}
+        if not counts:
+            continue
+        updated = ProjectStatistics.objects.filter(project_id=project_id).update(
+            updated_at=timezone.now(), **{column: F(column) + n for column, n in counts.items()}
+        )
+        if not updated:
+            continue
+        for (day_project_id, date), day_counter in daily.items():
+            day_counts = {column: n for column, n in day_counter.items() if n}
+            if day_project_id != project_id or not day_counts:
+                continue
+            rows = ProjectDailyStatistics.objects.filter(project_id=project_id, date=date).update(
+                **{column: F(column) + n for column, n in day_counts.items()}
+            )
+            # 删除记录（包括删除项目时的级联删除）不会新建日期桶
+            if not rows and any(n > 0 for n in day_counts.values()):
+                ProjectDailyStatistics.objects.get_or_create(project_id=project_id, date=date, defaults=day_counts)
+
+
+def record_created(instances):
+    """bulk_create 不触发信号，批量创建后调用以计入统计"""
+    if not instances:
+        return
+    label = instances[0]._meta.label
+    fields = TRACKED_MODELS[label][0]
+    apply_changes(label, [(None, _values(instance, fields)) for instance in instances])
+
+
+def record_increment(instance, **deltas):
+    """queryset.update() 以 F() 自增计数字段时不触发信号，自增后调用以计入统计"""
+    label = instance._meta.label
+    old = _values(instance, TRACKED_MODELS[label][0])
+    new = {**old, **{field: old[field] + n for field, n in deltas.items()}}
+    apply_changes(label, [(old, new)])
+
+
+def _on_post_init(sender, instance, **kwargs):
+    # 从数据库加载时 _state.adding 在 post_init 之后才置为 False，因此总是记录；新建记录在 post_save 中忽略
+    instance._statistics_snapshot = _snapshot(instance, TRACKED_MODELS[sender._meta.label][0])
+
+
+def _on_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    label = sender._meta.label
+    fields, (project_field, resolve_project), _ = TRACKED_MODELS[label]
+    new = _values(instance, fields)
+    old = None if created else getattr(instance, '_statistics_snapshot', None)
+    instance._statistics_snapshot = new
+    if old == new:
+        return
+    if not created and old is None:
+        # 加载时字段被延迟，无法得知变更前的值，提交后重建
+        key = new[project_field]
+        project_id = resolve_project(key) if resolve_project else key
+        if project_id is not None:
+            transaction.on_commit(lambda: rebuild_project_statistics(project_id))
+        return
+    apply_changes(label, [(old, new)])
+
+
+def _on_post_delete(sender, instance, **kwargs):
+    label = sender._meta.label
+    apply_changes(label, [(_values(instance, TRACKED_MODELS[label][0]), None)])
+
+
+def _invalidate_global_statistics(sender, **kwargs):
+    cache.delete(GLOBAL_CACHE_KEY)
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label in TRACKED_MODELS:
+        model = apps.get_model(label)
+        post_init.connect(_on_post_init, sender=model, dispatch_uid=f'project_statistics_init_{label}')
+        post_save.connect(_on_post_save, sender=model, dispatch_uid=f'project_statistics_save_{label}')
+        post_delete.connect(_on_post_delete, sender=model, dispatch_uid=f'project_statistics_delete_{label}')
+
+    for label in ('mcp_tools.RemoteMCPConfig', 'skills.Skill', 'knowledge.Document'):
+        model = apps.get_model(label)
+        for signal in (post_save, post_delete):
+            signal.connect(_invalidate_global_statistics, sender=model, dispatch_uid=f'project_statistics_global_{label}')
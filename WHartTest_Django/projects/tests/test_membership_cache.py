@@ -0,0 +1,92 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from projects.membership import get_project_role, has_project_role, load_user_permissions
+from projects.models import Project, ProjectMember
+
+
+class MembershipCacheTests(TestCase):
+    """项目成员角色和模型权限的缓存与失效"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.user = User.objects.create_user(username='member', password='password')
+        self.project = Project.objects.create(name='Cache Project', creator=self.owner)
+        self.other = Project.objects.create(name='Other Project', creator=self.owner)
+        self.membership = ProjectMember.objects.create(project=self.project, user=self.user, role='member')
+
+    def _fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_roles_loaded_once_per_request(self):
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(has_project_role(user, self.project.id))
+            self.assertTrue(has_project_role(user, str(self.project.id)))
+            self.assertFalse(has_project_role(user, self.other.id))
+            self.assertFalse(has_project_role(user, self.project.id, roles=('owner', 'admin')))
+            self.assertFalse(has_project_role(user, 'invalid'))
+
+        # 共享缓存命中，新的用户实例无需查询
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_role(user, self.project.id), 'member')
+
+    def test_membership_changes_invalidate_cache(self):
+        has_project_role(self._fresh_user(), self.project.id)
+
+        self.membership.role = 'admin'
+        self.membership.save()
+        self.assertEqual(get_project_role(self._fresh_user(), self.project.id), 'admin')
+
+        ProjectMember.objects.create(project=self.other, user=self.user, role='member')
+        self.assertTrue(has_project_role(self._fresh_user(), self.other.id))
+
+        self.membership.delete()
+        self.assertIsNone(get_project_role(self._fresh_user(), self.project.id))
+
+    def test_permissions_loaded_in_single_query(self):
+        group = Group.objects.create(name='testers')
+        group.permissions.add(Permission.objects.get(codename='view_project'))
+        self.user.user_permissions.add(Permission.objects.get(codename='change_project'))
+        self.user.groups.add(group)
+
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            load_user_permissions(user)
+            self.assertTrue(user.has_perm('projects.view_project'))
+            self.assertTrue(user.has_perm('projects.change_project'))
+            self.assertFalse(user.has_perm('projects.delete_project'))
+
+        # 用户组权限变更后失效
+        group.permissions.add(Permission.objects.get(codename='delete_project'))
+        user = self._fresh_user()
+        load_user_permissions(user)
+        self.assertTrue(user.has_perm('projects.delete_project'))
+
+    def test_warm_request_skips_authorization_queries(self):
+        group = Group.objects.create(name='viewers')
+        group.permissions.add(
+            Permission.objects.get(codename='view_testcase'),
+            Permission.objects.get(codename='view_project'),
+        )
+        self.user.groups.add(group)
+        client = APIClient()
+        url = f'/api/projects/{self.project.id}/testcases/'
+
+        def run():
+            client.force_authenticate(self._fresh_user())
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            return len(queries)
+
+        cold = run()
+        warm = run()
+        # 冷请求：一次成员角色查询 + 一次模型权限查询；热请求全部命中缓存
+        self.assertEqual(cold - warm, 2)
@@ -0,0 +1,93 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from projects.models import Project, ProjectMember, ProjectStatistics
+from projects.statistics import get_project_statistics, rebuild_project_statistics
+from requirements.models import RequirementDocument
+from testcases.models import AutomationScript, TestCase as TestCaseModel, TestCaseModule, TestExecution, TestSuite
+from testcases.tasks import _update_execution_counts
+
+
+class ProjectStatisticsTests(TestCase):
+    """统计汇总的增量维护结果应与全量重建一致"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(username='stats', password='password')
+        self.project = Project.objects.create(name='Stats Project', creator=self.user)
+        ProjectMember.objects.get_or_create(project=self.project, user=self.user, defaults={'role': 'owner'})
+        self.module = TestCaseModule.objects.create(project=self.project, name='module', creator=self.user)
+        self.suite = TestSuite.objects.create(project=self.project, name='suite', creator=self.user)
+        self.case = self._case('case-1')
+        self._case('case-2', review_status='approved')
+        AutomationScript.objects.create(test_case=self.case, name='script', script_content='pass', creator=self.user)
+        TestExecution.objects.create(suite=self.suite, status='completed', total_count=2, passed_count=2)
+
+    def _case(self, name, **kwargs):
+        return TestCaseModel.objects.create(
+            project=self.project, module=self.module, name=name, creator=self.user, **kwargs
+        )
+
+    def _assert_matches_rebuild(self):
+        incremental = get_project_statistics(self.project)
+        rebuild_project_statistics(self.project.id)
+        self.assertEqual(incremental, get_project_statistics(self.project))
+        return incremental
+
+    def test_incremental_updates_match_rebuild(self):
+        stats = get_project_statistics(self.project)
+        self.assertEqual(stats['testcases']['total'], 2)
+        self.assertEqual(stats['executions']['case_results']['passed'], 2)
+
+        # 用例审核状态变更、新增、删除
+        self.case.review_status = 'needs_optimization'
+        self.case.save()
+        self._case('case-3').delete()
+        script = AutomationScript.objects.get()
+        script.status = 'active'
+        script.save()
+
+        # Celery 任务更新执行计数
+        execution = TestExecution.objects.create(suite=self.suite, status='running', total_count=3)
+        for status in ('pass', 'fail', 'skip'):
+            _update_execution_counts(execution, status)
+        execution = TestExecution.objects.get(pk=execution.pk)
+        execution.status = 'failed'
+        execution.save(update_fields=['status', 'updated_at'])
+
+        RequirementDocument.objects.create(project=self.project, title='doc', document_type='txt', uploader=self.user)
+
+        stats = self._assert_matches_rebuild()
+        self.assertEqual(stats['testcases']['by_review_status']['needs_optimization'], 1)
+        self.assertEqual(stats['automation_scripts']['by_status']['active'], 1)
+        self.assertEqual(stats['executions']['by_status'], {'completed': 1, 'failed': 1, 'cancelled': 0})
+        self.assertEqual(stats['executions']['case_results']['passed'], 3)
+        self.assertEqual(stats['execution_trend']['summary_7d'], {'execution_count': 2, 'passed': 3, 'failed': 1})
+        self.assertEqual(stats['requirements']['total'], 1)
+
+        # 级联删除
+        self.case.delete()
+        self.suite.delete()
+        self._assert_matches_rebuild()
+
+    def test_endpoint_reads_rollup(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/projects/{self.project.id}/statistics/'
+        self.assertEqual(client.get(url).status_code, 200)
+
+        self._case('case-3')
+        with self.assertNumQueries(3):
+            response = client.get(url)
+        self.assertEqual(response.json()['data']['testcases']['total'], 3)
+
+    def test_rebuild_command(self):
+        get_project_statistics(self.project)
+        ProjectStatistics.objects.filter(project=self.project).update(testcase_total=0)
+        call_command('rebuild_project_statistics', project=self.project.id, stdout=io.StringIO())
+        self.assertEqual(ProjectStatistics.objects.get(project=self.project).testcase_total, 2)
@@ -12,6 +12,7 @@ from .serializers import (
     UserPromptListSerializer
 )
 from .services import initialize_user_prompts
+from langgraph_integration.prompt_cache import SystemPromptCache
 
 
 class UserPromptViewSet(BaseModelViewSet):
@@ -159,6 +160,8 @@ class UserPromptViewSet(BaseModelViewSet):
             user=request.user,
             is_default=True
         ).update(is_default=False)
+        # update() 不触发保存信号，需手动清理系统提示词缓存
+        SystemPromptCache.invalidate_user(request.user.id)
 
         return Response({
             "status": "success",
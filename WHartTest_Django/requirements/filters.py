@@ -1,5 +1,6 @@
 import django_filters
 from django.db import models
+from wharttest_django.search import FullTextFilter
 from .models import (
     RequirementDocument, RequirementModule, ReviewReport, 
     ReviewIssue, ModuleReviewResult
@@ -25,10 +26,10 @@ class RequirementDocumentFilter(django_filters.FilterSet):
     is_latest = django_filters.BooleanFilter()
     version = django_filters.CharFilter(lookup_expr='icontains')
     
-    # 内容过滤
+    # 内容过滤（长文本先用全文索引预筛选，再按字段 icontains 匹配）
     title = django_filters.CharFilter(lookup_expr='icontains')
-    description = django_filters.CharFilter(lookup_expr='icontains')
-    content = django_filters.CharFilter(lookup_expr='icontains')
+    description = FullTextFilter()
+    content = FullTextFilter()
     
     # 统计信息过滤
     word_count_min = django_filters.NumberFilter(field_name='word_count', lookup_expr='gte')
@@ -65,9 +66,9 @@ class RequirementModuleFilter(django_filters.FilterSet):
     parent_module = django_filters.UUIDFilter(field_name='parent_module__id')
     is_auto_generated = django_filters.BooleanFilter()
     
-    # 内容过滤
+    # 内容过滤（长文本先用全文索引预筛选，再按字段 icontains 匹配）
     title = django_filters.CharFilter(lookup_expr='icontains')
-    content = django_filters.CharFilter(lookup_expr='icontains')
+    content = FullTextFilter()
     
     # 位置过滤
     start_page_min = django_filters.NumberFilter(field_name='start_page', lookup_expr='gte')
@@ -153,10 +154,10 @@ class ReviewIssueFilter(django_filters.FilterSet):
     priority = django_filters.ChoiceFilter(choices=ReviewIssue.PRIORITY_CHOICES)
     is_resolved = django_filters.BooleanFilter()
     
-    # 内容过滤
+    # 内容过滤（长文本先用全文索引预筛选，再按字段 icontains 匹配）
     title = django_filters.CharFilter(lookup_expr='icontains')
-    description = django_filters.CharFilter(lookup_expr='icontains')
-    suggestion = django_filters.CharFilter(lookup_expr='icontains')
+    description = FullTextFilter()
+    suggestion = FullTextFilter()
     location = django_filters.CharFilter(lookup_expr='icontains')
     section = django_filters.CharFilter(lookup_expr='icontains')
     
@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-19 10:17
+
+from django.db import migrations, models
+
+from wharttest_django.search import create_search_index, drop_search_index, rebuild_search_index
+
+
+SEARCH_FIELDS = {
+    'requirementdocument': ('title', 'description', 'content'),
+    'requirementmodule': ('title', 'content'),
+    'reviewissue': ('title', 'description', 'suggestion'),
+}
+
+
+def build_search_index(apps, schema_editor):
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('requirements', model_name)
+        create_search_index(schema_editor, model)
+        rebuild_search_index(model, fields, using=schema_editor.connection.alias)
+
+
+def remove_search_index(apps, schema_editor):
+    for model_name in SEARCH_FIELDS:
+        drop_search_index(schema_editor, apps.get_model('requirements', model_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requirements', '0008_change_progress_to_float'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirementdocument',
+            name='search_tokens',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='检索词元'),
+        ),
+        migrations.AddField(
+            model_name='requirementmodule',
+            name='search_tokens',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='检索词元'),
+        ),
+        migrations.AddField(
+            model_name='reviewissue',
+            name='search_tokens',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='检索词元'),
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+from wharttest_django.search import rebuild_search_index
+
+
+SEARCH_FIELDS = {
+    'requirementdocument': ('title', 'description', 'content'),
+    'requirementmodule': ('title', 'content'),
+    'reviewissue': ('title', 'description', 'suggestion'),
+}
+
+
+def mark_truncated(apps, schema_editor):
+    # 只有词元数达到上限的记录可能被截断，重新生成它们的词元以写入 search_truncated
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('requirements', model_name)
+        rebuild_search_index(model, fields, using=schema_editor.connection.alias, only_full=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requirements', '0009_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requirementdocument',
+            name='search_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='检索词元已截断'),
+        ),
+        migrations.AddField(
+            model_name='requirementmodule',
+            name='search_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='检索词元已截断'),
+        ),
+        migrations.AddField(
+            model_name='reviewissue',
+            name='search_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='检索词元已截断'),
+        ),
+        migrations.RunPython(mark_truncated, migrations.RunPython.noop),
+    ]
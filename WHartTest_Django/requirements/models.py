@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from projects.models import Project
+from wharttest_django.search import FullTextSearchMixin
 import uuid
 
 
@@ -15,10 +16,12 @@ def document_image_upload_path(instance, filename):
     return f'requirement_documents/{instance.document.project.id}/{instance.document.id}/images/{filename}'
 
 
-class RequirementDocument(models.Model):
+class RequirementDocument(FullTextSearchMixin):
     """
     需求文档模型
     """
+    SEARCH_FIELDS = ('title', 'description', 'content')
+
     DOCUMENT_TYPES = [
         ('pdf', 'PDF'),
         ('doc', 'Word文档'),
@@ -169,10 +172,12 @@ class DocumentImage(models.Model):
         return f"{self.document.title} - {self.image_id}"
 
 
-class RequirementModule(models.Model):
+class RequirementModule(FullTextSearchMixin):
     """
     需求模块模型 - AI拆分或用户手动调整的功能模块
     """
+    SEARCH_FIELDS = ('title', 'content')
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey(
         RequirementDocument,
@@ -321,10 +326,12 @@ class ReviewReport(models.Model):
         return f"{self.document.title} - 评审报告 ({self.review_date.strftime('%Y-%m-%d')})"
 
 
-class ReviewIssue(models.Model):
+class ReviewIssue(FullTextSearchMixin):
     """
     评审问题模型
     """
+    SEARCH_FIELDS = ('title', 'description', 'suggestion')
+
     ISSUE_TYPES = [
         ('specification', '规范性'),
         ('clarity', '清晰度'),
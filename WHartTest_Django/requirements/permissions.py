@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from projects.models import ProjectMember
+from projects.membership import ADMIN_ROLES, get_project_role, has_project_role
 
 
 class IsProjectMemberForRequirement(permissions.BasePermission):
@@ -43,10 +43,7 @@ class IsProjectMemberForRequirement(permissions.BasePermission):
             return False
             
         # 检查用户是否是项目成员
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user
-        ).exists()
+        return get_project_role(request.user, project_id) is not None
 
     def has_object_permission(self, request, view, obj):
         # 如果用户是超级管理员，直接允许访问
@@ -66,10 +63,7 @@ class IsProjectMemberForRequirement(permissions.BasePermission):
             return False
             
         # 检查用户是否是项目成员
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user
-        ).exists()
+        return get_project_role(request.user, project_id) is not None
 
 
 class IsProjectAdminForRequirement(permissions.BasePermission):
@@ -106,11 +100,7 @@ class IsProjectAdminForRequirement(permissions.BasePermission):
             return False
             
         # 检查用户是否是项目管理员或拥有者
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user,
-            role__in=['admin', 'owner']
-        ).exists()
+        return has_project_role(request.user, project_id, ADMIN_ROLES)
 
     def has_object_permission(self, request, view, obj):
         # 如果用户是超级管理员，直接允许访问
@@ -128,11 +118,7 @@ class IsProjectAdminForRequirement(permissions.BasePermission):
             return False
             
         # 检查用户是否是项目管理员或拥有者
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user,
-            role__in=['admin', 'owner']
-        ).exists()
+        return has_project_role(request.user, project_id, ADMIN_ROLES)
 
 
 class CanManageRequirementDocument(permissions.BasePermission):
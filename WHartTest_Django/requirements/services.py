@@ -8,6 +8,7 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph_integration.models import LLMConfig
+from langgraph_integration import llm_client
 from .models import RequirementDocument, RequirementModule, DocumentImage
 from prompts.models import UserPrompt
 
@@ -28,6 +29,8 @@ def create_llm_instance(active_config, temperature=0.1):
         "base_url": active_config.api_url,
         "max_retries": 3,
         "timeout": 120,
+        # 共享连接池与端点限流
+        **llm_client.shared_http_clients(),
     }
     llm = ChatOpenAI(**llm_kwargs)
     logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
@@ -37,18 +40,18 @@ def create_llm_instance(active_config, temperature=0.1):
     return llm
 
 
-def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
+def safe_llm_invoke(llm, messages, max_retries=3):
     """
     安全地调用 LLM，处理空响应和临时性错误。
     
     某些 API（如非官方 OpenAI 兼容服务）可能返回 HTTP 200 但 choices 为空，
-    这个函数会检测并重试这种情况。
+    这个函数会检测并重试这种情况。重试间隔为带抖动的指数退避，服务端返回 Retry-After 时以其为准。
+    调用方均为同步代码（Celery 任务、后台线程），这里按同步方式等待。
     
     Args:
         llm: LangChain LLM 实例
         messages: 消息列表
         max_retries: 最大重试次数
-        retry_delay: 重试间隔（秒）
     
     Returns:
         LLM 响应对象
@@ -70,7 +73,7 @@ def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
             # 响应为空，记录并重试
             logger.warning(f"LLM 返回空响应，尝试重试 ({attempt + 1}/{max_retries})")
             if attempt < max_retries - 1:
-                time.sleep(retry_delay * (attempt + 1))  # 递增延迟
+                time.sleep(llm_client.retry_delay(attempt))
             continue
             
         except TypeError as e:
@@ -79,14 +82,14 @@ def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
                 logger.warning(f"LLM API 返回空 choices，尝试重试 ({attempt + 1}/{max_retries})")
                 last_error = e
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
+                    time.sleep(llm_client.retry_delay(attempt))
                 continue
             raise
         except Exception as e:
             last_error = e
             logger.warning(f"LLM 调用失败: {e}，尝试重试 ({attempt + 1}/{max_retries})")
             if attempt < max_retries - 1:
-                time.sleep(retry_delay * (attempt + 1))
+                time.sleep(llm_client.retry_delay(attempt, e))
             continue
     
     # 所有重试都失败
@@ -5,10 +5,20 @@ import logging
 from celery import shared_task
 from django.utils import timezone
 
+from wharttest_django.scheduling import ScheduledTask
+
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, name='requirements.execute_requirement_review')
+def _review_fair_share(task, document_id, *args, user_id=None, **kwargs):
+    """需求评审的公平份额归属：发起用户与文档所属项目"""
+    from .models import RequirementDocument
+    project_id = RequirementDocument.objects.filter(id=document_id).values_list('project_id', flat=True).first()
+    return {'user': user_id, 'project': project_id}
+
+
+@shared_task(bind=True, name='requirements.execute_requirement_review', base=ScheduledTask,
+             workload='interactive', fair_share=_review_fair_share)
 def execute_requirement_review(self, document_id, analysis_options=None, review_type='comprehensive', user_id=None):
     """
     异步执行需求评审任务
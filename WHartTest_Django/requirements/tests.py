@@ -1,3 +1,122 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from projects.models import Project
+from wharttest_django.search import full_text_search, narrowing_terms, query_terms, rebuild_search_index, tokenize
+from .filters import RequirementDocumentFilter, ReviewIssueFilter
+from .models import RequirementDocument, ReviewIssue, ReviewReport
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='password')
+        self.project = Project.objects.create(name='Search Project', creator=self.user)
+        self.login = self._document('登录模块', '用户登录需要支持短信验证码和 OAuth 登录，登录失败五次锁定账号。')
+        self.order = self._document('订单模块', '订单支付完成后发送通知，用户可在订单列表查看登录设备。')
+        self.report = self._document('报表', 'Export monthly reports as Excel files.')
+
+    def _document(self, title, content):
+        return RequirementDocument.objects.create(
+            project=self.project, title=title, content=content, document_type='txt', uploader=self.user
+        )
+
+    def _search(self, query):
+        return list(full_text_search(RequirementDocument.objects.all(), query))
+
+    def test_tokenize_splits_cjk_into_bigrams(self):
+        self.assertEqual(tokenize('用户登录 OAuth2 验'), ['用户', '户登', '登录', 'oauth2', '验'])
+        self.assertEqual(query_terms('登录 登录 oau'), [('登录', False), ('oau', True)])
+
+    def test_ranked_results(self):
+        results = self._search('登录')
+        self.assertEqual(results, [self.login, self.order])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+        self.assertEqual(self._search('短信验证码'), [self.login])
+        self.assertEqual(self._search('excel'), [self.report])
+        self.assertEqual(self._search('expo'), [self.report])
+        self.assertEqual(self._search('不存在的内容'), [])
+
+    def test_index_maintained_on_save_and_delete(self):
+        self.report.content = '导出月度报表'
+        self.report.save()
+        self.assertEqual(self._search('月度'), [self.report])
+        self.assertEqual(self._search('excel'), [])
+
+        # 只更新非检索字段时不重建词元
+        self.report.status = 'processing'
+        self.report.save(update_fields=['status'])
+        self.assertEqual(self._search('月度'), [self.report])
+
+        self.report.delete()
+        self.assertEqual(self._search('月度'), [])
+
+    def test_rebuild_index(self):
+        RequirementDocument.objects.update(search_tokens='')
+        rebuild_search_index(RequirementDocument, RequirementDocument.SEARCH_FIELDS)
+        self.assertEqual(self._search('验证码'), [self.login])
+
+    def test_punctuation_falls_back_to_icontains(self):
+        self.assertCountEqual(self._search('，'), [self.login, self.order])
+
+    def test_content_filter_uses_full_text_search(self):
+        queryset = RequirementDocumentFilter({'content': '订单支付'}, queryset=RequirementDocument.objects.all()).qs
+        self.assertEqual(list(queryset), [self.order])
+
+    def test_content_filter_keeps_icontains_semantics(self):
+        # 第一个片段可能从词中间开始，不参与预筛选
+        self.assertEqual(narrowing_terms('port monthly reports'), [('monthly', True), ('reports', True)])
+        self.assertEqual(narrowing_terms('订单支付'), [('订单', False), ('单支', False), ('支付', False)])
+
+        def filtered(**params):
+            return list(RequirementDocumentFilter(params, queryset=RequirementDocument.objects.all()).qs)
+
+        self.assertEqual(filtered(content='xport month'), [self.report])
+        self.assertEqual(filtered(content='单支付完'), [self.order])
+        # 只匹配该字段：标题里的“登录”不算
+        self.assertEqual(filtered(content='登录模块'), [])
+
+    def test_review_issue_filter_matches_its_own_field(self):
+        report = ReviewReport.objects.create(document=self.login)
+        issue = ReviewIssue.objects.create(
+            report=report, issue_type='clarity', priority='low',
+            title='alpha', description='alpha bar', suggestion='foo only',
+        )
+
+        def filtered(**params):
+            return list(ReviewIssueFilter(params, queryset=ReviewIssue.objects.all()).qs)
+
+        self.assertEqual(filtered(suggestion='bar'), [])
+        self.assertEqual(filtered(suggestion='foo'), [issue])
+        self.assertEqual(filtered(description='lph'), [issue])
+        self.assertEqual(filtered(description='pha bar'), [issue])
+        self.assertEqual(filtered(description='pha foo'), [])
+
+    @override_settings(FULL_TEXT_SEARCH_MAX_TOKENS=50)
+    def test_filter_finds_matches_past_the_token_cap(self):
+        """词元被截断的记录不做索引预筛选，匹配位置超出上限时仍与 icontains 一致"""
+        long_document = self._document('长文档', '需' * 60 + '订单支付完成')
+        self.assertTrue(long_document.search_truncated)
+        self.assertFalse(self.order.search_truncated)
+
+        queryset = RequirementDocumentFilter({'content': '订单支付完成'}, queryset=RequirementDocument.objects.all()).qs
+        self.assertCountEqual(list(queryset), [self.order, long_document])
+        self.assertEqual(
+            set(queryset), set(RequirementDocument.objects.filter(content__icontains='订单支付完成'))
+        )
+
+        # 重建索引同样标记截断
+        RequirementDocument.objects.update(search_truncated=False)
+        rebuild_search_index(RequirementDocument, RequirementDocument.SEARCH_FIELDS, only_full=True)
+        long_document.refresh_from_db()
+        self.assertTrue(long_document.search_truncated)
+
+    @override_settings(FULL_TEXT_SEARCH_MAX_RESULTS=1)
+    def test_search_limit_applies_within_scoped_queryset(self):
+        """结果数上限在项目范围内计算，其他项目相关度更高的结果不会占满名额"""
+        other_project = Project.objects.create(name='Other Project', creator=self.user)
+        RequirementDocument.objects.create(
+            project=other_project, title='登录 登录', content='登录 登录 登录 登录', document_type='txt', uploader=self.user
+        )
+        scoped = RequirementDocument.objects.filter(project=self.project)
+        self.assertEqual(list(full_text_search(scoped, '登录')), [self.login])
@@ -8,6 +8,7 @@ import logging
 import os
 
 from wharttest_django.viewsets import BaseModelViewSet
+from wharttest_django.search import FullTextSearchFilter, RankedOrderingFilter
 from prompts.models import UserPrompt
 from .models import (
     RequirementDocument, RequirementModule, ReviewReport,
@@ -37,7 +38,7 @@ class RequirementDocumentViewSet(BaseModelViewSet):
     """需求文档视图集"""
     queryset = RequirementDocument.objects.all()
     serializer_class = RequirementDocumentSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_class = RequirementDocumentFilter
     search_fields = ['title', 'description', 'content']
     ordering_fields = ['uploaded_at', 'updated_at', 'title', 'word_count', 'page_count']
@@ -638,7 +639,7 @@ class RequirementModuleViewSet(BaseModelViewSet):
     """需求模块视图集"""
     queryset = RequirementModule.objects.all()
     serializer_class = RequirementModuleSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_class = RequirementModuleFilter
     search_fields = ['title', 'content']
     ordering_fields = ['order', 'created_at', 'updated_at']
@@ -696,7 +697,7 @@ class ReviewIssueViewSet(BaseModelViewSet):
     """评审问题视图集"""
     queryset = ReviewIssue.objects.all()
     serializer_class = ReviewIssueSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, RankedOrderingFilter]
     filterset_class = ReviewIssueFilter
     search_fields = ['title', 'description', 'suggestion']
     ordering_fields = ['priority', 'created_at', 'page_number']
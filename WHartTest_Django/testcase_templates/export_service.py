@@ -1,14 +1,21 @@
 """
 用例导出服务 - 支持模版化导出
+
+大批量导出时按块读取用例（每块一次用例查询 + 一次步骤查询），模块路径一次性加载；
+默认格式使用 openpyxl 只写模式逐行写入文件，内存占用不随用例数量增长。
 """
 import io
 import posixpath
 import re
 import zipfile
 import xml.etree.ElementTree as ET
+from django.db.models import Prefetch
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
 
+from testcases.models import TestCaseModule, TestCaseStep
+
 
 class TestCaseExportService:
     """测试用例导出服务"""
@@ -24,12 +31,19 @@ class TestCaseExportService:
         'expected_results': '预期结果',
     }
 
+    # 按块读取用例的块大小（每块额外一次步骤查询）
+    CHUNK_SIZE = 2000
+
+    # 用例在 Excel 中的固定字段顺序
+    FIELD_ORDER = ['name', 'module', 'precondition', 'steps', 'expected_results', 'level', 'notes']
+
     def __init__(self, template=None):
         """
         初始化导出服务
         :param template: ImportExportTemplate 实例，为 None 时使用默认格式
         """
         self.template = template
+        self._module_path_cache = {}
 
     def export(self, queryset, project_name: str) -> tuple:
         """
@@ -38,57 +52,100 @@ class TestCaseExportService:
         :param project_name: 项目名称（用于文件名）
         :return: (bytes, filename)
         """
+        output = io.BytesIO()
+        filename = self.export_to_file(queryset, project_name, output)
+        return output.getvalue(), filename
+
+    def export_to_file(self, queryset, project_name: str, output) -> str:
+        """
+        导出用例到可写的二进制文件对象（临时文件/响应流），避免整个工作簿驻留内存
+        :return: 建议的下载文件名
+        """
         # 获取字段映射（模版或默认）
         field_mappings = self._get_field_mappings()
         value_transformations = self._get_value_transformations()
 
         using_template_file = bool(self.template and getattr(self.template, 'template_file', None) and self.template.template_file)
         if using_template_file:
-            excel_bytes = self._export_using_template_file_bytes(queryset, field_mappings, value_transformations)
+            output.write(self._export_using_template_file_bytes(queryset, field_mappings, value_transformations))
         else:
-            excel_bytes = self._export_default_bytes(queryset, field_mappings, value_transformations)
+            self._export_default(queryset, output, field_mappings, value_transformations)
+
+        return f"{project_name}_测试用例.xlsx"
 
-        filename = f"{project_name}_测试用例.xlsx"
-        return excel_bytes, filename
+    def _iter_testcases(self, queryset):
+        """
+        按块迭代用例：去掉列表接口附带的关联加载，只取导出字段，步骤按块批量预取并按步骤号排序
+        """
+        self._load_module_paths(queryset)
+        steps = TestCaseStep.objects.order_by('step_number').only(
+            'id', 'test_case', 'step_number', 'description', 'expected_result'
+        )
+        queryset = (
+            queryset.select_related(None)
+            .prefetch_related(None)
+            .only('id', 'project_id', 'module_id', 'name', 'precondition', 'level', 'notes')
+            .prefetch_related(Prefetch('steps', queryset=steps))
+        )
+        return queryset.iterator(chunk_size=self.CHUNK_SIZE)
 
-    def _export_default_bytes(self, queryset, field_mappings: dict, value_transformations: dict) -> bytes:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = self.template.sheet_name if self.template and self.template.sheet_name else "测试用例"
+    def _load_module_paths(self, queryset):
+        """一次查询加载用例所在项目的全部模块，按物化路径拼出模块完整路径"""
+        delimiter = self.template.module_path_delimiter if self.template else '/'
+        modules = TestCaseModule.objects.filter(
+            project_id__in=queryset.order_by().values('project_id')
+        ).values_list('id', 'name', 'path')
+        names = {}
+        paths = {}
+        for module_id, name, path in modules:
+            names[module_id] = name
+            paths[module_id] = [int(part) for part in path.strip('/').split('/') if part] or [module_id]
+        for module_id, ids in paths.items():
+            self._module_path_cache[module_id] = delimiter + delimiter.join(
+                names[i] for i in ids if i in names
+            )
+
+    def _export_default(self, queryset, output, field_mappings: dict, value_transformations: dict) -> None:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(self.template.sheet_name if self.template and self.template.sheet_name else "测试用例")
 
         # 构建表头
         headers = self._get_headers(field_mappings)
-        header_row = self.template.header_row if self.template else 1
         header_to_col = {}
         for col, header in enumerate(headers, 1):
-            cell_value = header if header is not None else ''
-            cell = ws.cell(row=header_row, column=col, value=cell_value)
+            if header:
+                header_to_col[str(header).strip()] = col
+
+        # 调整列宽（只写模式下需在写入行之前设置）
+        for col in range(1, len(headers) + 1):
+            col_letter = self._get_column_letter(col)
+            ws.column_dimensions[col_letter].width = 20
+
+        # 只写模式只能顺序追加行，表头/数据起始行之前用空行占位
+        header_row = self.template.header_row if self.template else 1
+        data_start_row = self.template.data_start_row if self.template else 2
+        for _ in range(header_row - 1):
+            ws.append([])
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header if header is not None else '')
             cell.font = Font(bold=True)
             cell.alignment = Alignment(horizontal='center')
-            if cell_value:
-                header_to_col[str(cell_value).strip()] = col
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for _ in range(data_start_row - header_row - 1):
+            ws.append([])
 
         # 写入数据
-        data_start_row = self.template.data_start_row if self.template else 2
-        for row_idx, testcase in enumerate(queryset, data_start_row):
-            self._write_testcase_row(
-                ws,
-                row_idx,
+        for testcase in self._iter_testcases(queryset):
+            ws.append(self._build_row_values(
                 testcase,
                 field_mappings,
                 value_transformations,
                 header_to_col=header_to_col if header_to_col else None
-            )
+            ))
 
-        # 调整列宽
-        for col in range(1, len(headers) + 1):
-            col_letter = self._get_column_letter(col)
-            ws.column_dimensions[col_letter].width = 20
-
-        output = io.BytesIO()
         wb.save(output)
-        output.seek(0)
-        return output.getvalue()
 
     def _export_using_template_file_bytes(self, queryset, field_mappings: dict, value_transformations: dict) -> bytes:
         """
@@ -123,9 +180,9 @@ class TestCaseExportService:
 
         # 写入数据（按表头列定位写入；未映射的列保持模板原样）
         row_idx = data_start_row
-        for testcase in queryset:
+        for testcase in self._iter_testcases(queryset):
             values_by_header = {}
-            for field in ['name', 'module', 'precondition', 'steps', 'expected_results', 'level', 'notes']:
+            for field in self.FIELD_ORDER:
                 if field not in field_mappings:
                     continue
                 header_name = field_mappings.get(field)
@@ -190,23 +247,21 @@ class TestCaseExportService:
     def _build_headers_by_field_order(self, field_mappings: dict) -> list:
         """构建表头列表"""
         # 按照固定顺序构建表头
-        field_order = ['name', 'module', 'precondition', 'steps', 'expected_results', 'level', 'notes']
         headers = []
-        for field in field_order:
+        for field in self.FIELD_ORDER:
             if field in field_mappings:
                 headers.append(field_mappings[field])
         return headers
 
-    def _write_testcase_row(self, ws, row: int, testcase, field_mappings: dict, value_transformations: dict, header_to_col: dict | None = None):
-        """写入单个用例行"""
-        field_order = ['name', 'module', 'precondition', 'steps', 'expected_results', 'level', 'notes']
+    def _build_row_values(self, testcase, field_mappings: dict, value_transformations: dict, header_to_col: dict | None = None) -> list:
+        """构建单个用例行的单元格值列表"""
+        values_by_col = {}
         col = 1
 
-        for field in field_order:
+        for field in self.FIELD_ORDER:
             if field not in field_mappings:
                 continue
 
-            value = self._get_field_value(testcase, field, value_transformations)
             if header_to_col is not None:
                 header_name = field_mappings.get(field)
                 if not header_name:
@@ -214,18 +269,23 @@ class TestCaseExportService:
                 col = header_to_col.get(str(header_name).strip())
                 if not col:
                     continue
-                ws.cell(row=row, column=col, value=value)
+                values_by_col[col] = self._get_field_value(testcase, field, value_transformations)
             else:
                 # 兼容旧逻辑：按字段顺序顺次写入
-                ws.cell(row=row, column=col, value=value)
+                values_by_col[col] = self._get_field_value(testcase, field, value_transformations)
                 col += 1
 
+        row = [None] * max(values_by_col, default=0)
+        for col, value in values_by_col.items():
+            row[col - 1] = value
+        return row
+
     def _get_field_value(self, testcase, field: str, value_transformations: dict) -> str:
         """获取字段值"""
         if field == 'name':
             return testcase.name
         elif field == 'module':
-            return self._get_module_path(testcase.module)
+            return self._get_module_path(testcase.module_id)
         elif field == 'precondition':
             return testcase.precondition or ''
         elif field == 'level':
@@ -242,31 +302,30 @@ class TestCaseExportService:
             return self._format_expected_results(testcase.steps.all())
         return ''
 
-    def _get_module_path(self, module) -> str:
-        """获取模块完整路径"""
-        if not module:
+    def _get_module_path(self, module_id) -> str:
+        """获取模块完整路径（路径已由 _load_module_paths 批量加载）"""
+        if not module_id:
             return ''
 
-        delimiter = self.template.module_path_delimiter if self.template else '/'
-        path_parts = []
-        current = module
-        while current:
-            path_parts.insert(0, current.name)
-            current = current.parent
-
-        return delimiter + delimiter.join(path_parts)
+        if module_id not in self._module_path_cache:
+            module = TestCaseModule.objects.filter(pk=module_id).first()
+            if not module:
+                return ''
+            delimiter = self.template.module_path_delimiter if self.template else '/'
+            self._module_path_cache[module_id] = delimiter + delimiter.join(module.get_path_names())
+        return self._module_path_cache[module_id]
 
     def _format_steps_desc(self, steps) -> str:
-        """格式化步骤描述"""
+        """格式化步骤描述（步骤已按步骤号预取，这里在内存中排序，不再触发查询）"""
         step_list = []
-        for step in steps.order_by('step_number'):
+        for step in sorted(steps, key=lambda s: s.step_number):
             step_list.append(f"[{step.step_number}]{step.description}")
         return '\n'.join(step_list)
 
     def _format_expected_results(self, steps) -> str:
         """格式化预期结果"""
         result_list = []
-        for step in steps.order_by('step_number'):
+        for step in sorted(steps, key=lambda s: s.step_number):
             result_list.append(f"[{step.step_number}]{step.expected_result}")
         return '\n'.join(result_list)
 
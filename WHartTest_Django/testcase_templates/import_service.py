@@ -1,7 +1,9 @@
 """
 用例导入服务
 
-根据导入模版配置，解析 Excel 文件并创建测试用例
+根据导入模版配置，解析 Excel 文件并创建测试用例：
+先解析全部行并逐行校验，再一次性解析/创建模块路径，最后在事务内批量写入用例和步骤。
+试运行模式只统计将要创建的用例和模块，不写入数据库。
 """
 import re
 import io
@@ -13,6 +15,7 @@ from django.db import transaction
 
 from testcases.models import TestCase, TestCaseStep, TestCaseModule
 from projects.models import Project
+from projects.statistics import record_created
 from .models import ImportExportTemplate
 
 logger = logging.getLogger(__name__)
@@ -29,18 +32,24 @@ class ImportResult:
     duplicate_names: List[Dict[str, Any]] = field(default_factory=list)
     errors: List[Dict[str, Any]] = field(default_factory=list)
     created_testcases: List[int] = field(default_factory=list)
+    dry_run: bool = False
+    modules_to_create: List[str] = field(default_factory=list)
 
 
 class TestCaseImportService:
     """测试用例导入服务"""
 
-    def __init__(self, template: ImportExportTemplate, project: Project, user):
+    # 每批 bulk_create 的行数
+    BATCH_SIZE = 500
+    MAX_MODULE_LEVEL = 5
+
+    def __init__(self, template: ImportExportTemplate, project: Project, user, dry_run: bool = False):
         self.template = template
         self.project = project
         self.user = user
-        self.result = ImportResult()
-        self._module_cache: Dict[str, TestCaseModule] = {}
-        self._existing_names: Dict[str, List[int]] = {}  # {(module_id, name): [testcase_ids]}
+        self.dry_run = dry_run
+        self.result = ImportResult(dry_run=dry_run)
+        self._existing_names: Dict[Tuple[Any, str], List[int]] = {}  # {(module_id, name): [testcase_ids]}
 
     def import_from_file(self, file) -> ImportResult:
         """从文件导入用例"""
@@ -71,6 +80,9 @@ class TestCaseImportService:
 
             workbook.close()
 
+            # 解析错误与校验错误分阶段产生，按行号排序后返回
+            self.result.errors.sort(key=lambda e: e.get('row', 0))
+
         except Exception as e:
             logger.exception("导入用例时发生错误")
             self.result.success = False
@@ -88,7 +100,7 @@ class TestCaseImportService:
 
     def _load_existing_names(self):
         """预加载项目中现有的用例名称"""
-        existing = TestCase.objects.filter(project=self.project).values('id', 'name', 'module_id')
+        existing = TestCase.objects.filter(project=self.project).order_by().values('id', 'name', 'module_id')
         for tc in existing:
             key = (tc['module_id'], tc['name'])
             if key not in self._existing_names:
@@ -116,48 +128,63 @@ class TestCaseImportService:
         # 应用值转换
         return self.template.transform_value(field_name, raw_value)
 
-    def _get_or_create_module(self, module_path: str) -> Optional[TestCaseModule]:
-        """根据模块路径获取或创建模块"""
-        if not module_path:
-            return None
-
-        # 检查缓存
-        if module_path in self._module_cache:
-            return self._module_cache[module_path]
-
-        # 解析路径
+    def _split_module_path(self, module_path: str) -> Tuple[str, ...]:
+        """按模版分隔符拆分模块路径"""
         delimiter = self.template.module_path_delimiter
-        parts = [p.strip() for p in module_path.split(delimiter) if p.strip()]
-
-        if not parts:
-            return None
+        return tuple(p.strip() for p in (module_path or '').split(delimiter) if p.strip())
 
-        parent = None
-        current_path = ''
-
-        for level, name in enumerate(parts, start=1):
-            current_path = f"{current_path}{delimiter}{name}" if current_path else name
+    def _resolve_modules(self, module_paths) -> Dict[Tuple[str, ...], Optional[int]]:
+        """
+        一次性解析所有模块路径：加载项目现有模块，缺失的模块按层级批量创建
 
-            # 先检查缓存
-            if current_path in self._module_cache:
-                parent = self._module_cache[current_path]
-                continue
+        Returns:
+            {路径分段元组: 模块ID}；试运行时待创建的模块映射为 None
+        """
+        existing = {}
+        for module_id, parent_id, name, path in TestCaseModule.objects.filter(
+            project=self.project
+        ).order_by().values_list('id', 'parent_id', 'name', 'path'):
+            existing[(parent_id, name)] = (module_id, path)
+
+        pending = object()  # 试运行时待创建的模块（其子模块同样不可能已存在）
+        resolved: Dict[Tuple[str, ...], Any] = {}
+        paths_by_id: Dict[int, str] = {}
+        prefixes = {parts[:depth] for parts in module_paths for depth in range(1, len(parts) + 1)}
+
+        # 按层级推进，同一层缺失的模块一次批量创建
+        for depth in range(1, max((len(p) for p in prefixes), default=0) + 1):
+            to_create = []
+            for prefix in sorted(p for p in prefixes if len(p) == depth):
+                parent_id = resolved[prefix[:-1]] if depth > 1 else None
+                match = existing.get((parent_id, prefix[-1])) if parent_id is not pending else None
+                if match:
+                    module_id, path = match
+                    resolved[prefix] = module_id
+                    paths_by_id[module_id] = path
+                    continue
 
-            # 查找或创建模块
-            module, created = TestCaseModule.objects.get_or_create(
-                project=self.project,
-                parent=parent,
-                name=name,
-                defaults={
-                    'level': level,
-                    'creator': self.user,
-                }
-            )
+                self.result.modules_to_create.append(self.template.module_path_delimiter.join(prefix))
+                if self.dry_run:
+                    resolved[prefix] = pending
+                else:
+                    to_create.append((prefix, TestCaseModule(
+                        project=self.project,
+                        parent_id=parent_id,
+                        name=prefix[-1],
+                        level=depth,
+                        creator=self.user,
+                    )))
 
-            self._module_cache[current_path] = module
-            parent = module
+            if to_create:
+                modules = TestCaseModule.objects.bulk_create([m for _, m in to_create], batch_size=self.BATCH_SIZE)
+                # bulk_create 不经过 save()，这里补齐物化路径
+                for (prefix, _), module in zip(to_create, modules):
+                    module.path = f"{paths_by_id.get(module.parent_id, '/')}{module.pk}/"
+                    paths_by_id[module.pk] = module.path
+                    resolved[prefix] = module.pk
+                TestCaseModule.objects.bulk_update(modules, ['path'], batch_size=self.BATCH_SIZE)
 
-        return parent
+        return {parts: (None if module_id is pending else module_id) for parts, module_id in resolved.items()}
 
     def _parse_steps_single_cell(self, steps_text: str, expected_text: str) -> List[Dict[str, str]]:
         """
@@ -224,6 +251,7 @@ class TestCaseImportService:
         step_column = step_config.get('step_column') or self.template.field_mappings.get('steps', '')
         expected_column = step_config.get('expected_column') or self.template.field_mappings.get('expected_results', '')
 
+        cases = []
         for row_idx, row in enumerate(
             worksheet.iter_rows(min_row=self.template.data_start_row),
             start=self.template.data_start_row
@@ -238,77 +266,30 @@ class TestCaseImportService:
                     self.result.skipped_count += 1
                     continue
 
-                # 获取模块
-                module_path = self._get_field_value(row, headers, 'module')
-                module = self._get_or_create_module(module_path)
-
-                if not module:
-                    self.result.errors.append({
-                        'row': row_idx,
-                        'error': f'无法解析模块路径: {module_path}',
-                        'name': name,
-                    })
-                    self.result.error_count += 1
-                    continue
-
-                # 检查重复
-                key = (module.id, name)
-                if key in self._existing_names:
-                    self.result.duplicate_names.append({
-                        'row': row_idx,
-                        'name': name,
-                        'module': module_path,
-                        'existing_ids': self._existing_names[key],
-                    })
-
-                # 获取其他字段
-                level = self._get_field_value(row, headers, 'level') or 'P2'
-                precondition = self._get_field_value(row, headers, 'precondition')
-                notes = self._get_field_value(row, headers, 'notes')
-
                 # 获取步骤
                 steps_text = self._get_cell_value(row, headers, step_column)
                 expected_text = self._get_cell_value(row, headers, expected_column)
-                steps = self._parse_steps_single_cell(steps_text, expected_text)
-
-                # 创建用例
-                with transaction.atomic():
-                    testcase = TestCase.objects.create(
-                        project=self.project,
-                        module=module,
-                        name=name,
-                        level=level,
-                        precondition=precondition,
-                        notes=notes,
-                        creator=self.user,
-                    )
-
-                    # 创建步骤
-                    for step_data in steps:
-                        TestCaseStep.objects.create(
-                            test_case=testcase,
-                            step_number=step_data['step_number'],
-                            description=step_data['description'],
-                            expected_result=step_data['expected_result'],
-                            creator=self.user,
-                        )
 
-                    self.result.imported_count += 1
-                    self.result.created_testcases.append(testcase.id)
-
-                    # 更新现有名称缓存
-                    if key not in self._existing_names:
-                        self._existing_names[key] = []
-                    self._existing_names[key].append(testcase.id)
+                cases.append({
+                    'row': row_idx,
+                    'name': name,
+                    'module_path': self._get_field_value(row, headers, 'module'),
+                    'level': self._get_field_value(row, headers, 'level') or 'P2',
+                    'precondition': self._get_field_value(row, headers, 'precondition'),
+                    'notes': self._get_field_value(row, headers, 'notes'),
+                    'steps': self._parse_steps_single_cell(steps_text, expected_text),
+                })
 
             except Exception as e:
-                logger.exception(f"导入第 {row_idx} 行时发生错误")
+                logger.exception(f"解析第 {row_idx} 行时发生错误")
                 self.result.errors.append({
                     'row': row_idx,
                     'error': str(e),
                 })
                 self.result.error_count += 1
 
+        self._save_cases(cases)
+
     def _import_multi_row_mode(self, worksheet, headers: Dict[str, int]):
         """多行步骤模式导入"""
         step_config = self.template.step_config or {}
@@ -360,61 +341,147 @@ class TestCaseImportService:
         if current_case:
             cases_to_create.append(current_case)
 
-        # 批量创建用例
-        for case_data in cases_to_create:
-            try:
-                module = self._get_or_create_module(case_data['module_path'])
-                if not module:
-                    self.result.errors.append({
-                        'row': case_data['row'],
-                        'error': f'无法解析模块路径: {case_data["module_path"]}',
-                        'name': case_data['name'],
-                    })
-                    self.result.error_count += 1
-                    continue
-
-                # 检查重复
-                key = (module.id, case_data['name'])
-                if key in self._existing_names:
-                    self.result.duplicate_names.append({
-                        'row': case_data['row'],
-                        'name': case_data['name'],
-                        'module': case_data['module_path'],
-                        'existing_ids': self._existing_names[key],
-                    })
-
-                with transaction.atomic():
-                    testcase = TestCase.objects.create(
-                        project=self.project,
-                        module=module,
-                        name=case_data['name'],
-                        level=case_data['level'],
-                        precondition=case_data['precondition'],
-                        notes=case_data['notes'],
-                        creator=self.user,
-                    )
-
-                    for step_data in case_data['steps']:
-                        TestCaseStep.objects.create(
-                            test_case=testcase,
-                            step_number=step_data['step_number'],
-                            description=step_data['description'],
-                            expected_result=step_data['expected_result'],
-                            creator=self.user,
-                        )
-
-                    self.result.imported_count += 1
-                    self.result.created_testcases.append(testcase.id)
-
-                    if key not in self._existing_names:
-                        self._existing_names[key] = []
-                    self._existing_names[key].append(testcase.id)
+        self._save_cases(cases_to_create)
+
+    def _validate_case(self, case_data: Dict[str, Any], module_parts: Tuple[str, ...]) -> Optional[str]:
+        """逐行校验（批量写入前完成，避免单行错误导致整批失败）"""
+        if not module_parts:
+            return f'无法解析模块路径: {case_data["module_path"]}'
+        if len(module_parts) > self.MAX_MODULE_LEVEL:
+            return f'模块级别不能超过{self.MAX_MODULE_LEVEL}级: {case_data["module_path"]}'
+        name_max_length = TestCase._meta.get_field('name').max_length
+        if len(case_data['name']) > name_max_length:
+            return f'用例名称长度不能超过{name_max_length}个字符'
+        level_max_length = TestCase._meta.get_field('level').max_length
+        if len(case_data['level']) > level_max_length:
+            return f'用例等级无效: {case_data["level"]}'
+        return None
+
+    def _save_cases(self, cases: List[Dict[str, Any]]):
+        """
+        批量保存解析后的用例
 
-            except Exception as e:
-                logger.exception(f"导入用例 {case_data['name']} 时发生错误")
+        1. 逐行校验，错误按行记录到 ImportResult
+        2. 一次性解析/创建所有模块路径
+        3. 在同一事务内按批 bulk_create 用例和步骤；试运行时只统计不写入
+        """
+        valid_cases = []
+        for case_data in cases:
+            parts = self._split_module_path(case_data['module_path'])
+            error = self._validate_case(case_data, parts)
+            if error:
                 self.result.errors.append({
                     'row': case_data['row'],
-                    'error': str(e),
+                    'error': error,
                     'name': case_data['name'],
                 })
                 self.result.error_count += 1
+                continue
+            valid_cases.append((case_data, parts))
+
+        if not valid_cases:
+            return
+
+        with transaction.atomic():
+            module_ids = self._resolve_modules({parts for _, parts in valid_cases})
+
+            # 检查重复（与现有用例及本次导入中更早的行比较）
+            pending_names: Dict[Tuple[Any, str], List[TestCase]] = {}
+            duplicates = []
+            to_create = []
+            for case_data, parts in valid_cases:
+                module_id = module_ids[parts]
+                # 试运行时待创建模块没有ID，以路径区分
+                key = (module_id if module_id is not None else parts, case_data['name'])
+                if key in self._existing_names or key in pending_names:
+                    entry = {
+                        'row': case_data['row'],
+                        'name': case_data['name'],
+                        'module': case_data['module_path'],
+                        'existing_ids': list(self._existing_names.get(key, [])),
+                    }
+                    self.result.duplicate_names.append(entry)
+                    duplicates.append((entry, list(pending_names.get(key, []))))
+
+                testcase = TestCase(
+                    project=self.project,
+                    module_id=module_id,
+                    name=case_data['name'],
+                    level=case_data['level'],
+                    precondition=case_data['precondition'],
+                    notes=case_data['notes'],
+                    creator=self.user,
+                )
+                pending_names.setdefault(key, []).append(testcase)
+                to_create.append((case_data, testcase))
+
+            if self.dry_run:
+                self.result.imported_count += len(to_create)
+                return
+
+            for start in range(0, len(to_create), self.BATCH_SIZE):
+                self._create_batch(to_create[start:start + self.BATCH_SIZE])
+
+            # 本次导入中更早创建的同名用例，在创建完成后补充ID
+            for entry, earlier in duplicates:
+                entry['existing_ids'].extend(tc.id for tc in earlier if tc.id)
+
+    def _create_batch(self, batch: List[Tuple[Dict[str, Any], TestCase]]):
+        """批量创建一批用例及其步骤；整批失败时退回逐行创建以定位出错的行"""
+        try:
+            with transaction.atomic():
+                testcases = TestCase.objects.bulk_create([tc for _, tc in batch])
+                TestCaseStep.objects.bulk_create([
+                    TestCaseStep(
+                        test_case=testcase,
+                        step_number=step_data['step_number'],
+                        description=step_data['description'],
+                        expected_result=step_data['expected_result'],
+                        creator=self.user,
+                    )
+                    for (case_data, _), testcase in zip(batch, testcases)
+                    for step_data in case_data['steps']
+                ], batch_size=self.BATCH_SIZE)
+        except Exception:
+            logger.exception("批量创建用例失败，改为逐行创建")
+            for case_data, testcase in batch:
+                testcase.pk = None
+                self._create_one(case_data, testcase)
+            return
+
+        # bulk_create 不触发信号，手动计入项目统计（逐行创建时由 save 信号处理）
+        record_created(testcases)
+        self._record_created(batch)
+
+    def _create_one(self, case_data: Dict[str, Any], testcase: TestCase):
+        try:
+            with transaction.atomic():
+                testcase.save(force_insert=True)
+                TestCaseStep.objects.bulk_create([
+                    TestCaseStep(
+                        test_case=testcase,
+                        step_number=step_data['step_number'],
+                        description=step_data['description'],
+                        expected_result=step_data['expected_result'],
+                        creator=self.user,
+                    )
+                    for step_data in case_data['steps']
+                ])
+        except Exception as e:
+            logger.exception(f"导入用例 {case_data['name']} 时发生错误")
+            testcase.pk = None
+            self.result.errors.append({
+                'row': case_data['row'],
+                'error': str(e),
+                'name': case_data['name'],
+            })
+            self.result.error_count += 1
+            return
+
+        self._record_created([(case_data, testcase)])
+
+    def _record_created(self, batch: List[Tuple[Dict[str, Any], TestCase]]):
+        for _, testcase in batch:
+            self.result.imported_count += 1
+            self.result.created_testcases.append(testcase.id)
+            self._existing_names.setdefault((testcase.module_id, testcase.name), []).append(testcase.id)
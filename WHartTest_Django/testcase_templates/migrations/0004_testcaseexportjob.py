@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 10:01
+
+import django.db.models.deletion
+import testcase_templates.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_remove_project_password_remove_project_system_url_and_more'),
+        ('testcase_templates', '0003_importexporttemplate_template_file'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestCaseExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('testcase_ids', models.JSONField(blank=True, help_text='为空时导出项目下全部用例', null=True, verbose_name='导出用例ID')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '导出中'), ('completed', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('file', models.FileField(blank=True, null=True, upload_to=testcase_templates.models.testcase_export_upload_path, verbose_name='导出文件')),
+                ('filename', models.CharField(blank=True, default='', max_length=255, verbose_name='下载文件名')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='用例数量')),
+                ('error_message', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('celery_task_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='Celery任务ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='testcase_export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='创建人')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='testcase_export_jobs', to='projects.project', verbose_name='所属项目')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to='testcase_templates.importexporttemplate', verbose_name='导出模板')),
+            ],
+            options={
+                'verbose_name': '用例导出任务',
+                'verbose_name_plural': '用例导出任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -144,3 +144,65 @@ class ImportExportTemplate(models.Model):
             mapping = self.value_transformations[field_name]
             return mapping.get(value, value)
         return value
+
+
+def testcase_export_upload_path(instance, filename):
+    return os.path.join('testcase_exports', str(instance.project_id), filename)
+
+
+class TestCaseExportJob(models.Model):
+    """
+    后台用例导出任务
+    大批量导出由 Celery 任务生成 Excel 文件，前端轮询状态后下载
+    """
+    STATUS_CHOICES = [
+        ('pending', _('等待中')),
+        ('running', _('导出中')),
+        ('completed', _('已完成')),
+        ('failed', _('失败')),
+    ]
+
+    project = models.ForeignKey(
+        'projects.Project',
+        on_delete=models.CASCADE,
+        related_name='testcase_export_jobs',
+        verbose_name=_('所属项目')
+    )
+    template = models.ForeignKey(
+        ImportExportTemplate,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='export_jobs',
+        verbose_name=_('导出模板')
+    )
+    testcase_ids = models.JSONField(
+        _('导出用例ID'),
+        null=True,
+        blank=True,
+        help_text=_('为空时导出项目下全部用例')
+    )
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(_('导出文件'), upload_to=testcase_export_upload_path, blank=True, null=True)
+    filename = models.CharField(_('下载文件名'), max_length=255, blank=True, default='')
+    total_count = models.PositiveIntegerField(_('用例数量'), default=0)
+    error_message = models.TextField(_('错误信息'), blank=True, null=True)
+    celery_task_id = models.CharField(_('Celery任务ID'), max_length=255, blank=True, null=True)
+    creator = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='testcase_export_jobs',
+        verbose_name=_('创建人')
+    )
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    completed_at = models.DateTimeField(_('完成时间'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('用例导出任务')
+        verbose_name_plural = _('用例导出任务')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.project_id} - {self.get_status_display()} ({self.created_at})"
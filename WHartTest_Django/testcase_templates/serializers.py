@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import ImportExportTemplate
+from .models import ImportExportTemplate, TestCaseExportJob
 
 
 class ImportExportTemplateSerializer(serializers.ModelSerializer):
@@ -63,6 +63,27 @@ class ImportExportTemplateListSerializer(serializers.ModelSerializer):
         ]
 
 
+class TestCaseExportJobSerializer(serializers.ModelSerializer):
+    """后台导出任务序列化器"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = TestCaseExportJob
+        fields = [
+            'id',
+            'project',
+            'template',
+            'status',
+            'status_display',
+            'filename',
+            'total_count',
+            'error_message',
+            'created_at',
+            'completed_at',
+        ]
+        read_only_fields = fields
+
+
 class ParseHeadersRequestSerializer(serializers.Serializer):
     """解析 Excel 表头请求序列化器"""
     file = serializers.FileField(help_text='要解析的 Excel 文件')
@@ -0,0 +1,70 @@
+"""
+用例导出的 Celery 异步任务
+"""
+import logging
+import tempfile
+import uuid
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from testcases.models import TestCase
+from wharttest_django.scheduling import ScheduledTask
+from .export_service import TestCaseExportService
+from .models import TestCaseExportJob
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, name='testcase_templates.export_testcases', base=ScheduledTask, workload='interactive')
+def export_testcases(self, job_id):
+    """
+    在后台生成用例导出文件
+
+    Args:
+        job_id: TestCaseExportJob 实例的ID
+    """
+    try:
+        job = TestCaseExportJob.objects.select_related('project', 'template').get(id=job_id)
+    except TestCaseExportJob.DoesNotExist:
+        logger.error(f"导出任务不存在: {job_id}")
+        return
+
+    job.status = 'running'
+    job.celery_task_id = self.request.id
+    job.save(update_fields=['status', 'celery_task_id'])
+
+    queryset = TestCase.objects.filter(project=job.project)
+    if job.testcase_ids:
+        queryset = queryset.filter(id__in=job.testcase_ids)
+
+    try:
+        with tempfile.TemporaryFile() as output:
+            filename = TestCaseExportService(job.template).export_to_file(queryset, job.project.name, output)
+            output.seek(0)
+            job.filename = filename
+            job.total_count = queryset.count()
+            job.file.save(f"{uuid.uuid4().hex}.xlsx", File(output), save=False)
+        job.status = 'completed'
+    except Exception as e:
+        logger.exception(f"导出任务 {job_id} 失败")
+        job.status = 'failed'
+        job.error_message = str(e)
+    job.completed_at = timezone.now()
+    job.save()
+
+    _purge_expired_jobs()
+    return {'job_id': job.id, 'status': job.status, 'total_count': job.total_count}
+
+
+def _purge_expired_jobs():
+    """清理超过保留期的导出任务及其文件"""
+    retention_days = getattr(settings, 'TESTCASE_EXPORT_JOB_RETENTION_DAYS', 7)
+    expired = TestCaseExportJob.objects.filter(created_at__lt=timezone.now() - timedelta(days=retention_days))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
@@ -1,3 +1,150 @@
-from django.test import TestCase
+import io
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from openpyxl import Workbook, load_workbook
+
+from projects.models import Project
+from testcases.models import TestCase as TestCaseModel, TestCaseModule, TestCaseStep
+from .export_service import TestCaseExportService
+from .import_service import TestCaseImportService
+from .models import ImportExportTemplate, TestCaseExportJob
+from .tasks import export_testcases
+
+
+class TestCaseExportServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='password')
+        self.project = Project.objects.create(name='Export Project', creator=self.user)
+        root = TestCaseModule.objects.create(project=self.project, name='root', creator=self.user)
+        self.module = TestCaseModule.objects.create(project=self.project, name='child', parent=root, creator=self.user)
+
+    def _add_cases(self, count):
+        start = TestCaseModel.objects.count()
+        for i in range(start, start + count):
+            testcase = TestCaseModel.objects.create(
+                project=self.project, module=self.module, name=f'case-{i}', level='P1', creator=self.user
+            )
+            # 倒序创建，验证导出按步骤号排序
+            for number in (2, 1):
+                TestCaseStep.objects.create(
+                    test_case=testcase, step_number=number,
+                    description=f'do {number}', expected_result=f'see {number}', creator=self.user
+                )
+
+    def _export(self):
+        data, _ = TestCaseExportService().export(TestCaseModel.objects.filter(project=self.project), self.project.name)
+        return list(load_workbook(io.BytesIO(data)).active.iter_rows(values_only=True))
+
+    def test_export_rows(self):
+        self._add_cases(1)
+        rows = self._export()
+        self.assertEqual(rows[0][:3], ('用例名称', '所属模块', '前置条件'))
+        self.assertEqual(rows[1][:5], ('case-0', '/root/child', None, '[1]do 1\n[2]do 2', '[1]see 1\n[2]see 2'))
+
+    def test_query_count_independent_of_case_count(self):
+        self._add_cases(2)
+        with self.assertNumQueries(3):
+            self._export()
+        self._add_cases(20)
+        with self.assertNumQueries(3):
+            rows = self._export()
+        self.assertEqual(len(rows), 23)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_background_export_job(self):
+        self._add_cases(3)
+        job = TestCaseExportJob.objects.create(project=self.project, creator=self.user)
+        export_testcases.apply(args=[job.id])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed', job.error_message)
+        self.assertEqual(job.total_count, 3)
+        with job.file.open('rb') as f:
+            rows = list(load_workbook(f).active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+
+
+class TestCaseImportServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password')
+        self.project = Project.objects.create(name='Import Project', creator=self.user)
+        self.existing_root = TestCaseModule.objects.create(project=self.project, name='root', creator=self.user)
+        self.existing = TestCaseModel.objects.create(
+            project=self.project, module=self.existing_root, name='dup', creator=self.user
+        )
+        self.template = ImportExportTemplate.objects.create(
+            name='import',
+            template_type='import',
+            field_mappings={
+                'name': '用例名称', 'module': '所属模块', 'level': '用例等级',
+                'steps': '步骤描述', 'expected_results': '预期结果',
+            },
+        )
+
+    def _file(self, rows):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['用例名称', '所属模块', '用例等级', '步骤描述', '预期结果'])
+        for row in rows:
+            ws.append(row)
+        output = io.BytesIO()
+        wb.save(output)
+        return SimpleUploadedFile('cases.xlsx', output.getvalue())
+
+    def _rows(self):
+        return [
+            ['dup', 'root', 'P1', '[1]a[2]b', '[1]x[2]y'],
+            ['new-1', 'root/a/b', 'P0', '[1]a', '[1]x'],
+            [None, 'root', 'P1', '', ''],
+            ['new-2', '', 'P1', '', ''],
+            ['new-3', 'root/a/b', 'P2', '', ''],
+            ['new-3', 'root/a/b', 'P2', '', ''],
+            ['too-deep', '1/2/3/4/5/6', 'P2', '', ''],
+        ]
+
+    def test_bulk_import(self):
+        result = TestCaseImportService(self.template, self.project, self.user).import_from_file(self._file(self._rows()))
+
+        self.assertTrue(result.success)
+        self.assertEqual((result.total_rows, result.imported_count, result.skipped_count, result.error_count), (7, 4, 1, 2))
+        self.assertEqual([e['row'] for e in result.errors], [5, 8])
+        self.assertEqual(result.modules_to_create, ['root/a', 'root/a/b'])
+        self.assertEqual([d['row'] for d in result.duplicate_names], [2, 7])
+        self.assertEqual(result.duplicate_names[0]['existing_ids'], [self.existing.id])
+        self.assertEqual(len(result.duplicate_names[1]['existing_ids']), 1)
+
+        leaf = TestCaseModule.objects.get(project=self.project, name='b')
+        self.assertEqual(leaf.get_path_names(), ['root', 'a', 'b'])
+        self.assertEqual(leaf.level, 3)
+        testcase = TestCaseModel.objects.get(name='new-1')
+        self.assertEqual(testcase.module_id, leaf.id)
+        self.assertEqual(list(testcase.steps.values_list('step_number', 'description', 'expected_result')), [(1, 'a', 'x')])
+        self.assertEqual(TestCaseStep.objects.filter(test_case__name='dup').count(), 2)
+
+    def test_query_count_independent_of_row_count(self):
+        def run(count):
+            rows = [[f'case-{count}-{i}', f'm{count}/sub', 'P1', '[1]a[2]b', '[1]x[2]y'] for i in range(count)]
+            service = TestCaseImportService(self.template, self.project, self.user)
+            file = self._file(rows)
+            with self.assertNumQueries(13):
+                result = service.import_from_file(file)
+            self.assertEqual(result.imported_count, count)
+
+        run(5)
+        run(50)
+
+    def test_dry_run_does_not_write(self):
+        modules_before = TestCaseModule.objects.count()
+        result = TestCaseImportService(self.template, self.project, self.user, dry_run=True).import_from_file(
+            self._file(self._rows())
+        )
+        self.assertTrue(result.dry_run)
+        self.assertEqual(result.imported_count, 4)
+        self.assertEqual(result.modules_to_create, ['root/a', 'root/a/b'])
+        self.assertEqual([d['row'] for d in result.duplicate_names], [2, 7])
+        self.assertEqual(result.created_testcases, [])
+        self.assertEqual(TestCaseModule.objects.count(), modules_before)
+        self.assertEqual(TestCaseModel.objects.count(), 1)
@@ -3,27 +3,45 @@
 
 使用独立子进程执行 Playwright，完全避免 Windows 事件循环问题。
 执行完成后自动清理资源，不占用服务器存储。
+
+画面由执行器通过 CDP screencast 以二进制管道送达，经 PreviewFrameStream 做
+最新帧优先的丢帧、确认驱动的流控和质量/FPS 自适应后发送给客户端。
 """
 
 import asyncio
+import base64
 import json
 import logging
 import subprocess
 import sys
 import tempfile
+import threading
 import os
 from pathlib import Path
 from typing import Optional
 from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 
+from wharttest_django.signalling import signal_backend, watch_signal
+
+from .preview_stream import (
+    CLIENT_FRAME_HEADER,
+    FRAME_TIMESTAMP,
+    PreviewFrameStream,
+    read_pipe_message,
+)
+
 logger = logging.getLogger(__name__)
 
 # Playwright 执行器脚本路径
 EXECUTOR_SCRIPT = Path(__file__).parent / 'playwright_executor.py'
 
+# 管道读取结束标记
+_PIPE_EOF = object()
+
 
 class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
     """
@@ -32,13 +50,18 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
     连接地址: ws://server/ws/execution-preview/<script_id>/
     
     消息格式:
-    - 发送 {"action": "start", "headless": true} 开始执行
-    - 发送 {"action": "stop"} 停止执行
-    - 接收 {"type": "frame", "data": "<base64>"} 截图帧
+    - 发送 {"action": "start", "headless": true, "fps": 10, "binary": true} 开始执行
+    - 发送 {"action": "stop"} 停止执行（本连接未在执行时，通过共享信号停止该用户在其他连接/进程上的同一脚本预览）
+    - 发送 {"action": "ack", "seq": <帧序号>} 确认已显示某帧（二进制模式）
+    - 接收二进制消息：4 字节大端帧序号 + JPEG 数据（binary=true）
+    - 接收 {"type": "frame", "data": "<base64>"} 截图帧（binary=false，兼容旧客户端）
+    - 接收 {"type": "stats", ...} 本连接的带宽、帧率、丢帧数和帧延迟
     - 接收 {"type": "status", "status": "running|completed|error", "message": "..."} 状态
     - 接收 {"type": "log", "message": "..."} 执行日志
     """
     
+    STATS_INTERVAL_SECONDS = 1.0
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.script_id: Optional[int] = None
@@ -47,7 +70,11 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
         self.process: Optional[subprocess.Popen] = None
         self.reader_task = None
         self.fps = 10
+        self.binary_frames = False
         self.temp_file_path = None  # 临时参数文件路径
+        self.frame_stream: Optional[PreviewFrameStream] = None
+        self.frame_task = None
+        self.stats_task = None
     
     async def connect(self):
         """WebSocket 连接建立"""
@@ -87,12 +114,19 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             action = data.get('action')
             
-            if action == 'start':
+            if action == 'ack':
+                if self.frame_stream:
+                    self.frame_stream.ack(int(data.get('seq', 0)))
+            elif action == 'start':
                 headless = data.get('headless', False)
                 fps = data.get('fps', 10)
+                self.binary_frames = bool(data.get('binary', False))
                 await self._start_execution(headless, fps)
             elif action == 'stop':
-                await self._stop_execution()
+                if self.is_executing:
+                    await self._stop_execution()
+                else:
+                    await sync_to_async(signal_backend().set)(self._stop_signal_name())
             else:
                 await self.send_status('error', f'未知操作: {action}')
         except json.JSONDecodeError:
@@ -109,6 +143,7 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
         
         self.is_executing = True
         self.fps = min(max(fps, 1), 30)
+        await sync_to_async(signal_backend().clear)(self._stop_signal_name())
         
         try:
             await self.send_status('starting', '正在准备执行...')
@@ -139,21 +174,31 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
             logger.info(f'启动执行器，参数文件: {self.temp_file_path}')
             
             # 启动独立进程执行 Playwright
-            # 合并 stderr 到 stdout，避免管道写满阻塞
+            # stdout 为二进制分帧协议；stderr 单独读取作为日志；stdin 用于下发画面参数
             self.process = subprocess.Popen(
                 [sys.executable, str(EXECUTOR_SCRIPT), self.temp_file_path],
+                stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,  # 合并 stderr 到 stdout
-                text=True,
-                bufsize=1,
+                stderr=subprocess.PIPE,
+                bufsize=0,
                 creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0,
             )
             
+            self.frame_stream = PreviewFrameStream(
+                send_frame=self._send_frame,
+                max_fps=self.fps,
+                require_ack=self.binary_frames,
+                on_settings_change=self._apply_stream_settings,
+            )
+            self.frame_task = asyncio.create_task(self.frame_stream.run())
+            self.stats_task = asyncio.create_task(self._report_stats())
+            
             # 启动输出读取任务
             self.reader_task = asyncio.create_task(self._read_process_output())
             
-            # 等待进程结束
-            await self.reader_task
+            # 等待进程结束，期间订阅来自其他连接/进程的停止信号
+            async with watch_signal(self._stop_signal_name(), on_signal=self._stop_execution):
+                await self.reader_task
             
         except asyncio.CancelledError:
             await self.send_status('cancelled', '执行已取消')
@@ -163,97 +208,120 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
         finally:
             await self._cleanup()
     
+    def _start_pipe_readers(self, queue: asyncio.Queue):
+        """后台线程读取子进程管道，通过 call_soon_threadsafe 投递到事件循环"""
+        loop = asyncio.get_running_loop()
+        process = self.process
+        
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        
+        def read_stdout():
+            try:
+                while True:
+                    message = read_pipe_message(process.stdout)
+                    if message is None:
+                        break
+                    put(message)
+            except Exception as e:
+                logger.debug(f'读取执行器输出结束: {e}')
+            finally:
+                put(_PIPE_EOF)
+        
+        def read_stderr():
+            try:
+                for raw in iter(process.stderr.readline, b''):
+                    line = raw.decode('utf-8', errors='replace').strip()
+                    if line:
+                        put((b'J', json.dumps({'type': 'log', 'message': line}).encode('utf-8')))
+            except Exception:
+                pass
+        
+        threading.Thread(target=read_stdout, name='preview-stdout', daemon=True).start()
+        threading.Thread(target=read_stderr, name='preview-stderr', daemon=True).start()
+    
     async def _read_process_output(self):
-        """异步读取进程输出并转发到 WebSocket"""
+        """读取执行器消息：JSON 消息按序转发，画面帧交给 frame_stream 做丢帧与流控"""
         if not self.process or not self.process.stdout:
             return
         
-        loop = asyncio.get_event_loop()
-        frame_count = 0
+        queue: asyncio.Queue = asyncio.Queue()
+        self._start_pipe_readers(queue)
         
         try:
-            while self.process.poll() is None:
-                # 非阻塞读取一行
-                line = await loop.run_in_executor(
-                    None,
-                    self.process.stdout.readline
-                )
+            while True:
+                item = await queue.get()
+                if item is _PIPE_EOF:
+                    break
                 
-                if not line:
-                    await asyncio.sleep(0.01)
+                kind, payload = item
+                if kind == b'F':
+                    (captured_at,) = FRAME_TIMESTAMP.unpack_from(payload)
+                    self.frame_stream.offer(payload[FRAME_TIMESTAMP.size:], captured_at)
                     continue
                 
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # 解析 JSON 消息
                 try:
-                    message = json.loads(line)
+                    message = json.loads(payload.decode('utf-8', errors='replace'))
                 except json.JSONDecodeError as e:
                     logger.warning(f'JSON解析失败: {e}')
-                    # 非 JSON 输出作为日志转发
-                    message = {'type': 'log', 'message': line}
-                
-                msg_type = message.get('type', 'unknown')
-                
-                # 处理 frame_file 类型：从文件读取数据并转换为 frame 消息
-                if msg_type == 'frame_file':
-                    frame_path = message.get('path', '')
-                    try:
-                        with open(frame_path, 'r', encoding='utf-8') as f:
-                            frame_data = f.read()
-                        os.remove(frame_path)
-                        message = {'type': 'frame', 'data': frame_data}
-                        msg_type = 'frame'
-                    except Exception as e:
-                        logger.warning(f'读取 frame 文件失败: {e}')
-                        continue
-                
-                if msg_type == 'frame':
-                    frame_count += 1
-                
+                    continue
                 await self.send(text_data=json.dumps(message))
             
-            # 读取剩余输出
-            remaining = self.process.stdout.read()
-            if remaining:
-                for line in remaining.strip().split('\n'):
-                    if not line:
-                        continue
-                    
-                    try:
-                        message = json.loads(line)
-                    except json.JSONDecodeError:
-                        message = {'type': 'log', 'message': line}
-                    
-                    msg_type = message.get('type', 'unknown')
-                    
-                    # 处理 frame_file 类型
-                    if msg_type == 'frame_file':
-                        frame_path = message.get('path', '')
-                        try:
-                            with open(frame_path, 'r', encoding='utf-8') as f:
-                                frame_data = f.read()
-                            os.remove(frame_path)
-                            message = {'type': 'frame', 'data': frame_data}
-                            msg_type = 'frame'
-                        except Exception as e:
-                            logger.warning(f'读取 frame 文件失败: {e}')
-                            continue
-                    
-                    if msg_type == 'frame':
-                        frame_count += 1
-                    
-                    await self.send(text_data=json.dumps(message))
+            # 让最后一帧（通常是最终画面）发出去
+            for _ in range(20):
+                if not self.frame_stream or not self.frame_stream.has_pending:
+                    break
+                await asyncio.sleep(0.05)
             
-            logger.info(f'共转发 {frame_count} 帧')
+            if self.frame_stream:
+                summary = self.frame_stream.summary()
+                logger.info(f'脚本 {self.script_id} 预览统计: {summary}')
+                await self.send(text_data=json.dumps({'type': 'stats', 'final': True, **summary}))
                     
         except asyncio.CancelledError:
             pass
         except Exception as e:
             logger.exception(f'读取进程输出出错: {e}')
     
+    async def _send_frame(self, seq: int, jpeg: bytes):
+        """发送一帧：二进制模式直接发送 JPEG，兼容模式发送 base64 文本"""
+        if self.binary_frames:
+            await self.send(bytes_data=CLIENT_FRAME_HEADER.pack(seq) + jpeg)
+        else:
+            await self.send(text_data=json.dumps({
+                'type': 'frame',
+                'data': base64.b64encode(jpeg).decode('ascii'),
+            }))
+    
+    def _apply_stream_settings(self, quality: int, max_fps: int):
+        """把自适应后的画面参数下发给执行器"""
+        if not self.process or self.process.poll() is not None or not self.process.stdin:
+            return
+        try:
+            self.process.stdin.write((json.dumps({'quality': quality, 'max_fps': max_fps}) + '\n').encode('utf-8'))
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+    
+    async def _report_stats(self):
+        """定期发送本连接的带宽/帧率/延迟统计，并驱动质量自适应"""
+        try:
+            while True:
+                await asyncio.sleep(self.STATS_INTERVAL_SECONDS)
+                if not self.frame_stream:
+                    continue
+                stats = self.frame_stream.maybe_adapt()
+                if stats is not None:
+                    await self.send(text_data=json.dumps({'type': 'stats', **stats}))
+        except asyncio.CancelledError:
+            pass
+    
+    def _stop_signal_name(self) -> str:
+        return f'execution-preview-stop:{self.user.id}:{self.script_id}'
+    
     async def _stop_execution(self):
         """停止执行"""
         if not self.is_executing:
@@ -278,6 +346,20 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
             except asyncio.CancelledError:
                 pass
         
+        # 停止帧发送与统计任务
+        if self.frame_stream:
+            self.frame_stream.close()
+        for task in (self.frame_task, self.stats_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.frame_task = None
+        self.stats_task = None
+        self.frame_stream = None
+        
         # 终止进程
         if self.process and self.process.poll() is None:
             self.process.terminate()
@@ -340,6 +422,7 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
         
         try:
             from testcases.models import AutomationScript
+            from projects.membership import has_project_role
             script = AutomationScript.objects.select_related(
                 'test_case__project'
             ).get(id=self.script_id)
@@ -350,7 +433,7 @@ class ExecutionPreviewConsumer(AsyncWebsocketConsumer):
             
             # 检查项目成员权限
             project_id = script.test_case.project_id
-            return self.user.project_memberships.filter(project_id=project_id).exists()
+            return has_project_role(self.user, project_id)
         except Exception:
             return False
     
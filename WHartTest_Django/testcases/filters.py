@@ -48,10 +48,8 @@ class TestCaseFilter(django_filters.FilterSet):
         if value is None:
             return queryset
         
-        try:
-            module = TestCaseModule.objects.get(id=value)
-        except TestCaseModule.DoesNotExist:
+        module_path = TestCaseModule.objects.filter(id=value).values_list('path', flat=True).first()
+        if not module_path:
             return queryset.none()
-        
-        all_module_ids = module.get_all_descendant_ids()
-        return queryset.filter(module_id__in=all_module_ids)
\ No newline at end of file
+
+        return queryset.filter(module__path__startswith=module_path)
\ No newline at end of file
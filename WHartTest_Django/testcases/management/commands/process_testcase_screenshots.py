@@ -0,0 +1,29 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from testcases.models import TestCaseScreenshot
+from testcases.screenshots import process_screenshot
+
+
+class Command(BaseCommand):
+    help = 'Deduplicate, transcode and thumbnail test case screenshots that have not been processed yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also retry screenshots whose previous processing failed',
+        )
+
+    def handle(self, *args, **kwargs):
+        queryset = TestCaseScreenshot.objects.filter(processing_status='pending')
+        if kwargs.get('retry_failed'):
+            TestCaseScreenshot.objects.filter(processing_status='failed').update(processing_status='pending')
+        screenshot_ids = list(queryset.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'Processing {len(screenshot_ids)} screenshot(s)...')
+
+        results = Counter(process_screenshot(pk) for pk in screenshot_ids)
+
+        summary = ', '.join(f'{status}: {count}' for status, count in sorted(results.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Done ({summary}).'))
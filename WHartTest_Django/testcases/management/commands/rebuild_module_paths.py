@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from testcases.models import TestCaseModule
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized paths and levels of testcase modules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            type=int,
+            help='Only rebuild modules of the given project ID (default: all projects)',
+        )
+
+    def handle(self, *args, **kwargs):
+        project_id = kwargs.get('project')
+        scope = f'project {project_id}' if project_id else 'all projects'
+        self.stdout.write(f'Rebuilding testcase module paths for {scope}...')
+
+        changed = TestCaseModule.rebuild_paths(project_id=project_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {changed} module(s) updated.'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 09:56
+
+from django.db import migrations, models
+
+
+def backfill_module_paths(apps, schema_editor):
+    """按层级为已有模块回填物化路径"""
+    TestCaseModule = apps.get_model('testcases', 'TestCaseModule')
+    modules = list(TestCaseModule.objects.only('id', 'parent_id', 'level', 'path'))
+    children = {}
+    for module in modules:
+        children.setdefault(module.parent_id, []).append(module)
+
+    changed = []
+    stack = [(module, '/', 1) for module in children.get(None, [])]
+    while stack:
+        module, prefix, level = stack.pop()
+        module.path = f"{prefix}{module.pk}/"
+        module.level = level
+        changed.append(module)
+        stack.extend((child, module.path, level + 1) for child in children.get(module.pk, []))
+
+    TestCaseModule.objects.bulk_update(changed, ['path', 'level'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testcases', '0018_alter_testcase_review_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcasemodule',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='模块路径'),
+        ),
+        migrations.RunPython(backfill_module_paths, migrations.RunPython.noop),
+    ]
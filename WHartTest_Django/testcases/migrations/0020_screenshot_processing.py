@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 10:31
+
+import testcases.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testcases', '0019_testcasemodule_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcasescreenshot',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='内容哈希'),
+        ),
+        migrations.AddField(
+            model_name='testcasescreenshot',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', '待处理'), ('ready', '已处理'), ('failed', '处理失败')], default='pending', max_length=20, verbose_name='处理状态'),
+        ),
+        migrations.AddField(
+            model_name='testcasescreenshot',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=testcases.models.testcase_screenshot_path, verbose_name='缩略图'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testcases', '0020_screenshot_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testexecution',
+            name='shard_task_ids',
+            field=models.JSONField(blank=True, default=list, verbose_name='分片任务ID'),
+        ),
+    ]
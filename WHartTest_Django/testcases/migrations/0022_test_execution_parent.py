@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testcases', '0021_test_execution_shard_task_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testexecution',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reruns', to='testcases.testexecution', verbose_name='原执行记录'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
@@ -141,6 +143,9 @@ class TestCaseModule(models.Model):
         verbose_name=_('父模块')
     )
     level = models.PositiveSmallIntegerField(_('模块级别'), default=1)
+    # 物化路径：祖先链上的模块ID（含自身），格式 "/1/5/12/"
+    # 子树查询使用 path__startswith，保存时维护，移动时同步更新所有后代
+    path = models.CharField(_('模块路径'), max_length=255, default='', db_index=True, editable=False)
     creator = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -179,22 +184,119 @@ class TestCaseModule(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        old_path, old_level = '', self.level
+        if self.pk:
+            old = TestCaseModule.objects.filter(pk=self.pk).values('path', 'level').first()
+            if old:
+                old_path, old_level = old['path'], old['level']
         super().save(*args, **kwargs)
 
+        new_path = self.build_path()
+        if new_path == old_path:
+            self.path = new_path
+            return
+        TestCaseModule.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            # 模块被移动：一条 UPDATE 同步所有后代的路径前缀和级别
+            TestCaseModule.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                level=F('level') + (self.level - old_level),
+            )
+        self.path = new_path
+
+    def build_path(self):
+        """根据父模块路径计算当前模块的物化路径（父模块路径以数据库为准，避免使用过期实例）"""
+        prefix = '/'
+        if self.parent_id:
+            prefix = TestCaseModule.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or '/'
+        return f"{prefix}{self.pk}/"
+
+    @property
+    def path_ids(self):
+        """祖先链上的模块ID（从根模块到当前模块）"""
+        return [int(part) for part in self.path.strip('/').split('/') if part]
+
+    def get_descendants(self, include_self=True):
+        """当前模块子树的查询集（单条索引查询）"""
+        queryset = TestCaseModule.objects.filter(project_id=self.project_id, path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
     def get_all_descendant_ids(self):
         """
-        获取当前模块及其所有子模块的ID列表（递归）
+        获取当前模块及其所有子模块的ID列表
+        """
+        return list(self.get_descendants().values_list('id', flat=True))
+
+    def get_path_names(self):
+        """从根模块到当前模块的名称列表（一次查询取出全部祖先）"""
+        ids = self.path_ids
+        if not ids:
+            return [self.name]
+        names = dict(TestCaseModule.objects.filter(id__in=ids).values_list('id', 'name'))
+        return [names[module_id] for module_id in ids if module_id in names]
+
+    @classmethod
+    def rebuild_paths(cls, project_id=None):
         """
-        ids = [self.id]
-        for child in self.children.all():
-            ids.extend(child.get_all_descendant_ids())
-        return ids
+        按层级重新计算物化路径和级别（用于历史数据回填或修复）
+
+        Returns:
+            int: 路径或级别发生变化的模块数量
+        """
+        queryset = cls.objects.all()
+        if project_id is not None:
+            queryset = queryset.filter(project_id=project_id)
+        modules = list(queryset.only('id', 'parent_id', 'level', 'path'))
+        children = {}
+        for module in modules:
+            children.setdefault(module.parent_id, []).append(module)
+
+        changed = []
+        # 项目过滤时父模块一定在同一项目内，根节点即 parent_id 为空的模块
+        stack = [(module, '/', 1) for module in children.get(None, [])]
+        while stack:
+            module, prefix, level = stack.pop()
+            path = f"{prefix}{module.pk}/"
+            if module.path != path or module.level != level:
+                module.path, module.level = path, level
+                changed.append(module)
+            stack.extend((child, path, level + 1) for child in children.get(module.pk, []))
+
+        cls.objects.bulk_update(changed, ['path', 'level'], batch_size=500)
+        return len(changed)
+
+
+def annotate_subtree_testcase_count(queryset):
+    """
+    为模块查询集注解 subtree_testcase_count（模块及其所有子模块下的用例数量）
+
+    使用关联子查询按物化路径前缀计数，列表接口一条 SQL 取出所有模块的数量
+    """
+    counts = (
+        TestCase.objects
+        .filter(project_id=OuterRef('project_id'), module__path__startswith=OuterRef('path'))
+        .order_by()
+        .values('project_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return queryset.annotate(
+        subtree_testcase_count=Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+    )
 
 
 class TestCaseScreenshot(models.Model):
     """
     测试用例截屏模型 - 支持一个用例多张截屏
     """
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', _('待处理')),
+        ('ready', _('已处理')),
+        ('failed', _('处理失败')),
+    ]
+
     test_case = models.ForeignKey(
         TestCase,
         on_delete=models.CASCADE,
@@ -211,6 +313,21 @@ class TestCaseScreenshot(models.Model):
     step_number = models.PositiveIntegerField(_('对应步骤'), blank=True, null=True)
     created_at = models.DateTimeField(_('上传时间'), auto_now_add=True)
 
+    # 异步处理结果：转码后的图片与缩略图按内容哈希命名，相同内容的记录共享文件
+    thumbnail = models.ImageField(
+        _('缩略图'),
+        upload_to=testcase_screenshot_path,
+        blank=True,
+        null=True
+    )
+    content_hash = models.CharField(_('内容哈希'), max_length=64, blank=True, default='', db_index=True)
+    processing_status = models.CharField(
+        _('处理状态'),
+        max_length=20,
+        choices=PROCESSING_STATUS_CHOICES,
+        default='pending'
+    )
+
     # MCP执行相关信息
     mcp_session_id = models.CharField(_('MCP会话ID'), max_length=255, blank=True, null=True)
     page_url = models.URLField(_('页面URL'), max_length=2000, blank=True, null=True)
@@ -237,12 +354,19 @@ class TestCaseScreenshot(models.Model):
             return f"{self.test_case.name} - Step {self.step_number}"
         return f"{self.test_case.name} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
 
+    @classmethod
+    def is_file_referenced(cls, name):
+        """文件是否被截屏记录引用（原图或缩略图）"""
+        return cls.objects.filter(models.Q(screenshot=name) | models.Q(thumbnail=name)).exists()
+
     def delete(self, *args, **kwargs):
-        """删除模型时同时删除文件"""
-        if self.screenshot:
-            if os.path.isfile(self.screenshot.path):
-                os.remove(self.screenshot.path)
-        super().delete(*args, **kwargs)
+        """删除模型时同时删除不再被其他记录引用的文件"""
+        files = [f for f in (self.screenshot, self.thumbnail) if f]
+        result = super().delete(*args, **kwargs)
+        for field_file in files:
+            if not self.is_file_referenced(field_file.name) and os.path.isfile(field_file.path):
+                os.remove(field_file.path)
+        return result
 
 
 class TestSuite(models.Model):
@@ -337,6 +461,17 @@ class TestExecution(models.Model):
     
     # Celery任务ID,用于追踪和取消任务
     celery_task_id = models.CharField(_('任务ID'), max_length=255, blank=True, null=True)
+    # 分布式执行时各分片的Celery任务ID,取消时用于撤销
+    shard_task_ids = models.JSONField(_('分片任务ID'), default=list, blank=True)
+    # 仅重跑失败用例时指向原执行记录,通过的结果从原执行复制
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reruns',
+        verbose_name=_('原执行记录')
+    )
 
     # 是否为功能测试用例生成Playwright脚本
     generate_playwright_script = models.BooleanField(
@@ -632,3 +767,58 @@ class ScriptExecution(models.Model):
         if self.started_at and self.completed_at:
             return (self.completed_at - self.started_at).total_seconds()
         return self.execution_time
+
+
+# 用例所属模块的 __str__ 会沿父模块逐级拼接名称，模块最多5级，一次 JOIN 取全
+TESTCASE_MODULE_CHAIN = 'module__parent__parent__parent__parent'
+
+
+def with_testcase_relations(queryset):
+    """为用例查询集批量加载序列化所需的关联数据（创建人、模块链、步骤、截屏）"""
+    return queryset.select_related('creator', TESTCASE_MODULE_CHAIN).prefetch_related(
+        'steps',
+        'creator__groups',
+        models.Prefetch(
+            'screenshots',
+            queryset=TestCaseScreenshot.objects.select_related('uploader').prefetch_related('uploader__groups'),
+        ),
+    )
+
+
+def _count_subquery(queryset, group_field):
+    """按外键分组计数的关联子查询，无记录时为 0"""
+    counts = queryset.order_by().values(group_field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+
+def annotate_script_execution_summary(queryset):
+    """
+    为脚本查询集注解执行次数和最近一次执行（latest_execution_*、execution_count）
+
+    每个字段都是基于 script_id 索引的关联子查询，列表接口不再逐行查询执行记录
+    """
+    latest = ScriptExecution.objects.filter(script_id=OuterRef('pk')).order_by('-created_at', '-id')
+    return queryset.annotate(
+        latest_execution_id=Subquery(latest.values('id')[:1]),
+        latest_execution_status=Subquery(latest.values('status')[:1]),
+        latest_execution_created_at=Subquery(latest.values('created_at')[:1]),
+        latest_execution_time=Subquery(latest.values('execution_time')[:1]),
+        execution_count=_count_subquery(ScriptExecution.objects.filter(script_id=OuterRef('pk')), 'script_id'),
+    )
+
+
+def with_suite_relations(queryset):
+    """为测试套件查询集注解用例/脚本数量，并批量加载用例和脚本详情"""
+    testcase_links = TestSuite.testcases.through.objects.filter(testsuite_id=OuterRef('pk'))
+    script_links = TestSuite.automation_scripts.through.objects.filter(testsuite_id=OuterRef('pk'))
+    scripts = annotate_script_execution_summary(
+        AutomationScript.objects.select_related('test_case', 'creator')
+    ).prefetch_related('creator__groups')
+    return queryset.select_related('creator').annotate(
+        testcase_count=_count_subquery(testcase_links, 'testsuite_id'),
+        script_count=_count_subquery(script_links, 'testsuite_id'),
+    ).prefetch_related(
+        'creator__groups',
+        models.Prefetch('testcases', queryset=with_testcase_relations(TestCase.objects.all())),
+        models.Prefetch('automation_scripts', queryset=scripts),
+    )
@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from projects.models import ProjectMember # 用于检查项目成员
+from projects.membership import has_project_role # 用于检查项目成员（请求内/共享缓存）
 
 class IsProjectMemberForTestCase(permissions.BasePermission):
     """
@@ -25,11 +25,7 @@ class IsProjectMemberForTestCase(permissions.BasePermission):
         except (ValueError, TypeError):
             return False
 
-        return ProjectMember.objects.filter(
-            project_id=project_pk,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, project_pk)
 
     def has_object_permission(self, request, view, obj):
         """
@@ -44,11 +40,7 @@ class IsProjectMemberForTestCase(permissions.BasePermission):
             return False # 对象没有关联项目，不应该发生
 
         # 检查用户是否是该 TestCase 所属项目的成员
-        return ProjectMember.objects.filter(
-            project=obj.project,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, obj.project_id)
 
 # 如果需要更细致的权限，例如“只有创建者才能修改/删除”，可以添加如下权限：
 # class IsOwnerOrReadOnlyForTestCase(permissions.BasePermission):
@@ -90,11 +82,7 @@ class IsProjectMemberForTestCaseModule(permissions.BasePermission):
         except (ValueError, TypeError):
             return False
 
-        return ProjectMember.objects.filter(
-            project_id=project_pk,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, project_pk)
 
     def has_object_permission(self, request, view, obj):
         """
@@ -109,11 +97,7 @@ class IsProjectMemberForTestCaseModule(permissions.BasePermission):
             return False # 对象没有关联项目，不应该发生
 
         # 检查用户是否是该 TestCaseModule 所属项目的成员
-        return ProjectMember.objects.filter(
-            project=obj.project,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, obj.project_id)
 
 
 class IsProjectMemberForTestSuite(permissions.BasePermission):
@@ -135,11 +119,7 @@ class IsProjectMemberForTestSuite(permissions.BasePermission):
         except (ValueError, TypeError):
             return False
 
-        return ProjectMember.objects.filter(
-            project_id=project_pk,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, project_pk)
 
     def has_object_permission(self, request, view, obj):
         """检查用户是否对单个TestSuite实例有权限"""
@@ -149,11 +129,7 @@ class IsProjectMemberForTestSuite(permissions.BasePermission):
         if not hasattr(obj, 'project'):
             return False
 
-        return ProjectMember.objects.filter(
-            project=obj.project,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, obj.project_id)
 
 
 class IsProjectMemberForTestExecution(permissions.BasePermission):
@@ -175,11 +151,7 @@ class IsProjectMemberForTestExecution(permissions.BasePermission):
         except (ValueError, TypeError):
             return False
 
-        return ProjectMember.objects.filter(
-            project_id=project_pk,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
+        return has_project_role(request.user, project_pk)
 
     def has_object_permission(self, request, view, obj):
         """检查用户是否对单个TestExecution实例有权限"""
@@ -190,8 +162,4 @@ class IsProjectMemberForTestExecution(permissions.BasePermission):
         if not hasattr(obj, 'suite') or not hasattr(obj.suite, 'project'):
             return False
 
-        return ProjectMember.objects.filter(
-            project=obj.suite.project,
-            user=request.user,
-            role__in=['owner', 'admin', 'member']
-        ).exists()
\ No newline at end of file
+        return has_project_role(request.user, obj.suite.project_id)
\ No newline at end of file
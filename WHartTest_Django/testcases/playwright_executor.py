@@ -6,13 +6,18 @@ Playwright 执行器 - 独立进程版本
 2. 完整脚本：包含 sync_playwright() 和 run() 函数的独立脚本
 
 对于完整脚本，会拦截 sync_playwright() 调用，注入截图功能。
+
+画面通过 CDP screencast 推送（Chromium），不支持时回退为每次页面操作后截图。
+stdout 使用二进制分帧协议（见 preview_stream.py）：1 字节类型 + 4 字节大端长度 + 负载，
+b'J' 为 JSON 消息，b'F' 为 8 字节采集时间戳 + JPEG 数据，帧数据不落盘、不做 base64。
+stdin 接收 JSON 行控制消息 {"quality": int, "max_fps": int}，用于按客户端速度调整画面。
 """
 
 import base64
 import json
 import os
+import struct
 import sys
-import tempfile
 import time
 import builtins
 import threading
@@ -24,54 +29,120 @@ _original_print = builtins.print
 # 线程锁，保护 stdout 输出，防止多个消息交错
 _output_lock = threading.Lock()
 
-# 获取 stdout 的文件描述符
-_stdout_fd = sys.stdout.fileno()
+# 协议输出使用独立的 fd；fd 1 重定向到 stderr，防止原生输出破坏二进制协议
+_stdout_fd = os.dup(sys.stdout.fileno())
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
 
-# Frame 文件目录
-_frame_dir = tempfile.mkdtemp(prefix='playwright_frames_')
+_PIPE_HEADER = struct.Struct('>cI')
+_FRAME_TIMESTAMP = struct.Struct('>d')
 
+# 画面参数，由 stdin 控制消息更新
+_screencast_settings = {'quality': 50, 'max_fps': 10}
 
-def send_message(msg_type: str, data: dict):
-    """发送消息到标准输出"""
-    # 对于 frame 类型，将大数据写入文件，只传递文件路径
-    if msg_type == 'frame' and 'data' in data:
-        frame_data = data['data']
-        # 创建临时文件保存 frame 数据
-        frame_file = os.path.join(_frame_dir, f'frame_{time.time()}.b64')
-        with open(frame_file, 'w', encoding='utf-8') as f:
-            f.write(frame_data)
-        # 发送文件路径而非数据
-        message = json.dumps({'type': 'frame_file', 'path': frame_file}) + '\n'
-    else:
-        message = json.dumps({'type': msg_type, **data}) + '\n'
-    
-    message_bytes = message.encode('utf-8')
+# 已发送帧数（screencast 与截图合计）
+_frames_sent = [0]
+
+
+def _write_message(kind: bytes, payload: bytes):
     with _output_lock:
-        os.write(_stdout_fd, message_bytes)
+        os.write(_stdout_fd, _PIPE_HEADER.pack(kind, len(payload)) + payload)
+
+
+def send_message(msg_type: str, data: dict):
+    """发送 JSON 消息"""
+    _write_message(b'J', json.dumps({'type': msg_type, **data}).encode('utf-8'))
+
+
+def send_frame(jpeg: bytes, captured_at: float = None):
+    """发送一帧 JPEG（原始二进制）"""
+    _write_message(b'F', _FRAME_TIMESTAMP.pack(captured_at or time.time()) + jpeg)
+    _frames_sent[0] += 1
 
 
 def patched_print(*args, **kwargs):
     """补丁版本的 print，将输出转换为 JSON 日志消息"""
     # 生成打印内容
     output = ' '.join(str(arg) for arg in args)
-    message = json.dumps({'type': 'log', 'message': output}) + '\n'
-    message_bytes = message.encode('utf-8')
-    with _output_lock:
-        # 使用 os.write 直接写入 fd
-        os.write(_stdout_fd, message_bytes)
+    send_message('log', {'message': output})
+
+
+def _control_reader():
+    """读取 stdin 控制消息，更新画面质量/FPS"""
+    for line in sys.stdin:
+        try:
+            control = json.loads(line)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if not isinstance(control, dict):
+            continue
+        if control.get('quality'):
+            _screencast_settings['quality'] = max(10, min(100, int(control['quality'])))
+        if control.get('max_fps'):
+            _screencast_settings['max_fps'] = max(1, min(30, int(control['max_fps'])))
+
+
+def start_screencast(page) -> bool:
+    """
+    为页面开启 CDP screencast，画面变化时由浏览器推送帧
+
+    帧在 Playwright 事件分发时回调（脚本执行 Playwright 操作期间），按 max_fps 限速；
+    质量变化时重启 screencast。返回是否开启成功。
+    """
+    try:
+        cdp = page.context.new_cdp_session(page)
+    except Exception as e:
+        send_message('log', {'message': f'CDP screencast 不可用，回退为操作截图: {e}'})
+        return False
+    
+    state = {'quality': _screencast_settings['quality'], 'last_sent': 0.0}
+    
+    def start(quality):
+        cdp.send('Page.startScreencast', {
+            'format': 'jpeg',
+            'quality': quality,
+            'maxWidth': 1280,
+            'maxHeight': 720,
+        })
+    
+    def on_frame(params):
+        try:
+            cdp.send('Page.screencastFrameAck', {'sessionId': params['sessionId']})
+        except Exception:
+            return
+        now = time.time()
+        if now - state['last_sent'] >= 1.0 / _screencast_settings['max_fps']:
+            state['last_sent'] = now
+            captured_at = (params.get('metadata') or {}).get('timestamp') or now
+            send_frame(base64.b64decode(params['data']), captured_at)
+        quality = _screencast_settings['quality']
+        if quality != state['quality']:
+            state['quality'] = quality
+            try:
+                cdp.send('Page.stopScreencast')
+                start(quality)
+            except Exception:
+                pass
+    
+    try:
+        cdp.on('Page.screencastFrame', on_frame)
+        start(state['quality'])
+        return True
+    except Exception as e:
+        send_message('log', {'message': f'启动 screencast 失败，回退为操作截图: {e}'})
+        return False
 
 
 def create_screenshot_page_wrapper(real_page, interval=0.1):
-    """创建一个自动截图的 page 包装器"""
+    """创建一个自动截图的 page 包装器（已开启 screencast 时不在操作后截图）"""
     last_screenshot_time = [0]
     frame_count = [0]
+    screencast_active = start_screencast(real_page)
     
     def take_screenshot(silent=False):
         """执行截图并发送，silent=True 时不输出失败日志（用于脚本结束后的尝试截图）"""
         try:
-            screenshot = real_page.screenshot(type='jpeg', quality=50)
-            frame_data = base64.b64encode(screenshot).decode('utf-8')
-            send_message('frame', {'data': frame_data})
+            screenshot = real_page.screenshot(type='jpeg', quality=_screencast_settings['quality'])
+            send_frame(screenshot)
             frame_count[0] += 1
             return True
         except Exception as e:
@@ -84,6 +155,8 @@ def create_screenshot_page_wrapper(real_page, interval=0.1):
     
     def maybe_screenshot():
         """检查是否需要截图"""
+        if screencast_active:
+            return
         now = time.time()
         if now - last_screenshot_time[0] >= interval:
             take_screenshot()
@@ -119,8 +192,7 @@ def create_screenshot_page_wrapper(real_page, interval=0.1):
             # 截图并发送到前端
             screenshot_bytes = self._real_page.screenshot(*args, **kwargs)
             try:
-                frame_data = base64.b64encode(screenshot_bytes).decode('utf-8')
-                send_message('frame', {'data': frame_data})
+                send_frame(screenshot_bytes)
                 frame_count[0] += 1
             except Exception as e:
                 send_message('log', {'message': f'发送截图帧失败: {str(e)}'})
@@ -129,7 +201,8 @@ def create_screenshot_page_wrapper(real_page, interval=0.1):
         # 显式定义常用方法，确保截图被触发
         def goto(self, *args, **kwargs):
             result = self._real_page.goto(*args, **kwargs)
-            take_screenshot()  # goto 后强制截图
+            if not screencast_active:
+                take_screenshot()  # goto 后强制截图
             return result
         
         def click(self, *args, **kwargs):
@@ -203,7 +276,10 @@ def main():
     timeout_seconds = params.get('timeout_seconds', 60)
     
     screenshot_interval = 1 / fps
-    total_frames = [0]
+    _screencast_settings['max_fps'] = max(1, min(30, int(fps)))
+    if params.get('quality'):
+        _screencast_settings['quality'] = max(10, min(100, int(params['quality'])))
+    threading.Thread(target=_control_reader, name='preview-control', daemon=True).start()
     
     # 替换全局 print 函数
     builtins.print = patched_print
@@ -247,7 +323,6 @@ def main():
                                     page, screenshot_interval
                                 )
                                 pages_and_screenshotters.append((page, take_ss))
-                                total_frames[0] = frame_count
                                 return wrapped_page
                             
                             context.new_page = patched_context_new_page
@@ -259,7 +334,6 @@ def main():
                                 page, screenshot_interval
                             )
                             pages_and_screenshotters.append((page, take_ss))
-                            total_frames[0] = frame_count
                             return wrapped_page
                         
                         browser.new_context = patched_new_context
@@ -308,8 +382,7 @@ def main():
                 except Exception:
                     pass
             
-            frame_count_value = total_frames[0][0] if isinstance(total_frames[0], list) else 0
-            send_message('log', {'message': f'共发送 {frame_count_value} 帧'})
+            send_message('log', {'message': f'共发送 {_frames_sent[0]} 帧'})
             send_message('status', {'status': 'completed', 'message': '脚本执行完成'})
             
         else:
@@ -347,7 +420,7 @@ def main():
                     take_ss()
                     time.sleep(screenshot_interval)
                 
-                send_message('log', {'message': f'共发送 {frame_count[0]} 帧'})
+                send_message('log', {'message': f'共发送 {_frames_sent[0]} 帧'})
                 send_message('status', {'status': 'completed', 'message': '脚本执行完成'})
                 
                 browser.close()
@@ -0,0 +1,260 @@
+"""
+执行预览帧流控制
+
+执行器子进程通过二进制管道送来 JPEG 帧（CDP screencast），这里按单个预览连接做流控：
+- 最新帧优先：只保留一帧待发送，客户端跟不上时旧帧直接丢弃
+- 确认驱动：二进制模式下客户端每显示一帧回 ack，未确认帧数达到窗口上限时暂停发送
+- 自适应：按客户端实际消费速度、丢帧率和帧延迟调整 JPEG 质量与最大 FPS
+- 统计：每个连接的带宽、帧率、丢帧数和端到端延迟
+
+执行器管道协议：1 字节类型 + 4 字节大端长度 + 负载
+- b'J'：UTF-8 JSON 消息（status/log）
+- b'F'：8 字节大端 double 采集时间戳（秒）+ JPEG 数据
+"""
+import asyncio
+import logging
+import struct
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PIPE_HEADER = struct.Struct('>cI')
+FRAME_TIMESTAMP = struct.Struct('>d')
+# 发往浏览器的二进制帧：4 字节大端帧序号 + JPEG
+CLIENT_FRAME_HEADER = struct.Struct('>I')
+
+
+def pack_pipe_message(kind: bytes, payload: bytes) -> bytes:
+    return PIPE_HEADER.pack(kind, len(payload)) + payload
+
+
+def read_pipe_message(stream) -> Optional[tuple]:
+    """从二进制流读取一条消息，EOF 时返回 None"""
+    header = _read_exact(stream, PIPE_HEADER.size)
+    if header is None:
+        return None
+    kind, length = PIPE_HEADER.unpack(header)
+    payload = _read_exact(stream, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def _read_exact(stream, size: int) -> Optional[bytes]:
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+class PreviewFrameStream:
+    """单个预览连接的帧发送循环"""
+
+    QUALITY_LEVELS = (30, 40, 50, 65, 80)
+    MAX_IN_FLIGHT = 2
+    ACK_TIMEOUT_SECONDS = 2.0
+    ADAPT_INTERVAL_SECONDS = 2.0
+
+    def __init__(
+        self,
+        send_frame: Callable[[int, bytes], Awaitable[None]],
+        max_fps: int = 10,
+        quality: int = 50,
+        require_ack: bool = True,
+        on_settings_change: Optional[Callable[[int, int], None]] = None,
+    ):
+        self._send_frame = send_frame
+        self.requested_fps = max(1, int(max_fps))
+        self.max_fps = self.requested_fps
+        self._quality_index = min(
+            range(len(self.QUALITY_LEVELS)), key=lambda i: abs(self.QUALITY_LEVELS[i] - quality)
+        )
+        self._max_quality_index = self._quality_index
+        self.require_ack = require_ack
+        self._on_settings_change = on_settings_change
+
+        self._pending: Optional[tuple] = None  # (jpeg, captured_at)
+        self._pending_event = asyncio.Event()
+        self._window_event = asyncio.Event()
+        self._window_event.set()
+        self._in_flight: Dict[int, tuple] = {}  # seq -> (sent_at, captured_at)
+        self._seq = 0
+        self._closed = False
+        self._last_sent_at = 0.0
+
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self._latencies: "deque[float]" = deque(maxlen=200)
+        self._started_at = time.monotonic()
+        self._window_started_at = self._started_at
+        self._window = {'received': 0, 'sent': 0, 'dropped': 0, 'acked': 0, 'bytes': 0}
+        self._window_latencies = []
+        self.last_window_stats: Dict = {}
+
+    @property
+    def quality(self) -> int:
+        return self.QUALITY_LEVELS[self._quality_index]
+
+    @property
+    def has_pending(self) -> bool:
+        return self._pending is not None
+
+    def offer(self, jpeg: bytes, captured_at: float) -> None:
+        """执行器送来新帧：覆盖尚未发送的旧帧"""
+        self.frames_received += 1
+        self._window['received'] += 1
+        if self._pending is not None:
+            self.frames_dropped += 1
+            self._window['dropped'] += 1
+        self._pending = (jpeg, captured_at)
+        self._pending_event.set()
+
+    def ack(self, seq: int) -> None:
+        """客户端确认已显示某帧"""
+        entry = self._in_flight.pop(seq, None)
+        if entry is None:
+            return
+        _, captured_at = entry
+        latency_ms = max(0.0, (time.time() - captured_at) * 1000)
+        self._latencies.append(latency_ms)
+        self._window_latencies.append(latency_ms)
+        self._window['acked'] += 1
+        self._window_event.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._pending_event.set()
+        self._window_event.set()
+
+    def _expire_in_flight(self) -> None:
+        """超时未确认的帧视为丢失，避免窗口永久占满"""
+        deadline = time.monotonic() - self.ACK_TIMEOUT_SECONDS
+        for seq in [s for s, (sent_at, _) in self._in_flight.items() if sent_at < deadline]:
+            self._in_flight.pop(seq, None)
+        if len(self._in_flight) < self.MAX_IN_FLIGHT:
+            self._window_event.set()
+
+    async def run(self) -> None:
+        while not self._closed:
+            await self._pending_event.wait()
+            if self._closed:
+                break
+
+            if self.require_ack:
+                self._expire_in_flight()
+                while len(self._in_flight) >= self.MAX_IN_FLIGHT and not self._closed:
+                    self._window_event.clear()
+                    try:
+                        await asyncio.wait_for(self._window_event.wait(), timeout=self.ACK_TIMEOUT_SECONDS)
+                    except asyncio.TimeoutError:
+                        self._expire_in_flight()
+
+            # 按当前最大 FPS 限速（等待期间到达的新帧会覆盖待发送帧）
+            interval = 1.0 / self.max_fps
+            wait = self._last_sent_at + interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            pending = self._pending
+            self._pending = None
+            self._pending_event.clear()
+            if pending is None or self._closed:
+                continue
+
+            jpeg, captured_at = pending
+            self._seq += 1
+            seq = self._seq
+            if self.require_ack:
+                self._in_flight[seq] = (time.monotonic(), captured_at)
+            self._last_sent_at = time.monotonic()
+            await self._send_frame(seq, jpeg)
+            if not self.require_ack:
+                # 无确认的客户端以发送完成时间估算延迟
+                self._latencies.append(max(0.0, (time.time() - captured_at) * 1000))
+                self._window_latencies.append(self._latencies[-1])
+                self._window['acked'] += 1
+
+            self.frames_sent += 1
+            self.bytes_sent += len(jpeg)
+            self._window['sent'] += 1
+            self._window['bytes'] += len(jpeg)
+
+    def maybe_adapt(self) -> Optional[Dict]:
+        """
+        每个统计窗口结束时调整质量/FPS，并返回该窗口的统计数据（窗口未结束返回 None）
+
+        - 丢帧率高或延迟高：先降质量，质量已最低时把 FPS 降到客户端实际消费速度
+        - 丢帧率低且延迟低：先恢复 FPS，再逐级提高质量（不超过初始设置）
+        """
+        now = time.monotonic()
+        elapsed = now - self._window_started_at
+        if elapsed < self.ADAPT_INTERVAL_SECONDS:
+            return None
+
+        window = self._window
+        latencies = sorted(self._window_latencies)
+        avg_latency = sum(latencies) / len(latencies) if latencies else None
+        p95_latency = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+        client_fps = window['acked'] / elapsed
+        drop_ratio = window['dropped'] / window['received'] if window['received'] else 0.0
+
+        old_settings = (self.quality, self.max_fps)
+        congested = drop_ratio > 0.3 or (avg_latency is not None and avg_latency > 500)
+        relaxed = drop_ratio < 0.05 and (avg_latency is None or avg_latency < 200)
+        if congested and window['received']:
+            if self._quality_index > 0:
+                self._quality_index -= 1
+            else:
+                self.max_fps = max(1, min(self.max_fps, int(client_fps) or 1))
+        elif relaxed:
+            if self.max_fps < self.requested_fps:
+                self.max_fps = min(self.requested_fps, self.max_fps + 2)
+            elif self._quality_index < self._max_quality_index:
+                self._quality_index += 1
+
+        stats = {
+            'fps': round(window['sent'] / elapsed, 1),
+            'client_fps': round(client_fps, 1),
+            'kbps': round(window['bytes'] * 8 / 1000 / elapsed, 1),
+            'dropped': window['dropped'],
+            'latency_ms': {
+                'avg': round(avg_latency, 1) if avg_latency is not None else None,
+                'p95': round(p95_latency, 1) if p95_latency is not None else None,
+            },
+            'quality': self.quality,
+            'max_fps': self.max_fps,
+        }
+        self.last_window_stats = stats
+
+        self._window_started_at = now
+        self._window = {k: 0 for k in window}
+        self._window_latencies = []
+
+        if (self.quality, self.max_fps) != old_settings and self._on_settings_change:
+            self._on_settings_change(self.quality, self.max_fps)
+        return stats
+
+    def summary(self) -> Dict:
+        """整个连接的累计统计"""
+        elapsed = max(0.001, time.monotonic() - self._started_at)
+        latencies = sorted(self._latencies)
+        return {
+            'frames_received': self.frames_received,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'bytes_sent': self.bytes_sent,
+            'avg_kbps': round(self.bytes_sent * 8 / 1000 / elapsed, 1),
+            'avg_latency_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+            'p95_latency_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else None,
+            'quality': self.quality,
+            'max_fps': self.max_fps,
+        }
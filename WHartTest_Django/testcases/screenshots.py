@@ -0,0 +1,143 @@
+"""
+测试用例截屏处理
+
+上传接口只保存原图并登记记录（processing_status=pending），由 Celery 任务完成后续处理：
+- 计算原图 SHA-256，同一用例同一步骤重复上传的相同截屏直接丢弃
+- 转码为 WebP（Pillow 不支持时为 JPEG）并生成缩略图
+- 转码结果按内容哈希命名，同一项目内相同内容只存一份，多条记录共享文件
+
+配置项：
+- TESTCASE_SCREENSHOT_FORMAT: 转码格式 WEBP / JPEG（默认 WEBP）
+- TESTCASE_SCREENSHOT_QUALITY: 转码质量（默认 85）
+- TESTCASE_SCREENSHOT_THUMBNAIL_SIZE: 缩略图最长边像素（默认 320）
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, features
+
+from .models import TestCaseScreenshot
+
+logger = logging.getLogger(__name__)
+
+_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def _output_format():
+    fmt = str(getattr(settings, 'TESTCASE_SCREENSHOT_FORMAT', 'WEBP')).upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt if fmt in _EXTENSIONS else 'JPEG'
+
+
+def _quality():
+    return int(getattr(settings, 'TESTCASE_SCREENSHOT_QUALITY', 85))
+
+
+def _thumbnail_size():
+    return int(getattr(settings, 'TESTCASE_SCREENSHOT_THUMBNAIL_SIZE', 320))
+
+
+def _encode(image, fmt):
+    if fmt == 'WEBP':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        options = {'quality': _quality(), 'method': 4}
+    else:
+        image = image.convert('RGB')
+        options = {'quality': _quality(), 'optimize': True}
+    output = io.BytesIO()
+    image.save(output, fmt, **options)
+    return output.getvalue()
+
+
+def _save_shared(storage, name, render):
+    """按内容哈希命名的文件已存在则直接复用，否则生成并写入"""
+    if storage.exists(name):
+        return name
+    return storage.save(name, ContentFile(render()))
+
+
+def process_screenshot(screenshot_id):
+    """
+    处理一张已上传的截屏
+
+    Returns:
+        str: ready（已处理）、duplicate（重复已丢弃）、failed（处理失败，保留原图）、
+             missing（记录不存在）或记录当前状态（已处理过）
+    """
+    try:
+        screenshot = TestCaseScreenshot.objects.select_related('test_case').get(pk=screenshot_id)
+    except TestCaseScreenshot.DoesNotExist:
+        return 'missing'
+    if screenshot.processing_status != 'pending':
+        return screenshot.processing_status
+
+    original = screenshot.screenshot
+    try:
+        with original.open('rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        duplicate = TestCaseScreenshot.objects.filter(
+            test_case_id=screenshot.test_case_id,
+            step_number=screenshot.step_number,
+            content_hash=content_hash,
+        ).exclude(pk=screenshot.pk).exists()
+        if duplicate:
+            logger.info(f"截屏 {screenshot.pk} 与用例 {screenshot.test_case_id} 已有截屏内容相同，丢弃")
+            screenshot.delete()
+            return 'duplicate'
+
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        fmt = _output_format()
+        ext = _EXTENSIONS[fmt]
+        base = f"testcase_screenshots/{screenshot.test_case.project_id}/{content_hash}"
+        storage = original.storage
+
+        def render_thumbnail():
+            thumbnail = image.copy()
+            size = _thumbnail_size()
+            thumbnail.thumbnail((size, size))
+            return _encode(thumbnail, fmt)
+
+        image_name = _save_shared(storage, f'{base}.{ext}', lambda: _encode(image, fmt))
+        thumbnail_name = _save_shared(storage, f'{base}_thumb.{ext}', render_thumbnail)
+    except Exception as e:
+        logger.error(f"处理截屏 {screenshot_id} 失败: {e}", exc_info=True)
+        TestCaseScreenshot.objects.filter(pk=screenshot_id).update(processing_status='failed')
+        return 'failed'
+
+    original_name = original.name
+    screenshot.content_hash = content_hash
+    screenshot.screenshot.name = image_name
+    screenshot.thumbnail.name = thumbnail_name
+    screenshot.processing_status = 'ready'
+    screenshot.save(update_fields=['content_hash', 'screenshot', 'thumbnail', 'processing_status'])
+
+    if original_name != image_name and not TestCaseScreenshot.is_file_referenced(original_name):
+        try:
+            storage.delete(original_name)
+        except Exception as e:
+            logger.warning(f"删除截屏原图 {original_name} 失败: {e}")
+    return 'ready'
+
+
+def enqueue_screenshot_processing(screenshot_ids):
+    """事务提交后投递处理任务；Celery 不可用时在当前进程内处理"""
+    from .tasks import process_testcase_screenshot
+
+    def enqueue():
+        for screenshot_id in screenshot_ids:
+            try:
+                process_testcase_screenshot.delay(screenshot_id)
+            except Exception as e:
+                logger.warning(f"投递截屏处理任务失败，改为同步处理: {e}")
+                process_screenshot(screenshot_id)
+
+    transaction.on_commit(enqueue)
@@ -12,14 +12,17 @@ import os
 import re
 import shutil
 import logging
+import time
 import uuid
 from pathlib import Path
-from typing import Optional, TYPE_CHECKING
+from typing import Callable, Optional, TYPE_CHECKING
 from datetime import datetime
 
 from django.utils import timezone
 from django.conf import settings
 
+from .script_runner_pool import ScriptRunnerPool, ScriptRunnerUnavailable
+
 if TYPE_CHECKING:
     from .models import ScriptExecution
 
@@ -115,7 +118,8 @@ class ScriptExecutor:
         script_content: str,
         use_pytest: bool = True,
         headless: bool = True,
-        record_video: bool = False
+        record_video: bool = False,
+        on_output: Optional[Callable[[str, str], None]] = None
     ) -> dict:
         """
         执行脚本并返回结果
@@ -125,6 +129,7 @@ class ScriptExecutor:
             use_pytest: 是否使用 pytest 执行
             headless: 是否无头模式
             record_video: 是否录制视频
+            on_output: 输出回调 on_output(stream_name, text)，预热执行池下逐行增量回调
         
         Returns:
             执行结果字典
@@ -173,33 +178,45 @@ class ScriptExecutor:
             logger.info(f"[ScriptExecutor] 执行命令: {' '.join(cmd)}")
             
             # 设置环境变量
-            env = os.environ.copy()
-            env['PLAYWRIGHT_HEADLESS'] = '1' if headless else '0'
-            env['PWDEBUG'] = '0'  # 禁用调试模式
-            env['PYTHONIOENCODING'] = 'utf-8'  # 解决 Windows GBK 编码问题
+            env_overrides = {
+                'PLAYWRIGHT_HEADLESS': '1' if headless else '0',
+                'PWDEBUG': '0',  # 禁用调试模式
+                'PYTHONIOENCODING': 'utf-8',  # 解决 Windows GBK 编码问题
+            }
             
             # 录屏目录（通过环境变量传递给脚本）
             video_dir = ''
             if record_video:
                 video_dir = str(Path(self.work_dir) / 'videos')
                 Path(video_dir).mkdir(parents=True, exist_ok=True)
-                env['PLAYWRIGHT_VIDEO_DIR'] = video_dir
+                env_overrides['PLAYWRIGHT_VIDEO_DIR'] = video_dir
                 logger.info(f"[ScriptExecutor] 录屏目录: {video_dir}")
             
             # 执行脚本
             start_time = datetime.now()
             logger.info(f"[ScriptExecutor] 开始执行, 超时时间: {self.timeout_seconds}秒")
             
-            process = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='replace',
-                timeout=self.timeout_seconds,
-                cwd=self.work_dir,
-                env=env
-            )
+            process = None
+            if ScriptRunnerPool.enabled():
+                process = self._run_in_pool(script_path, use_pytest, headless, env_overrides, on_output)
+            
+            if process is None:
+                env = os.environ.copy()
+                env.update(env_overrides)
+                # 等待预热进程的时间同样计入超时
+                remaining = self.timeout_seconds - (datetime.now() - start_time).total_seconds()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(cmd, self.timeout_seconds)
+                process = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    encoding='utf-8',
+                    errors='replace',
+                    timeout=remaining,
+                    cwd=self.work_dir,
+                    env=env
+                )
             
             end_time = datetime.now()
             
@@ -243,6 +260,33 @@ class ScriptExecutor:
         
         return result
     
+    def _run_in_pool(self, script_path: Path, use_pytest: bool, headless: bool, env_overrides: dict, on_output):
+        """
+        在预热执行池中运行脚本，返回带 returncode/stdout/stderr 的结果
+
+        执行进程无法启动或全部繁忙时返回 None，由调用方回退到一次性子进程。
+        """
+        try:
+            run_result = ScriptRunnerPool.run(
+                script_path=str(script_path),
+                cwd=self.work_dir,
+                use_pytest=use_pytest,
+                headless=headless,
+                env=env_overrides,
+                timeout=self.timeout_seconds,
+                on_output=on_output,
+            )
+        except ScriptRunnerUnavailable as e:
+            logger.warning(f"[ScriptExecutor] 预热执行池不可用，回退到子进程执行: {e}")
+            return None
+        
+        if run_result.timed_out:
+            raise subprocess.TimeoutExpired(str(script_path), self.timeout_seconds)
+        if run_result.returncode is None:
+            # 执行进程崩溃：输出中已附带进程 stderr
+            run_result.returncode = 1
+        return run_result
+    
     def _persist_screenshots(self) -> list:
         """
         将截图从临时目录移动到持久化的 media 目录
@@ -316,6 +360,32 @@ class ScriptExecutor:
             shutil.rmtree(self.work_dir, ignore_errors=True)
 
 
+class ExecutionOutputWriter:
+    """
+    执行输出增量回写 ScriptExecution.output（按时间节流），执行过程中即可查看进度
+    
+    作为 ScriptExecutor.execute_script 的 on_output 回调使用，只记录 stdout，
+    与执行完成后写入的 output 保持一致。
+    """
+    
+    FLUSH_INTERVAL_SECONDS = 1.0
+    
+    def __init__(self, execution):
+        self.execution_id = execution.pk
+        self._chunks = []
+        self._last_flush = 0.0
+    
+    def __call__(self, stream_name: str, text: str):
+        if stream_name != 'stdout':
+            return
+        self._chunks.append(text)
+        now = time.monotonic()
+        if now - self._last_flush >= self.FLUSH_INTERVAL_SECONDS:
+            self._last_flush = now
+            from .models import ScriptExecution
+            ScriptExecution.objects.filter(pk=self.execution_id).update(output=''.join(self._chunks))
+
+
 def _cleanup_old_executions(script, max_executions: int = 15):
     """
     清理旧的执行记录，只保留最新的 max_executions 条
@@ -432,7 +502,8 @@ def execute_automation_script(
             script_content=script.script_content,
             use_pytest=use_pytest,
             headless=headless if headless is not None else script.headless,
-            record_video=record_video
+            record_video=record_video,
+            on_output=ExecutionOutputWriter(execution)
         )
         
         # 更新执行记录
@@ -0,0 +1,327 @@
+"""
+自动化脚本预热执行池
+
+每次执行都新起 `python -m pytest` 需要付出解释器启动、导入 pytest/Playwright、
+启动浏览器的固定开销。这里维护少量常驻的 script_runner_worker.py 进程：
+- 进程启动时已导入 Playwright 并启动无头浏览器，每次执行使用全新的 BrowserContext
+- 执行输出逐行回传，通过 on_output 回调增量推送
+- 进程执行满 max_runs 次、超时或异常退出后回收，下次使用时重新启动
+"""
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = Path(__file__).parent / 'script_runner_worker.py'
+
+OutputCallback = Callable[[str, str], None]
+
+
+class ScriptRunnerUnavailable(RuntimeError):
+    """预热进程无法启动（调用方应回退到一次性子进程执行）"""
+
+
+class ScriptRunnerBusy(ScriptRunnerUnavailable):
+    """所有预热进程都在执行中，等待超过 SCRIPT_RUNNER_ACQUIRE_TIMEOUT（调用方同样回退到一次性子进程执行）"""
+
+
+@dataclass
+class ScriptRunResult:
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+
+
+class _RunnerWorker:
+    """单个常驻执行进程，同一时间只执行一个脚本"""
+
+    _EOF = object()
+
+    def __init__(self):
+        env = os.environ.copy()
+        env['PYTHONIOENCODING'] = 'utf-8'
+        self.proc = subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            env=env,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0,
+        )
+        self.runs = 0
+        self.last_used = time.monotonic()
+        self._messages: "queue.Queue" = queue.Queue()
+        self._stderr_tail: "deque[str]" = deque(maxlen=200)
+        threading.Thread(target=self._stdout_reader, name='script-runner-stdout', daemon=True).start()
+        threading.Thread(target=self._stderr_reader, name='script-runner-stderr', daemon=True).start()
+
+    def _stdout_reader(self):
+        for line in self.proc.stdout:
+            raw = line.strip()
+            if not raw:
+                continue
+            try:
+                self._messages.put(json.loads(raw))
+            except json.JSONDecodeError:
+                self._stderr_tail.append(raw)
+        self._messages.put(self._EOF)
+
+    def _stderr_reader(self):
+        for line in self.proc.stderr:
+            self._stderr_tail.append(line.rstrip('\n'))
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def wait_ready(self, timeout: float) -> None:
+        try:
+            message = self._messages.get(timeout=timeout)
+        except queue.Empty:
+            self.terminate(graceful=False)
+            raise ScriptRunnerUnavailable(f'执行进程启动超时（{timeout}秒）')
+        if message is self._EOF or message.get('type') != 'ready':
+            self.terminate()
+            raise ScriptRunnerUnavailable(f"执行进程启动失败: {self.stderr_tail()}")
+
+    def stderr_tail(self, lines: int = 50) -> str:
+        return '\n'.join(list(self._stderr_tail)[-lines:])
+
+    def run(
+        self,
+        script_path: str,
+        cwd: str,
+        use_pytest: bool,
+        headless: bool,
+        env: Dict[str, str],
+        timeout: float,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ScriptRunResult:
+        request_id = uuid.uuid4().hex
+        request = {
+            'id': request_id,
+            'script_path': script_path,
+            'cwd': cwd,
+            'use_pytest': use_pytest,
+            'headless': headless,
+            'env': env,
+        }
+        self.runs += 1
+        self.last_used = time.monotonic()
+        self.proc.stdin.write(json.dumps(request, ensure_ascii=False) + '\n')
+        self.proc.stdin.flush()
+
+        chunks: Dict[str, List[str]] = {'stdout': [], 'stderr': []}
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                message = self._messages.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                # 同步脚本无法中断，只能回收整个进程
+                self.terminate(graceful=False)
+                return ScriptRunResult(None, ''.join(chunks['stdout']), ''.join(chunks['stderr']), timed_out=True)
+
+            if message is self._EOF:
+                chunks['stderr'].append(f"\n执行进程异常退出:\n{self.stderr_tail()}")
+                return ScriptRunResult(None, ''.join(chunks['stdout']), ''.join(chunks['stderr']))
+            if message.get('id') != request_id:
+                continue
+
+            if message.get('type') == 'output':
+                stream = 'stderr' if message.get('stream') == 'stderr' else 'stdout'
+                data = message.get('data') or ''
+                chunks[stream].append(data)
+                if on_output:
+                    try:
+                        on_output(stream, data)
+                    except Exception as e:
+                        logger.debug(f"[ScriptRunnerPool] 输出回调失败: {e}")
+            elif message.get('type') == 'done':
+                self.last_used = time.monotonic()
+                return ScriptRunResult(message.get('returncode'), ''.join(chunks['stdout']), ''.join(chunks['stderr']))
+
+    def terminate(self, graceful: bool = True) -> None:
+        if self.proc.poll() is not None:
+            return
+        if not graceful:
+            self.proc.kill()
+        try:
+            # 关闭 stdin 后进程退出主循环并关闭浏览器
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            try:
+                self.proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                pass
+
+
+class ScriptRunnerPool:
+    """
+    进程内的预热执行池（每个 Django/Celery 进程各自一份）
+
+    配置项：
+    - SCRIPT_RUNNER_POOL_ENABLED: 是否启用（默认 True，关闭后每次执行新起子进程）
+    - SCRIPT_RUNNER_POOL_SIZE: 常驻进程数（默认 1）
+    - SCRIPT_RUNNER_POOL_MAX_RUNS: 单个进程最多执行次数，超过后回收（默认 50）
+    - SCRIPT_RUNNER_POOL_IDLE_TIMEOUT: 空闲超过该秒数的进程被回收（默认 600）
+    - SCRIPT_RUNNER_ACQUIRE_TIMEOUT: 等待空闲进程的最长秒数（默认 10），超过后抛出 ScriptRunnerBusy
+    """
+
+    READY_TIMEOUT = 60
+
+    _idle: List[_RunnerWorker] = []
+    _total = 0
+    _condition = threading.Condition()
+    _reaper_started = False
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, 'SCRIPT_RUNNER_POOL_ENABLED', True))
+
+    @staticmethod
+    def _size() -> int:
+        return max(1, int(getattr(settings, 'SCRIPT_RUNNER_POOL_SIZE', 1)))
+
+    @staticmethod
+    def _max_runs() -> int:
+        return max(1, int(getattr(settings, 'SCRIPT_RUNNER_POOL_MAX_RUNS', 50)))
+
+    @staticmethod
+    def _idle_timeout() -> int:
+        return max(30, int(getattr(settings, 'SCRIPT_RUNNER_POOL_IDLE_TIMEOUT', 600)))
+
+    @staticmethod
+    def _acquire_timeout() -> float:
+        return max(0.0, float(getattr(settings, 'SCRIPT_RUNNER_ACQUIRE_TIMEOUT', 10)))
+
+    @classmethod
+    def _ensure_reaper(cls) -> None:
+        with cls._condition:
+            if cls._reaper_started:
+                return
+            cls._reaper_started = True
+
+        def _loop():
+            while True:
+                time.sleep(30)
+                try:
+                    cls.reap_idle()
+                except Exception:
+                    pass
+
+        threading.Thread(target=_loop, name='script-runner-reaper', daemon=True).start()
+
+    @classmethod
+    def _acquire(cls, timeout: float) -> _RunnerWorker:
+        deadline = time.monotonic() + timeout
+        with cls._condition:
+            while True:
+                while cls._idle:
+                    worker = cls._idle.pop()
+                    if worker.is_alive():
+                        return worker
+                    cls._total -= 1
+                if cls._total < cls._size():
+                    cls._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ScriptRunnerBusy(f'{cls._size()} 个预热执行进程都在执行中，等待超过 {timeout} 秒')
+                cls._condition.wait(remaining)
+
+        # 在锁外启动新进程（导入 Playwright、启动浏览器需要数秒）
+        try:
+            worker = _RunnerWorker()
+            worker.wait_ready(cls.READY_TIMEOUT)
+        except Exception:
+            with cls._condition:
+                cls._total -= 1
+                cls._condition.notify()
+            raise
+        logger.info(f"[ScriptRunnerPool] 启动预热执行进程 pid={worker.proc.pid}")
+        return worker
+
+    @classmethod
+    def _release(cls, worker: _RunnerWorker) -> None:
+        recycle = not worker.is_alive() or worker.runs >= cls._max_runs()
+        if recycle:
+            worker.terminate()
+            logger.info(f"[ScriptRunnerPool] 回收执行进程 pid={worker.proc.pid}, 已执行 {worker.runs} 次")
+        with cls._condition:
+            if recycle:
+                cls._total -= 1
+            else:
+                cls._idle.append(worker)
+            cls._condition.notify()
+
+    @classmethod
+    def run(
+        cls,
+        script_path: str,
+        cwd: str,
+        use_pytest: bool,
+        headless: bool,
+        env: Dict[str, str],
+        timeout: float,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ScriptRunResult:
+        """
+        在预热进程中执行脚本，timeout 为整次执行的预算（包含等待空闲进程和启动进程的时间）
+
+        Raises:
+            ScriptRunnerUnavailable: 执行进程无法启动
+            ScriptRunnerBusy: 等待空闲进程超过 SCRIPT_RUNNER_ACQUIRE_TIMEOUT
+        """
+        cls._ensure_reaper()
+        deadline = time.monotonic() + timeout
+        worker = cls._acquire(min(cls._acquire_timeout(), timeout))
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return ScriptRunResult(None, '', '', timed_out=True)
+            return worker.run(script_path, cwd, use_pytest, headless, env, remaining, on_output)
+        finally:
+            cls._release(worker)
+
+    @classmethod
+    def reap_idle(cls) -> None:
+        """回收空闲过久的进程"""
+        now = time.monotonic()
+        with cls._condition:
+            stale = [w for w in cls._idle if now - w.last_used > cls._idle_timeout()]
+            for worker in stale:
+                cls._idle.remove(worker)
+                cls._total -= 1
+        for worker in stale:
+            worker.terminate()
+
+    @classmethod
+    def shutdown(cls) -> None:
+        with cls._condition:
+            workers, cls._idle = cls._idle, []
+            cls._total -= len(workers)
+        for worker in workers:
+            worker.terminate()
@@ -0,0 +1,322 @@
+"""
+自动化脚本预热执行进程 - 常驻进程版本
+
+由 script_runner_pool.ScriptRunnerPool 启动。启动时预先导入 pytest / Playwright 并
+启动无头浏览器，之后循环从 stdin 读取执行请求，每次执行都在全新的 BrowserContext 中进行。
+
+协议：stdin/stdout 行分隔 JSON
+请求：
+  { id, script_path, cwd, use_pytest, headless, env }
+响应：
+  { type: "ready" }
+  { id, type: "output", stream: "stdout" | "stderr", data }
+  { id, type: "done", returncode }
+
+脚本中的 sync_playwright() 会被替换为复用常驻浏览器的版本；browser.close()
+只关闭本次执行创建的 context。pytest 脚本的 browser/context/page fixture 同样由常驻浏览器提供。
+"""
+
+import io
+import json
+import os
+import runpy
+import sys
+import threading
+import traceback
+
+# 协议输出使用独立的 fd；fd 1 重定向到 stderr，防止脚本或子进程的原生输出破坏协议
+_protocol_fd = os.dup(1)
+os.dup2(2, 1)
+_protocol_lock = threading.Lock()
+
+# 常驻浏览器只覆盖这些 launch 参数，其余参数（channel、args、slow_mo 等）走真实 launch
+_WARM_LAUNCH_KWARGS = {'headless', 'timeout'}
+
+
+def send_message(msg_type: str, data: dict):
+    """发送消息到协议 fd"""
+    message = (json.dumps({'type': msg_type, **data}, ensure_ascii=False) + '\n').encode('utf-8')
+    with _protocol_lock:
+        os.write(_protocol_fd, message)
+
+
+class StreamWriter(io.TextIOBase):
+    """替换 sys.stdout/sys.stderr，按行把输出作为 output 消息推送"""
+
+    def __init__(self, request_id: str, stream: str):
+        self.request_id = request_id
+        self.stream = stream
+        self._buffer = ''
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+    def isatty(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        if not s:
+            return 0
+        self._buffer += s
+        if '\n' in self._buffer:
+            head, _, self._buffer = self._buffer.rpartition('\n')
+            send_message('output', {'id': self.request_id, 'stream': self.stream, 'data': head + '\n'})
+        return len(s)
+
+    def flush(self):
+        if self._buffer:
+            data, self._buffer = self._buffer, ''
+            send_message('output', {'id': self.request_id, 'stream': self.stream, 'data': data})
+
+
+class RunScope:
+    """单次执行期间创建的 context / 真实浏览器，执行结束后统一关闭"""
+
+    def __init__(self):
+        self.contexts = []
+        self.browsers = []
+
+    def close(self):
+        for context in self.contexts:
+            try:
+                context.close()
+            except Exception:
+                pass
+        for browser in self.browsers:
+            try:
+                browser.close()
+            except Exception:
+                pass
+        self.contexts.clear()
+        self.browsers.clear()
+
+
+class WarmBrowser:
+    """常驻浏览器代理：new_context/new_page 记录到本次执行，close() 只关闭这些 context"""
+
+    def __init__(self, browser, scope: RunScope):
+        self._browser = browser
+        self._scope = scope
+
+    def new_context(self, *args, **kwargs):
+        context = self._browser.new_context(*args, **kwargs)
+        self._scope.contexts.append(context)
+        return context
+
+    def new_page(self, *args, **kwargs):
+        return self.new_context(*args, **kwargs).new_page()
+
+    def close(self, *args, **kwargs):
+        self._scope.close()
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+
+class WarmBrowserType:
+    def __init__(self, runtime, name: str):
+        self._runtime = runtime
+        self._name = name
+        self._real = getattr(runtime.playwright, name)
+
+    def launch(self, *args, **kwargs):
+        if self._name == 'chromium' and not args and set(kwargs) <= _WARM_LAUNCH_KWARGS:
+            return self._runtime.warm_browser(kwargs.get('headless', True))
+        browser = self._real.launch(*args, **kwargs)
+        self._runtime.scope.browsers.append(browser)
+        return browser
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+class WarmPlaywright:
+    def __init__(self, runtime):
+        self._runtime = runtime
+        self.chromium = WarmBrowserType(runtime, 'chromium')
+        self.firefox = WarmBrowserType(runtime, 'firefox')
+        self.webkit = WarmBrowserType(runtime, 'webkit')
+
+    def stop(self):
+        self._runtime.scope.close()
+
+    def __getattr__(self, name):
+        return getattr(self._runtime.playwright, name)
+
+
+class WarmPlaywrightContextManager:
+    """替代 sync_playwright() 的返回值，支持 with 语句和 start()/stop()"""
+
+    def __init__(self, runtime):
+        self._playwright = WarmPlaywright(runtime)
+
+    def start(self):
+        return self._playwright
+
+    def __enter__(self):
+        return self._playwright
+
+    def __exit__(self, *exc):
+        self._playwright.stop()
+
+
+class Runtime:
+    """常驻的 Playwright 实例与浏览器"""
+
+    def __init__(self):
+        from playwright.sync_api import sync_playwright
+        import playwright.sync_api as sync_api_module
+
+        self.sync_api_module = sync_api_module
+        self.original_sync_playwright = sync_api_module.sync_playwright
+        self.playwright = sync_playwright().start()
+        self.browsers = {}
+        self.scope = RunScope()
+
+    def browser(self, headless: bool):
+        browser = self.browsers.get(headless)
+        if browser is None or not browser.is_connected():
+            browser = self.playwright.chromium.launch(headless=headless)
+            self.browsers[headless] = browser
+        return browser
+
+    def warm_browser(self, headless: bool) -> WarmBrowser:
+        return WarmBrowser(self.browser(headless), self.scope)
+
+    def default_context_options(self) -> dict:
+        options = {}
+        video_dir = os.environ.get('PLAYWRIGHT_VIDEO_DIR', '')
+        if video_dir:
+            options['record_video_dir'] = video_dir
+            options['record_video_size'] = {'width': 1280, 'height': 720}
+        return options
+
+    def patch(self):
+        self.sync_api_module.sync_playwright = lambda: WarmPlaywrightContextManager(self)
+
+    def unpatch(self):
+        self.sync_api_module.sync_playwright = self.original_sync_playwright
+
+
+def make_pytest_plugin(runtime: Runtime, headless: bool):
+    """为 pytest 脚本提供 browser/context/page fixture（替代 pytest-playwright）"""
+    import pytest
+
+    class WarmBrowserPlugin:
+        @pytest.fixture(scope='session')
+        def browser(self):
+            return runtime.warm_browser(headless)
+
+        @pytest.fixture
+        def context(self, browser):
+            return browser.new_context(**runtime.default_context_options())
+
+        @pytest.fixture
+        def page(self, context):
+            return context.new_page()
+
+    return WarmBrowserPlugin()
+
+
+def run_request(runtime: Runtime, request: dict) -> int:
+    request_id = request['id']
+    script_path = request['script_path']
+    cwd = request.get('cwd') or os.path.dirname(script_path)
+    headless = bool(request.get('headless', True))
+
+    saved_env = {k: os.environ.get(k) for k in (request.get('env') or {})}
+    saved_cwd = os.getcwd()
+    saved_modules = set(sys.modules)
+    saved_stdout, saved_stderr = sys.stdout, sys.stderr
+    stdout = StreamWriter(request_id, 'stdout')
+    stderr = StreamWriter(request_id, 'stderr')
+
+    for key, value in (request.get('env') or {}).items():
+        os.environ[key] = str(value)
+    os.chdir(cwd)
+    sys.stdout, sys.stderr = stdout, stderr
+    runtime.patch()
+
+    returncode = 0
+    try:
+        if request.get('use_pytest'):
+            import pytest
+            returncode = int(pytest.main(
+                [
+                    script_path, '-v', '--tb=short',
+                    '--import-mode=importlib',
+                    '-p', 'no:cacheprovider',
+                    '-p', 'no:playwright',
+                ],
+                plugins=[make_pytest_plugin(runtime, headless)],
+            ))
+        else:
+            runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        runtime.unpatch()
+        runtime.scope.close()
+        stdout.flush()
+        stderr.flush()
+        sys.stdout, sys.stderr = saved_stdout, saved_stderr
+        os.chdir(saved_cwd)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        # 卸载脚本目录下导入的模块，下次执行重新导入
+        for name in set(sys.modules) - saved_modules:
+            module_file = getattr(sys.modules.get(name), '__file__', None) or ''
+            if module_file.startswith(cwd):
+                sys.modules.pop(name, None)
+
+    return returncode
+
+
+def main():
+    runtime = Runtime()
+    try:
+        runtime.browser(True)
+    except Exception as e:
+        # 预热失败不影响进程可用，首次执行时再尝试启动
+        print(f'[script_runner_worker] 预启动浏览器失败: {e}', file=sys.stderr)
+    send_message('ready', {'pid': os.getpid()})
+
+    for line in sys.stdin:
+        raw = line.strip()
+        if not raw:
+            continue
+        try:
+            request = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(request, dict) or not request.get('id'):
+            continue
+        returncode = run_request(runtime, request)
+        send_message('done', {'id': request['id'], 'returncode': returncode})
+
+    for browser in runtime.browsers.values():
+        try:
+            browser.close()
+        except Exception:
+            pass
+    runtime.playwright.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ from .models import (
 from projects.models import Project # 确保导入Project模型以便进行校验
 from accounts.serializers import UserDetailSerializer # 用于显示创建者信息
 from django.db import transaction
+from django.db.models import Max
 
 class TestCaseStepSerializer(serializers.ModelSerializer):
     """
@@ -198,9 +199,13 @@ class TestCaseModuleSerializer(serializers.ModelSerializer):
     def get_testcase_count(self, obj):
         """
         计算模块下的用例数量（包含所有子模块的用例）
+
+        列表接口的查询集已通过 annotate_subtree_testcase_count 注解，直接读取注解值
         """
-        all_module_ids = obj.get_all_descendant_ids()
-        return TestCase.objects.filter(module_id__in=all_module_ids).count()
+        annotated = getattr(obj, 'subtree_testcase_count', None)
+        if annotated is not None:
+            return annotated
+        return TestCase.objects.filter(project_id=obj.project_id, module__path__startswith=obj.path).count()
 
     def validate(self, attrs):
         """验证模块数据"""
@@ -229,12 +234,14 @@ class TestCaseModuleSerializer(serializers.ModelSerializer):
             if parent.id == self.instance.id:
                 raise serializers.ValidationError({"parent": "父模块不能是自己"})
 
-            # 检查是否会形成循环引用
-            current_parent = parent
-            while current_parent:
-                if current_parent.parent_id == self.instance.id:
-                    raise serializers.ValidationError({"parent": "不能选择自己的子模块作为父模块"})
-                current_parent = current_parent.parent
+            # 检查是否会形成循环引用（父模块路径包含当前模块即为其后代）
+            if self.instance.path and parent.path.startswith(self.instance.path):
+                raise serializers.ValidationError({"parent": "不能选择自己的子模块作为父模块"})
+
+            # 验证移动后整个子树不超过5级
+            subtree_depth = self.instance.get_descendants().aggregate(depth=Max('level'))['depth'] or self.instance.level
+            if parent.level + 1 + subtree_depth - self.instance.level > 5:
+                raise serializers.ValidationError({"parent": "移动后模块级别不能超过5级"})
 
         return attrs
 
@@ -270,6 +277,8 @@ class TestCaseScreenshotSerializer(serializers.ModelSerializer):
     
     # 用于“读”操作：显示相对 URL
     screenshot_url = serializers.CharField(source='screenshot.url', read_only=True)
+    # 列表展示用缩略图，后台处理完成前返回原图
+    thumbnail_url = serializers.SerializerMethodField()
     
     # 用于“写”操作：接收上传的文件
     screenshot = serializers.ImageField(write_only=True, required=False)
@@ -280,11 +289,17 @@ class TestCaseScreenshotSerializer(serializers.ModelSerializer):
             'id', 'test_case',
             'screenshot',       # 用于上传
             'screenshot_url',   # 用于显示
+            'thumbnail_url',    # 用于列表展示
             'title', 'description',
             'step_number', 'created_at', 'mcp_session_id', 'page_url',
-            'uploader', 'uploader_detail'
+            'processing_status', 'uploader', 'uploader_detail'
+        ]
+        read_only_fields = [
+            'id', 'created_at', 'uploader', 'uploader_detail', 'screenshot_url', 'thumbnail_url', 'processing_status'
         ]
-        read_only_fields = ['id', 'created_at', 'uploader', 'uploader_detail', 'screenshot_url']
+
+    def get_thumbnail_url(self, obj):
+        return (obj.thumbnail or obj.screenshot).url
 
     def create(self, validated_data):
         """创建截屏时自动设置上传人"""
@@ -334,11 +349,17 @@ class TestSuiteSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'project', 'creator', 'creator_detail', 'created_at', 'updated_at']
     
     def get_testcase_count(self, obj):
-        """获取套件中的用例数量"""
+        """获取套件中的用例数量（列表查询集由 with_suite_relations 注解）"""
+        annotated = getattr(obj, 'testcase_count', None)
+        if annotated is not None:
+            return annotated
         return obj.testcases.count()
     
     def get_script_count(self, obj):
         """获取套件中的脚本数量"""
+        annotated = getattr(obj, 'script_count', None)
+        if annotated is not None:
+            return annotated
         return obj.automation_scripts.count()
     
     def get_scripts_detail(self, obj):
@@ -450,10 +471,13 @@ class TestSuiteSerializer(serializers.ModelSerializer):
         instance.max_concurrent_tasks = validated_data.get('max_concurrent_tasks', instance.max_concurrent_tasks)
         instance.save()
         
+        # 关联变化后列表查询集注解的数量已过期，置空后序列化时重新计数
         if testcases is not None:
             instance.testcases.set(testcases)
+            instance.testcase_count = None
         if scripts is not None:
             instance.automation_scripts.set(scripts)
+            instance.script_count = None
         
         return instance
 
@@ -531,13 +555,13 @@ class TestExecutionSerializer(serializers.ModelSerializer):
             'started_at', 'completed_at', 'total_count', 'passed_count',
             'failed_count', 'skipped_count', 'error_count', 'celery_task_id',
             'duration', 'pass_rate', 'results', 'script_results',
-            'generate_playwright_script', 'created_at', 'updated_at'
+            'generate_playwright_script', 'parent', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'status', 'started_at', 'completed_at',
             'total_count', 'passed_count', 'failed_count', 'skipped_count',
             'error_count', 'celery_task_id', 'duration', 'pass_rate',
-            'created_at', 'updated_at'
+            'parent', 'created_at', 'updated_at'
         ]
 
 
@@ -591,7 +615,16 @@ class AutomationScriptSerializer(serializers.ModelSerializer):
         ]
     
     def get_latest_execution(self, obj):
-        """获取最近一次执行记录"""
+        """获取最近一次执行记录（列表查询集由 annotate_script_execution_summary 注解）"""
+        if hasattr(obj, 'latest_execution_id'):
+            if obj.latest_execution_id is None:
+                return None
+            return {
+                'id': obj.latest_execution_id,
+                'status': obj.latest_execution_status,
+                'created_at': obj.latest_execution_created_at,
+                'execution_time': obj.latest_execution_time
+            }
         execution = obj.executions.order_by('-created_at').first()
         if execution:
             return {
@@ -604,6 +637,9 @@ class AutomationScriptSerializer(serializers.ModelSerializer):
     
     def get_execution_count(self, obj):
         """获取执行次数"""
+        annotated = getattr(obj, 'execution_count', None)
+        if annotated is not None:
+            return annotated
         return obj.executions.count()
 
 
@@ -623,6 +659,8 @@ class AutomationScriptListSerializer(serializers.ModelSerializer):
     
     def get_latest_status(self, obj):
         """获取最近执行状态"""
+        if hasattr(obj, 'latest_execution_status'):
+            return obj.latest_execution_status
         execution = obj.executions.order_by('-created_at').first()
         return execution.status if execution else None
 
@@ -4,9 +4,11 @@
 import logging
 import asyncio
 import re
+import time
 from celery import shared_task
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import F
 from datetime import datetime
 from typing import Dict, Any
 from django.conf import settings
@@ -18,17 +20,33 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import TestExecution, TestSuite, TestCaseResult, TestCase, ScriptExecution
 from prompts.models import UserPrompt, PromptType
-from asgiref.sync import sync_to_async
+from projects.statistics import record_increment
+from asgiref.sync import async_to_sync, sync_to_async
 from .script_executor import execute_automation_script
+from wharttest_django.concurrency import acquire_slot, release_slot
+from wharttest_django.scheduling import ScheduledTask
+from wharttest_django.signalling import signal_backend, watch_signal
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, name='testcases.execute_test_suite')
+def _suite_fair_share(task, execution_id):
+    """套件执行的公平份额归属：执行人与项目"""
+    owner = TestExecution.objects.filter(id=execution_id).values('executor_id', 'suite__project_id').first() or {}
+    return {'user': owner.get('executor_id'), 'project': owner.get('suite__project_id')}
+
+
+@shared_task(bind=True, name='testcases.execute_test_suite', base=ScheduledTask,
+             workload='batch', fair_share=_suite_fair_share, acks_late=True, reject_on_worker_lost=True)
 def execute_test_suite(self, execution_id):
     """
     执行测试套件的异步任务
     
+    可恢复执行：执行记录已有结果记录时（worker 重启后重新投递、续跑、手动恢复、仅重跑失败用例），
+    只执行仍处于 pending / running 状态的用例和脚本，已结束的结果保持不变。
+    单次任务执行超过 TEST_SUITE_CHECKPOINT_SECONDS 后不再调度新的用例，等进行中的用例结束后
+    投递新的任务继续执行，避免长套件触发任务超时后从头开始。
+    
     Args:
         execution_id: TestExecution实例的ID
         
@@ -40,63 +58,73 @@ def execute_test_suite(self, execution_id):
         execution = TestExecution.objects.select_related('suite').get(id=execution_id)
         suite = execution.suite
         
-        logger.info(f"开始执行测试套件: {suite.name} (ID: {suite.id})")
+        if execution.status in ('completed', 'cancelled'):
+            logger.info(f"测试执行 {execution_id} 已结束（{execution.status}），忽略重复投递")
+            return _execution_summary(execution)
+        
+        resuming = execution.results.exists() or execution.script_results.exists()
+        logger.info(f"{'继续' if resuming else '开始'}执行测试套件: {suite.name} (ID: {suite.id})")
         
         # 更新执行状态为运行中
         execution.status = 'running'
-        execution.started_at = timezone.now()
+        execution.started_at = execution.started_at or timezone.now()
+        execution.completed_at = None
         execution.celery_task_id = self.request.id
-        execution.save(update_fields=['status', 'started_at', 'celery_task_id', 'updated_at'])
-        
-        # 1. 获取套件中的所有测试用例
-        testcases = suite.testcases.all().order_by('level', 'id')  # 按优先级排序
+        execution.save(update_fields=['status', 'started_at', 'completed_at', 'celery_task_id', 'updated_at'])
         
-        # 2. 获取套件中的所有自动化脚本
-        scripts = suite.automation_scripts.all().order_by('id')
-        
-        # 更新总数
-        execution.total_count = testcases.count() + scripts.count()
-        execution.save(update_fields=['total_count', 'updated_at'])
+        if resuming:
+            # 从中断处继续：统计按已结束的结果重新汇总，只执行未结束的记录
+            results, script_executions = _unfinished_result_rows(execution)
+            # 通过 save 写入，项目统计按新旧差值同步（仅重跑失败用例时复制的通过结果也会计入）
+            counts = _aggregate_execution_counts(execution.id)
+            execution.total_count = execution.results.count() + execution.script_results.count()
+            for field, value in counts.items():
+                setattr(execution, field, value)
+            execution.save(update_fields=['total_count', *counts, 'updated_at'])
+            logger.info(f"测试执行 {execution.id} 剩余 {len(results) + len(script_executions)} 个任务")
+        else:
+            # 1. 获取套件中的所有测试用例
+            testcases = suite.testcases.all().order_by('level', 'id')  # 按优先级排序
+            
+            # 2. 获取套件中的所有自动化脚本
+            scripts = suite.automation_scripts.all().order_by('id')
+            
+            # 更新总数
+            execution.total_count = testcases.count() + scripts.count()
+            execution.save(update_fields=['total_count', 'updated_at'])
+            
+            # 批量创建所有待执行任务的结果记录
+            results, script_executions = _create_result_rows(execution, testcases, scripts)
         
-        # 收集所有待执行的任务
-        all_tasks = []
+        # 分布式模式：每个用例/脚本作为独立任务分发到各个 worker
+        if getattr(settings, 'TEST_SUITE_DISTRIBUTED_EXECUTION', False):
+            dispatched = _dispatch_suite_shards(execution, results, script_executions)
+            if dispatched.get('status') == 'dispatched':
+                # 套件的公平份额保留到 finalize_test_execution，分片执行期间续租
+                self.hold_fair_share()
+            return dispatched
         
-        # 为每个测试用例创建结果记录
-        for testcase in testcases:
-            result = TestCaseResult.objects.create(
-                execution=execution,
-                testcase=testcase,
-                status='pending'
-            )
-            all_tasks.append(result)
-            
-        # 为每个自动化脚本创建执行记录
-        for script in scripts:
-            script_exec = ScriptExecution.objects.create(
-                script=script,
-                test_execution=execution,
-                executor=execution.executor,
-                status='pending',
-                browser_type='chromium'
-            )
-            all_tasks.append(script_exec)
+        all_tasks = results + script_executions
         
         # 获取并发配置
         max_concurrent = suite.max_concurrent_tasks
         logger.info(f"并发配置: {max_concurrent} 个任务同时执行")
         
-        # 使用asyncio执行并发测试
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(
-                _execute_tasks_concurrently(execution, all_tasks, max_concurrent)
-            )
-        finally:
-            loop.close()
+        checkpoint = getattr(settings, 'TEST_SUITE_CHECKPOINT_SECONDS', 0)
+        deadline = time.monotonic() + checkpoint if checkpoint else None
+        
+        # 使用asyncio执行并发测试（async_to_sync 让数据库操作回到当前线程，复用 worker 的数据库连接）
+        async_to_sync(_execute_tasks_concurrently)(execution, all_tasks, max_concurrent, deadline)
+        
+        # 重新加载：计数由 F() 自增、状态可能已被取消，内存中的实例已过期
+        execution = TestExecution.objects.select_related('suite').get(id=execution.id)
+        if execution.status != 'cancelled' and _has_unfinished_rows(execution):
+            # 到达检查点：由新的任务继续执行剩余用例
+            continuation = execute_test_suite.apply_async(args=[execution.id])
+            logger.info(f"测试执行 {execution.id} 到达检查点，由任务 {continuation.id} 继续执行")
+            return {**_execution_summary(execution), 'continued_by': continuation.id}
         
         # 更新执行记录为已完成
-        execution.refresh_from_db()
         execution.status = 'completed' if execution.status != 'cancelled' else 'cancelled'
         execution.completed_at = timezone.now()
         execution.save(update_fields=['status', 'completed_at', 'updated_at'])
@@ -107,18 +135,7 @@ def execute_test_suite(self, execution_id):
                    f"错误: {execution.error_count}, "
                    f"跳过: {execution.skipped_count}")
         
-        return {
-            'execution_id': execution.id,
-            'suite_name': suite.name,
-            'status': execution.status,
-            'total': execution.total_count,
-            'passed': execution.passed_count,
-            'failed': execution.failed_count,
-            'skipped': execution.skipped_count,
-            'error': execution.error_count,
-            'pass_rate': execution.pass_rate,
-            'duration': execution.duration
-        }
+        return _execution_summary(execution)
         
     except TestExecution.DoesNotExist:
         error_msg = f"测试执行记录不存在: {execution_id}"
@@ -141,6 +158,129 @@ def execute_test_suite(self, execution_id):
         return {'error': error_msg}
 
 
+def _create_result_rows(execution, testcases, scripts):
+    """为套件中的用例和脚本批量创建待执行的结果记录"""
+    results = TestCaseResult.objects.bulk_create([
+        TestCaseResult(execution=execution, testcase=testcase, status='pending')
+        for testcase in testcases
+    ])
+    script_executions = ScriptExecution.objects.bulk_create([
+        ScriptExecution(
+            script=script,
+            test_execution=execution,
+            executor=execution.executor,
+            status='pending',
+            browser_type='chromium'
+        )
+        for script in scripts
+    ])
+    return results, script_executions
+
+
+# 未结束的结果状态（中断时处于 running 的用例需要重新执行）
+UNFINISHED_STATUSES = ('pending', 'running')
+
+
+def _unfinished_result_rows(execution):
+    """取出未结束的结果记录并重置为 pending，用于从中断处继续执行"""
+    results = list(
+        execution.results.filter(status__in=UNFINISHED_STATUSES)
+        .select_related('testcase').order_by('testcase__level', 'id')
+    )
+    script_executions = list(
+        execution.script_results.filter(status__in=UNFINISHED_STATUSES)
+        .select_related('script').order_by('id')
+    )
+    for rows in (results, script_executions):
+        interrupted = [row.id for row in rows if row.status == 'running']
+        if interrupted:
+            rows[0].__class__.objects.filter(id__in=interrupted).update(status='pending', started_at=None)
+            for row in rows:
+                row.status = 'pending'
+                row.started_at = None
+    return results, script_executions
+
+
+def _has_unfinished_rows(execution):
+    return (
+        execution.results.filter(status__in=UNFINISHED_STATUSES).exists()
+        or execution.script_results.filter(status__in=UNFINISHED_STATUSES).exists()
+    )
+
+
+def is_resumable(execution):
+    """
+    执行是否可以从中断处继续：有未结束的结果记录，且执行已失败，
+    或执行中/等待中但超过 TEST_SUITE_STALE_SECONDS 没有进展（worker 被杀或重启后任务丢失）
+    """
+    if execution.status == 'failed':
+        return _has_unfinished_rows(execution)
+    if execution.status in UNFINISHED_STATUSES:
+        stale = getattr(settings, 'TEST_SUITE_STALE_SECONDS', settings.CELERY_TASK_TIME_LIMIT)
+        if (timezone.now() - execution.updated_at).total_seconds() >= stale:
+            return _has_unfinished_rows(execution)
+    return False
+
+
+def create_rerun_execution(parent, executor):
+    """
+    仅重跑失败用例：创建子执行记录，复制原执行中通过的结果，其余用例和脚本置为 pending
+    
+    子执行由 execute_test_suite 按已有结果记录继续执行，只会执行 pending 的部分
+    """
+    with transaction.atomic():
+        execution = TestExecution.objects.create(
+            suite=parent.suite,
+            executor=executor,
+            status='pending',
+            generate_playwright_script=parent.generate_playwright_script,
+            parent=parent
+        )
+        results = []
+        for result in parent.results.all().order_by('id'):
+            if result.status == 'pass':
+                result.pk = None
+                result.execution = execution
+            else:
+                result = TestCaseResult(execution=execution, testcase_id=result.testcase_id, status='pending')
+            results.append(result)
+        script_executions = []
+        for script_execution in parent.script_results.all().order_by('id'):
+            if script_execution.status == 'pass':
+                script_execution.pk = None
+                script_execution.test_execution = execution
+            else:
+                script_execution = ScriptExecution(
+                    script_id=script_execution.script_id,
+                    test_execution=execution,
+                    executor=executor,
+                    status='pending',
+                    browser_type=script_execution.browser_type
+                )
+            script_executions.append(script_execution)
+        TestCaseResult.objects.bulk_create(results)
+        ScriptExecution.objects.bulk_create(script_executions)
+        execution.total_count = len(results) + len(script_executions)
+        execution.save(update_fields=['total_count', 'updated_at'])
+    return execution
+
+
+def _execution_summary(execution):
+    """执行结果摘要"""
+    return {
+        'execution_id': execution.id,
+        'suite_name': execution.suite.name,
+        'status': execution.status,
+        'total': execution.total_count,
+        'passed': execution.passed_count,
+        'failed': execution.failed_count,
+        'skipped': execution.skipped_count,
+        'error': execution.error_count,
+        'pass_rate': execution.pass_rate,
+        'duration': execution.duration
+    }
+
+
 def execute_single_testcase(result: TestCaseResult):
     """
     执行单个测试用例 - 通过对话API驱动测试执行
@@ -181,7 +321,7 @@ def execute_single_testcase(result: TestCaseResult):
         raise
 
 
-async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
+async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent, deadline=None):
     """
     并发执行测试任务（包括用例和脚本）
     
@@ -189,85 +329,319 @@ async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
         execution: TestExecution实例
         tasks_list: TestCaseResult 或 ScriptExecution 列表
         max_concurrent: 最大并发数
+        deadline: time.monotonic() 检查点，过后不再调度新的任务（保持 pending，由后续任务继续）
     """
     import asyncio
     
     # 使用信号量控制并发数
     semaphore = asyncio.Semaphore(max_concurrent)
+    # 进程内信号后端收不到 web 进程发出的取消信号（未配置 Redis），此时仍逐个任务查询执行状态
+    check_status = not signal_backend().shared
+    
+    async def is_cancelled(cancelled):
+        if cancelled.is_set():
+            return True
+        if check_status:
+            status = await TestExecution.objects.filter(id=execution.id).values_list('status', flat=True).afirst()
+            return status == 'cancelled'
+        return False
     
-    async def execute_with_semaphore(task_obj):
+    async def execute_with_semaphore(task_obj, cancelled):
         """带信号量控制的执行函数"""
         async with semaphore:
-            # 检查是否已取消
-            current_execution = await sync_to_async(TestExecution.objects.get)(id=execution.id)
-            if current_execution.status == 'cancelled':
+            # 检查是否已取消（跨进程信号后端由订阅推送，无需逐个任务查库）
+            if await is_cancelled(cancelled):
                 task_name = getattr(task_obj, 'testcase', getattr(task_obj, 'script', task_obj)).name
                 logger.info(f"测试执行已取消，跳过任务: {task_name}")
                 return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
             
-            try:
-                # 更新状态为执行中
-                task_obj.status = 'running'
-                task_obj.started_at = timezone.now()
-                await sync_to_async(task_obj.save)()
-                
-                # 根据任务类型调用不同的执行逻辑
-                if isinstance(task_obj, TestCaseResult):
-                    # 执行测试用例
-                    await _execute_testcase_via_chat_api(task_obj)
-                    task_name = task_obj.testcase.name
-                elif isinstance(task_obj, ScriptExecution):
-                    # 执行自动化脚本
-                    await _execute_script_task(task_obj)
-                    task_name = task_obj.script.name
-                else:
-                    raise ValueError(f"未知的任务类型: {type(task_obj)}")
-                
-                logger.info(f"任务执行成功: {task_name}")
-                
-                # 刷新状态
-                await sync_to_async(task_obj.refresh_from_db)()
-                
-                # 统一状态映射
-                status_map = {
-                    'pass': 'pass', 'passed': 'pass',
-                    'fail': 'fail', 'failed': 'fail',
-                    'skip': 'skip', 'skipped': 'skip',
-                    'error': 'error'
-                }
-                normalized_status = status_map.get(task_obj.status, 'error')
-                
-                # 更新统计（使用原子操作避免竞态）
-                await sync_to_async(_update_execution_counts)(execution, normalized_status)
-                
-            except Exception as e:
-                task_name = "Unknown"
-                if hasattr(task_obj, 'testcase'):
-                    task_name = task_obj.testcase.name
-                elif hasattr(task_obj, 'script'):
-                    task_name = task_obj.script.name
-                    
-                error_msg = f"并发执行任务失败: {str(e)}"
-                logger.error(f"{error_msg} - {task_name}", exc_info=True)
-                
-                # 更新状态为错误
-                task_obj.status = 'error'
-                task_obj.error_message = error_msg
-                task_obj.completed_at = timezone.now()
-                
-                if task_obj.started_at and task_obj.completed_at:
-                    task_obj.execution_time = (task_obj.completed_at - task_obj.started_at).total_seconds()
-                
-                await sync_to_async(task_obj.save)()
-                
-                # 更新错误计数
-                await sync_to_async(_update_execution_counts)(execution, 'error')
+            await _execute_task(execution, task_obj)
     
-    # 创建所有任务
-    async_tasks = [execute_with_semaphore(task) for task in tasks_list]
+    async with watch_signal(_cancel_signal_name(execution.id)) as cancelled:
+        # 创建所有任务
+        async_tasks = [execute_with_semaphore(task, cancelled) for task in tasks_list]
+        
+        # 并发执行所有任务
+        await asyncio.gather(*async_tasks, return_exceptions=True)
+
+
+# 用例/脚本执行状态到执行统计的映射
+_STATUS_MAP = {
+    'pass': 'pass', 'passed': 'pass',
+    'fail': 'fail', 'failed': 'fail',
+    'skip': 'skip', 'skipped': 'skip',
+    'error': 'error'
+}
+
+
+async def _execute_task(execution, task_obj):
+    """执行单个用例或脚本，并更新执行统计"""
+    try:
+        # 更新状态为执行中
+        task_obj.status = 'running'
+        task_obj.started_at = timezone.now()
+        await sync_to_async(task_obj.save)()
+        
+        # 根据任务类型调用不同的执行逻辑
+        if isinstance(task_obj, TestCaseResult):
+            # 执行测试用例
+            await _execute_testcase_via_chat_api(task_obj)
+            task_name = task_obj.testcase.name
+        elif isinstance(task_obj, ScriptExecution):
+            # 执行自动化脚本
+            await _execute_script_task(task_obj)
+            task_name = task_obj.script.name
+        else:
+            raise ValueError(f"未知的任务类型: {type(task_obj)}")
+        
+        logger.info(f"任务执行成功: {task_name}")
+        
+        # 刷新状态
+        await sync_to_async(task_obj.refresh_from_db)()
+        
+        # 统一状态映射
+        normalized_status = _STATUS_MAP.get(task_obj.status, 'error')
+        
+        # 更新统计（使用原子操作避免竞态）
+        await sync_to_async(_update_execution_counts)(execution, normalized_status)
+        
+    except Exception as e:
+        task_name = "Unknown"
+        if hasattr(task_obj, 'testcase'):
+            task_name = task_obj.testcase.name
+        elif hasattr(task_obj, 'script'):
+            task_name = task_obj.script.name
+            
+        error_msg = f"并发执行任务失败: {str(e)}"
+        logger.error(f"{error_msg} - {task_name}", exc_info=True)
+        
+        # 更新状态为错误
+        task_obj.status = 'error'
+        task_obj.error_message = error_msg
+        task_obj.completed_at = timezone.now()
+        
+        if task_obj.started_at and task_obj.completed_at:
+            task_obj.execution_time = (task_obj.completed_at - task_obj.started_at).total_seconds()
+        
+        await sync_to_async(task_obj.save)()
+        
+        # 更新错误计数
+        await sync_to_async(_update_execution_counts)(execution, 'error')
+
+
+def _cancel_signal_name(execution_id):
+    return f'test-execution-cancel:{execution_id}'
+
+
+def signal_execution_cancel(execution_id):
+    """通知执行该测试的 worker 停止调度剩余任务（跨进程）"""
+    return signal_backend().set(_cancel_signal_name(execution_id))
+
+
+# ---------------------------------------------------------------------------
+# 分布式执行（TEST_SUITE_DISTRIBUTED_EXECUTION=True）
+#
+# 结果记录批量创建后，每个用例/脚本作为一个 execute_suite_shard 任务分发：
+# - 套件级并发：分片按 max_concurrent_tasks 分成若干条链（chain），链内串行、链间并行
+# - 全局并发：所有套件的分片共享 TEST_SUITE_MAX_RUNNING_SHARDS 个名额，拿不到名额的分片稍后重试
+# - 全部分片结束后由 chord 回调 finalize_test_execution 按结果记录汇总统计
+# - 分片异常结束（硬超时、撤销等）时链中断、chord 回调不会执行，改由回调的 errback
+#   recover_test_execution 标记异常分片并重新分发剩余记录；worker 丢失时分片重新投递（reject_on_worker_lost）
+# - 取消时撤销尚未执行的分片（shard_task_ids）
+# - 公平份额：execute_test_suite 分发后保留套件的名额，分片执行期间续租，执行结束时释放
+# ---------------------------------------------------------------------------
+
+SHARD_SLOT_NAME = 'test-suite-shards'
+
+_SHARD_MODELS = {
+    'testcase': TestCaseResult,
+    'script': ScriptExecution,
+}
+
+
+def _dispatch_suite_shards(execution, results, script_executions):
+    """为待执行的结果记录分发分片任务"""
+    from celery import chain, chord
+
+    shards = [('testcase', result.id) for result in results]
+    shards += [('script', script_execution.id) for script_execution in script_executions]
+
+    if not shards:
+        return finalize_test_execution(execution.id)
+
+    lane_count = max(1, min(execution.suite.max_concurrent_tasks or 1, len(shards)))
+    lanes = [[] for _ in range(lane_count)]
+    for index, (kind, object_id) in enumerate(shards):
+        # 预先分配任务ID，取消时据此撤销
+        lanes[index % lane_count].append(
+            execute_suite_shard.si(execution.id, kind, object_id).set(task_id=str(uuid.uuid4()))
+        )
+    shard_task_ids = [signature.options['task_id'] for lane in lanes for signature in lane]
+    TestExecution.objects.filter(id=execution.id).update(shard_task_ids=shard_task_ids)
+
+    chord([chain(*lane) for lane in lanes])(
+        finalize_test_execution.si(execution.id).on_error(recover_test_execution.si(execution.id))
+    )
+
+    logger.info(f"测试执行 {execution.id} 已分发 {len(shards)} 个分片，{lane_count} 路并行")
+    return {
+        'execution_id': execution.id,
+        'status': 'dispatched',
+        'shards': len(shards),
+        'lanes': lane_count,
+    }
+
+
+@shared_task(bind=True, name='testcases.execute_suite_shard', acks_late=True, reject_on_worker_lost=True,
+             base=ScheduledTask, workload='batch')
+def execute_suite_shard(self, execution_id, kind, object_id):
+    """
+    执行套件中的单个用例或脚本（分布式模式）
+    
+    Args:
+        execution_id: TestExecution实例的ID
+        kind: testcase / script
+        object_id: TestCaseResult 或 ScriptExecution 的ID
     
-    # 并发执行所有任务
-    await asyncio.gather(*async_tasks, return_exceptions=True)
+    Returns:
+        str: 分片结束时的状态
+    """
+    model = _SHARD_MODELS[kind]
+    related = 'testcase' if kind == 'testcase' else 'script'
+    task_obj = model.objects.select_related(related).filter(id=object_id).first()
+    if task_obj is None:
+        return 'missing'
+    # worker 丢失后重新投递时记录停留在 running：与 _unfinished_result_rows 一致，视为中断并重新执行
+    if task_obj.status == 'running':
+        logger.warning(f"测试执行 {execution_id} 的分片 {kind}:{object_id} 上次执行中断，重新执行")
+        model.objects.filter(id=object_id, status='running').update(status='pending', started_at=None)
+        task_obj.status = 'pending'
+        task_obj.started_at = None
+    # 重复投递（acks_late）或已被取消置为跳过的分片不再执行
+    if task_obj.status != 'pending':
+        return task_obj.status
+    if signal_backend().is_set(_cancel_signal_name(execution_id)):
+        logger.info(f"测试执行 {execution_id} 已取消，跳过分片 {kind}:{object_id}")
+        return 'cancelled'
+
+    limit = getattr(settings, 'TEST_SUITE_MAX_RUNNING_SHARDS', 0)
+    if not acquire_slot(SHARD_SLOT_NAME, self.request.id, limit):
+        raise self.retry(countdown=getattr(settings, 'TEST_SUITE_SHARD_RETRY_DELAY', 5), max_retries=None)
+
+    try:
+        execution = TestExecution.objects.select_related('suite').get(id=execution_id)
+        with execute_test_suite.renew_fair_share(execution.celery_task_id, execution_id):
+            # async_to_sync 让 sync_to_async 的数据库操作回到当前线程执行，复用 worker 的数据库连接
+            async_to_sync(_execute_task)(execution, task_obj)
+    finally:
+        release_slot(SHARD_SLOT_NAME, self.request.id)
+    return task_obj.status
+
+
+def _aggregate_execution_counts(execution_id):
+    """按结果记录重新汇总执行统计"""
+    from django.db.models import Count
+
+    counts = {'pass': 0, 'fail': 0, 'skip': 0, 'error': 0}
+    for queryset in (
+        TestCaseResult.objects.filter(execution_id=execution_id),
+        ScriptExecution.objects.filter(test_execution_id=execution_id),
+    ):
+        for row in queryset.values('status').annotate(count=Count('id')):
+            normalized_status = _STATUS_MAP.get(row['status'])
+            if normalized_status:
+                counts[normalized_status] += row['count']
+    return {
+        'passed_count': counts['pass'],
+        'failed_count': counts['fail'],
+        'skipped_count': counts['skip'],
+        'error_count': counts['error'],
+    }
+
+
+@shared_task(name='testcases.finalize_test_execution', base=ScheduledTask, workload='batch')
+def finalize_test_execution(execution_id):
+    """
+    汇总分布式执行的结果（chord 回调）
+    
+    Args:
+        execution_id: TestExecution实例的ID
+    """
+    execution = TestExecution.objects.select_related('suite').get(id=execution_id)
+    for field, value in _aggregate_execution_counts(execution_id).items():
+        setattr(execution, field, value)
+    if execution.status != 'cancelled':
+        execution.status = 'completed'
+    execution.completed_at = execution.completed_at or timezone.now()
+    execution.save(update_fields=[
+        'passed_count', 'failed_count', 'skipped_count', 'error_count',
+        'status', 'completed_at', 'updated_at'
+    ])
+    logger.info(f"测试套件执行完成（分布式）: {execution.suite.name}, "
+               f"通过: {execution.passed_count}, "
+               f"失败: {execution.failed_count}, "
+               f"错误: {execution.error_count}, "
+               f"跳过: {execution.skipped_count}")
+    execute_test_suite.release_fair_share(execution.celery_task_id, execution.id)
+    return _execution_summary(execution)
+
+
+SHARD_INTERRUPTED_MESSAGE = '分片任务异常结束（超时或被终止）'
+
+
+@shared_task(name='testcases.recover_test_execution', base=ScheduledTask, workload='batch')
+def recover_test_execution(execution_id):
+    """
+    分片异常结束后的恢复（chord 回调的 errback，全部分片链结束后执行）
+    
+    仍处于 running 的记录即异常结束的分片，标记为错误；剩余未执行的记录重新分发。
+    没有分片异常结束却仍有未执行的记录时不再自动分发（避免同一故障反复重试），
+    执行置为失败，可通过恢复执行接口继续。
+    
+    Args:
+        execution_id: TestExecution实例的ID
+    """
+    execution = TestExecution.objects.select_related('suite').filter(id=execution_id).first()
+    if execution is None or execution.status == 'completed':
+        return None
+    if execution.status != 'cancelled':
+        interrupted = 0
+        for model, execution_field in ((TestCaseResult, 'execution_id'), (ScriptExecution, 'test_execution_id')):
+            interrupted += model.objects.filter(**{execution_field: execution_id}, status='running').update(
+                status='error', error_message=SHARD_INTERRUPTED_MESSAGE, completed_at=timezone.now()
+            )
+        if _has_unfinished_rows(execution):
+            if interrupted:
+                logger.warning(f"测试执行 {execution_id} 有 {interrupted} 个分片异常结束，重新分发剩余分片")
+                return _dispatch_suite_shards(execution, *_unfinished_result_rows(execution))
+            logger.error(f"测试执行 {execution_id} 的分片链异常结束，剩余记录未执行，执行置为失败")
+            for field, value in _aggregate_execution_counts(execution_id).items():
+                setattr(execution, field, value)
+            execution.status = 'failed'
+            execution.completed_at = timezone.now()
+            execution.save(update_fields=[
+                'passed_count', 'failed_count', 'skipped_count', 'error_count',
+                'status', 'completed_at', 'updated_at'
+            ])
+            execute_test_suite.release_fair_share(execution.celery_task_id, execution.id)
+            return _execution_summary(execution)
+    return finalize_test_execution(execution_id)
+
+
+def revoke_execution_shards(execution):
+    """撤销尚未执行的分片任务（正在执行的分片跑完当前用例后结束）"""
+    if not execution.shard_task_ids:
+        return 0
+    from celery import current_app
+
+    try:
+        current_app.control.revoke(execution.shard_task_ids)
+    except Exception as e:
+        logger.warning(f"撤销测试执行 {execution.id} 的分片任务失败: {e}")
+        return 0
+    return len(execution.shard_task_ids)
 
 
 @sync_to_async
@@ -275,7 +649,7 @@ def _execute_script_task(script_execution):
     """
     同步执行脚本任务的包装器
     """
-    from .script_executor import ScriptExecutor
+    from .script_executor import ScriptExecutor, ExecutionOutputWriter
     
     script = script_execution.script
     
@@ -298,7 +672,8 @@ def _execute_script_task(script_execution):
             script_content=script.script_content,
             use_pytest=use_pytest,
             headless=script.headless,
-            record_video=False # 暂时不开启录屏，或者从配置获取
+            record_video=False, # 暂时不开启录屏，或者从配置获取
+            on_output=ExecutionOutputWriter(script_execution)
         )
         
         # 更新执行记录
@@ -329,28 +704,29 @@ def _execute_script_task(script_execution):
         raise
 
 
+# 执行统计状态到计数字段的映射
+_COUNT_FIELDS = {
+    'pass': 'passed_count',
+    'fail': 'failed_count',
+    'skip': 'skipped_count',
+    'error': 'error_count',
+}
+
+
 def _update_execution_counts(execution, status):
     """
     原子更新执行统计
-    使用select_for_update避免并发写入冲突
+    在数据库中以 F() 自增，并发结束的任务不再争抢执行记录的行锁
     """
+    field = _COUNT_FIELDS.get(status)
+    if field is None:
+        return
     with transaction.atomic():
-        # 锁定当前执行记录
-        exec_obj = TestExecution.objects.select_for_update().get(id=execution.id)
-        
-        if status == 'pass':
-            exec_obj.passed_count += 1
-        elif status == 'fail':
-            exec_obj.failed_count += 1
-        elif status == 'skip':
-            exec_obj.skipped_count += 1
-        elif status == 'error':
-            exec_obj.error_count += 1
-        
-        exec_obj.save(update_fields=[
-            'passed_count', 'failed_count', 'skipped_count',
-            'error_count', 'updated_at'
-        ])
+        TestExecution.objects.filter(id=execution.id).update(
+            **{field: F(field) + 1, 'updated_at': timezone.now()}
+        )
+        # update() 不触发信号，手动计入项目统计
+        record_increment(execution, **{field: 1})
 
 
 @sync_to_async
@@ -809,7 +1185,8 @@ async def _execute_testcase_via_chat_api(result: TestCaseResult):
         await _save_result(result)
 
 
-@shared_task(name='testcases.cancel_test_execution')
+# 取消请求在交互队列中最先出队
+@shared_task(name='testcases.cancel_test_execution', base=ScheduledTask, workload='interactive', priority=0)
 def cancel_test_execution(execution_id):
     """
     取消测试执行
@@ -821,6 +1198,8 @@ def cancel_test_execution(execution_id):
         execution = TestExecution.objects.get(id=execution_id)
         
         if execution.status in ['pending', 'running']:
+            signal_execution_cancel(execution_id)
+            revoke_execution_shards(execution)
             execution.status = 'cancelled'
             execution.completed_at = timezone.now()
             execution.save(update_fields=['status', 'completed_at', 'updated_at'])
@@ -846,4 +1225,15 @@ def cancel_test_execution(execution_id):
         return {'success': False, 'message': '测试执行记录不存在'}
     except Exception as e:
         logger.error(f"取消测试执行失败: {str(e)}", exc_info=True)
-        return {'success': False, 'message': str(e)}
\ No newline at end of file
+        return {'success': False, 'message': str(e)}
+
+@shared_task(name='testcases.process_testcase_screenshot', base=ScheduledTask, workload='interactive')
+def process_testcase_screenshot(screenshot_id):
+    """
+    处理上传的测试用例截屏：去重、转码并生成缩略图
+    
+    Args:
+        screenshot_id: TestCaseScreenshot实例的ID
+    """
+    from .screenshots import process_screenshot
+    return process_screenshot(screenshot_id)
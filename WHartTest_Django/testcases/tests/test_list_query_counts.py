@@ -0,0 +1,88 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from projects.models import Project, ProjectMember
+from testcases.models import (
+    AutomationScript, ScriptExecution, TestCase as TestCaseModel, TestCaseModule,
+    TestCaseScreenshot, TestCaseStep, TestSuite,
+)
+
+
+@override_settings(MEDIA_ROOT='/tmp/wharttest-test-media')
+class ListEndpointQueryCountTests(TestCase):
+    """列表接口的查询次数不应随行数增长"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.user.groups.add(Group.objects.create(name='testers'))
+        self.project = Project.objects.create(name='Query Project', creator=self.user)
+        ProjectMember.objects.get_or_create(project=self.project, user=self.user, defaults={'role': 'owner'})
+        root = TestCaseModule.objects.create(project=self.project, name='root', creator=self.user)
+        self.module = TestCaseModule.objects.create(project=self.project, name='child', parent=root, creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.batch = 0
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            self.batch += 1
+            module = TestCaseModule.objects.create(
+                project=self.project, name=f'module-{self.batch}', parent=self.module, creator=self.user
+            )
+            testcase = TestCaseModel.objects.create(
+                project=self.project, module=module, name=f'case-{self.batch}', creator=self.user
+            )
+            TestCaseStep.objects.create(test_case=testcase, step_number=1, description='d', expected_result='e', creator=self.user)
+            TestCaseScreenshot.objects.create(
+                test_case=testcase, uploader=self.user,
+                screenshot=SimpleUploadedFile(f'shot-{self.batch}.png', b'png', content_type='image/png'),
+            )
+            script = AutomationScript.objects.create(
+                test_case=testcase, name=f'script-{self.batch}', script_content='print(1)', creator=self.user
+            )
+            ScriptExecution.objects.create(script=script, status='pass', executor=self.user)
+            ScriptExecution.objects.create(script=script, status='fail', executor=self.user)
+            suite = TestSuite.objects.create(project=self.project, name=f'suite-{self.batch}', creator=self.user)
+            suite.testcases.add(testcase)
+            suite.automation_scripts.add(script)
+
+    def _query_count(self, url):
+        # 每次都按冷缓存和新的用户实例计数，避免成员角色缓存掩盖查询次数的变化
+        cache.clear()
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def _assert_constant(self, url):
+        self._add_rows(2)
+        small = self._query_count(url)
+        self._add_rows(8)
+        large = self._query_count(url)
+        self.assertEqual(small, large, f'{url} 的查询次数随行数增长: {small} -> {large}')
+
+    def test_testcase_list(self):
+        self._assert_constant(f'/api/projects/{self.project.id}/testcases/')
+
+    def test_testcase_module_list(self):
+        self._assert_constant(f'/api/projects/{self.project.id}/testcase-modules/')
+
+    def test_test_suite_list(self):
+        self._assert_constant(f'/api/projects/{self.project.id}/test-suites/')
+
+    def test_automation_script_list(self):
+        self._assert_constant(f'/api/automation-scripts/?project_id={self.project.id}')
+
+    def test_automation_script_annotations(self):
+        self._add_rows(1)
+        script = AutomationScript.objects.get()
+        response = self.client.get(f'/api/automation-scripts/{script.id}/?project_id={self.project.id}')
+        data = response.json()['data']
+        self.assertEqual(data['execution_count'], 2)
+        self.assertEqual(data['latest_execution']['id'], script.executions.order_by('-created_at', '-id').first().id)
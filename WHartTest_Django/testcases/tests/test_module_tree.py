@@ -0,0 +1,66 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from projects.models import Project
+from testcases.filters import TestCaseFilter
+from testcases.models import TestCase as TestCaseModel, TestCaseModule, annotate_subtree_testcase_count
+from testcases.serializers import TestCaseModuleSerializer
+
+
+class TestCaseModuleTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tree', password='password')
+        self.project = Project.objects.create(name='Tree Project', creator=self.user)
+        self.root = self._module('root')
+        self.child = self._module('child', self.root)
+        self.leaf = self._module('leaf', self.child)
+        self.other = self._module('other')
+        for module in (self.root, self.leaf, self.leaf, self.other):
+            TestCaseModel.objects.create(project=self.project, module=module, name=f'case-{module.name}', creator=self.user)
+
+    def _module(self, name, parent=None):
+        return TestCaseModule.objects.create(project=self.project, name=name, parent=parent, creator=self.user)
+
+    def test_path_maintained_on_create_and_move(self):
+        self.assertEqual(self.leaf.path, f'/{self.root.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.get_path_names(), ['root', 'child', 'leaf'])
+
+        # 移动子树：后代路径和级别同步更新
+        self.child.parent = self.other
+        self.child.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{self.other.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.level, 3)
+        self.assertEqual(sorted(self.other.get_all_descendant_ids()), sorted([self.other.id, self.child.id, self.leaf.id]))
+
+        self.child.parent = None
+        self.child.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.level, 2)
+
+    def test_subtree_counts_in_single_query(self):
+        queryset = annotate_subtree_testcase_count(TestCaseModule.objects.filter(project=self.project))
+        serializer = TestCaseModuleSerializer()
+        with self.assertNumQueries(1):
+            counts = {module.name: serializer.get_testcase_count(module) for module in queryset}
+        self.assertEqual(counts, {'root': 3, 'child': 2, 'leaf': 2, 'other': 1})
+
+    def test_filter_by_module_subtree(self):
+        queryset = TestCaseFilter({'module_id': self.child.id}, queryset=TestCaseModel.objects.all()).qs
+        self.assertEqual(queryset.count(), 2)
+
+    def test_cycle_rejected(self):
+        serializer = TestCaseModuleSerializer(self.root, data={'parent_id': self.leaf.id}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('parent', serializer.errors)
+
+    def test_rebuild_command_backfills_paths(self):
+        TestCaseModule.objects.update(path='', level=1)
+        call_command('rebuild_module_paths', stdout=io.StringIO())
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{self.root.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.level, 3)
@@ -0,0 +1,65 @@
+import asyncio
+import io
+import time
+
+from django.test import SimpleTestCase
+
+from testcases.preview_stream import PreviewFrameStream, pack_pipe_message, read_pipe_message
+
+
+class PreviewFrameStreamTests(SimpleTestCase):
+    def test_pipe_message_roundtrip(self):
+        stream = io.BytesIO(pack_pipe_message(b'J', b'{}') + pack_pipe_message(b'F', b'\xff\xd8jpeg'))
+        self.assertEqual(read_pipe_message(stream), (b'J', b'{}'))
+        self.assertEqual(read_pipe_message(stream), (b'F', b'\xff\xd8jpeg'))
+        self.assertIsNone(read_pipe_message(stream))
+
+    def test_latest_frame_wins_until_acked(self):
+        """未确认帧占满窗口时只保留最新帧，确认后发送最新帧"""
+        async def scenario():
+            sent = []
+
+            async def send_frame(seq, jpeg):
+                sent.append((seq, jpeg))
+
+            stream = PreviewFrameStream(send_frame, max_fps=30)
+            stream.MAX_IN_FLIGHT = 1
+            task = asyncio.create_task(stream.run())
+
+            stream.offer(b'a', time.time())
+            await asyncio.sleep(0.05)
+            for frame in (b'b', b'c', b'd'):
+                stream.offer(frame, time.time())
+            await asyncio.sleep(0.05)
+            self.assertEqual(sent, [(1, b'a')])
+
+            stream.ack(1)
+            await asyncio.sleep(0.1)
+            stream.close()
+            await task
+            return stream, sent
+
+        stream, sent = asyncio.run(scenario())
+        self.assertEqual(sent, [(1, b'a'), (2, b'd')])
+        self.assertEqual(stream.frames_dropped, 2)
+        self.assertEqual(stream.summary()['frames_sent'], 2)
+
+    def test_adapts_quality_when_congested(self):
+        async def scenario():
+            changes = []
+
+            async def send_frame(seq, jpeg):
+                pass
+
+            stream = PreviewFrameStream(send_frame, max_fps=10, quality=50,
+                                        on_settings_change=lambda q, fps: changes.append((q, fps)))
+            for _ in range(10):
+                stream.offer(b'x', time.time())
+            stream._window_started_at -= stream.ADAPT_INTERVAL_SECONDS
+            stats = stream.maybe_adapt()
+            return stream, stats, changes
+
+        stream, stats, changes = asyncio.run(scenario())
+        self.assertEqual(stats['dropped'], 9)
+        self.assertEqual(stream.quality, 40)
+        self.assertEqual(changes, [(40, 10)])
@@ -0,0 +1,100 @@
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from projects.models import Project, ProjectMember
+from testcases.models import TestCase as TestCaseModel, TestCaseModule, TestCaseScreenshot
+from testcases.screenshots import process_screenshot
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def _png(color='red', size=(1280, 720)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TESTCASE_SCREENSHOT_FORMAT='WEBP', TESTCASE_SCREENSHOT_THUMBNAIL_SIZE=320)
+class ScreenshotProcessingTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(username='shooter', password='password')
+        self.project = Project.objects.create(name='Screenshot Project', creator=self.user)
+        ProjectMember.objects.get_or_create(project=self.project, user=self.user, defaults={'role': 'owner'})
+        module = TestCaseModule.objects.create(project=self.project, name='Module', creator=self.user)
+        self.case = TestCaseModel.objects.create(project=self.project, module=module, name='Case', creator=self.user)
+        self.other_case = TestCaseModel.objects.create(project=self.project, module=module, name='Other', creator=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, testcase, content, step_number=1):
+        url = f'/api/projects/{self.project.id}/testcases/{testcase.id}/upload-screenshots/'
+        with patch('testcases.tasks.process_testcase_screenshot.delay', side_effect=process_screenshot), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'screenshots': SimpleUploadedFile('step.png', content, content_type='image/png'),
+                'title': 'step',
+                'step_number': step_number,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['data']['screenshots'][0]
+
+    def test_upload_transcodes_and_generates_thumbnail(self):
+        uploaded = self._upload(self.case, _png())
+        self.assertEqual(uploaded['processing_status'], 'pending')
+        self.assertEqual(uploaded['thumbnail_url'], uploaded['screenshot_url'])
+
+        screenshot = TestCaseScreenshot.objects.get(pk=uploaded['id'])
+        self.assertEqual(screenshot.processing_status, 'ready')
+        self.assertEqual(len(screenshot.content_hash), 64)
+        self.assertTrue(screenshot.screenshot.name.endswith(f'{screenshot.content_hash}.webp'))
+        with Image.open(screenshot.thumbnail.path) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (320, 180)))
+        self.assertFalse(screenshot.screenshot.storage.exists(uploaded['screenshot_url'].split('/media/')[-1]))
+
+        listed = self.client.get(f'/api/projects/{self.project.id}/testcases/').json()['data']
+        case = next(item for item in listed if item['id'] == self.case.id)
+        self.assertTrue(case['screenshots'][0]['thumbnail_url'].endswith('_thumb.webp'))
+
+    def test_duplicates_skipped_and_files_shared(self):
+        content = _png('blue')
+        first = TestCaseScreenshot.objects.get(pk=self._upload(self.case, content)['id'])
+
+        # 同一用例同一步骤的相同截屏被丢弃
+        self._upload(self.case, content)
+        self.assertEqual(self.case.screenshots.count(), 1)
+
+        # 其他用例的相同截屏保留记录，但共享文件
+        shared = TestCaseScreenshot.objects.get(pk=self._upload(self.other_case, content)['id'])
+        self.assertEqual(shared.screenshot.name, first.screenshot.name)
+        self.assertEqual(shared.thumbnail.name, first.thumbnail.name)
+
+        path = first.screenshot.path
+        first.delete()
+        self.assertTrue(shared.screenshot.storage.exists(shared.screenshot.name))
+        shared.delete()
+        self.assertFalse(shared.screenshot.storage.exists(path))
+
+    def test_invalid_image_marked_failed(self):
+        screenshot = TestCaseScreenshot.objects.create(
+            test_case=self.case,
+            screenshot=SimpleUploadedFile('broken.png', b'not an image', content_type='image/png'),
+        )
+        self.assertEqual(process_screenshot(screenshot.id), 'failed')
+        screenshot.refresh_from_db()
+        self.assertEqual(screenshot.processing_status, 'failed')
+        self.assertTrue(screenshot.screenshot.storage.exists(screenshot.screenshot.name))
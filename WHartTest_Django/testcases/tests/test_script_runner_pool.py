@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase, override_settings
+
+from testcases.script_executor import ScriptExecutor
+from testcases.script_runner_pool import ScriptRunnerPool
+
+
+@override_settings(SCRIPT_RUNNER_POOL_SIZE=1, SCRIPT_RUNNER_POOL_MAX_RUNS=2)
+class ScriptRunnerPoolTests(SimpleTestCase):
+    def tearDown(self):
+        ScriptRunnerPool.shutdown()
+
+    def test_output_streamed_and_worker_reused(self):
+        """预热进程复用执行，输出逐行回调"""
+        received = []
+        executor = ScriptExecutor(timeout_seconds=60)
+        self.addCleanup(executor.cleanup)
+
+        script = 'import os\nprint("step 1")\nprint("headless", os.environ["PLAYWRIGHT_HEADLESS"])\n'
+        result = executor.execute_script(script, use_pytest=False, on_output=lambda s, t: received.append((s, t)))
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['output'], 'step 1\nheadless 1\n')
+        self.assertIn(('stdout', 'step 1\n'), received)
+
+        pid = ScriptRunnerPool._idle[0].proc.pid
+        result = executor.execute_script('raise SystemExit(2)', use_pytest=False)
+        self.assertFalse(result['success'])
+        # 达到 MAX_RUNS 后进程被回收
+        self.assertEqual(ScriptRunnerPool._idle, [])
+        self.assertEqual(ScriptRunnerPool._total, 0)
+
+        executor.execute_script('print("again")', use_pytest=False)
+        self.assertNotEqual(ScriptRunnerPool._idle[0].proc.pid, pid)
+
+    def test_pytest_script(self):
+        executor = ScriptExecutor(timeout_seconds=60)
+        self.addCleanup(executor.cleanup)
+
+        script = 'import pytest\n\ndef test_ok():\n    assert True\n\ndef test_fail():\n    assert 1 == 2\n'
+        result = executor.execute_script(script, use_pytest=True)
+        self.assertFalse(result['success'])
+        self.assertIn('1 failed, 1 passed', result['output'])
+
+    @override_settings(SCRIPT_RUNNER_ACQUIRE_TIMEOUT=0.2)
+    def test_busy_pool_falls_back_to_subprocess(self):
+        """预热进程全部繁忙时不按脚本超时等待，而是回退到一次性子进程执行"""
+        import threading
+        import time
+
+        executor = ScriptExecutor(timeout_seconds=60)
+        self.addCleanup(executor.cleanup)
+        blocker = threading.Thread(
+            target=executor.execute_script, args=('import time\ntime.sleep(3)',), kwargs={'use_pytest': False}
+        )
+        executor.execute_script('print("warm")', use_pytest=False)
+        blocker.start()
+        self.addCleanup(blocker.join)
+        while ScriptRunnerPool._idle:
+            time.sleep(0.05)
+
+        other = ScriptExecutor(timeout_seconds=60)
+        self.addCleanup(other.cleanup)
+        begin = time.monotonic()
+        result = other.execute_script('print("fallback")', use_pytest=False)
+        self.assertTrue(result['success'], result['error_message'])
+        self.assertEqual(result['output'], 'fallback\n')
+        self.assertLess(time.monotonic() - begin, 2.5)
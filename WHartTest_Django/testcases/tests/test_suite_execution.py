@@ -76,4 +76,362 @@ class TestSuiteExecutionTests(TestCase):
         context = {'project_id': self.project.id, 'request': None}
         serializer = TestSuiteSerializer(data=data, context=context)
         self.assertFalse(serializer.is_valid())
-        self.assertIn('non_field_errors', serializer.errors)
\ No newline at end of file
+        self.assertIn('non_field_errors', serializer.errors)
+
+class ExecutionCancelSignalTests(TestCase):
+    def setUp(self):
+        from wharttest_django.signalling import reset_signal_backend
+        reset_signal_backend()
+        self.addCleanup(reset_signal_backend)
+        self.user = User.objects.create_user(username='canceller', password='password')
+        self.project = Project.objects.create(name='Cancel Project', creator=self.user)
+        self.suite = TestSuite.objects.create(project=self.project, name='Suite', creator=self.user)
+        self.execution = TestExecution.objects.create(suite=self.suite, executor=self.user, status='running')
+
+    def test_cancelled_execution_skips_pending_tasks_without_polling(self):
+        """收到取消信号后不再调度剩余任务，也不再逐个任务查询执行状态"""
+        from unittest.mock import patch
+        from asgiref.sync import async_to_sync
+        from testcases.models import ScriptExecution
+        from testcases.tasks import _execute_tasks_concurrently, signal_execution_cancel
+        from wharttest_django.signalling import InMemorySignalBackend
+
+        module = TestCaseModule.objects.create(project=self.project, name='Module', creator=self.user)
+        testcase = TestCaseModel.objects.create(project=self.project, module=module, name='Case', creator=self.user)
+        script = AutomationScript.objects.create(
+            test_case=testcase, name='Script', script_content='print(1)', creator=self.user
+        )
+        tasks = [
+            ScriptExecution.objects.create(script=script, test_execution=self.execution, status='pending')
+            for _ in range(3)
+        ]
+
+        signal_execution_cancel(self.execution.id)
+        # 模拟跨进程信号后端（Redis）：取消由订阅推送
+        with patch.object(InMemorySignalBackend, 'shared', True), self.assertNumQueries(0):
+            async_to_sync(_execute_tasks_concurrently)(self.execution, tasks, 2)
+        self.assertEqual(
+            list(ScriptExecution.objects.filter(test_execution=self.execution).values_list('status', flat=True)),
+            ['pending'] * 3,
+        )
+
+    def test_cancel_from_other_process_without_redis_falls_back_to_status(self):
+        """未配置 Redis 时 web 进程的取消信号到不了 worker，按数据库中的执行状态停止调度"""
+        from asgiref.sync import async_to_sync
+        from django.test import override_settings
+        from testcases.models import ScriptExecution
+        from testcases.tasks import _execute_tasks_concurrently
+        from wharttest_django.signalling import signal_backend
+
+        module = TestCaseModule.objects.create(project=self.project, name='Module', creator=self.user)
+        testcase = TestCaseModel.objects.create(project=self.project, module=module, name='Case', creator=self.user)
+        script = AutomationScript.objects.create(
+            test_case=testcase, name='Script', script_content='print(1)', creator=self.user
+        )
+        tasks = [
+            ScriptExecution.objects.create(script=script, test_execution=self.execution, status='pending')
+            for _ in range(2)
+        ]
+        # 取消请求只改写了数据库状态，worker 进程内的信号后端没有收到信号
+        TestExecution.objects.filter(id=self.execution.id).update(status='cancelled')
+
+        with override_settings(SIGNAL_BACKEND_URL='', REDIS_URL=''):
+            self.assertFalse(signal_backend().shared)
+            async_to_sync(_execute_tasks_concurrently)(self.execution, tasks, 2)
+        self.assertEqual(
+            list(ScriptExecution.objects.filter(test_execution=self.execution).values_list('status', flat=True)),
+            ['pending'] * 2,
+        )
+
+
+class SuiteRunFixtureMixin:
+    """套件执行用例的公共数据：3 个用例（最后一个失败）、1 个脚本、并发 2，Celery 同步执行"""
+
+    settings_overrides = {}
+
+    def setUp(self):
+        from django.test import override_settings
+        from wharttest_django.celery import app
+        from wharttest_django.concurrency import reset_slots
+        from wharttest_django.signalling import reset_signal_backend
+
+        reset_signal_backend()
+        reset_slots()
+        self.addCleanup(reset_signal_backend)
+        self.addCleanup(reset_slots)
+        settings_override = override_settings(**self.settings_overrides)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', eager)
+
+        self.user = User.objects.create_user(username='distributor', password='password')
+        self.project = Project.objects.create(name='Distributed Project', creator=self.user)
+        module = TestCaseModule.objects.create(project=self.project, name='Module', creator=self.user)
+        self.testcases = [
+            TestCaseModel.objects.create(project=self.project, module=module, name=f'Case {i}', creator=self.user)
+            for i in range(3)
+        ]
+        self.script = AutomationScript.objects.create(
+            test_case=self.testcases[0], name='Script', script_content='print(1)', creator=self.user
+        )
+        self.suite = TestSuite.objects.create(
+            project=self.project, name='Suite', creator=self.user, max_concurrent_tasks=2
+        )
+        self.suite.testcases.add(*self.testcases)
+        self.suite.automation_scripts.add(self.script)
+        self.execution = TestExecution.objects.create(suite=self.suite, executor=self.user)
+
+    def _patch_executors(self):
+        from unittest.mock import patch
+        from asgiref.sync import sync_to_async
+
+        async def run_case(result):
+            result.status = 'fail' if result.testcase_id == self.testcases[-1].id else 'pass'
+            await sync_to_async(result.save)()
+
+        async def run_script(script_execution):
+            script_execution.status = 'pass'
+            await sync_to_async(script_execution.save)()
+
+        case_patch = patch('testcases.tasks._execute_testcase_via_chat_api', side_effect=run_case)
+        script_patch = patch('testcases.tasks._execute_script_task', side_effect=run_script)
+        case_patch.start()
+        script_patch.start()
+        self.addCleanup(case_patch.stop)
+        self.addCleanup(script_patch.stop)
+
+
+class DistributedSuiteExecutionTests(SuiteRunFixtureMixin, TestCase):
+    """分布式执行：分片分发、全局并发名额、取消撤销"""
+
+    settings_overrides = {'TEST_SUITE_DISTRIBUTED_EXECUTION': True, 'TEST_SUITE_MAX_RUNNING_SHARDS': 2}
+
+    def test_suite_fans_out_and_finalizes_counts(self):
+        from testcases.tasks import execute_test_suite
+
+        self._patch_executors()
+        dispatched = execute_test_suite.apply(args=[self.execution.id]).get()
+        self.assertEqual((dispatched['shards'], dispatched['lanes']), (4, 2))
+
+        self.execution.refresh_from_db()
+        self.assertEqual(len(self.execution.shard_task_ids), 4)
+        self.assertEqual(self.execution.status, 'completed')
+        self.assertEqual(
+            (self.execution.total_count, self.execution.passed_count, self.execution.failed_count),
+            (4, 3, 1),
+        )
+        self.assertEqual(self.execution.results.filter(status='pending').count(), 0)
+
+    def test_local_mode_bulk_creates_rows_and_increments_counts(self):
+        """单 worker 模式：结果记录批量创建，计数以 F() 自增，项目统计与全量重建一致"""
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        from projects.statistics import get_project_statistics, rebuild_project_statistics
+        from testcases.tasks import execute_test_suite
+
+        self._patch_executors()
+        get_project_statistics(self.project)
+        with override_settings(TEST_SUITE_DISTRIBUTED_EXECUTION=False), \
+                CaptureQueriesContext(connection) as queries:
+            summary = execute_test_suite.apply(args=[self.execution.id]).get()
+
+        self.assertEqual((summary['status'], summary['passed'], summary['failed']), ('completed', 3, 1))
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len([sql for sql in inserts if 'testcases_testcaseresult' in sql]), 1)
+        self.assertEqual(len([sql for sql in inserts if 'testcases_scriptexecution' in sql]), 1)
+
+        incremental = get_project_statistics(self.project)
+        rebuild_project_statistics(self.project.id)
+        self.assertEqual(incremental, get_project_statistics(self.project))
+        self.assertEqual(incremental['executions']['case_results']['passed'], 3)
+
+    def test_shard_waits_for_global_slot(self):
+        from unittest.mock import patch
+        from testcases.models import TestCaseResult
+        from testcases.tasks import execute_suite_shard
+        from wharttest_django.concurrency import acquire_slot
+
+        self._patch_executors()
+        result = TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0])
+        self.assertTrue(acquire_slot('test-suite-shards', 'other-1', 2))
+        self.assertTrue(acquire_slot('test-suite-shards', 'other-2', 2))
+        self.assertFalse(acquire_slot('test-suite-shards', 'other-3', 2))
+
+        with patch('testcases.tasks.acquire_slot', side_effect=[False, True]) as acquire:
+            status = execute_suite_shard.apply(args=[self.execution.id, 'testcase', result.id]).get()
+        self.assertEqual(status, 'pass')
+        self.assertEqual(acquire.call_count, 2)
+
+    def test_cancel_skips_and_revokes_outstanding_shards(self):
+        from unittest.mock import patch
+        from testcases.models import TestCaseResult
+        from testcases.tasks import cancel_test_execution, execute_suite_shard, signal_execution_cancel
+
+        result = TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0])
+        signal_execution_cancel(self.execution.id)
+        status = execute_suite_shard.apply(args=[self.execution.id, 'testcase', result.id]).get()
+        self.assertEqual(status, 'cancelled')
+
+        TestExecution.objects.filter(id=self.execution.id).update(status='running', shard_task_ids=['a', 'b'])
+        with patch('celery.app.control.Control.revoke') as revoke:
+            self.assertTrue(cancel_test_execution(self.execution.id)['success'])
+        revoke.assert_called_once_with(['a', 'b'])
+        result.refresh_from_db()
+        self.assertEqual(result.status, 'skip')
+
+    def test_dispatch_attaches_recovery_errback(self):
+        from unittest.mock import patch
+        from testcases.tasks import _create_result_rows, _dispatch_suite_shards
+
+        results, script_executions = _create_result_rows(self.execution, self.testcases, [self.script])
+        with patch('celery.chord') as chord:
+            _dispatch_suite_shards(self.execution, results, script_executions)
+        body = chord.return_value.call_args.args[0]
+        self.assertEqual(body.task, 'testcases.finalize_test_execution')
+        self.assertEqual([errback.task for errback in body.options['link_error']], ['testcases.recover_test_execution'])
+
+    def test_redelivered_shard_reruns_interrupted_row(self):
+        from testcases.models import TestCaseResult
+        from testcases.tasks import execute_suite_shard
+
+        self._patch_executors()
+        result = TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0], status='running')
+        status = execute_suite_shard.apply(args=[self.execution.id, 'testcase', result.id]).get()
+        self.assertEqual(status, 'pass')
+
+    def test_recovery_errors_killed_shard_and_redispatches_rest(self):
+        from testcases.models import TestCaseResult
+        from testcases.tasks import SHARD_INTERRUPTED_MESSAGE, recover_test_execution
+
+        self._patch_executors()
+        TestExecution.objects.filter(id=self.execution.id).update(status='running')
+        killed = TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0], status='running')
+        remaining = TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[1])
+
+        recover_test_execution.apply(args=[self.execution.id]).get()
+
+        killed.refresh_from_db()
+        remaining.refresh_from_db()
+        self.execution.refresh_from_db()
+        self.assertEqual((killed.status, killed.error_message), ('error', SHARD_INTERRUPTED_MESSAGE))
+        self.assertEqual(remaining.status, 'pass')
+        self.assertEqual(self.execution.status, 'completed')
+        self.assertEqual((self.execution.passed_count, self.execution.error_count), (1, 1))
+
+    def test_recovery_without_interrupted_shard_fails_execution(self):
+        from testcases.models import TestCaseResult
+        from testcases.tasks import is_resumable, recover_test_execution
+
+        TestExecution.objects.filter(id=self.execution.id).update(status='running')
+        TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0])
+
+        summary = recover_test_execution.apply(args=[self.execution.id]).get()
+
+        self.execution.refresh_from_db()
+        self.assertEqual(summary['status'], 'failed')
+        self.assertTrue(is_resumable(self.execution))
+
+
+class ResumableSuiteExecutionTests(SuiteRunFixtureMixin, TestCase):
+    """可恢复执行：只执行未结束的用例、检查点续跑、仅重跑失败用例"""
+
+    settings_overrides = {'TEST_SUITE_DISTRIBUTED_EXECUTION': False, 'TASK_FAIR_SHARE_LIMITS': {}}
+
+    def _executed_testcase_ids(self):
+        from testcases import tasks
+        return [call.args[0].testcase_id for call in tasks._execute_testcase_via_chat_api.call_args_list]
+
+    def test_resume_runs_only_unfinished_rows(self):
+        from testcases.models import ScriptExecution, TestCaseResult
+        from testcases.tasks import execute_test_suite
+
+        self._patch_executors()
+        TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[0], status='pass')
+        TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[1], status='running')
+        TestCaseResult.objects.create(execution=self.execution, testcase=self.testcases[2], status='pending')
+        ScriptExecution.objects.create(script=self.script, test_execution=self.execution, status='pending')
+        TestExecution.objects.filter(id=self.execution.id).update(status='failed')
+
+        summary = execute_test_suite.apply(args=[self.execution.id]).get()
+
+        self.assertEqual(self._executed_testcase_ids(), [self.testcases[1].id, self.testcases[2].id])
+        self.assertEqual(
+            (summary['status'], summary['total'], summary['passed'], summary['failed']),
+            ('completed', 4, 3, 1),
+        )
+
+    def test_checkpoint_continues_in_new_task(self):
+        """到达检查点后剩余用例由新的任务继续执行，不会重复执行已完成的用例"""
+        import asyncio
+        from django.test import override_settings
+        from testcases import tasks
+
+        self._patch_executors()
+        run_case = tasks._execute_testcase_via_chat_api.side_effect
+
+        async def slow_case(result):
+            await asyncio.sleep(0.1)
+            await run_case(result)
+
+        tasks._execute_testcase_via_chat_api.side_effect = slow_case
+        with override_settings(TEST_SUITE_CHECKPOINT_SECONDS=0.05):
+            summary = tasks.execute_test_suite.apply(args=[self.execution.id]).get()
+
+        self.assertIn('continued_by', summary)
+        self.assertEqual(sorted(self._executed_testcase_ids()), sorted(case.id for case in self.testcases))
+        self.execution.refresh_from_db()
+        self.assertEqual(self.execution.status, 'completed')
+        self.assertEqual((self.execution.passed_count, self.execution.failed_count), (3, 1))
+
+    def test_rerun_failed_creates_child_reusing_passes(self):
+        from rest_framework.test import APIClient
+        from testcases.tasks import execute_test_suite
+        from testcases import tasks
+
+        from projects.models import ProjectDailyStatistics, ProjectStatistics
+        from projects.statistics import rebuild_project_statistics
+
+        rebuild_project_statistics(self.project.id)
+        self._patch_executors()
+        execute_test_suite.apply(args=[self.execution.id]).get()
+        tasks._execute_testcase_via_chat_api.reset_mock()
+
+        from projects.models import ProjectMember
+
+        admin = User.objects.create_superuser(username='rerunner', password='password')
+        ProjectMember.objects.create(project=self.project, user=admin, role='owner')
+        client = APIClient()
+        client.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f'/api/projects/{self.project.id}/test-executions/{self.execution.id}/rerun-failed/'
+            )
+        self.assertEqual(response.status_code, 201)
+
+        child = TestExecution.objects.get(id=response.json()['data']['id'])
+        self.assertEqual(child.parent_id, self.execution.id)
+        self.assertEqual(self._executed_testcase_ids(), [self.testcases[-1].id])
+        self.assertEqual(child.status, 'completed')
+        self.assertEqual((child.total_count, child.passed_count, child.failed_count), (4, 3, 1))
+        self.assertEqual(child.results.filter(status='pass').count(), 2)
+
+        # 增量维护的项目统计与全量重建一致（复制的通过结果同样计入）
+        def snapshot():
+            stats = ProjectStatistics.objects.filter(project=self.project).values().get()
+            stats.pop('updated_at')
+            daily = list(ProjectDailyStatistics.objects.filter(project=self.project).values(
+                'date', 'execution_count', 'passed', 'failed'
+            ))
+            return stats, daily
+
+        incremental = snapshot()
+        rebuild_project_statistics(self.project.id)
+        self.assertEqual(incremental, snapshot())
+        self.assertEqual(incremental[0]['case_passed'], 6)
+
+        # 已完成的执行不能继续执行
+        response = client.post(f'/api/projects/{self.project.id}/test-executions/{self.execution.id}/resume/')
+        self.assertEqual(response.status_code, 400)
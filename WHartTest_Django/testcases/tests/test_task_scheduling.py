@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from projects.models import Project
+from testcases.models import TestExecution, TestSuite
+from wharttest_django.concurrency import reset_slots
+from wharttest_django.scheduling import metrics, reset_metrics
+
+
+class TaskSchedulingTests(TestCase):
+    """工作负载队列路由、公平份额与队列指标接口"""
+
+    def setUp(self):
+        from wharttest_django.celery import app
+
+        reset_slots()
+        reset_metrics()
+        self.addCleanup(reset_slots)
+        self.addCleanup(reset_metrics)
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', eager)
+        self.app = app
+
+        self.user = User.objects.create_user(username='scheduler', password='password')
+        self.project = Project.objects.create(name='Scheduling Project', creator=self.user)
+        self.suite = TestSuite.objects.create(project=self.project, name='Suite', creator=self.user)
+        self.execution = TestExecution.objects.create(suite=self.suite, executor=self.user)
+
+    def test_tasks_are_routed_by_workload(self):
+        from requirements.tasks import execute_requirement_review
+        from testcases.tasks import cancel_test_execution, execute_test_suite
+
+        router = self.app.amqp.router
+        suite_route = router.route({}, execute_test_suite.name, task_type=execute_test_suite)
+        review_route = router.route({}, execute_requirement_review.name, task_type=execute_requirement_review)
+        cancel_route = router.route({}, cancel_test_execution.name, task_type=cancel_test_execution)
+
+        self.assertEqual((suite_route['queue'].name, suite_route['priority']), ('batch', 7))
+        self.assertEqual((review_route['queue'].name, review_route['priority']), ('interactive', 2))
+        self.assertEqual((cancel_route['queue'].name, cancel_route['priority']), ('interactive', 0))
+
+    def test_suite_over_user_share_is_requeued(self):
+        """同一用户已有套件在执行时，新的套件执行重新排队而不是占用 worker"""
+        from testcases.tasks import execute_test_suite
+
+        with override_settings(TASK_FAIR_SHARE_LIMITS={'batch': {'user': 1}}), \
+                patch('wharttest_django.scheduling.acquire_slot', side_effect=[False, True]) as acquire, \
+                patch('wharttest_django.scheduling.release_slot') as release:
+            summary = execute_test_suite.apply(args=[self.execution.id]).get()
+
+        self.assertEqual(summary['status'], 'completed')
+        self.assertEqual(acquire.call_count, 2)
+        self.assertEqual(acquire.call_args.args[0], f'fair-share:batch:user:{self.user.id}')
+        release.assert_called_once()
+        self.assertEqual(metrics().snapshot('batch')['throttled'], 1)
+
+    def test_queue_stats_endpoint_is_admin_only(self):
+        metrics().record_wait('batch', 1500)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/task-queues/stats/').status_code, 403)
+
+        admin = User.objects.create_superuser(username='queue-admin', password='password')
+        client.force_authenticate(admin)
+        with patch('wharttest_django.scheduling._queue_depth', return_value=3):
+            response = client.get('/api/task-queues/stats/')
+        self.assertEqual(response.status_code, 200)
+        queues = {queue['workload']: queue for queue in response.json()['data']['queues']}
+        self.assertEqual(queues['batch']['depth'], 3)
+        self.assertEqual((queues['batch']['started'], queues['batch']['max_wait_ms']), (1, 1500.0))
+        self.assertEqual(queues['interactive']['queue'], 'interactive')
+
+    def test_fair_share_lease_is_renewed_while_running(self):
+        """执行期间心跳续租；心跳停止（worker 被杀）后名额在一个租约内释放"""
+        import time
+
+        from wharttest_django.concurrency import acquire_slot
+        from wharttest_django.scheduling import _LeaseHeartbeat
+
+        name = f'fair-share:batch:user:{self.user.id}'
+        self.assertTrue(acquire_slot(name, 'running-task', 1, 0.3))
+        heartbeat = _LeaseHeartbeat([(name, 1)], 'running-task', 0.3)
+        heartbeat.start()
+        time.sleep(0.5)
+        self.assertFalse(acquire_slot(name, 'next-task', 1, 0.3))
+
+        heartbeat.stop()
+        heartbeat.join()
+        time.sleep(0.4)
+        self.assertTrue(acquire_slot(name, 'next-task', 1, 0.3))
+
+    def test_resume_releases_slot_held_by_killed_task(self):
+        from projects.models import ProjectMember
+        from wharttest_django.concurrency import acquire_slot
+
+        admin = User.objects.create_superuser(username='resume-admin', password='password')
+        ProjectMember.objects.create(project=self.project, user=admin, role='owner')
+        name = f'fair-share:batch:user:{self.user.id}'
+        self.execution.status = 'failed'
+        self.execution.celery_task_id = 'killed-task'
+        self.execution.save()
+
+        with override_settings(TASK_FAIR_SHARE_LIMITS={'batch': {'user': 1}}):
+            self.assertTrue(acquire_slot(name, 'killed-task', 1))
+            client = APIClient()
+            client.force_authenticate(admin)
+            with patch('testcases.tasks.is_resumable', return_value=True):
+                response = client.post(
+                    f'/api/projects/{self.project.id}/test-executions/{self.execution.id}/resume/'
+                )
+            self.assertEqual(response.status_code, 202)
+            self.assertTrue(acquire_slot(name, 'resumed-task', 1))
+
+    def test_distributed_suite_holds_slot_until_finalized(self):
+        """分布式模式：分发后保留套件的名额，分片执行期间续租，汇总后释放"""
+        from testcases.tasks import execute_test_suite, finalize_test_execution
+        from wharttest_django.concurrency import acquire_slot, release_slot
+
+        name = f'fair-share:batch:user:{self.user.id}'
+        with override_settings(TASK_FAIR_SHARE_LIMITS={'batch': {'user': 1}}, TEST_SUITE_DISTRIBUTED_EXECUTION=True), \
+                patch('testcases.tasks._dispatch_suite_shards', return_value={'status': 'dispatched'}):
+            execute_test_suite.apply(args=[self.execution.id]).get()
+            self.execution.refresh_from_db()
+            self.assertFalse(acquire_slot(name, 'other-suite', 1))
+
+            # 租约到期后由分片续租
+            release_slot(name, self.execution.celery_task_id)
+            with execute_test_suite.renew_fair_share(self.execution.celery_task_id, self.execution.id):
+                self.assertFalse(acquire_slot(name, 'other-suite', 1))
+
+            finalize_test_execution(self.execution.id)
+            self.assertTrue(acquire_slot(name, 'other-suite', 1))
@@ -4,22 +4,26 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import FileResponse
 from django.conf import settings
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment
 from rest_framework.parsers import MultiPartParser, FormParser
 import io
+import tempfile
 
 from .models import (
     TestCase, TestCaseModule, Project, TestCaseScreenshot,
-    TestSuite, TestExecution, TestCaseResult
+    TestSuite, TestExecution, TestCaseResult, annotate_subtree_testcase_count,
+    with_testcase_relations, with_suite_relations, annotate_script_execution_summary
 )
 from .serializers import TestCaseSerializer, TestCaseModuleSerializer, TestCaseScreenshotSerializer
 from .permissions import IsProjectMemberForTestCase, IsProjectMemberForTestCaseModule
 from .filters import TestCaseFilter # 导入自定义过滤器
+from .screenshots import enqueue_screenshot_processing
 # 确保导入项目自定义的权限类
 from wharttest_django.permissions import HasModelPermission, permission_required
+from projects.membership import get_member_project_ids, has_project_role
 
 
 def _normalize_media_url(url: str) -> str:
@@ -81,7 +85,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             project = get_object_or_404(Project, pk=project_pk)
             # 权限类 IsProjectMemberForTestCase 已经检查了用户是否是此项目的成员
             # 所以这里可以直接返回项目下的用例
-            return TestCase.objects.filter(project=project).select_related('creator', 'module').prefetch_related('steps')
+            return with_testcase_relations(TestCase.objects.filter(project=project))
         # 如果没有 project_pk (理论上不应该发生，因为路由是嵌套的)
         # 返回空 queryset 或根据需求抛出错误
         return TestCase.objects.none()
@@ -142,6 +146,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         2. POST请求通过请求体: {"ids": [1, 2, 3], "template_id": 1}
         如果不提供ids，则导出项目下所有用例
         如果提供template_id，则使用模版配置导出
+        如果提供async=true，则创建后台导出任务，返回任务信息（通过 export-jobs/{id}/ 查询和下载）
         """
         from testcase_templates.models import ImportExportTemplate
         from testcase_templates.export_service import TestCaseExportService
@@ -153,6 +158,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             # POST请求，从请求体获取ids和template_id
             ids_data = request.data.get('ids', [])
             template_id = request.data.get('template_id')
+            run_async = str(request.data.get('async', '')).lower() in ('1', 'true')
             if ids_data:
                 try:
                     testcase_ids = [int(id) for id in ids_data]
@@ -166,6 +172,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             # GET请求，从查询参数获取ids和template_id
             ids_param = request.query_params.get('ids', '')
             template_id = request.query_params.get('template_id')
+            run_async = request.query_params.get('async', '').lower() in ('1', 'true')
             if ids_param:
                 try:
                     testcase_ids = [int(id.strip()) for id in ids_param.split(',') if id.strip()]
@@ -200,27 +207,70 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         # 获取项目名称
         project = get_object_or_404(Project, pk=project_pk)
 
-        # 使用导出服务
+        if run_async:
+            from testcase_templates.models import TestCaseExportJob
+            from testcase_templates.serializers import TestCaseExportJobSerializer
+            from testcase_templates.tasks import export_testcases
+
+            job = TestCaseExportJob.objects.create(
+                project=project,
+                template=template,
+                testcase_ids=testcase_ids,
+                creator=request.user
+            )
+            export_testcases.delay(job.id)
+            return Response(TestCaseExportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        # 使用导出服务，写入临时文件后流式返回（文件在响应结束时自动删除）
         export_service = TestCaseExportService(template)
+        output = tempfile.TemporaryFile()
         try:
-            excel_data, filename = export_service.export(queryset, project.name)
+            filename = export_service.export_to_file(queryset, project.name, output)
         except Exception as e:
+            output.close()
             import logging
             logging.getLogger(__name__).exception("导出Excel失败")
             return Response(
                 {'error': f'导出失败: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        output.seek(0)
 
-        # 创建HTTP响应
-        response = HttpResponse(
-            excel_data,
+        response = FileResponse(
+            output,
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
         return response
 
+    @action(detail=False, methods=['get'], url_path=r'export-jobs/(?P<job_id>\d+)')
+    def export_job(self, request, project_pk=None, job_id=None):
+        """查询后台导出任务状态"""
+        from testcase_templates.models import TestCaseExportJob
+        from testcase_templates.serializers import TestCaseExportJobSerializer
+
+        job = get_object_or_404(TestCaseExportJob, pk=job_id, project_id=project_pk)
+        return Response(TestCaseExportJobSerializer(job).data)
+
+    @action(detail=False, methods=['get'], url_path=r'export-jobs/(?P<job_id>\d+)/download')
+    def download_export_job(self, request, project_pk=None, job_id=None):
+        """下载后台导出任务生成的文件"""
+        from testcase_templates.models import TestCaseExportJob
+
+        job = get_object_or_404(TestCaseExportJob, pk=job_id, project_id=project_pk)
+        if job.status != 'completed' or not job.file:
+            return Response(
+                {'error': '导出任务尚未完成'},
+                status=status.HTTP_409_CONFLICT
+            )
+        response = FileResponse(
+            job.file.open('rb'),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{job.filename}"'
+        return response
+
     def _get_module_path(self, module):
         """
         获取模块的完整路径
@@ -228,13 +278,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         if not module:
             return ""
 
-        path_parts = []
-        current = module
-        while current:
-            path_parts.insert(0, current.name)
-            current = current.parent
-
-        return "/" + "/".join(path_parts)
+        return "/" + "/".join(module.get_path_names())
 
     def _format_steps(self, steps):
         """
@@ -258,6 +302,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         请求体: multipart/form-data
         - file: Excel 文件
         - template_id: 导入模版ID
+        - dry_run: 为 true 时只校验并返回将要导入的用例/模块，不写入数据
         """
         from testcase_templates.models import ImportExportTemplate
         from testcase_templates.import_service import TestCaseImportService
@@ -291,7 +336,8 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         project = get_object_or_404(Project, pk=project_pk)
 
         # 执行导入
-        service = TestCaseImportService(template, project, request.user)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        service = TestCaseImportService(template, project, request.user, dry_run=dry_run)
         result = service.import_from_file(file)
 
         return Response({
@@ -303,6 +349,8 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             'duplicate_names': result.duplicate_names,
             'errors': result.errors[:20],  # 只返回前20条错误
             'created_testcase_ids': result.created_testcases,
+            'dry_run': result.dry_run,
+            'modules_to_create': result.modules_to_create,
         }, status=status.HTTP_200_OK if result.success else status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'], url_path='batch-delete')
@@ -452,7 +500,8 @@ class TestCaseViewSet(viewsets.ModelViewSet):
                 except (ValueError, TypeError):
                     step_number = None
 
-            # 为每个文件创建截屏记录
+            # 为每个文件创建截屏记录（只保存原图，去重、转码和缩略图由后台任务完成）
+            created_ids = []
             for i, file in enumerate(uploaded_files):
                 screenshot_data = {
                     'test_case': testcase.id,
@@ -471,13 +520,16 @@ class TestCaseViewSet(viewsets.ModelViewSet):
 
                 if serializer.is_valid():
                     screenshot = serializer.save()
+                    created_ids.append(screenshot.id)
                     created_screenshots.append(serializer.data)
                 else:
+                    enqueue_screenshot_processing(created_ids)
                     return Response(
                         {'error': f'文件 {file.name} 保存失败: {serializer.errors}'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
+            enqueue_screenshot_processing(created_ids)
             return Response({
                 'message': f'成功上传 {len(created_screenshots)} 张截屏',
                 'screenshots': created_screenshots
@@ -630,7 +682,8 @@ class TestCaseModuleViewSet(viewsets.ModelViewSet):
         if project_pk:
             project = get_object_or_404(Project, pk=project_pk)
             # 权限类 IsProjectMemberForTestCaseModule 已经检查了用户是否是此项目的成员
-            return TestCaseModule.objects.filter(project=project).select_related('creator', 'parent')
+            queryset = TestCaseModule.objects.filter(project=project).select_related('creator').prefetch_related('creator__groups')
+            return annotate_subtree_testcase_count(queryset)
         return TestCaseModule.objects.none()
 
     def perform_create(self, serializer):
@@ -690,7 +743,7 @@ class TestSuiteViewSet(viewsets.ModelViewSet):
         project_pk = self.kwargs.get('project_pk')
         if project_pk:
             project = get_object_or_404(Project, pk=project_pk)
-            return TestSuite.objects.filter(project=project).prefetch_related('testcases', 'creator')
+            return with_suite_relations(TestSuite.objects.filter(project=project))
         return TestSuite.objects.none()
 
     def get_serializer_class(self):
@@ -752,7 +805,6 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         """创建测试执行并启动Celery任务"""
         from .serializers import TestExecutionCreateSerializer, TestExecutionSerializer
-        from .tasks import execute_test_suite
         
         serializer = TestExecutionCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -776,6 +828,16 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
             generate_playwright_script=generate_playwright_script
         )
         
+        self._start_execution_task(execution)
+        
+        # 返回创建的执行记录
+        result_serializer = TestExecutionSerializer(execution, context={'request': request})
+        return Response(result_serializer.data, status=status.HTTP_201_CREATED)
+
+    def _start_execution_task(self, execution):
+        """事务提交后启动执行任务"""
+        from .tasks import execute_test_suite
+        
         # 使用transaction.on_commit()确保数据库事务提交后再启动Celery任务
         # Django和Celery在同一容器中运行,共享同一数据库连接,避免查询不到记录的问题
         def start_execution_task():
@@ -784,15 +846,57 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
             TestExecution.objects.filter(id=execution.id).update(celery_task_id=task.id)
         
         transaction.on_commit(start_execution_task)
+
+    @action(detail=True, methods=['post'], url_path='resume')
+    def resume(self, request, project_pk=None, pk=None):
+        """
+        从中断处继续执行（worker 被杀、任务超时或部署重启后）
+        只执行仍处于等待中/执行中的用例和脚本，已结束的结果保持不变
+        """
+        from .serializers import TestExecutionSerializer
+        from .tasks import execute_test_suite, is_resumable
         
-        # 返回创建的执行记录
-        result_serializer = TestExecutionSerializer(execution, context={'request': request})
-        return Response(result_serializer.data, status=status.HTTP_201_CREATED)
+        execution = self.get_object()
+        if not is_resumable(execution):
+            return Response({
+                'error': f'状态为 {execution.get_status_display()} 的执行没有可继续的用例或仍在执行中'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 原任务所在的 worker 已被杀掉时，立即释放它遗留的公平份额名额，不必等租约到期
+        execute_test_suite.release_fair_share(execution.celery_task_id, execution.id)
+        
+        execution.status = 'pending'
+        execution.save(update_fields=['status', 'updated_at'])
+        self._start_execution_task(execution)
+        
+        serializer = TestExecutionSerializer(execution, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'], url_path='rerun-failed')
+    def rerun_failed(self, request, project_pk=None, pk=None):
+        """
+        仅重跑失败用例：创建子执行记录，通过的结果从原执行复制，
+        失败、错误、跳过及未执行的用例和脚本重新执行
+        """
+        from .serializers import TestExecutionSerializer
+        from .tasks import create_rerun_execution
+        
+        parent = self.get_object()
+        if parent.status in ['pending', 'running']:
+            return Response({
+                'error': f'无法重跑状态为 {parent.get_status_display()} 的执行，请等待执行结束'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        execution = create_rerun_execution(parent, request.user)
+        self._start_execution_task(execution)
+        
+        serializer = TestExecutionSerializer(execution, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel(self, request, project_pk=None, pk=None):
         """取消测试执行"""
-        from .tasks import cancel_test_execution
+        from .tasks import cancel_test_execution, signal_execution_cancel
         from celery import current_app
         
         execution = self.get_object()
@@ -802,6 +906,9 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
                 'error': f'无法取消状态为 {execution.get_status_display()} 的执行'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # 立即通知执行中的 worker 停止调度剩余任务
+        signal_execution_cancel(execution.id)
+        
         # 尝试撤销Celery任务
         if execution.celery_task_id:
             current_app.control.revoke(execution.celery_task_id, terminate=True)
@@ -955,8 +1062,10 @@ class AutomationScriptViewSet(viewsets.ModelViewSet):
         ]
     
     def get_queryset(self):
-        queryset = AutomationScript.objects.select_related(
-            'test_case', 'test_case__project', 'creator', 'source_task'
+        queryset = annotate_script_execution_summary(
+            AutomationScript.objects.select_related(
+                'test_case', 'test_case__project', 'creator', 'source_task'
+            ).prefetch_related('creator__groups')
         )
 
         # 强制按项目过滤，未指定项目时返回空集
@@ -968,8 +1077,7 @@ class AutomationScriptViewSet(viewsets.ModelViewSet):
         # 非管理员需验证项目访问权限
         user = self.request.user
         if not user.is_superuser:
-            user_project_ids = user.project_memberships.values_list('project_id', flat=True)
-            if int(project_id) not in user_project_ids:
+            if not has_project_role(user, int(project_id)):
                 return queryset.none()
 
         return queryset
@@ -982,7 +1090,7 @@ class AutomationScriptViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.is_superuser:
             return True
-        return user.project_memberships.filter(project_id=project_id).exists()
+        return has_project_role(user, project_id)
     
     @action(detail=True, methods=['post'], url_path='execute')
     def execute(self, request, pk=None):
@@ -1123,7 +1231,6 @@ class ScriptExecutionViewSet(viewsets.ReadOnlyModelViewSet):
         # 非管理员只能看到自己所属项目的执行记录
         user = self.request.user
         if not user.is_superuser:
-            user_project_ids = user.project_memberships.values_list('project_id', flat=True)
-            queryset = queryset.filter(script__test_case__project_id__in=user_project_ids)
+            queryset = queryset.filter(script__test_case__project_id__in=get_member_project_ids(user))
         
         return queryset
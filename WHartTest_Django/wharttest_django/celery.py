@@ -21,6 +21,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # 自动从所有已注册的Django app中加载任务
 app.autodiscover_tasks()
 
+# 注册队列等待时间等调度信号（发布端与 worker 端都需要）
+from wharttest_django import scheduling  # noqa: E402,F401
+
 # 针对Windows平台的兼容性修复
 if platform.system() == 'Windows':
     app.conf.update(
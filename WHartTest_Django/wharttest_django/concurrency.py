@@ -0,0 +1,126 @@
+"""
+跨进程并发名额
+
+用于限制分布在多个 Celery worker 上的同类任务的总并发数（如套件分片执行）：
+- 每个持有者以 token 标识，名额带租约，持有进程崩溃后租约到期自动释放
+- 配置了 REDIS_URL 时使用 Redis 有序集合（Lua 脚本保证原子性），否则使用进程内存（仅适用于单进程部署）
+
+使用方式：
+- acquire_slot(name, token, limit) -> bool
+- release_slot(name, token)
+
+配置项：
+- CONCURRENCY_KEY_PREFIX: Redis key 前缀（默认 wharttest:slots:）
+- CONCURRENCY_SLOT_LEASE: 名额租约（秒，默认 3600，应大于单个任务的最长执行时间）
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+def _lease():
+    return int(getattr(settings, 'CONCURRENCY_SLOT_LEASE', 3600))
+
+
+class InMemorySlots:
+    """进程内名额（线程安全）"""
+
+    def __init__(self):
+        self._holders = {}  # name -> {token: 租约到期时间}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, token, limit, lease):
+        now = time.time()
+        with self._lock:
+            holders = self._holders.setdefault(name, {})
+            for holder, expires_at in list(holders.items()):
+                if expires_at <= now:
+                    del holders[holder]
+            if token in holders or len(holders) < limit:
+                holders[token] = now + lease
+                return True
+            return False
+
+    def release(self, name, token):
+        with self._lock:
+            self._holders.get(name, {}).pop(token, None)
+
+
+class RedisSlots:
+    """Redis 名额：有序集合成员为 token，分值为租约到期时间"""
+
+    def __init__(self, url, prefix='wharttest:slots:'):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._acquire = self._client.register_script(_ACQUIRE_SCRIPT)
+
+    def acquire(self, name, token, limit, lease):
+        now = time.time()
+        key = f'{self._prefix}{name}'
+        return bool(self._acquire(keys=[key], args=[now, now + lease, token, limit, lease]))
+
+    def release(self, name, token):
+        self._client.zrem(f'{self._prefix}{name}', token)
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _backend():
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                url = getattr(settings, 'REDIS_URL', '')
+                if url:
+                    _slots = RedisSlots(url, getattr(settings, 'CONCURRENCY_KEY_PREFIX', 'wharttest:slots:'))
+                else:
+                    _slots = InMemorySlots()
+    return _slots
+
+
+def reset_slots():
+    """丢弃名额后端（配置变更或测试时使用）"""
+    global _slots
+    with _slots_lock:
+        _slots = None
+
+
+def acquire_slot(name, token, limit, lease=None):
+    """
+    占用一个名额，limit <= 0 表示不限制
+
+    同一 token 重复占用视为续租；名额后端不可用时放行，避免任务全部阻塞
+    """
+    if not limit or limit <= 0:
+        return True
+    try:
+        return _backend().acquire(name, str(token), int(limit), lease or _lease())
+    except Exception as e:
+        logger.warning(f"占用并发名额 {name} 失败，直接放行: {e}")
+        return True
+
+
+def release_slot(name, token):
+    """释放名额"""
+    try:
+        _backend().release(name, str(token))
+    except Exception as e:
+        logger.warning(f"释放并发名额 {name} 失败: {e}")
@@ -4,6 +4,12 @@ from rest_framework import permissions
 logger = logging.getLogger(__name__)
 
 
+def _load_user_permissions(user):
+    """一次性加载用户模型权限，避免 has_perm 分别查询用户权限和用户组权限"""
+    from projects.membership import load_user_permissions
+    load_user_permissions(user)
+
+
 class HasModelPermission(permissions.BasePermission):
     """
     自定义权限类，检查用户是否有特定的模型权限
@@ -29,6 +35,8 @@ class HasModelPermission(permissions.BasePermission):
         if request.user.is_superuser:
             return True
 
+        _load_user_permissions(request.user)
+
         # 如果提供了特定权限，则检查该权限
         if self.perm:
             has_perm = request.user.has_perm(self.perm)
@@ -75,6 +83,8 @@ class HasModelPermission(permissions.BasePermission):
         if request.user.is_superuser:
             return True
 
+        _load_user_permissions(request.user)
+
         # 如果提供了特定权限，则检查该权限（仅模型级别）
         if self.perm:
             # 只检查模型级权限，不检查对象级权限
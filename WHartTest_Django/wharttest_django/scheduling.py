@@ -0,0 +1,340 @@
+"""
+Celery 任务调度：工作负载队列、优先级与公平份额
+
+所有任务原先都进入同一个默认队列，一个用户 30 分钟的回归套件会挡住其他人的需求评审。这里按工作负载分类：
+- 队列：任务声明 workload（interactive / batch / default），由 route_task 路由到对应队列，
+  各队列由不同的 worker 消费（见 supervisord.conf），长任务不再占满交互任务的并发
+- 优先级：同一队列内按优先级出队（Redis broker 数值越小越优先，取消等控制类任务可单独设置 priority）
+- 公平份额：声明了 fair_share 的任务开始执行前按用户/项目占用并发名额（wharttest_django.concurrency），
+  超出份额时重新排队，让其他用户的任务先执行。名额使用短租约，执行期间由心跳线程续租，
+  worker 被强制超时或 OOM 杀掉后名额在一个租约内自动释放；恢复执行时可用 release_fair_share 立即释放遗留的名额。
+  任务把工作分发给其他任务时可调用 hold_fair_share 在返回后保留名额，由后续任务通过 renew_fair_share 续租，
+  全部完成后 release_fair_share 释放
+- 指标：记录各队列的排队等待时间和被限流次数，queue_stats() 汇总队列积压，供管理员接口查看
+
+任务声明方式：
+    @shared_task(bind=True, name='...', base=ScheduledTask, workload='batch', fair_share=_owners)
+
+fair_share(task, *args, **kwargs) 返回 {'user': 用户ID, 'project': 项目ID}，按任务参数确定归属
+
+配置项：
+- TASK_WORKLOAD_QUEUES: 工作负载 -> 队列名（默认 interactive / batch / celery）
+- TASK_FAIR_SHARE_LIMITS: 工作负载 -> {'user': 每个用户同时执行数, 'project': 每个项目同时执行数}，0 表示不限制
+- TASK_FAIR_SHARE_RETRY_DELAY: 超出份额时重新排队的延迟（秒，默认 10）
+- TASK_FAIR_SHARE_LEASE: 公平份额名额的租约（秒，默认 120），执行期间每 1/3 租约续租一次
+- TASK_QUEUE_METRICS_PREFIX: Redis 指标 key 前缀（默认 wharttest:queue-metrics:）
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from celery import Task
+from celery.signals import before_task_publish, task_prerun
+from django.conf import settings
+
+from .concurrency import acquire_slot, release_slot
+
+logger = logging.getLogger(__name__)
+
+# 工作负载 -> 默认优先级（Redis broker：0 最先出队）
+WORKLOAD_PRIORITIES = {
+    'interactive': 2,
+    'default': 5,
+    'batch': 7,
+}
+
+DEFAULT_WORKLOAD_QUEUES = {
+    'interactive': 'interactive',
+    'batch': 'batch',
+    'default': 'celery',
+}
+
+
+def workload_queues():
+    return {**DEFAULT_WORKLOAD_QUEUES, **(getattr(settings, 'TASK_WORKLOAD_QUEUES', None) or {})}
+
+
+def fair_share_limits(workload):
+    return (getattr(settings, 'TASK_FAIR_SHARE_LIMITS', None) or {}).get(workload) or {}
+
+
+def fair_share_lease():
+    return int(getattr(settings, 'TASK_FAIR_SHARE_LEASE', 120))
+
+
+class _LeaseHeartbeat(threading.Thread):
+    """任务执行期间定期续租公平份额名额，进程被杀后心跳随之停止，名额在一个租约内到期"""
+
+    def __init__(self, holders, token, lease):
+        super().__init__(name=f'fair-share-heartbeat-{token}', daemon=True)
+        self._holders = holders  # [(名额名, 上限)]
+        self._token = token
+        self._lease = lease
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self._lease / 3):
+            for name, limit in self._holders:
+                if not acquire_slot(name, self._token, limit, self._lease):
+                    logger.warning(f"续租公平份额名额 {name} 失败，名额已被其他任务占用")
+
+    def stop(self):
+        self._stopped.set()
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery 路由（CELERY_TASK_ROUTES）：按任务声明的 workload 选择队列和默认优先级"""
+    workload = getattr(task, 'workload', None) or 'default'
+    route = {'queue': workload_queues().get(workload, workload)}
+    priority = getattr(task, 'priority', None)
+    route['priority'] = priority if priority is not None else WORKLOAD_PRIORITIES.get(workload, 5)
+    return route
+
+
+class ScheduledTask(Task):
+    """带工作负载分类和公平份额的任务基类"""
+
+    workload = 'default'
+    fair_share = None
+
+    def __call__(self, *args, **kwargs):
+        # 直接调用（非 worker 执行）时不占用份额
+        if self.request.called_directly:
+            return super().__call__(*args, **kwargs)
+        # worker 已推入请求上下文，直接调用 run（Task.__call__ 会推入新的空请求，retry 将无法使用）
+        holders = self._acquire_fair_share(args, kwargs)
+        heartbeat = None
+        if holders:
+            heartbeat = _LeaseHeartbeat(holders, self.request.id, fair_share_lease())
+            heartbeat.start()
+        try:
+            return self.run(*args, **kwargs)
+        finally:
+            if heartbeat:
+                heartbeat.stop()
+            if not getattr(self.request, 'fair_share_held', False):
+                for name, limit in holders:
+                    release_slot(name, self.request.id)
+
+    def _fair_share_slots(self, args, kwargs):
+        """任务需要占用的公平份额名额 [(范围, 归属, 名额名, 上限)]"""
+        limits = fair_share_limits(self.workload)
+        if self.fair_share is None or not any(limits.values()):
+            return []
+        try:
+            owners = self.fair_share(*args, **kwargs) or {}
+        except Exception as e:
+            logger.warning(f"确定任务 {self.name} 的归属失败，跳过公平份额: {e}")
+            return []
+
+        slots = []
+        for scope, owner in owners.items():
+            limit = limits.get(scope, 0)
+            if owner is None or not limit:
+                continue
+            slots.append((scope, owner, f'fair-share:{self.workload}:{scope}:{owner}', limit))
+        return slots
+
+    def _acquire_fair_share(self, args, kwargs):
+        holders = []
+        for scope, owner, name, limit in self._fair_share_slots(args, kwargs):
+            if not acquire_slot(name, self.request.id, limit, fair_share_lease()):
+                for held, _ in holders:
+                    release_slot(held, self.request.id)
+                logger.info(f"任务 {self.name}[{self.request.id}] 超出 {scope}={owner} 的并发份额，重新排队")
+                metrics().record_throttled(self._queue())
+                raise self.retry(
+                    countdown=getattr(settings, 'TASK_FAIR_SHARE_RETRY_DELAY', 10), max_retries=None
+                )
+            holders.append((name, limit))
+        return holders
+
+    def hold_fair_share(self):
+        """当前请求返回后保留占用的名额（工作已分发给其他任务），之后由 renew_fair_share 续租、release_fair_share 释放"""
+        self.request.fair_share_held = True
+
+    @contextmanager
+    def renew_fair_share(self, token, *args, **kwargs):
+        """在其他任务执行期间为 token 续租这组参数的名额（租约在任务之间的空档内到期后名额即被释放）"""
+        holders = []
+        if token:
+            lease = fair_share_lease()
+            for scope, owner, name, limit in self._fair_share_slots(args, kwargs):
+                if not acquire_slot(name, token, limit, lease):
+                    logger.warning(f"续租公平份额名额 {name} 失败，名额已被其他任务占用")
+                    continue
+                holders.append((name, limit))
+        heartbeat = None
+        if holders:
+            heartbeat = _LeaseHeartbeat(holders, token, fair_share_lease())
+            heartbeat.start()
+        try:
+            yield
+        finally:
+            if heartbeat:
+                heartbeat.stop()
+
+    def release_fair_share(self, token, *args, **kwargs):
+        """释放任务 token 按这组参数占用的公平份额名额（如恢复被杀掉的 worker 遗留的执行时）"""
+        if not token:
+            return
+        for scope, owner, name, limit in self._fair_share_slots(args, kwargs):
+            release_slot(name, token)
+
+    def _queue(self):
+        delivery_info = self.request.delivery_info or {}
+        return delivery_info.get('routing_key') or workload_queues().get(self.workload, self.workload)
+
+
+# ---------------------------------------------------------------------------
+# 队列指标
+# ---------------------------------------------------------------------------
+
+_RECORD_WAIT_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], 'started', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'total_wait_ms', ARGV[1])
+redis.call('HSET', KEYS[1], 'last_wait_ms', ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'max_wait_ms') or '0')
+if tonumber(ARGV[1]) > current then
+    redis.call('HSET', KEYS[1], 'max_wait_ms', ARGV[1])
+end
+return 1
+"""
+
+
+def _summarize(values):
+    started = int(values.get('started', 0))
+    total = float(values.get('total_wait_ms', 0))
+    return {
+        'started': started,
+        'throttled': int(values.get('throttled', 0)),
+        'avg_wait_ms': round(total / started, 2) if started else 0.0,
+        'max_wait_ms': round(float(values.get('max_wait_ms', 0)), 2),
+        'last_wait_ms': round(float(values.get('last_wait_ms', 0)), 2),
+    }
+
+
+class InMemoryQueueMetrics:
+    """进程内队列指标（仅适用于单进程部署）"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record_wait(self, queue, wait_ms):
+        with self._lock:
+            values = self._data.setdefault(queue, {})
+            values['started'] = values.get('started', 0) + 1
+            values['total_wait_ms'] = values.get('total_wait_ms', 0) + wait_ms
+            values['last_wait_ms'] = wait_ms
+            values['max_wait_ms'] = max(values.get('max_wait_ms', 0), wait_ms)
+
+    def record_throttled(self, queue):
+        with self._lock:
+            values = self._data.setdefault(queue, {})
+            values['throttled'] = values.get('throttled', 0) + 1
+
+    def snapshot(self, queue):
+        with self._lock:
+            return _summarize(dict(self._data.get(queue, {})))
+
+
+class RedisQueueMetrics:
+    """Redis 队列指标：每个队列一个哈希，web 进程可读取所有 worker 记录的数据"""
+
+    def __init__(self, url, prefix='wharttest:queue-metrics:'):
+        import redis
+
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._record_wait = self._client.register_script(_RECORD_WAIT_SCRIPT)
+
+    def record_wait(self, queue, wait_ms):
+        self._record_wait(keys=[f'{self._prefix}{queue}'], args=[round(wait_ms, 2)])
+
+    def record_throttled(self, queue):
+        self._client.hincrby(f'{self._prefix}{queue}', 'throttled', 1)
+
+    def snapshot(self, queue):
+        return _summarize(self._client.hgetall(f'{self._prefix}{queue}'))
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                url = getattr(settings, 'REDIS_URL', '')
+                if url:
+                    _metrics = RedisQueueMetrics(
+                        url, getattr(settings, 'TASK_QUEUE_METRICS_PREFIX', 'wharttest:queue-metrics:')
+                    )
+                else:
+                    _metrics = InMemoryQueueMetrics()
+    return _metrics
+
+
+def reset_metrics():
+    """丢弃指标后端（配置变更或测试时使用）"""
+    global _metrics
+    with _metrics_lock:
+        _metrics = None
+
+
+@before_task_publish.connect(dispatch_uid='scheduling_enqueued_at')
+def _stamp_enqueued_at(headers=None, **kwargs):
+    # 自定义消息头在 worker 端作为 task.request 的属性出现；重新排队时重新计时
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+@task_prerun.connect(dispatch_uid='scheduling_queue_wait')
+def _record_queue_wait(task=None, **kwargs):
+    enqueued_at = getattr(task.request, 'enqueued_at', None)
+    if not enqueued_at or task.request.called_directly:
+        return
+    delivery_info = task.request.delivery_info or {}
+    queue = delivery_info.get('routing_key') or 'celery'
+    wait_ms = max(time.time() - float(enqueued_at), 0) * 1000
+    try:
+        metrics().record_wait(queue, wait_ms)
+    except Exception as e:
+        logger.debug(f"记录队列 {queue} 等待时间失败: {e}")
+
+
+def _queue_depth(app, queue):
+    """队列中等待的消息数，broker 不可用时返回 None"""
+    try:
+        with app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=1)
+            return conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        logger.debug(f"读取队列 {queue} 积压失败: {e}")
+        return None
+
+
+def queue_stats():
+    """各工作负载队列的积压、等待时间与公平份额配置"""
+    from celery import current_app
+
+    queues = []
+    for workload, queue in workload_queues().items():
+        try:
+            snapshot = metrics().snapshot(queue)
+        except Exception as e:
+            logger.warning(f"读取队列 {queue} 指标失败: {e}")
+            snapshot = _summarize({})
+        queues.append({
+            'workload': workload,
+            'queue': queue,
+            'depth': _queue_depth(current_app, queue),
+            'default_priority': WORKLOAD_PRIORITIES.get(workload),
+            'fair_share': fair_share_limits(workload),
+            **snapshot,
+        })
+    return {'queues': queues}
@@ -0,0 +1,395 @@
+"""
+全文检索
+
+知识库文档、需求文档、需求模块、评审问题的正文很长，icontains 只能顺序扫描。这里为这些模型
+维护一列分词后的 search_tokens（中日韩文字切成二元组，其他文字按单词小写），并按数据库建立索引：
+- PostgreSQL: search_tokens 上的 to_tsvector('simple') GIN 表达式索引，ts_rank 排序
+- SQLite（本地模式）: <表名>_fts FTS5 虚拟表，保存/删除时同步写入，bm25 排序
+- 其他数据库: 回退为 icontains
+
+检索入口：
+- full_text_search(queryset, query): 过滤并注解 search_rank
+- FullTextSearchFilter / RankedOrderingFilter: 替换视图的 SearchFilter / OrderingFilter
+- FullTextFilter: django-filter 字段，用于已有的内容过滤参数；结果与该字段的 icontains 一致，
+  全文索引只用于预筛选候选记录，不限制结果数量
+
+配置项：
+- FULL_TEXT_SEARCH_MAX_TOKENS: 单条记录最多索引的词元数（默认 50000，避免超出 tsvector 的 1MB 上限），
+  超出的记录标记 search_truncated，字段过滤不对其做索引预筛选，直接按 icontains 判断
+- FULL_TEXT_SEARCH_MAX_RESULTS: SQLite 模式下 search 参数（full_text_search）最多返回的结果数（默认 1000），
+  按相关度取前 N 条；字段过滤参数不受此限制
+"""
+import logging
+import re
+import uuid
+
+import django_filters
+from django_filters.constants import EMPTY_VALUES
+from django.conf import settings
+from django.db import OperationalError, connections, models
+from django.db.models import Case, F, Func, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字：假名、扩展A、基本汉字、谚文、兼容汉字
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_SEGMENT_RE = re.compile(rf'([{_CJK}]+)|([^\W_{_CJK}]+)')
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _max_tokens():
+    return int(getattr(settings, 'FULL_TEXT_SEARCH_MAX_TOKENS', 50000))
+
+
+def _max_results():
+    return int(getattr(settings, 'FULL_TEXT_SEARCH_MAX_RESULTS', 1000))
+
+
+def _segments(text):
+    """切分文本，返回 (是否中日韩文字, 片段)"""
+    for cjk, word in _SEGMENT_RE.findall(text or ''):
+        if cjk:
+            yield True, cjk
+        else:
+            yield False, word.lower()
+
+
+def tokenize(text):
+    """索引分词：中日韩连续文字切成重叠二元组，其他文字按单词"""
+    tokens = []
+    for is_cjk, segment in _segments(text):
+        if is_cjk and len(segment) > 1:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+def query_terms(query):
+    """
+    检索词切分，返回去重后的 [(词元, 是否前缀匹配)]
+
+    中日韩二元组精确匹配；单个汉字和其他单词按前缀匹配，接近原先 icontains 的体验
+    """
+    terms = []
+    for is_cjk, segment in _segments(query):
+        if is_cjk and len(segment) > 1:
+            terms.extend((segment[i:i + 2], False) for i in range(len(segment) - 1))
+        else:
+            terms.append((segment, True))
+    return list(dict.fromkeys(terms))
+
+
+def narrowing_terms(value):
+    """
+    字段过滤的预筛选词元，格式同 query_terms
+
+    只保留包含 value 的文本一定会命中的词元，保证预筛选结果覆盖 icontains 的全部匹配：
+    - 中日韩二元组：value 是文本的子串时，其中的二元组也是文本的词元
+    - 第一个片段之后的单词/单字：前面有分隔，在文本中从词首开始，按前缀匹配
+    第一个片段可能从文本的词中间开始（如 'lph' 匹配 'alpha'），不参与预筛选
+    """
+    terms = []
+    for index, (is_cjk, segment) in enumerate(_segments(value)):
+        if is_cjk and len(segment) > 1:
+            terms.extend((segment[i:i + 2], False) for i in range(len(segment) - 1))
+        elif index > 0:
+            terms.append((segment, True))
+    return list(dict.fromkeys(terms))
+
+
+def build_search_tokens(instance, fields):
+    """返回 (search_tokens, 是否因超出 FULL_TEXT_SEARCH_MAX_TOKENS 被截断)"""
+    tokens = []
+    for field in fields:
+        tokens.extend(tokenize(getattr(instance, field, None)))
+    max_tokens = _max_tokens()
+    return ' '.join(tokens[:max_tokens]), len(tokens) > max_tokens
+
+
+class FullTextSearchMixin(models.Model):
+    """
+    全文检索模型基类
+
+    子类通过 SEARCH_FIELDS 声明参与检索的字段，保存时自动重建 search_tokens。
+    """
+    SEARCH_FIELDS = ()
+
+    search_tokens = models.TextField(_('检索词元'), blank=True, default='', editable=False)
+    search_truncated = models.BooleanField(_('检索词元已截断'), default=False, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        self._search_tokens_changed = False
+        if update_fields is None or set(update_fields) & set(self.SEARCH_FIELDS):
+            tokens, self.search_truncated = build_search_tokens(self, self.SEARCH_FIELDS)
+            self._search_tokens_changed = tokens != self.search_tokens
+            self.search_tokens = tokens
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_tokens', 'search_truncated'}
+        super().save(*args, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# 索引维护
+# ---------------------------------------------------------------------------
+
+def _fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def _fts_rowid(pk):
+    """FTS5 行号：UUID 主键取高 63 位，整数主键直接使用"""
+    if isinstance(pk, uuid.UUID):
+        return pk.int >> 65
+    return int(pk)
+
+
+def _write_fts_rows(connection, model, rows):
+    """rows: [(pk, search_tokens)]，先删后插"""
+    table = _fts_table(model)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM "{table}" WHERE rowid = %s', [(_fts_rowid(pk),) for pk, tokens in rows])
+        cursor.executemany(
+            f'INSERT INTO "{table}" (rowid, object_id, search_tokens) VALUES (%s, %s, %s)',
+            [(_fts_rowid(pk), str(pk), tokens) for pk, tokens in rows if tokens],
+        )
+
+
+@receiver(post_save)
+def _sync_fts_on_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw or not isinstance(instance, FullTextSearchMixin) or not getattr(instance, '_search_tokens_changed', False):
+        return
+    connection = connections[using or 'default']
+    if connection.vendor == 'sqlite':
+        _write_fts_rows(connection, sender, [(instance.pk, instance.search_tokens)])
+
+
+@receiver(post_delete)
+def _sync_fts_on_delete(sender, instance, using=None, **kwargs):
+    if not isinstance(instance, FullTextSearchMixin):
+        return
+    connection = connections[using or 'default']
+    if connection.vendor == 'sqlite':
+        _write_fts_rows(connection, sender, [(instance.pk, '')])
+
+
+def create_search_index(schema_editor, model):
+    """创建检索索引（迁移中调用）"""
+    table = model._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{table}_search_gin" ON "{table}" '
+            f'USING gin (to_tsvector(\'simple\'::regconfig, "search_tokens"))'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{_fts_table(model)}" USING fts5(object_id UNINDEXED, search_tokens)'
+        )
+
+
+def drop_search_index(schema_editor, model):
+    """删除检索索引（迁移回滚时调用）"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{model._meta.db_table}_search_gin"')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{_fts_table(model)}"')
+
+
+def rebuild_search_index(model, fields, using='default', only_full=False):
+    """
+    重新生成模型记录的 search_tokens / search_truncated（SQLite 同时重建 FTS5 表）
+
+    迁移中的历史模型没有 SEARCH_FIELDS，因此字段由调用方传入。
+    only_full=True 时只重建词元数可能已达上限的记录（每个词元至少 1 个字符，长度不足上限的不可能被截断）
+    """
+    connection = connections[using]
+    batch = []
+    total = 0
+    queryset = model._default_manager.using(using).only('pk', *fields).order_by()
+    if only_full:
+        queryset = queryset.alias(tokens_length=Length('search_tokens')).filter(tokens_length__gte=_max_tokens())
+    for instance in queryset.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        instance.search_tokens, instance.search_truncated = build_search_tokens(instance, fields)
+        batch.append(instance)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            _flush_rebuild_batch(connection, model, batch, using)
+            total += len(batch)
+            batch = []
+    if batch:
+        _flush_rebuild_batch(connection, model, batch, using)
+        total += len(batch)
+    logger.info(f"已重建 {model._meta.label} 的检索索引，共 {total} 条")
+    return total
+
+
+def _flush_rebuild_batch(connection, model, batch, using):
+    # 早期迁移中的历史模型还没有 search_truncated 字段
+    update_fields = ['search_tokens']
+    if any(field.name == 'search_truncated' for field in model._meta.get_fields()):
+        update_fields.append('search_truncated')
+    model._default_manager.using(using).bulk_update(batch, update_fields)
+    if connection.vendor == 'sqlite':
+        _write_fts_rows(connection, model, [(instance.pk, instance.search_tokens) for instance in batch])
+
+
+# ---------------------------------------------------------------------------
+# 检索
+# ---------------------------------------------------------------------------
+
+def full_text_search(queryset, query):
+    """
+    全文检索，返回过滤后的 queryset，注解 search_rank（越大越相关）并按其降序排列
+
+    检索词切不出词元（如只有标点）或数据库不支持时，回退为 SEARCH_FIELDS 上的 icontains
+    """
+    terms = query_terms(query)
+    vendor = connections[queryset.db].vendor
+    if terms and vendor == 'postgresql':
+        return _search_postgresql(queryset, terms)
+    if terms and vendor == 'sqlite':
+        result = _search_sqlite(queryset, terms)
+        if result is not None:
+            return result
+    return _search_icontains(queryset, query)
+
+
+def _postgresql_match(terms):
+    from django.contrib.postgres.search import SearchQuery, SearchVectorField
+
+    # 表达式需与 create_search_index 中的索引表达式一致才能命中 GIN 索引
+    vector = Func(
+        F('search_tokens'),
+        template="to_tsvector('simple'::regconfig, %(expressions)s)",
+        output_field=SearchVectorField(),
+    )
+    search_query = SearchQuery(
+        ' & '.join(f'{term}:*' if prefix else term for term, prefix in terms),
+        config='simple', search_type='raw',
+    )
+    return vector, search_query
+
+
+def _search_postgresql(queryset, terms):
+    from django.contrib.postgres.search import SearchRank
+
+    vector, search_query = _postgresql_match(terms)
+    return queryset.alias(search_vector=vector).filter(search_vector=search_query).annotate(
+        search_rank=SearchRank(vector, search_query)
+    ).order_by('-search_rank')
+
+
+def _sqlite_match(terms):
+    return ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+
+
+def _sqlite_object_id(model):
+    """FTS5 表中 object_id（str(pk)）转换为与主键列可比较的表达式，UUID 主键在 SQLite 中存为不带连字符的 32 位十六进制"""
+    if isinstance(model._meta.pk, models.UUIDField):
+        return "replace(object_id, '-', '')"
+    return 'CAST(object_id AS INTEGER)'
+
+
+def _search_sqlite(queryset, terms):
+    model = queryset.model
+    table = _fts_table(model)
+    match = _sqlite_match(terms)
+    # 先限定在调用方的 queryset（项目、权限等过滤）内再按相关度取前 N 条，避免其他项目的结果占满名额
+    scoped_sql, scoped_params = queryset.order_by().values('pk').query.sql_with_params()
+    try:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT object_id FROM "{table}" WHERE "{table}" MATCH %s '
+                f'AND {_sqlite_object_id(model)} IN ({scoped_sql}) ORDER BY rank LIMIT %s',
+                [match, *scoped_params, _max_results()],
+            )
+            ids = [model._meta.pk.to_python(row[0]) for row in cursor.fetchall()]
+    except OperationalError as e:
+        logger.warning(f"{table} 全文检索失败，回退为 icontains: {e}")
+        return None
+
+    ranks = [When(pk=pk, then=Value(len(ids) - i)) for i, pk in enumerate(ids)]
+    return queryset.filter(pk__in=ids).annotate(
+        search_rank=Case(*ranks, default=Value(0), output_field=IntegerField())
+    ).order_by('-search_rank')
+
+
+def _search_icontains(queryset, query):
+    condition = Q()
+    for field in queryset.model.SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
+
+
+def narrow_candidates(queryset, terms):
+    """
+    按全文索引预筛选候选记录（不排序、不限制数量），数据库不支持时原样返回
+
+    SQLite 以子查询关联 FTS5 表。词元被截断的记录索引不完整，不参与预筛选，始终保留为候选
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        vector, search_query = _postgresql_match(terms)
+        return queryset.alias(search_vector=vector).filter(
+            Q(search_vector=search_query) | Q(search_truncated=True)
+        )
+    if vendor == 'sqlite':
+        table = _fts_table(queryset.model)
+        return queryset.filter(Q(pk__in=RawSQL(
+            f'SELECT {_sqlite_object_id(queryset.model)} FROM "{table}" WHERE "{table}" MATCH %s',
+            [_sqlite_match(terms)],
+        )) | Q(search_truncated=True))
+    return queryset
+
+
+class FullTextFilter(django_filters.CharFilter):
+    """
+    django-filter 长文本字段过滤：结果与该字段的 icontains 一致
+
+    全文索引只用于预筛选候选记录（见 narrowing_terms），切不出可靠的预筛选词元时直接 icontains
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('lookup_expr', 'icontains')
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        terms = narrowing_terms(value)
+        if terms:
+            qs = narrow_candidates(qs, terms)
+        return super().filter(qs, value)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """search 参数走全文索引；模型未接入全文检索时沿用 SearchFilter"""
+
+    def filter_queryset(self, request, queryset, view):
+        if not issubclass(queryset.model, FullTextSearchMixin):
+            return super().filter_queryset(request, queryset, view)
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        return full_text_search(queryset, query)
+
+
+class RankedOrderingFilter(filters.OrderingFilter):
+    """未指定 ordering 参数时，全文检索结果按相关度排序而不是视图默认排序"""
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank']
+        return super().get_ordering(request, queryset, view)
@@ -99,12 +99,43 @@ INSTALLED_APPS = [
 # ASGI 配置（用于 Channels WebSocket）
 ASGI_APPLICATION = 'wharttest_django.asgi.application'
 
-# Channels Layer 配置（使用内存后端，生产环境建议使用 Redis）
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Redis 地址：配置后 Channels Layer、停止/取消信号（wharttest_django.signalling）与默认缓存走 Redis，
+# 可部署多个 Web/Celery worker；未配置时使用进程内存，仅适用于单进程部署
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+# 默认缓存（项目成员角色与权限、项目统计、对话摘要等）：多进程部署时需共享，
+# 否则某个进程的缓存失效（如移除项目成员）在其他进程中要等 TTL 到期才生效
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'wharttest',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Channels Layer 配置
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -538,6 +569,36 @@ CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 软超时时间(秒) - 25分钟
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Worker预取任务数量
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000  # Worker执行多少任务后重启
 
+# 测试套件分布式执行：每个用例/脚本作为独立的 Celery 任务分发到所有 worker（testcases.tasks.execute_suite_shard）
+# 套件内并发仍由 TestSuite.max_concurrent_tasks 控制；TEST_SUITE_MAX_RUNNING_SHARDS 为所有套件同时执行的分片上限（0 表示不限制）
+TEST_SUITE_DISTRIBUTED_EXECUTION = os.environ.get('TEST_SUITE_DISTRIBUTED_EXECUTION', 'False') == 'True'
+TEST_SUITE_MAX_RUNNING_SHARDS = int(os.environ.get('TEST_SUITE_MAX_RUNNING_SHARDS', '0'))
+# 套件执行检查点：单次任务执行超过该秒数后不再调度新用例，由新的任务继续执行剩余用例（0 表示不分段）
+# 应小于 CELERY_TASK_SOFT_TIME_LIMIT 减去单个用例的最长耗时
+TEST_SUITE_CHECKPOINT_SECONDS = int(os.environ.get('TEST_SUITE_CHECKPOINT_SECONDS', str(CELERY_TASK_SOFT_TIME_LIMIT - 5 * 60)))
+
+# Celery任务调度（wharttest_django.scheduling）：按工作负载路由到不同队列，各队列由独立的 worker 消费
+# interactive: 需求评审、用例导出、截屏处理、取消执行；batch: 测试套件执行；其余任务进入默认队列 celery
+CELERY_TASK_ROUTES = ('wharttest_django.scheduling.route_task',)
+# Redis broker 按优先级出队，并按 -Q 中的顺序优先消费靠前的队列
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+# 公平份额：每个用户/项目同时执行的任务数上限（0 表示不限制），超出时任务重新排队
+TASK_FAIR_SHARE_LIMITS = {
+    'batch': {
+        'user': int(os.environ.get('TASK_FAIR_SHARE_BATCH_PER_USER', '1')),
+        'project': int(os.environ.get('TASK_FAIR_SHARE_BATCH_PER_PROJECT', '0')),
+    },
+    'interactive': {
+        'user': int(os.environ.get('TASK_FAIR_SHARE_INTERACTIVE_PER_USER', '0')),
+        'project': int(os.environ.get('TASK_FAIR_SHARE_INTERACTIVE_PER_PROJECT', '0')),
+    },
+}
+# 公平份额名额的租约（秒），执行期间由心跳续租；worker 被强制超时或 OOM 杀掉后名额在一个租约内释放
+TASK_FAIR_SHARE_LEASE = int(os.environ.get('TASK_FAIR_SHARE_LEASE', '120'))
+
 # Celery日志配置
 CELERY_WORKER_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s] %(message)s'
 CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(task_name)s(%(task_id)s)] %(message)s'
@@ -546,3 +607,13 @@ CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(
 # 在Docker环境中应设置为 http://backend:8000
 # 在本地开发环境中可以使用 http://localhost:8000
 BASE_URL = os.environ.get('DJANGO_BASE_URL', 'http://localhost:8000')
+
+# LLM 调用限流（langgraph_integration.llm_client）：同一模型服务端点的所有会话共享一个令牌桶
+# 每分钟请求数上限，0 表示不限流；可用 LLM_ENDPOINT_RATE_LIMITS = {'主机名': 每分钟请求数} 单独覆盖
+LLM_RATE_LIMIT_RPM = int(os.environ.get('LLM_RATE_LIMIT_RPM', '0'))
+
+# 对话上下文压缩（orchestrator_integration.context_compression）：相同消息块的摘要按内容哈希缓存的秒数
+CONTEXT_SUMMARY_CACHE_TTL = int(os.environ.get('CONTEXT_SUMMARY_CACHE_TTL', str(7 * 24 * 3600)))
+
+# 多知识库联合检索（knowledge.services.MultiKnowledgeBaseSearch）：并发检索各知识库集合的最大线程数
+KNOWLEDGE_SEARCH_MAX_WORKERS = int(os.environ.get('KNOWLEDGE_SEARCH_MAX_WORKERS', '8'))
@@ -0,0 +1,223 @@
+"""
+跨进程信号
+
+停止 Agent Loop、取消测试执行、停止脚本预览等请求可能落在与实际执行者不同的进程上
+（多个 uvicorn worker、水平扩展的 Celery worker），这里提供统一的信号后端：
+- RedisSignalBackend: 信号存为带 TTL 的 key，设置时同时 PUBLISH，等待方订阅频道，无需轮询
+- InMemorySignalBackend: 进程内存储，仅适用于单进程部署（shared=False，其他进程设置的信号收不到，
+  调用方需要自行回退到数据库状态检查，如取消测试执行）
+
+使用方式：
+- signal_backend().set(name) / is_set(name) / clear(name)
+- async with watch_signal(name) as event: ... event.is_set()
+
+配置项：
+- SIGNAL_BACKEND_URL: Redis 地址，未配置时使用 REDIS_URL；都为空时使用进程内存
+- SIGNAL_KEY_PREFIX: Redis key 与频道前缀（默认 wharttest:signal:）
+- SIGNAL_TTL: 信号默认过期时间（秒，默认 300），防止信号永不清理
+"""
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Redis 不可用时等待方的重试间隔（秒）
+RECONNECT_DELAY = 1.0
+
+
+def _default_ttl():
+    return int(getattr(settings, 'SIGNAL_TTL', 300))
+
+
+class SignalBackend:
+    """信号后端接口"""
+
+    # 信号是否跨进程可见
+    shared = True
+
+    def set(self, name, ttl=None):
+        raise NotImplementedError
+
+    def is_set(self, name):
+        raise NotImplementedError
+
+    def clear(self, name):
+        raise NotImplementedError
+
+    async def wait(self, name):
+        """等待信号被设置；调用时已设置则立即返回"""
+        raise NotImplementedError
+
+
+class InMemorySignalBackend(SignalBackend):
+    """进程内信号（线程安全），等待方通过 asyncio.Event 唤醒"""
+
+    shared = False
+
+    def __init__(self):
+        self._signals = {}  # name -> 过期时间
+        self._waiters = {}  # name -> {(loop, event)}
+        self._lock = threading.Lock()
+
+    def set(self, name, ttl=None):
+        with self._lock:
+            self._signals[name] = time.monotonic() + (ttl or _default_ttl())
+            waiters = list(self._waiters.get(name, ()))
+        for loop, event in waiters:
+            with contextlib.suppress(RuntimeError):  # 事件循环已关闭
+                loop.call_soon_threadsafe(event.set)
+        return True
+
+    def is_set(self, name):
+        with self._lock:
+            expires_at = self._signals.get(name)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._signals[name]
+                return False
+            return True
+
+    def clear(self, name):
+        with self._lock:
+            return self._signals.pop(name, None) is not None
+
+    async def wait(self, name):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(name, set()).add(waiter)
+        try:
+            if not self.is_set(name):
+                await waiter[1].wait()
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(name)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[name]
+
+
+class RedisSignalBackend(SignalBackend):
+    """Redis 信号：key 保存状态（带 TTL），频道通知等待方"""
+
+    def __init__(self, url, prefix='wharttest:signal:'):
+        import redis
+
+        self._url = url
+        self._prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, name):
+        return f'{self._prefix}{name}'
+
+    def set(self, name, ttl=None):
+        key = self._key(name)
+        try:
+            pipe = self._client.pipeline()
+            pipe.set(key, 1, ex=ttl or _default_ttl())
+            pipe.publish(key, 1)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"设置信号 {name} 失败: {e}")
+            return False
+
+    def is_set(self, name):
+        try:
+            return bool(self._client.exists(self._key(name)))
+        except Exception as e:
+            logger.warning(f"读取信号 {name} 失败: {e}")
+            return False
+
+    def clear(self, name):
+        try:
+            return bool(self._client.delete(self._key(name)))
+        except Exception as e:
+            logger.warning(f"清除信号 {name} 失败: {e}")
+            return False
+
+    async def wait(self, name):
+        import redis.asyncio as aioredis
+
+        key = self._key(name)
+        while True:
+            client = aioredis.Redis.from_url(self._url)
+            pubsub = client.pubsub()
+            try:
+                # 先订阅再检查 key，避免两者之间设置的信号被漏掉
+                await pubsub.subscribe(key)
+                if await client.exists(key):
+                    return
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"订阅信号 {name} 失败，{RECONNECT_DELAY} 秒后重试: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                with contextlib.suppress(Exception):
+                    await pubsub.aclose()
+                with contextlib.suppress(Exception):
+                    await client.aclose()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def signal_backend():
+    """获取全局信号后端"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                url = getattr(settings, 'SIGNAL_BACKEND_URL', '') or getattr(settings, 'REDIS_URL', '')
+                if url:
+                    prefix = getattr(settings, 'SIGNAL_KEY_PREFIX', 'wharttest:signal:')
+                    _backend = RedisSignalBackend(url, prefix)
+                else:
+                    _backend = InMemorySignalBackend()
+                logger.info(f"信号后端: {type(_backend).__name__}")
+    return _backend
+
+
+def reset_signal_backend():
+    """丢弃全局信号后端（配置变更或测试时使用）"""
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+@contextlib.asynccontextmanager
+async def watch_signal(name, on_signal=None):
+    """
+    在上下文内订阅信号，返回的 asyncio.Event 在信号到达后被设置
+
+    on_signal: 信号到达时调用的回调（可选，同步或异步函数）
+    """
+    event = asyncio.Event()
+    backend = signal_backend()
+
+    async def watcher():
+        await backend.wait(name)
+        event.set()
+        if on_signal is not None:
+            result = on_signal()
+            if asyncio.iscoroutine(result):
+                await result
+
+    task = asyncio.create_task(watcher())
+    try:
+        yield event
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
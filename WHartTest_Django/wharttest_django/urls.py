@@ -31,6 +31,7 @@ from testcases.views import (
     AutomationScriptViewSet, ScriptExecutionViewSet
 )  # 导入 TestCase、TestCaseModule、TestSuite、TestExecution 和自动化用例视图集
 from skills.views import SkillViewSet  # 导入 Skill 视图集
+from wharttest_django.views import TaskQueueStatsView  # Celery 任务队列指标
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 router = DefaultRouter()
@@ -61,6 +62,7 @@ urlpatterns = [
     path('api/requirements/', include('requirements.urls')), # 需求评审管理 URLs
     path('api/orchestrator/', include('orchestrator_integration.urls')), # 智能编排 URLs
     path('api/', include('testcase_templates.urls')), # 用例导入导出模版 URLs
+    path('api/task-queues/stats/', TaskQueueStatsView.as_view(), name='task-queue-stats'), # 任务队列指标（管理员）
     # DRF Spectacular - OpenAPI schema and docs
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     # Optional UI:
@@ -0,0 +1,16 @@
+"""
+项目级管理接口
+"""
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .scheduling import queue_stats
+
+
+class TaskQueueStatsView(APIView):
+    """Celery 任务队列指标（仅管理员）：各工作负载队列的积压、排队等待时间、被公平份额限流的次数"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(queue_stats())
@@ -25,6 +25,7 @@ export interface TestCaseScreenshot {
   test_case: number;
   screenshot: string; // 截图URL
   screenshot_url: string; // 截图URL（备用）
+  thumbnail_url?: string; // 缩略图URL（后台处理完成前为原图）
   title?: string;
   description?: string;
   step_number?: number;